@@ -1,6 +1,25 @@
+# =====================================================================
+# app_logger.py: Bot 共通ロガー (V112 - 非同期・構造化ログ)
+#
+# 1. config.LOG_LEVEL をそのまま使う (V49 の DEBUG 強制は廃止。開発中は config 側で DEBUG にする)
+# 2. Bot のスレッドはキューに積むだけで、整形と出力 (コンソール / ファイル) は別スレッドで行う
+# 3. メッセージ種別 (先頭の "FIND:" や "DB EXECUTE:" など) ごとにレート制限する
+# 4. JSONL 形式で、サイズでローテーションするファイルに出力する
+#    動画1本ごとの判定記録 (log_decision) は別ファイル (decisions) に1行で出力する
+#
+# ホットパスでは f-string ではなく logger.debug("FIND: ... %s", value) の形式で書くこと
+# (レベルが無効なら文字列を組み立てない。整形は出力スレッドで行われる)
+# =====================================================================
+import atexit
+import json
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 # config.py から LOG_LEVEL をインポートすることを想定
 try:
@@ -8,43 +27,212 @@ try:
 except ImportError:
     LOG_LEVEL = logging.DEBUG  # config が読み込めない場合のデフォルト
 
+try:
+    from config import (LOG_TO_CONSOLE, LOG_DIR, LOG_JSON_ENABLED, LOG_DECISIONS_ENABLED, LOG_MAX_BYTES,
+                        LOG_BACKUP_COUNT, LOG_QUEUE_MAX, LOG_RATE_LIMITS)
+except ImportError:
+    LOG_TO_CONSOLE, LOG_DIR, LOG_JSON_ENABLED, LOG_DECISIONS_ENABLED = True, 'logs', False, False
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_MAX, LOG_RATE_LIMITS = 20 * 1024 * 1024, 5, 10000, {}
+
 # -------------------------------------------------
 # 1. グローバルLoggerインスタンスの作成
 # -------------------------------------------------
 # Bot全体でこの 'logger' インスタンスを共有する
 # 他のファイル (helper, manager) はこれをインポートする
 logger = logging.getLogger('TikTokBot')
+# ★ V112 修正: config.LOG_LEVEL に従う ('INFO' のような文字列も可)
+logger.setLevel(logging.getLevelName(LOG_LEVEL) if isinstance(LOG_LEVEL, str) else LOG_LEVEL)
+
+# 動画ごとの判定記録 (本体のログとは別ファイル。レート制限の対象外)
+decision_logger = logging.getLogger('TikTokBot.decisions')
+decision_logger.setLevel(logging.INFO)
+decision_logger.propagate = False
 
-# ★ V49 修正: ログが INFO にリセットされるのを防ぐため、
-# グローバルロガーのレベルを DEBUG に強制設定する
-logger.setLevel(logging.DEBUG)
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - (%(filename)s:%(lineno)d) - %(message)s'
+
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_QUEUE_HANDLER: Optional['NonBlockingQueueHandler'] = None
 
 
 # -------------------------------------------------
-# 2. ログハンドラの設定関数
+# 2. ハンドラ・フィルタ
 # -------------------------------------------------
-def setup_logging_handlers():
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    レコードをそのままキューに積む (標準の QueueHandler と違い、Bot のスレッドでは整形しない)。
+    キューが満杯の場合は待たずに破棄し、件数だけ数える。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def message_type(record: logging.LogRecord) -> str:
+    """"FIND: SUCCESS ..." → "FIND" (整形前のテンプレートから取り出すため安価)"""
+    template = record.msg if isinstance(record.msg, str) else ''
+    head, separator, _ = template[:40].partition(':')
+    return head.strip() if separator else ''
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    メッセージ種別ごとに、window 秒あたり最大 limit 件まで通す。
+    WARNING 以上と判定記録は制限しない。抑制した件数は次の窓の最初に1行で報告する。
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]]):
+        super().__init__()
+        self.limits = limits
+        self._windows: Dict[str, list] = {}  # 種別 → [窓の開始時刻, 通過数, 抑制数]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or record.name == decision_logger.name:
+            return True
+        kind = message_type(record)
+        rule = self.limits.get(kind)
+        if rule is None:
+            return True
+        limit, window_seconds = rule
+        now = record.created
+        with self._lock:
+            window = self._windows.get(kind)
+            if window is None or now - window[0] >= window_seconds:
+                suppressed = window[2] if window else 0
+                self._windows[kind] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [LOG: {suppressed} '{kind}' messages suppressed in the last " \
+                                 f"{window_seconds:g}s]"
+                return True
+            if window[1] < limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class JsonLineFormatter(logging.Formatter):
+    """1レコード = 1行の JSON。extra={'fields': {...}} で渡した値はそのまま列になる"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'src': f"{record.filename}:{record.lineno}",
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DecisionFilter(logging.Filter):
+    """判定記録だけを通す (include=True) / 判定記録以外を通す (include=False)"""
+
+    def __init__(self, include: bool):
+        super().__init__()
+        self.include = include
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (record.name == decision_logger.name) == self.include
+
+
+def _rotating_handler(path: str, formatter: logging.Formatter) -> logging.Handler:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                                   encoding='utf-8', delay=True)
+    handler.setFormatter(formatter)
+    return handler
+
+
+# -------------------------------------------------
+# 3. ログハンドラの設定関数
+# -------------------------------------------------
+def setup_logging_handlers(log_name: str = 'tiktok_bot'):
     """
     メインスクリプト (collector_bot_main.py) から呼び出され、
     ログの出力先（コンソールやファイル）を設定する。
+    [V112 修正] 出力はキュー経由で別スレッドが行う。log_name はファイル名 (Bot ごとに分ける)
     """
+    global _LISTENER, _QUEUE_HANDLER
     # ハンドラが既に追加されている場合は、重複して追加しない
-    if not logger.hasHandlers():
-        # 1. コンソールへのハンドラ
+    if _LISTENER is not None or logger.hasHandlers():
+        return
+
+    handlers = []
+    main_only = _DecisionFilter(include=False)
+    if LOG_TO_CONSOLE:
         console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        console_handler.addFilter(main_only)
+        handlers.append(console_handler)
+    if LOG_JSON_ENABLED:
+        json_handler = _rotating_handler(os.path.join(LOG_DIR, f"{log_name}.jsonl"), JsonLineFormatter())
+        json_handler.addFilter(main_only)
+        handlers.append(json_handler)
+    if LOG_DECISIONS_ENABLED:
+        decision_handler = _rotating_handler(os.path.join(LOG_DIR, f"{log_name}.decisions.jsonl"),
+                                             logging.Formatter('%(message)s'))
+        decision_handler.addFilter(_DecisionFilter(include=True))
+        handlers.append(decision_handler)
+
+    _QUEUE_HANDLER = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_MAX))
+    if LOG_RATE_LIMITS:
+        _QUEUE_HANDLER.addFilter(RateLimitFilter(LOG_RATE_LIMITS))
+    logger.addHandler(_QUEUE_HANDLER)
+    decision_logger.addHandler(_QUEUE_HANDLER)
+
+    _LISTENER = logging.handlers.QueueListener(_QUEUE_HANDLER.queue, *handlers, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(stop_logging)
+
+    logger.info("Logger handlers configured (Level: %s, Outputs: %s).",
+                logging.getLevelName(logger.level), [type(h).__name__ for h in handlers])
+
+
+def stop_logging():
+    """キューに残ったログを出力し切ってから出力スレッドを止める"""
+    global _LISTENER
+    if _LISTENER is None:
+        return
+    listener, _LISTENER = _LISTENER, None
+    listener.stop()
+    if _QUEUE_HANDLER is not None and _QUEUE_HANDLER.dropped:
+        sys.stderr.write(f"LOG: {_QUEUE_HANDLER.dropped} log records were dropped (queue full).\n")
+
+
+def log_decision(video_id: Optional[str], outcome: str, **fields):
+    """
+    [V112 新規] 動画1本分の判定 (収集 / 棄却ステージと理由 / 重複 / エラー) を1行の JSON で記録する。
+    LOG_DECISIONS_ENABLED が False の場合は何もしない (JSON の組み立ても行わない)。
+    """
+    if not LOG_DECISIONS_ENABLED:
+        return
+    record = {'ts': round(time.time(), 3), 'video_id': video_id, 'outcome': outcome}
+    record.update(fields)
+    decision_logger.info('%s', _LazyJson(record))
 
-        # ★ V49 修正: ハンドラのレベルも DEBUG に強制設定
-        console_handler.setLevel(logging.DEBUG)
 
-        # 詳細なログフォーマット
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - (%(filename)s:%(lineno)d) - %(message)s'
-        )
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+class _LazyJson:
+    """出力スレッドで初めて JSON 文字列にする"""
+    __slots__ = ('value',)
 
-        # TODO: (オプション) ファイルへのハンドラ
-        # file_handler = logging.FileHandler('bot_log.log')
-        # logger.addHandler(file_handler)
+    def __init__(self, value: Dict[str, Any]):
+        self.value = value
 
-        logger.info("Logger handlers configured successfully and set to DEBUG verbosity.")
\ No newline at end of file
+    def __str__(self) -> str:
+        return json.dumps(self.value, ensure_ascii=False, default=str, separators=(',', ':'))
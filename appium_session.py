@@ -0,0 +1,91 @@
+# =====================================================================
+# appium_session.py: Appium セッションの保存と再接続 (V116)
+#
+# UiAutomator2 のセッション作成 (サーバー APK の確認・インストール、端末の初期化) には
+# 数秒〜数十秒かかる。Bot が異常終了・再起動した場合でも Appium サーバー側のセッションは
+# newCommandTimeout まで残っているため、セッション ID を端末ごとに保存しておき、
+# 再起動時は新規作成せずに既存のセッションへ接続し直す。
+#
+# 1. APPIUM_SESSION_STATE_DIR/<UDID>.json にセッション ID・capabilities・接続先を保存する
+# 2. ReattachedRemote: POST /session を送らずに既存のセッション ID を使う webdriver.Remote
+# 3. 一度でもセッションを作成できた端末は prepared とし、次の新規作成では
+#    サーバーのインストールと端末の初期化を省略する (失敗した場合は省略せずに作り直す)
+# =====================================================================
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+from appium import webdriver
+
+from app_logger import logger
+from config import APPIUM_SESSION_STATE_DIR
+
+# 新規セッション作成時、端末が準備済みなら追加する capabilities
+SKIP_DEVICE_PREPARATION_CAPS = {
+    'appium:skipServerInstallation': True,
+    'appium:skipDeviceInitialization': True,
+}
+
+
+def session_state_path(udid: str) -> str:
+    safe_udid = re.sub(r'[^\w.\-]', '_', udid)
+    return os.path.join(APPIUM_SESSION_STATE_DIR, f"{safe_udid}.json")
+
+
+def load_session_state(udid: str) -> Dict[str, Any]:
+    """保存済みの状態 (なければ空の dict)"""
+    try:
+        with open(session_state_path(udid), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"SESSION: Could not read the saved session for {udid}: {e}")
+        return {}
+
+
+def _write_session_state(udid: str, state: Dict[str, Any]):
+    path = session_state_path(udid)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"SESSION: Failed to save the session state to {path}: {e}")
+
+
+def save_session_state(udid: str, appium_url: str, session_id: str, capabilities: Dict[str, Any]):
+    _write_session_state(udid, {
+        'udid': udid,
+        'appium_url': appium_url,
+        'session_id': session_id,
+        'capabilities': capabilities,
+        'prepared': True,
+        'saved_at': time.time(),
+    })
+
+
+def clear_session_id(udid: str):
+    """セッションを終了した・死んでいた場合に呼ぶ (端末が準備済みであることは残す)"""
+    state = load_session_state(udid)
+    if state.get('session_id'):
+        state['session_id'] = None
+        _write_session_state(udid, state)
+
+
+class ReattachedRemote(webdriver.Remote):
+    """既存のセッションに接続する webdriver.Remote (start_session で POST /session を送らない)"""
+
+    def __init__(self, session_id: str, capabilities: Dict[str, Any], **kwargs):
+        self._reattach_session_id = session_id
+        self._reattach_capabilities = capabilities
+        super().__init__(**kwargs)
+
+    def start_session(self, capabilities: Dict[str, Any], browser_profile: Optional[Any] = None):
+        self.session_id = self._reattach_session_id
+        self.caps = dict(self._reattach_capabilities)
@@ -0,0 +1,294 @@
+# =====================================================================
+# appium_transport.py: Appium への HTTP 接続 (keep-alive プール) とコマンド別の往復時間計測 (V115)
+#
+# Bot は VirtualBox の VM 上で動き、Appium サーバーは Windows ホスト上にあるため、
+# WebDriver コマンドはすべて仮想 NIC を往復する。ここでは
+#   1. 接続プール (サイズ・接続/読み取りタイムアウト) を config で調整した keep-alive 接続を使う
+#   2. コマンド名 (getPageSource, findElement ...) ごとの往復時間を記録する (metrics.APPIUM_COMMAND_SECONDS)
+#   3. 新規に張った TCP 接続の数を数える (keep-alive が効いていれば Bot の起動直後以外は増えない)
+#   4. 端末に触れない GET /status の往復時間を定期的に測り、「通信にかかった時間」の推定に使う
+#      (動画1本の Appium 時間 = コマンド数 × /status の往復時間 (通信) + 残り (サーバー・端末での処理))
+#   5. ★ V118 追加: コマンドの種類ごとの期限 (APPIUM_COMMAND_DEADLINES)。
+#      監視スレッドが期限切れのコマンドの HTTP 接続を切断し、AppiumCommandDeadlineExceeded を送出させる。
+#      セッションは「応答なしの疑い」とし、リカバリ側で生存確認をしてから続行する。
+#      (newCommandTimeout はサーバー側でセッションを破棄するまでの時間であり、1コマンドの所要時間は制限しない)
+# =====================================================================
+import socket
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+import urllib3
+from appium.webdriver.appium_connection import AppiumConnection
+from appium.webdriver.client_config import AppiumClientConfig
+from selenium.common.exceptions import WebDriverException
+
+from app_logger import logger
+from config import APPIUM_HTTP_POOL_MAXSIZE, APPIUM_HTTP_CONNECT_TIMEOUT_SECONDS, APPIUM_HTTP_READ_TIMEOUT_SECONDS
+from config import APPIUM_TRANSPORT_PROBE_INTERVAL_SECONDS
+from config import APPIUM_COMMAND_DEADLINES, APPIUM_COMMAND_DEFAULT_DEADLINE_SECONDS, APPIUM_WATCHDOG_POLL_SECONDS
+from metrics import APPIUM_COMMAND_SECONDS, APPIUM_CONNECTIONS_TOTAL, APPIUM_COMMAND_DEADLINE_EXCEEDED_TOTAL
+
+# /status の往復時間は直近この件数の中央値を使う
+PROBE_SAMPLES = 20
+
+
+class AppiumCommandDeadlineExceeded(WebDriverException):
+    """[V118 新規] コマンドが期限内に応答せず、監視スレッドが接続を切断した"""
+
+    def __init__(self, command: str, deadline_seconds: float):
+        self.command = command
+        self.deadline_seconds = deadline_seconds
+        super().__init__(f"Appium command '{command}' did not respond within {deadline_seconds:g}s.")
+
+
+class AppiumSessionUnresponsive(WebDriverException):
+    """[V118 新規] 期限切れの後、生存確認にも応答しなかった (セッションの作り直しが必要)"""
+
+
+class _InflightCommand:
+    __slots__ = ('command', 'deadline_seconds', 'deadline_at', 'connection', 'expired', '_lock')
+
+    def __init__(self, command: str, deadline_seconds: float):
+        self.command = command
+        self.deadline_seconds = deadline_seconds
+        self.deadline_at = time.monotonic() + deadline_seconds
+        self.connection = None
+        self.expired = False
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        with self._lock:
+            self.connection = connection
+            expired = self.expired
+        if expired:
+            self._shutdown(connection)
+
+    def abort(self):
+        with self._lock:
+            self.expired = True
+            connection = self.connection
+        if connection is not None:
+            self._shutdown(connection)
+
+    @staticmethod
+    def _shutdown(connection):
+        # 受信待ちで止まっているスレッドの recv を、別スレッドからの shutdown で戻す
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+# コマンドを実行中のスレッド → 実行中のコマンド (接続プールが使う接続を結び付けるため)
+_CURRENT = threading.local()
+
+
+class CommandWatchdog:
+    """[V118 新規] 実行中のコマンドの期限を監視し、期限切れのコマンドの HTTP 接続を切断する"""
+
+    def __init__(self, poll_seconds: float = APPIUM_WATCHDOG_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._inflight: Dict[int, _InflightCommand] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, command: str, deadline_seconds: float) -> _InflightCommand:
+        inflight = _InflightCommand(command, deadline_seconds)
+        with self._lock:
+            self._inflight[id(inflight)] = inflight
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='appium-watchdog', daemon=True)
+                self._thread.start()
+        _CURRENT.inflight = inflight
+        return inflight
+
+    def end(self, inflight: _InflightCommand):
+        _CURRENT.inflight = None
+        with self._lock:
+            self._inflight.pop(id(inflight), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            now = time.monotonic()
+            with self._lock:
+                expired = [c for c in self._inflight.values() if not c.expired and now >= c.deadline_at]
+            for inflight in expired:
+                logger.warning(f"WATCHDOG: '{inflight.command}' exceeded its {inflight.deadline_seconds:g}s "
+                               f"deadline. Aborting the request.")
+                inflight.abort()
+
+
+class _WatchedPoolMixin:
+    """新規接続を数え、実行中のコマンドに使用中の接続を結び付ける"""
+
+    def _new_conn(self):
+        APPIUM_CONNECTIONS_TOTAL.inc(scheme=self.scheme)
+        return super()._new_conn()
+
+    def _make_request(self, conn, *args, **kwargs):
+        inflight = getattr(_CURRENT, 'inflight', None)
+        if inflight is not None:
+            inflight.attach(conn)
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class _CountingHTTPConnectionPool(_WatchedPoolMixin, urllib3.HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_WatchedPoolMixin, urllib3.HTTPSConnectionPool):
+    pass
+
+
+class CommandTimings:
+    """コマンド別の累計と、動画1本分 (start_window 〜 take_window) の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # コマンド名 → (回数, 合計秒, 最大秒, 期限切れ回数)
+        self.by_command: Dict[str, Tuple[int, float, float, int]] = {}
+        self._window_count = 0
+        self._window_seconds = 0.0
+
+    def record(self, command: str, seconds: float, expired: bool = False):
+        with self._lock:
+            count, total, slowest, hangs = self.by_command.get(command, (0, 0.0, 0.0, 0))
+            self.by_command[command] = (count + 1, total + seconds, max(slowest, seconds), hangs + int(expired))
+            self._window_count += 1
+            self._window_seconds += seconds
+
+    def start_window(self):
+        with self._lock:
+            self._window_count = 0
+            self._window_seconds = 0.0
+
+    def take_window(self) -> Tuple[int, float]:
+        with self._lock:
+            window = (self._window_count, self._window_seconds)
+            self._window_count = 0
+            self._window_seconds = 0.0
+            return window
+
+
+class InstrumentedAppiumConnection(AppiumConnection):
+    """
+    AppiumConnection の接続プールを調整し、execute() ごとの往復時間を記録する。
+    (接続プールは親クラスの __init__ 内で _get_connection_manager() から作られる)
+    """
+
+    def __init__(self, remote_server_addr: str, pool_maxsize: int = APPIUM_HTTP_POOL_MAXSIZE,
+                 connect_timeout: float = APPIUM_HTTP_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout: float = APPIUM_HTTP_READ_TIMEOUT_SECONDS,
+                 probe_interval_seconds: float = APPIUM_TRANSPORT_PROBE_INTERVAL_SECONDS,
+                 deadlines: Optional[Dict[str, float]] = None,
+                 default_deadline_seconds: float = APPIUM_COMMAND_DEFAULT_DEADLINE_SECONDS):
+        self.pool_maxsize = pool_maxsize
+        self.http_timeout = urllib3.Timeout(connect=connect_timeout, read=read_timeout)
+        self.timings = CommandTimings()
+        self.probe_interval_seconds = probe_interval_seconds
+        self._probe_samples: deque = deque(maxlen=PROBE_SAMPLES)
+        self._last_probe_at = 0.0
+        self._status_url = remote_server_addr.rstrip('/') + '/status'
+        # ★ V118 追加: コマンドの期限と監視スレッド。期限切れが起きたらリカバリで生存確認するまで True
+        self.deadlines = APPIUM_COMMAND_DEADLINES if deadlines is None else deadlines
+        self.default_deadline_seconds = default_deadline_seconds
+        self.watchdog = CommandWatchdog()
+        self.session_suspect = False
+        # RemoteConnection._request はリクエストごとに client_config.timeout を渡す (既定は None = 無制限) ため、
+        # プールの timeout だけでは効かない。client_config にも同じ urllib3.Timeout を指定する
+        client_config = AppiumClientConfig(remote_server_addr=remote_server_addr, keep_alive=True,
+                                           timeout=self.http_timeout)
+        super().__init__(keep_alive=True, client_config=client_config)
+
+    def _get_connection_manager(self):
+        # 1 Bot = 1 セッションのため、同時に使う接続は少ない。上限を超えたら新規接続せず空きを待つ (block=True)
+        manager = urllib3.PoolManager(num_pools=1, maxsize=self.pool_maxsize, block=True,
+                                      timeout=self.http_timeout, retries=False)
+        manager.pool_classes_by_scheme = {'http': _CountingHTTPConnectionPool,
+                                          'https': _CountingHTTPSConnectionPool}
+        return manager
+
+    @staticmethod
+    def command_name(command: str, params: Optional[Dict[str, Any]]) -> str:
+        """
+        期限・集計に使うコマンド名。Appium の拡張コマンド (query_app_state, activate_app, クリップボード ...) は
+        すべて w3cExecuteScript として送られるため、'mobile: xxx' のスクリプト名で区別する
+        """
+        if command == 'w3cExecuteScript' and params:
+            script = params.get('script')
+            if isinstance(script, str) and script.startswith('mobile:'):
+                return script
+        return command
+
+    def execute(self, command: str, params: Dict[str, Any]):
+        started = time.perf_counter()
+        name = self.command_name(command, params)
+        deadline_seconds = self.deadlines.get(name, self.default_deadline_seconds)
+        inflight = self.watchdog.begin(name, deadline_seconds)
+        try:
+            return super().execute(command, params)
+        except Exception as e:
+            if inflight.expired:
+                self.session_suspect = True
+                APPIUM_COMMAND_DEADLINE_EXCEEDED_TOTAL.inc(command=name)
+                raise AppiumCommandDeadlineExceeded(name, deadline_seconds) from e
+            raise
+        finally:
+            self.watchdog.end(inflight)
+            elapsed = time.perf_counter() - started
+            self.timings.record(name, elapsed, inflight.expired)
+            APPIUM_COMMAND_SECONDS.observe(elapsed, command=name)
+
+    # --- 通信時間の推定 ---
+
+    def probe_transport(self, force: bool = False) -> Optional[float]:
+        """前回から probe_interval_seconds 以上経っていれば GET /status の往復時間を測る。直近の中央値を返す"""
+        now = time.time()
+        if force or now - self._last_probe_at >= self.probe_interval_seconds:
+            self._last_probe_at = now
+            started = time.perf_counter()
+            try:
+                self._conn.request('GET', self._status_url, headers={'Accept': 'application/json'})
+                self._probe_samples.append(time.perf_counter() - started)
+            except Exception as e:
+                logger.debug("TRANSPORT: /status probe failed: %s", e)
+        return self.transport_rtt()
+
+    def transport_rtt(self) -> Optional[float]:
+        return statistics.median(self._probe_samples) if self._probe_samples else None
+
+    def split_window(self) -> Dict[str, Any]:
+        """動画1本分の Appium 時間を、通信 (推定) とサーバー・端末での処理に分ける"""
+        count, seconds = self.timings.take_window()
+        rtt = self.transport_rtt()
+        transport = min(count * rtt, seconds) if rtt is not None else None
+        return {
+            'appium_commands': count,
+            'appium_seconds': round(seconds, 3),
+            'transport_seconds': round(transport, 3) if transport is not None else None,
+            'device_seconds': round(seconds - transport, 3) if transport is not None else None,
+        }
+
+    def report(self, top: int = 8) -> str:
+        """
+        コマンド別の累計 (合計時間の多い順) と接続数・/status の往復時間。
+        ★ V118 追加: 最大時間・期限切れ回数も出し、期限切れのあったコマンドは top に関係なく全て出す
+        """
+        rtt = self.transport_rtt()
+        lines = [f"APPIUM TRANSPORT: Connections opened={int(APPIUM_CONNECTIONS_TOTAL.value(scheme='http'))}, "
+                 f"/status RTT={'n/a' if rtt is None else f'{rtt * 1000:.1f}ms'}, Pool max={self.pool_maxsize}"]
+        commands = sorted(self.timings.by_command.items(), key=lambda item: item[1][1], reverse=True)
+        for rank, (command, (count, total, slowest, hangs)) in enumerate(commands):
+            if rank >= top and not hangs:
+                continue
+            deadline = self.deadlines.get(command, self.default_deadline_seconds)
+            lines.append(f"  {command:<24} n={count:<6} mean={total / count * 1000:7.1f}ms max={slowest:6.1f}s "
+                         f"total={total:8.1f}s hung={hangs} (Deadline: {deadline:g}s)")
+        return '\n'.join(lines)
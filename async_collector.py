@@ -0,0 +1,574 @@
+# =====================================================================
+# async_collector.py: 1プロセスで複数端末を動かす asyncio 版の収集ランタイム (V114)
+#
+# collector_bot_main.py は 1プロセス = 1端末で、モジュールのグローバル変数 (DB_MANAGER, APPIUM_DRIVER_HELPER ...)
+# に状態を持つ。処理時間のほとんどは Appium / MySQL の往復待ちなので、ここでは
+#   1. 端末ごとに DeviceSession (状態をすべてインスタンスに持つ) を作り、1タスクとして動かす
+#   2. Appium へは async_webdriver.py の非同期クライアントで送る (keep-alive 接続プールを全端末で共有)
+#   3. DB は TikTokDBManager の接続プール + 専用スレッドで呼び出す (pymysql は同期のため。接続数は
+#      ASYNC_DB_POOL_SIZE で固定し、端末数に比例させない)
+#   4. 言語パックは element_ids を書き換えず、端末ごとにセレクタの名前空間を持つ (国の異なる端末を混在できる)
+#
+# 対象はおすすめフィードのみ (収集判定は collector_bot_main のパイプラインと同じ:
+# 指紋キャッシュ → いいね数 → 静止画 → 広告 → ブロックリスト → URL → 挿入)。
+# 次の処理は行わない: 検索収集、スクリーンショット、「もっと見る」による全文キャプション、ジェスチャー方式の計測。
+# 1本分の処理に失敗した場合は recovery.py と同じ段階でおすすめフィードに戻して続け、
+# セッションを作り直すのは端末が応答しない (診断が HUNG) 場合だけにする。
+#
+# 使い方:
+#   python async_collector.py                (bot_configurations の is_active = 1 の全端末)
+#   python async_collector.py 1 2 5          (指定した BOT_ID のみ)
+# =====================================================================
+import argparse
+import asyncio
+import functools
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from appium.options.common import AppiumOptions
+
+import element_ids as ids
+import locale_packs
+import metrics
+import recovery
+from app_logger import logger, setup_logging_handlers, log_decision
+from appium_transport import AppiumSessionUnresponsive
+from async_webdriver import AsyncHttpPool, AsyncAppiumSession, is_session_lost
+from config import APPIUM_URL, APPIUM_CAPABILITIES_BASE, TIKTOK_PACKAGE_NAME
+from config import IS_TEST_MODE, RECOMMENDED_VIDEOS_COUNT, TEST_RECOMMENDED_VIDEOS_COUNT, MIN_LIKES_DEFAULT
+from config import CHANNEL_BLOCKLIST, WAITING_SCREENSHOT_CHECK, DEFAULT_LOCALE, LOCALE_BY_COUNTRY, GESTURE_PATHS
+from config import USE_FINGERPRINT_CACHE, FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS
+from config import FINGERPRINT_CACHE_WARM_ROWS
+from config import SWIPE_SETTLE_TIMEOUT_SECONDS, SWIPE_SETTLE_POLL_SECONDS, CLIPBOARD_TIMEOUT_SECONDS
+from config import CLIPBOARD_POLL_SECONDS, APP_STOP_TIMEOUT_SECONDS, APP_READY_TIMEOUT_SECONDS
+from config import FLEET_START_STAGGER_SECONDS, ASYNC_APPIUM_POOL_CONNECTIONS, ASYNC_DB_POOL_SIZE
+from config import ASYNC_COMMAND_TIMEOUT_SECONDS, ASYNC_ERROR_BACKOFF_SECONDS
+from config import RECOVERY_SETTLE_TIMEOUT_SECONDS, RECOVERY_POLL_SECONDS, RECOVERY_DEEP_LINK_URL
+from config import RECOVERY_MAX_PER_CYCLE
+from dom_snapshot import DomSnapshot
+from gesture_engine import GesturePath
+from tiktok_appium_helper import TiktokAppiumHelper, parse_video_fields, video_signature, extract_video_id_from_url
+from tiktok_db_manager import TikTokDBManager
+from video_fingerprint_cache import VideoFingerprintCache
+
+
+# =====================================================================
+# I. DB 接続プール
+# =====================================================================
+
+class AsyncDBPool:
+    """
+    TikTokDBManager を size 個持ち、専用スレッドで呼び出す。
+    1つの接続を同時に複数のスレッドが使わないよう、呼び出しの間はプールから取り出しておく。
+    """
+
+    def __init__(self, size: int, factory: Callable[[], TikTokDBManager] = TikTokDBManager):
+        self.size = size
+        self.factory = factory
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='AsyncDB')
+        self._idle: Optional[asyncio.Queue] = None
+        self._managers: List[TikTokDBManager] = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            manager = await loop.run_in_executor(self._executor, self.factory)
+            self._managers.append(manager)
+            self._idle.put_nowait(manager)
+        logger.info(f"ASYNC DB: {self.size} connections ready.")
+
+    async def call(self, method_name: str, *args) -> Any:
+        manager = await self._idle.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(getattr(manager, method_name), *args))
+        finally:
+            self._idle.put_nowait(manager)
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        for manager in self._managers:
+            await loop.run_in_executor(self._executor, manager.close)
+        self._executor.shutdown(wait=True)
+
+
+# =====================================================================
+# II. 端末ごとのセッション
+# =====================================================================
+
+class DeviceSession:
+    """1端末分の状態 (collector_bot_main.py のグローバル変数に相当するものをすべてここに持つ)"""
+
+    def __init__(self, config: Dict[str, Any], http_pool: AsyncHttpPool, db: AsyncDBPool,
+                 fingerprint_cache: Optional[VideoFingerprintCache]):
+        self.bot_id = int(config['bot_id'])
+        self.config = config
+        self.country = config.get('target_country')
+        self.http_pool = http_pool
+        self.db = db
+        self.fingerprint_cache = fingerprint_cache
+        self.appium: Optional[AsyncAppiumSession] = None
+        self.threshold = MIN_LIKES_DEFAULT
+        locale = locale_packs.resolve_locale(self.country, LOCALE_BY_COUNTRY, DEFAULT_LOCALE)
+        self.pack = locale_packs.load_locale_pack(locale)
+        self.selectors = locale_packs.localized_selectors(locale, ids)
+        self._paths: Dict[str, GesturePath] = {}
+        self._last_signature: Optional[str] = None
+        self.processed = 0
+
+    # --- セッション ---
+
+    async def start(self):
+        threshold = await self.db.call('get_like_threshold', self.country)
+        self.threshold = threshold if threshold is not None else MIN_LIKES_DEFAULT
+        # 同期版と同じく AppiumOptions を通し、標準外の capabilities に 'appium:' を付ける (Appium 2 は付いていないと拒否する)
+        options = AppiumOptions()
+        options.load_capabilities({
+            **APPIUM_CAPABILITIES_BASE,
+            'appium:deviceName': self.config['appium_device_name'],
+            'appium:udid': self.config['appium_udid'],
+            'appium:systemPort': TiktokAppiumHelper.get_free_port(),
+        })
+        self.appium = await AsyncAppiumSession.create(self.http_pool, options.to_capabilities())
+        await self.db.call('mark_bot_started', self.bot_id)
+        await self.appium.update_settings({'waitForIdleTimeout': 0})
+        self._paths.clear()
+        logger.info(f"[{self.bot_id}] ASYNC: Session {self.appium.session_id} created "
+                    f"(Locale: {self.pack.locale}, Threshold: {self.threshold}).")
+        await self.reboot_app()
+
+    async def close(self):
+        if self.appium is not None:
+            await self.appium.quit()
+            self.appium = None
+
+    # --- 画面 ---
+
+    async def snapshot(self) -> DomSnapshot:
+        return DomSnapshot(await self.appium.page_source())
+
+    async def wait_until(self, predicate: Callable[[], Awaitable[Any]], timeout_seconds: float,
+                         poll_seconds: float) -> Any:
+        deadline = time.time() + timeout_seconds
+        while True:
+            result = await predicate()
+            if result:
+                return result
+            if time.time() >= deadline:
+                return None
+            await asyncio.sleep(poll_seconds)
+
+    async def tap_bounds(self, bounds: Tuple[int, int, int, int]):
+        await self.appium.tap((bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2)
+
+    async def _path(self, name: str) -> GesturePath:
+        """画面サイズはセッションごとに1回だけ取得し、ジェスチャーの実座標とコマンド本体をキャッシュする"""
+        path = self._paths.get(name)
+        if path is None:
+            width, height = await self.appium.window_size()
+            start_x, start_y, end_x, end_y, duration_ms = GESTURE_PATHS[name]
+            path = self._paths[name] = GesturePath(name, (int(width * start_x), int(height * start_y)),
+                                                   (int(width * end_x), int(height * end_y)), duration_ms)
+        return path
+
+    async def reboot_app(self) -> bool:
+        await self.appium.terminate_app(TIKTOK_PACKAGE_NAME)
+
+        async def stopped():
+            return await self.appium.query_app_state(TIKTOK_PACKAGE_NAME) <= 1
+
+        await self.wait_until(stopped, APP_STOP_TIMEOUT_SECONDS, 0.2)
+        await self.appium.activate_app(TIKTOK_PACKAGE_NAME)
+        self._last_signature = None
+
+        async def feed_ready():
+            snapshot = await self.snapshot()
+            return snapshot.exists(self.selectors.SHARE_BUTTON_SELECTORS) or \
+                snapshot.exists(self.selectors.HOME_ICON_SELECTORS)
+
+        if not await self.wait_until(feed_ready, APP_READY_TIMEOUT_SECONDS, 0.5):
+            logger.warning(f"[{self.bot_id}] ASYNC: TikTok app activated but the home feed was not detected.")
+            return False
+        return True
+
+    async def swipe_to_next_video(self, max_attempts: int = 2) -> bool:
+        for _ in range(max_attempts):
+            previous = self._last_signature
+            path = await self._path('next_video')
+            await self.appium.perform_actions(path.actions_payload)
+
+            async def feed_moved():
+                fields = parse_video_fields(await self.snapshot(), self.selectors, self.pack)
+                signature = video_signature(fields)
+                return signature if signature and signature != previous else None
+
+            signature = await self.wait_until(feed_moved, SWIPE_SETTLE_TIMEOUT_SECONDS, SWIPE_SETTLE_POLL_SECONDS)
+            if signature:
+                self._last_signature = signature
+                return True
+        return False
+
+    async def copy_video_url(self, share_bounds: Optional[Tuple[int, int, int, int]]) -> Optional[str]:
+        """シェアボタン → 「リンクをコピー」をスナップショットの座標でタップし、クリップボードからURLを読む"""
+        await self.appium.set_clipboard_text('')
+        if share_bounds:
+            await self.tap_bounds(share_bounds)
+        else:
+            by, value = self.selectors.SHARE_BUTTON_SELECTORS[0]
+            await self.appium.click(await self.appium.find_element(by, value))
+
+        async def copy_link_node():
+            return (await self.snapshot()).find_first(self.selectors.COPY_LINK_BUTTON_SELECTORS)
+
+        node = await self.wait_until(copy_link_node, CLIPBOARD_TIMEOUT_SECONDS, CLIPBOARD_POLL_SECONDS)
+        if node is None or not node.bounds:
+            logger.warning(f"[{self.bot_id}] NAV: Copy Link button not found. Closing share menu.")
+            await self.appium.back()
+            return None
+        await self.tap_bounds(node.bounds)
+
+        async def clipboard_url():
+            text = await self.appium.get_clipboard_text()
+            if text and text.startswith('http'):
+                return text
+            return None
+
+        url = await self.wait_until(clipboard_url, CLIPBOARD_TIMEOUT_SECONDS, CLIPBOARD_POLL_SECONDS)
+        if not url:
+            await self.appium.back()
+        return url
+
+    # --- 1本分の処理 ---
+
+    async def process_video(self) -> bool:
+        ctx: Dict[str, Any] = {'video_id': None, 'stage_seconds': {}}
+        status_from = 'INITIAL_COLLECTION'
+        stage, reason = None, None
+        try:
+            stage = 'snapshot'
+            fields = await self._timed(ctx, stage, self._snapshot_fields())
+            reason = self._filter(ctx, fields)
+            if reason is None:
+                stage = 'url'
+                url = await self._timed(ctx, stage, self.copy_video_url(fields['share_button_bounds']))
+                video_id = extract_video_id_from_url(url) if url else None
+                if not video_id:
+                    reason = f"Could not get Video ID (URL: {url})."
+                else:
+                    ctx['video_id'] = video_id
+                    status_from = f'COLLECTING (ID: {video_id})'
+                    stage = 'insert'
+                    reason = await self._timed(ctx, stage, self._insert(ctx, fields, url, status_from))
+        except Exception as e:
+            metrics.VIDEOS_TOTAL.inc(outcome='error')
+            log_decision(ctx['video_id'], 'error', bot_id=self.bot_id, stage=stage,
+                         reason=f"{type(e).__name__}: {e}", stage_seconds=ctx['stage_seconds'])
+            if ctx['video_id']:
+                await self.db.call('isolate_record_due_to_error', ctx['video_id'], str(e), status_from,
+                                   str(self.bot_id))
+            raise
+
+        if reason is None:
+            outcome = 'processed'
+            self.processed += 1
+            logger.info(f"[{self.bot_id}] SUCCESS: Collected new video. DB_ID: {ctx['video_id']} "
+                        f"(Likes: {ctx['likes']:,})")
+        else:
+            outcome = 'duplicate' if ctx.get('duplicate') else 'skipped'
+            logger.info(f"[{self.bot_id}] PROCESS: SKIPPED at stage '{ctx.get('rejected_stage', stage)}' "
+                        f"(ID: {ctx['video_id']}). Reason: {reason}")
+            if ctx['video_id'] and not ctx.get('duplicate'):
+                await self.db.call('isolate_record_due_to_error', ctx['video_id'], reason, status_from,
+                                   str(self.bot_id))
+        metrics.VIDEOS_TOTAL.inc(outcome=outcome)
+        log_decision(ctx['video_id'], outcome, bot_id=self.bot_id, source='RECOMMENDED', likes=ctx.get('likes'),
+                     stage=None if reason is None else ctx.get('rejected_stage', stage), reason=reason,
+                     stage_seconds=ctx['stage_seconds'])
+        return reason is None
+
+    async def _timed(self, ctx: Dict[str, Any], stage: str, awaitable: Awaitable[Any]) -> Any:
+        started = time.time()
+        outcome = 'error'
+        try:
+            result = await awaitable
+            outcome = 'rejected' if stage == 'insert' and result is not None else 'passed'
+            return result
+        finally:
+            elapsed = time.time() - started
+            ctx['stage_seconds'][stage] = round(elapsed, 3)
+            metrics.PIPELINE_STAGE_SECONDS.observe(elapsed, stage=stage, outcome=outcome)
+
+    async def _snapshot_fields(self) -> Dict[str, Any]:
+        fields = parse_video_fields(await self.snapshot(), self.selectors, self.pack)
+        self._last_signature = video_signature(fields)
+        return fields
+
+    def _filter(self, ctx: Dict[str, Any], fields: Dict[str, Any]) -> Optional[str]:
+        """スナップショットだけで判定できるフィルター (往復なし)。棄却理由を返す"""
+        ctx['likes'] = fields['likes_count']
+        checks = (
+            ('seen_cache', self._seen_cache_reason),
+            ('likes', lambda f: None if f['likes_count'] >= self.threshold else
+                f"Skipped: Likes ({f['likes_count']}) below threshold ({self.threshold})."),
+            ('photo', lambda f: None if f['is_video'] else "Skipped: Static Image Post detected."),
+            ('ad', lambda f: "Skipped: Ad post detected." if f.get('is_ad') else None),
+            ('blocklist', lambda f: f"Skipped: Channel '{f['channel_name']}' is blocklisted."
+                if f['channel_name'] in CHANNEL_BLOCKLIST else None),
+        )
+        for stage, check in checks:
+            reason = check(fields)
+            if reason is not None:
+                ctx['rejected_stage'] = stage
+                ctx['duplicate'] = stage == 'seen_cache'
+                return reason
+        return None
+
+    def _seen_cache_reason(self, fields: Dict[str, Any]) -> Optional[str]:
+        if self.fingerprint_cache is None:
+            return None
+        cached_video_id = self.fingerprint_cache.lookup(fields['channel_name'], fields['caption_text'],
+                                                        fields['likes_count'], fields.get('caption_truncated', False))
+        if cached_video_id:
+            return f"Already collected (ID {cached_video_id}, fingerprint cache hit)."
+        return None
+
+    async def _insert(self, ctx: Dict[str, Any], fields: Dict[str, Any], url: str, status_from: str) -> Optional[str]:
+        video_id = ctx['video_id']
+        metadata = {
+            'video_id': video_id,
+            'url': url,
+            'likes_count': fields['likes_count'],
+            'found_source': 'RECOMMENDED',
+            'searched_by_keyword': None,
+            'channel_name': fields['channel_name'],
+            'caption_text': fields['caption_text'],
+            'country_code': self.country,
+        }
+        result = await self.db.call('insert_new_video_record', metadata, None)
+        if result.startswith('ERROR_'):
+            logger.error(f"[{self.bot_id}] PROCESS: DB Insert failed: {result}")
+            return result
+        await self.db.call('log_history', video_id, status_from, WAITING_SCREENSHOT_CHECK,
+                           f"Successfully collected. Likes={fields['likes_count']:,}", str(self.bot_id))
+        self._remember(metadata)
+        return None
+
+    def _remember(self, metadata: Dict[str, Any]):
+        if self.fingerprint_cache is not None:
+            self.fingerprint_cache.add(metadata['channel_name'], metadata['caption_text'], metadata['likes_count'],
+                                       metadata['video_id'])
+
+    # --- リカバリ ---
+
+    async def diagnose(self) -> str:
+        """recovery.diagnose_screen で現在の画面を判定する。端末・セッションが応答しない場合は HUNG"""
+        try:
+            return recovery.diagnose_screen(await self.snapshot(), TIKTOK_PACKAGE_NAME, self.selectors)
+        except Exception as e:
+            if is_session_lost(e):
+                return recovery.HUNG
+            logger.debug("[%s] RECOVERY: Screen diagnosis failed: %s: %s", self.bot_id, type(e).__name__, e)
+            return recovery.UNKNOWN
+
+    async def recover(self, target: str, reason: str) -> recovery.RecoveryResult:
+        """
+        recovery.RecoveryManager と同じ段階 (安い順) で目的の画面に戻す。戻れなかった場合は ok=False。
+        端末・セッションが応答しない場合は AppiumSessionUnresponsive を送出する (run でセッションを作り直す)
+        """
+        started = time.perf_counter()
+        targets = recovery.TARGET_SCREENS[target]
+        ladder = recovery.LADDERS[target]
+        result = recovery.RecoveryResult(target, await self.diagnose())
+        screen = result.diagnosis
+
+        step = 0
+        while screen not in targets and screen != recovery.HUNG:
+            step = recovery.next_step(target, screen, step)
+            if step is None:
+                break
+            action = ladder[step]
+            result.actions.append(action)
+            screen = await self._apply_recovery(action, screen, targets)
+            step += 1
+
+        result.screen = screen
+        result.ok = screen in targets
+        result.seconds = time.perf_counter() - started
+        recovery.record_recovery(result, f"[{self.bot_id}] {reason}")
+        if screen == recovery.HUNG:
+            raise AppiumSessionUnresponsive(f"Session {self.appium.session_id} did not respond ({reason}).")
+        return result
+
+    async def _apply_recovery(self, action: str, screen: str, targets: Tuple[str, ...]) -> str:
+        try:
+            if action == 'dismiss':
+                node = (await self.snapshot()).find_first(self.selectors.POPUP_DISMISS_SELECTORS)
+                if node is not None and node.bounds:
+                    await self.tap_bounds(node.bounds)
+                elif screen == recovery.SHARE_SHEET:
+                    await self.appium.back()
+                else:
+                    return screen
+            elif action == 'back':
+                await self.appium.back()
+            elif action == 'home':
+                node = (await self.snapshot()).find_first(self.selectors.HOME_ICON_SELECTORS)
+                if node is None or not node.bounds:
+                    return screen
+                await self.tap_bounds(node.bounds)
+            elif action == 'activate':
+                await self.appium.activate_app(TIKTOK_PACKAGE_NAME)
+            elif action == 'deep_link':
+                if not RECOVERY_DEEP_LINK_URL:
+                    return screen
+                await self.appium.execute_script('mobile: deepLink', {'url': RECOVERY_DEEP_LINK_URL,
+                                                                      'package': TIKTOK_PACKAGE_NAME})
+            elif action == 'restart':
+                await self.reboot_app()
+        except Exception as e:
+            if is_session_lost(e):
+                return recovery.HUNG
+            logger.debug("[%s] RECOVERY: Action '%s' failed: %s: %s", self.bot_id, action, type(e).__name__, e)
+        return await self._settle(screen, targets)
+
+    async def _settle(self, before: str, targets: Tuple[str, ...]) -> str:
+        """操作後、画面が落ち着くまで診断し直す (終了条件は RecoveryManager._settle と同じ)"""
+        deadline = time.perf_counter() + RECOVERY_SETTLE_TIMEOUT_SECONDS
+        previous = None
+        while True:
+            screen = await self.diagnose()
+            if (screen in targets or screen != before or screen == previous
+                    or time.perf_counter() >= deadline):
+                return screen
+            previous = screen
+            await asyncio.sleep(RECOVERY_POLL_SECONDS)
+
+    async def recover_and_skip(self, error: Exception) -> bool:
+        """動画の処理に失敗した後、おすすめフィードに戻して次の動画へ進める (再起動した場合はスワイプしない)"""
+        result = await self.recover('home', f"{type(error).__name__}: {error}")
+        if not result.ok:
+            return False
+        if result.restarted:
+            return True
+        try:
+            if not await self.swipe_to_next_video():
+                logger.warning(f"[{self.bot_id}] COLLECTION: Feed did not move after recovery. Continuing anyway.")
+            return True
+        except Exception as e:
+            if is_session_lost(e):
+                raise
+            logger.error(f"[{self.bot_id}] COLLECTION: Swipe failed after recovery: {e}")
+            return False
+
+    # --- ループ ---
+
+    async def run_cycle(self, count: int):
+        """1本分の失敗ではセッションを作り直さず、リカバリして続ける (リカバリできなければサイクルを打ち切る)"""
+        logger.info(f"[{self.bot_id}] COLLECTION: Starting recommended feed cycle (Count: {count}).")
+        recoveries = 0
+        for _ in range(count):
+            try:
+                await self.process_video()
+                if not await self.swipe_to_next_video():
+                    logger.warning(f"[{self.bot_id}] COLLECTION: Feed did not move after retries. Continuing anyway.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.bot_id}] COLLECTION: Error processing video: {type(e).__name__}: {e}.")
+                logger.debug(traceback.format_exc())
+                recoveries += 1
+                if recoveries > RECOVERY_MAX_PER_CYCLE or not await self.recover_and_skip(e):
+                    logger.error(f"[{self.bot_id}] COLLECTION: Could not resume the recommended feed. "
+                                 f"Ending this cycle.")
+                    break
+        logger.info(f"[{self.bot_id}] COLLECTION: Cycle finished (Processed so far: {self.processed}).")
+
+    async def run(self):
+        """
+        セッションの開始に失敗した・端末が応答しない (リカバリの診断が HUNG) 場合のみ、
+        セッションを作り直して続行する (プロセス全体は止めない)
+        """
+        count = TEST_RECOMMENDED_VIDEOS_COUNT if IS_TEST_MODE else RECOMMENDED_VIDEOS_COUNT
+        while True:
+            try:
+                if self.appium is None:
+                    await self.start()
+                await self.run_cycle(count)
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.bot_id}] ASYNC: Device session failed: {e}. "
+                             f"Recreating the session in {ASYNC_ERROR_BACKOFF_SECONDS:.0f}s.")
+                logger.debug(traceback.format_exc())
+                await self.close()
+                await asyncio.sleep(ASYNC_ERROR_BACKOFF_SECONDS)
+
+
+# =====================================================================
+# III. ランタイム
+# =====================================================================
+
+async def run_devices(bot_ids: List[int]):
+    db = AsyncDBPool(ASYNC_DB_POOL_SIZE)
+    await db.start()
+    http_pool = AsyncHttpPool(APPIUM_URL, ASYNC_APPIUM_POOL_CONNECTIONS, ASYNC_COMMAND_TIMEOUT_SECONDS)
+    sessions: List[DeviceSession] = []
+    try:
+        if bot_ids:
+            configs = [await db.call('fetch_bot_configuration', bot_id) for bot_id in bot_ids]
+            missing = [bot_id for bot_id, config in zip(bot_ids, configs) if not config]
+            if missing:
+                logger.error(f"ASYNC: Configuration not found for BOT_ID={missing}. Check bot_configurations table.")
+            configs = [config for config in configs if config]
+        else:
+            configs = await db.call('fetch_active_bot_configurations')
+        if not configs:
+            logger.error("ASYNC: No bots to run.")
+            return
+
+        fingerprint_cache = None
+        if USE_FINGERPRINT_CACHE:
+            fingerprint_cache = VideoFingerprintCache(FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS)
+            fingerprint_cache.warm(await db.call('fetch_recent_video_fingerprints', FINGERPRINT_CACHE_WARM_ROWS))
+
+        sessions = [DeviceSession(config, http_pool, db, fingerprint_cache) for config in configs]
+        logger.info(f"ASYNC: Running {len(sessions)} devices in one process "
+                    f"(Bots: {[s.bot_id for s in sessions]}).")
+        tasks = []
+        for index, session in enumerate(sessions):
+            # 全端末が同時に Appium セッションを作らないよう、開始をずらす
+            tasks.append(asyncio.create_task(_staggered(session, index * FLEET_START_STAGGER_SECONDS),
+                                             name=f"bot-{session.bot_id}"))
+        await asyncio.gather(*tasks)
+    finally:
+        for session in sessions:
+            await session.close()
+        http_pool.close()
+        await db.close()
+
+
+async def _staggered(session: DeviceSession, delay_seconds: float):
+    await asyncio.sleep(delay_seconds + random.uniform(0, 1))
+    await session.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive several devices from one asyncio process.")
+    parser.add_argument('bot_ids', nargs='*', type=int, help="BOT_IDs to run (default: all active bots)")
+    args = parser.parse_args()
+
+    setup_logging_handlers('async_collector')
+    metrics.REGISTRY.set_constant_labels(runtime='async')
+    try:
+        asyncio.run(run_devices(args.bot_ids))
+    except KeyboardInterrupt:
+        logger.warning("ASYNC: KeyboardInterrupt received. Shutting down.")
+
+
+if __name__ == '__main__':
+    main()
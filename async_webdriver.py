@@ -0,0 +1,237 @@
+# =====================================================================
+# async_webdriver.py: asyncio 用の最小限の WebDriver (Appium) クライアント (V114)
+#
+# 1. HTTP/1.1 keep-alive の接続プールを asyncio のストリームで実装する (追加の依存なし)
+#    プールは Appium サーバーごとに1つ作り、全端末のセッションで共有する
+# 2. async_collector.py が使うコマンドだけを実装する
+#    (page_source / 要素検索・クリック / W3C Actions / スクリプト実行 / クリップボード / アプリ操作 / 設定)
+# 3. エラー応答 (W3C の {"value": {"error": ...}}) は AsyncWebDriverError として送出する
+# =====================================================================
+import asyncio
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app_logger import logger
+
+# W3C の要素参照キー (古い JSONWP の 'ELEMENT' も受け付ける)
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+
+class AsyncWebDriverError(Exception):
+    def __init__(self, status: int, error: str, message: str):
+        self.status = status
+        self.error = error
+        super().__init__(f"{error} (HTTP {status}): {message}")
+
+
+def is_session_lost(error: BaseException) -> bool:
+    """[V114 修正] セッション自体が使えなくなったか (Appium サーバーに届かない・応答しない・セッションが消えた)"""
+    if isinstance(error, AsyncWebDriverError):
+        return error.error in ('invalid session id', 'session not created')
+    return isinstance(error, (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError))
+
+
+class _Connection:
+    __slots__ = ('reader', 'writer')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHttpPool:
+    """1つの Appium サーバーへの keep-alive 接続プール (同時接続数の上限付き)"""
+
+    def __init__(self, base_url: str, max_connections: int, timeout_seconds: float):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout_seconds = timeout_seconds
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle: List[_Connection] = []
+        self.opened = 0
+
+    async def _open(self) -> _Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    async def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, Any]:
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        async with self._slots:
+            reused = bool(self._idle)
+            connection = self._idle.pop() if reused else await self._open()
+            try:
+                status, data, keep_alive = await asyncio.wait_for(
+                    self._round_trip(connection, method, path, payload), self.timeout_seconds)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                connection.close()
+                if not reused:
+                    raise
+                # サーバー側で閉じられた keep-alive 接続だった場合のみ、新しい接続で1回やり直す
+                logger.debug("ASYNC HTTP: Stale connection (%s). Retrying on a new connection.", e)
+                connection = await self._open()
+                try:
+                    status, data, keep_alive = await asyncio.wait_for(
+                        self._round_trip(connection, method, path, payload), self.timeout_seconds)
+                except BaseException:
+                    connection.close()
+                    raise
+            except BaseException:
+                connection.close()
+                raise
+            if keep_alive:
+                self._idle.append(connection)
+            else:
+                connection.close()
+        return status, (json.loads(data) if data else None)
+
+    async def _round_trip(self, connection: _Connection, method: str, path: str,
+                          payload: bytes) -> Tuple[int, bytes, bool]:
+        head = (f"{method} {self.prefix}{path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: keep-alive\r\n\r\n")
+        connection.writer.write(head.encode('latin-1') + payload)
+        await connection.writer.drain()
+
+        reader = connection.reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed before the response.")
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            return status, b''.join(chunks), keep_alive
+        if 'content-length' in headers:
+            return status, await reader.readexactly(int(headers['content-length'])), keep_alive
+        return status, await reader.read(), False
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle.clear()
+
+
+class AsyncAppiumSession:
+    """1端末分の WebDriver セッション"""
+
+    def __init__(self, pool: AsyncHttpPool, session_id: str, capabilities: Dict[str, Any]):
+        self.pool = pool
+        self.session_id = session_id
+        self.capabilities = capabilities
+
+    @classmethod
+    async def create(cls, pool: AsyncHttpPool, capabilities: Dict[str, Any]) -> 'AsyncAppiumSession':
+        status, data = await pool.request('POST', '/session',
+                                          {'capabilities': {'alwaysMatch': capabilities, 'firstMatch': [{}]}})
+        value = _unwrap(status, data)
+        session_id = value.get('sessionId') or (data or {}).get('sessionId')
+        if not session_id:
+            raise AsyncWebDriverError(status, 'session not created', f"No sessionId in response: {data}")
+        return cls(pool, session_id, value.get('capabilities', {}))
+
+    async def command(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Any:
+        status, data = await self.pool.request(method, f"/session/{self.session_id}{path}", body)
+        return _unwrap(status, data)
+
+    # --- 画面 ---
+
+    async def page_source(self) -> str:
+        return await self.command('GET', '/source')
+
+    async def window_size(self) -> Tuple[int, int]:
+        rect = await self.command('GET', '/window/rect')
+        return int(rect['width']), int(rect['height'])
+
+    async def find_element(self, using: str, value: str) -> str:
+        element = await self.command('POST', '/element', {'using': using, 'value': value})
+        return element.get(ELEMENT_KEY) or element['ELEMENT']
+
+    async def click(self, element_id: str):
+        await self.command('POST', f'/element/{element_id}/click', {})
+
+    # --- 操作 ---
+
+    async def perform_actions(self, payload: Dict[str, Any]):
+        await self.command('POST', '/actions', payload)
+
+    async def tap(self, x: int, y: int):
+        await self.perform_actions({'actions': [{
+            'type': 'pointer', 'id': 'finger1', 'parameters': {'pointerType': 'touch'},
+            'actions': [
+                {'type': 'pointerMove', 'duration': 0, 'x': x, 'y': y, 'origin': 'viewport'},
+                {'type': 'pointerDown', 'button': 0},
+                {'type': 'pause', 'duration': 50},
+                {'type': 'pointerUp', 'button': 0},
+            ],
+        }]})
+
+    async def back(self):
+        await self.command('POST', '/back', {})
+
+    async def execute_script(self, script: str, args: Dict[str, Any]) -> Any:
+        return await self.command('POST', '/execute/sync', {'script': script, 'args': [args]})
+
+    # --- クリップボード ---
+
+    async def get_clipboard_text(self) -> str:
+        encoded = await self.command('POST', '/appium/device/get_clipboard', {'contentType': 'plaintext'})
+        return base64.b64decode(encoded or '').decode('utf-8', errors='replace')
+
+    async def set_clipboard_text(self, text: str):
+        await self.command('POST', '/appium/device/set_clipboard',
+                           {'content': base64.b64encode(text.encode('utf-8')).decode('ascii'),
+                            'contentType': 'plaintext'})
+
+    # --- アプリ・設定 ---
+
+    async def activate_app(self, package: str):
+        await self.command('POST', '/appium/device/activate_app', {'appId': package})
+
+    async def terminate_app(self, package: str):
+        await self.command('POST', '/appium/device/terminate_app', {'appId': package})
+
+    async def query_app_state(self, package: str) -> int:
+        return int(await self.command('POST', '/appium/device/app_state', {'appId': package}))
+
+    async def update_settings(self, settings: Dict[str, Any]):
+        await self.command('POST', '/appium/settings', {'settings': settings})
+
+    async def quit(self):
+        try:
+            await self.command('DELETE', '')
+        except Exception as e:
+            logger.debug("ASYNC HTTP: deleteSession failed: %s", e)
+
+
+def _unwrap(status: int, data: Any) -> Any:
+    value = data.get('value') if isinstance(data, dict) else data
+    if status >= 400 or (isinstance(value, dict) and 'error' in value):
+        error = value.get('error', 'unknown error') if isinstance(value, dict) else 'unknown error'
+        message = value.get('message', '') if isinstance(value, dict) else str(data)
+        raise AsyncWebDriverError(status, error, message)
+    return value
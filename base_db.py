@@ -1,13 +1,46 @@
 # =====================================================================
 # base_db.py: 全てのDBクラスが継承する基盤層 (V26 - 安定版)
 # =====================================================================
+import logging
 import pymysql
 import pymysql.cursors
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Callable
 import time
 import traceback
 from app_logger import logger
 from config import MYSQL_CONFIG  # 接続設定を読み込む
+from config import DB_LOCK_RETRY_ATTEMPTS, DB_LOCK_RETRY_WAIT_SECONDS
+
+# ★ V120 修正: OperationalError はデータ・スキーマの問題 (1054/1292/1364 など) でも送出されるため、エラー番号で分類する
+# 2002/2003: 接続できない, 2006: サーバーが切断した, 2013: 通信中に切断された, 2055: 読み書きの失敗
+CONNECTION_LOST_ERRNOS = frozenset({2002, 2003, 2006, 2013, 2055})
+# 1205: ロック待ちタイムアウト, 1213: デッドロック (やり直せば書き込める)
+LOCK_CONFLICT_ERRNOS = frozenset({1205, 1213})
+
+
+def mysql_errno(error: Exception) -> Optional[int]:
+    """[V120 新規] PyMySQL の例外の MySQL エラー番号 (args[0])。番号が無い場合は None"""
+    args = getattr(error, 'args', ())
+    if args and isinstance(args[0], int):
+        return args[0]
+    return None
+
+
+def is_connection_error(error: Exception) -> bool:
+    """
+    [V120 新規] 接続・サーバー側の一時的な問題 (待てば書き込める) か。False ならデータ自体の問題
+    [V120 修正] OperationalError は接続が失われた番号の場合のみ。InterfaceError と通信 (OSError) は常に接続の問題
+    """
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    if isinstance(error, pymysql.err.OperationalError):
+        return mysql_errno(error) in CONNECTION_LOST_ERRNOS
+    return isinstance(error, (ConnectionError, OSError))
+
+
+def is_lock_conflict(error: Exception) -> bool:
+    """[V120 新規] ロック待ちタイムアウト・デッドロックか (トランザクションをやり直せば書き込める)"""
+    return isinstance(error, pymysql.err.MySQLError) and mysql_errno(error) in LOCK_CONFLICT_ERRNOS
 
 
 class BaseDB:
@@ -40,6 +73,9 @@ class BaseDB:
                 cursorclass=pymysql.cursors.DictCursor,
                 autocommit=False,
                 connect_timeout=10,
+                # ★ V120 追加: 応答の無いサーバーで止まり続けないよう、設定があれば読み書きにも上限を設ける
+                read_timeout=self.config.get('read_timeout'),
+                write_timeout=self.config.get('write_timeout'),
                 # ★ UTF-8MB4 (絵文字) 対応
                 charset='utf8mb4'
             )
@@ -57,6 +93,20 @@ class BaseDB:
             self._cur = None
             return False
 
+    def ensure_connection(self) -> bool:
+        """[V116 新規] 既存の接続が生きていれば再利用し (途中のトランザクションは取り消す)、切れていれば再接続する"""
+        if not self._conn:
+            return self.connect()
+        try:
+            self._conn.ping(reconnect=True)
+            self._conn.rollback()
+            return True
+        except pymysql.Error as e:
+            logger.warning(f"DB WARNING: Connection check failed ({e}). Reconnecting.")
+            self._conn = None
+            self._cur = None
+            return self.connect()
+
     def close(self):
         """DB接続とカーソルを閉じる"""
         try:
@@ -85,6 +135,28 @@ class BaseDB:
         if self._conn:
             self._conn.rollback()
 
+    def run_transaction(self, action: Callable[[], Any], attempts: int = DB_LOCK_RETRY_ATTEMPTS) -> Any:
+        """
+        [V120 新規] action を実行してコミットする。失敗した場合はロールバックして例外を送出する。
+        ロック待ちタイムアウト・デッドロックの場合のみ、attempts 回まで最初からやり直す。
+        """
+        attempt = 1
+        while True:
+            try:
+                result = action()
+                self.commit()
+                return result
+            except Exception as e:
+                try:
+                    self.rollback()
+                except Exception:
+                    pass
+                if not is_lock_conflict(e) or attempt >= attempts:
+                    raise
+                logger.warning(f"DB WARNING: Lock conflict ({e}). Retrying transaction ({attempt}/{attempts - 1}).")
+                time.sleep(DB_LOCK_RETRY_WAIT_SECONDS * attempt)
+                attempt += 1
+
     def start_transaction(self):
         """[V18 設計復元] トランザクションを明示的に開始する"""
         logger.debug("DB: Starting transaction.")
@@ -105,8 +177,11 @@ class BaseDB:
                 logger.error("DB ERROR: Connection failed. Query aborted.")
                 raise ConnectionError("DB接続が失われています。")
 
+        # ★ V112 修正: DEBUG が無効な場合はログ用の文字列を一切組み立てない
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         # SQLクエリをログに出力
-        logger.debug(f"DB EXECUTE: {sql[:100].strip()}...")
+        if debug_enabled:
+            logger.debug("DB EXECUTE: %s...", sql[:100].strip())
 
         # ★ バイナリダンプ撲滅対策 ★
         # params が存在し、それが bytes を含んでいないかチェック
@@ -116,7 +191,10 @@ class BaseDB:
                 params_tuple = (params,)
             else:
                 params_tuple = tuple(params)
+        else:
+            params_tuple = None  # パラメータなし
 
+        if params_tuple and debug_enabled:
             # ログ出力用の安全なパラメータリストを作成
             safe_params_log = []
             has_bytes = False
@@ -134,9 +212,7 @@ class BaseDB:
             # V26: ログが冗長すぎるため、bytes以外の場合でもデバッグレベルを下げるか検討
             # V34: ログレベルはDEBUGで固定
             if not has_bytes:
-                logger.debug(f"DB PARAMS: {safe_params_log}")
-        else:
-            params_tuple = None  # パラメータなし
+                logger.debug("DB PARAMS: %s", safe_params_log)
 
         try:
             # 実行時はオリジナルの params_tuple を使用
@@ -152,6 +228,34 @@ class BaseDB:
             self.rollback()
             raise
 
+    def execute_many(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        """
+        [V119 新規] 同じクエリを複数行分まとめて実行し、影響を与えた行数を返す。
+        INSERT ... VALUES (%s, ...) の形であれば PyMySQL が複数行の INSERT 1文にまとめて送る。
+        (params は件数だけをログに出す)
+        """
+        if not rows:
+            return 0
+        if not self._conn or not self._cur:
+            logger.warning("DB WARNING: Connection lost. Reconnecting...")
+            if not self.connect():
+                logger.error("DB ERROR: Connection failed. Query aborted.")
+                raise ConnectionError("DB接続が失われています。")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("DB EXECUTE MANY (%d rows): %s...", len(rows), sql[:100].strip())
+
+        try:
+            if self._cur:
+                return self._cur.executemany(sql, rows)
+            logger.error("DB ERROR: Cursor is not initialized.")
+            return 0
+        except pymysql.Error as e:
+            logger.error(f"DB ERROR: SQL execution failed ({len(rows)} rows): {e}")
+            logger.error(f"Failed SQL: {sql[:100].strip()}...")
+            self.rollback()
+            raise
+
     def fetchone(self, sql: str, params: Optional[Tuple[Any, ...]] = None) -> Optional[Dict[str, Any]]:
         """単一のレコードを取得する（読み取り操作）"""
         self.execute_query(sql, params)
@@ -2,21 +2,48 @@
 # collector_bot_main.py (V61 - V50の動作ロジックに回帰)
 # =====================================================================
 
+import os
 import sys
+import threading
 import time
 import traceback
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, Tuple
 from selenium.common.exceptions import TimeoutException
 
 # 依存モジュールのインポート
-from config import MIN_LIKES_DEFAULT, WAITING_SCREENSHOT_CHECK, ERROR_NEEDS_REVIEW
+from config import MIN_LIKES_DEFAULT, WAITING_SCREENSHOT_CHECK, DUPLICATE_CONTENT
+from config import WAITING_SCREENSHOT_ATTACH
 # ★ V57 修正: configから全ての収集定数をインポート
 from config import RECOMMENDED_VIDEOS_COUNT, SEARCHED_VIDEOS_COUNT
 from config import IS_TEST_MODE, TEST_RECOMMENDED_VIDEOS_COUNT, TEST_SEARCHED_VIDEOS_COUNT
 from config import APPIUM_HOST, APPIUM_PORT, LOG_LEVEL
-from tiktok_appium_helper import TiktokAppiumHelper, AndroidConnectionError
+from config import USE_SNAPSHOT_EXTRACTION
+from config import USE_FINGERPRINT_CACHE, FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS
+from config import FINGERPRINT_CACHE_WARM_ROWS
+from config import VIDEO_PIPELINE_ORDER, VIDEO_PIPELINE_AUTO_ORDER, CHANNEL_BLOCKLIST
+from config import CAPTURE_SCREENSHOTS
+from config import SCREENSHOT_ASYNC, SCREENSHOT_WORKERS, SCREENSHOT_QUEUE_MAX, SCREENSHOT_QUEUE_PUT_TIMEOUT_SECONDS
+from config import SCREENSHOT_CAPTURE_TIMEOUT_SECONDS, SCREENSHOT_ATTACH_WAIT_MAX_SECONDS
+from config import SCREENSHOT_STORE_ENABLED, SCREENSHOT_STORE_BACKEND, SCREENSHOT_STORE_OPTIONS
+from config import PHASH_ENABLED, PHASH_MAX_DISTANCE, PHASH_INDEX_WARM_ROWS
+from config import PHASH_MIN_SET_BITS, PHASH_MAX_BUCKET_SCAN
+from config import METRICS_ENABLED, METRICS_EXPORT_MODE, METRICS_TEXTFILE_DIR, METRICS_EXPORT_INTERVAL_SECONDS
+from config import METRICS_HTTP_HOST, METRICS_HTTP_PORT_BASE
+from config import RECOVERY_MAX_PER_CYCLE
+from config import DB_WRITE_BUFFER_ENABLED
+from config import MYSQL_CONFIG, DB_WRITER_ENABLED, DB_WRITER_QUERY_TIMEOUT_SECONDS, DB_SPOOL_DIR
+from tiktok_appium_helper import TiktokAppiumHelper, AndroidConnectionError, use_locale_for_country
 from tiktok_db_manager import TikTokDBManager
-from app_logger import logger, setup_logging_handlers
+from db_writer import BackgroundDBWriter
+from video_fingerprint_cache import VideoFingerprintCache
+from video_pipeline import PipelineStage, VideoPipeline
+from screenshot_worker import ScreenshotWorkerPool
+from screenshot_store import ScreenshotStore, create_screenshot_store
+from perceptual_hash import MultiIndexHashIndex, is_informative_hash
+from recovery import RecoveryManager
+import metrics
+import screenshot_codec
+from app_logger import logger, setup_logging_handlers, log_decision
 
 # --- グローバル変数 (Bot実行時に設定) ---
 BOT_ID: Optional[int] = None
@@ -25,6 +52,15 @@ MIN_LIKES_THRESHOLD: int = MIN_LIKES_DEFAULT
 APPIUM_DRIVER_HELPER: Optional[TiktokAppiumHelper] = None
 DB_MANAGER: Optional[TikTokDBManager] = None
 BOT_CONFIG: Optional[Dict[str, Any]] = None
+FINGERPRINT_CACHE: Optional[VideoFingerprintCache] = None
+VIDEO_PIPELINE: Optional[VideoPipeline] = None
+SCREENSHOT_POOL: Optional[ScreenshotWorkerPool] = None
+SCREENSHOT_STORE: Optional[ScreenshotStore] = None
+PHASH_INDEX: Optional[MultiIndexHashIndex] = None
+# ★ V108 修正: 転載元の検索と登録の間に別のワーカーが同じ動画を登録しないよう、2つをまとめてロックする
+PHASH_LINK_LOCK = threading.Lock()
+METRICS_EXPORTER: Optional[metrics.MetricsExporter] = None
+DB_WRITER: Optional[BackgroundDBWriter] = None
 
 
 # =====================================================================
@@ -50,9 +86,10 @@ def run_collector_bot():
 
     # ★ V57 修正: config.IS_TEST_MODE の値を直接ログ出力
     if IS_TEST_MODE:
-        logger.warning(f"!!! TEST MODE IS ACTIVE via config.py !!!")
+        logger.warning("!!! TEST MODE IS ACTIVE via config.py !!!")
 
     logger.info(f"Starting Collector Bot: {BOT_ID} (Test Mode: {IS_TEST_MODE})...")
+    start_metrics_export()
 
     # 1. 接続と設定の初期化
     if not initialize_bot_resources():
@@ -69,6 +106,7 @@ def run_collector_bot():
 
     # ★★★ V55 修正: 「おすすめ」と「検索」を交互に実行するメインループ ★★★
     cycle_counter = 0
+    resumed_without_progress = False  # ★ V116 追加: 直前の致命的エラーの後、セッションを作り直さずに再開したか
     while True:
         cycle_counter += 1
         logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: Starting full collection cycle.")
@@ -80,7 +118,19 @@ def run_collector_bot():
             # 2. オプティマイズ (検索) 収集 (機能②) を実行
             collect_via_search(search_count)
 
+            # ★ V119 追加: サイクルの終わりに書き込み待ちの行を書き込む
+            DB_MANAGER.flush_writes()
+            report_video_pipeline()
+            if FINGERPRINT_CACHE is not None:
+                logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: Fingerprint cache stats: {FINGERPRINT_CACHE.stats()}")
+            if SCREENSHOT_POOL is not None:
+                logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: Screenshot pool stats: {SCREENSHOT_POOL.stats()}")
+            if APPIUM_DRIVER_HELPER is not None and APPIUM_DRIVER_HELPER.transport is not None:
+                logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: {APPIUM_DRIVER_HELPER.transport.report()}")
+            if DB_WRITER is not None:
+                logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: DB writer stats: {DB_WRITER.stats()}")
             logger.info(f"[{BOT_ID}] MAIN CYCLE {cycle_counter}: Cycle finished. Sleeping for 10 seconds.")
+            resumed_without_progress = False
             time.sleep(10)  # 連続実行を防ぐための小休止
 
         except KeyboardInterrupt:
@@ -89,12 +139,21 @@ def run_collector_bot():
         except Exception as e:
             logger.critical(f"FATAL ERROR IN MAIN LOOP ({BOT_ID}): {e}")
             logger.critical(traceback.format_exc())
+
+            # ★ V116 追加: セッションと DB 接続が生きていれば、作り直さずにすぐ再開する
+            # (再開後のサイクルが完了する前に再び失敗した場合は、従来どおり待機してから作り直す)
+            if not resumed_without_progress and resume_live_resources():
+                resumed_without_progress = True
+                continue
+            resumed_without_progress = False
             time.sleep(60)
 
             # Appium接続が切れた場合は再初期化を試みる
             try:
+                if APPIUM_DRIVER_HELPER:
+                    APPIUM_DRIVER_HELPER.save_selector_stats()
                 if APPIUM_DRIVER_HELPER and APPIUM_DRIVER_HELPER.driver:
-                    APPIUM_DRIVER_HELPER.driver.quit()
+                    APPIUM_DRIVER_HELPER.quit()
             except:
                 pass
 
@@ -106,8 +165,20 @@ def run_collector_bot():
     # ループ終了後のクリーンアップ
     logger.info("MAIN: Bot loop terminated. Cleaning up resources.")
     try:
+        # ★ V119 追加: 書き込み後に渡すスクショがあるため、ワーカープールを止める前に書き込む
+        if DB_MANAGER:
+            DB_MANAGER.flush_writes()
+        if SCREENSHOT_POOL is not None:
+            SCREENSHOT_POOL.shutdown()
+        # ★ V120 追加: ワーカーが最後に預けた書き込みまで書き込む (書き込めなかった分はスプールに残り、次回の起動時に再送する)
+        if DB_WRITER is not None:
+            DB_WRITER.close()
+        if METRICS_EXPORTER is not None:
+            METRICS_EXPORTER.stop()
+        if APPIUM_DRIVER_HELPER:
+            APPIUM_DRIVER_HELPER.save_selector_stats()
         if APPIUM_DRIVER_HELPER and APPIUM_DRIVER_HELPER.driver:
-            APPIUM_DRIVER_HELPER.driver.quit()
+            APPIUM_DRIVER_HELPER.quit()
         if DB_MANAGER:
             DB_MANAGER.close()
     except Exception as e:
@@ -118,17 +189,67 @@ def run_collector_bot():
 # II. 接続と設定の初期化
 # =====================================================================
 
+def resume_live_resources() -> bool:
+    """[V116 新規] 致命的エラーの後、Appium セッションと DB 接続が生きていれば作り直さずに再開できる状態に戻す"""
+    if not APPIUM_DRIVER_HELPER or not DB_MANAGER:
+        return False
+    started = time.perf_counter()
+    if not DB_MANAGER.ensure_connection() or not APPIUM_DRIVER_HELPER.is_session_alive():
+        return False
+    APPIUM_DRIVER_HELPER.invalidate_snapshot()
+    if not APPIUM_DRIVER_HELPER.ensure_app_ready():
+        return False
+    logger.info(f"[{BOT_ID}] MAIN: Resumed on the live Appium session and DB connection "
+                f"in {time.perf_counter() - started:.1f}s.")
+    return True
+
+
+def start_metrics_export():
+    """[V111 新規] Bot ごとのメトリクス出力 (テキストファイル or ローカル HTTP) を開始する"""
+    global METRICS_EXPORTER
+    if not METRICS_ENABLED or METRICS_EXPORTER is not None:
+        return
+    metrics.REGISTRY.set_constant_labels(bot=BOT_ID)
+    try:
+        if METRICS_EXPORT_MODE == 'http':
+            METRICS_EXPORTER = metrics.MetricsExporter('http', host=METRICS_HTTP_HOST,
+                                                       port=METRICS_HTTP_PORT_BASE + BOT_ID)
+        else:
+            path = os.path.join(METRICS_TEXTFILE_DIR, f"tiktok_bot_{BOT_ID}.prom")
+            METRICS_EXPORTER = metrics.MetricsExporter('textfile', path=path,
+                                                       interval_seconds=METRICS_EXPORT_INTERVAL_SECONDS)
+    except Exception as e:
+        logger.warning(f"[{BOT_ID}] METRICS: Export could not be started: {e}. Metrics are still collected.")
+
+
 def initialize_bot_resources() -> bool:
     """DB, Appium接続、Bot設定、閾値設定の読み込みを全て実行する"""
-    global DB_MANAGER, APPIUM_DRIVER_HELPER, BOT_CONFIG, TARGET_COUNTRY_CODE, MIN_LIKES_THRESHOLD
+    global DB_MANAGER, APPIUM_DRIVER_HELPER, BOT_CONFIG, TARGET_COUNTRY_CODE, MIN_LIKES_THRESHOLD, FINGERPRINT_CACHE
+    global SCREENSHOT_POOL, SCREENSHOT_STORE, PHASH_INDEX, DB_WRITER
 
     logger.debug(f"[{BOT_ID}] INITIALIZE: Connecting to Database...")
-    try:
-        DB_MANAGER = TikTokDBManager()
-    except Exception as e:
-        logger.error(f"[{BOT_ID}] INITIALIZE: DB Manager initialization failed: {e}")
-        logger.error(traceback.format_exc())
-        return False
+    # ★ V116 修正: 再初期化時は既存の接続を使い続ける (テーブル作成の DDL を再実行しない)
+    if DB_MANAGER is not None and DB_MANAGER.ensure_connection():
+        logger.debug(f"[{BOT_ID}] INITIALIZE: Reusing the existing database connection.")
+    else:
+        # ★ V119 追加: 作り直す前の接続で書き込めなかった行は新しい接続に引き継ぐ
+        pending_writes = DB_MANAGER.write_buffer if DB_MANAGER is not None else None
+        try:
+            DB_MANAGER = TikTokDBManager()
+        except Exception as e:
+            logger.error(f"[{BOT_ID}] INITIALIZE: DB Manager initialization failed: {e}")
+            logger.error(traceback.format_exc())
+            return False
+        if pending_writes is not None:
+            DB_MANAGER.enable_write_buffer(buffer=pending_writes)
+    # ★ V120 追加: 書き込みはバックグラウンドのライターに任せる (MySQL に書き込めない間はローカルのスプールに溜める)
+    if DB_WRITER_ENABLED:
+        if DB_WRITER is None:
+            DB_WRITER = BackgroundDBWriter(_create_writer_db, os.path.join(DB_SPOOL_DIR, f"bot_{BOT_ID}.sqlite3"))
+            DB_WRITER.start()
+        DB_MANAGER.attach_writer(DB_WRITER)
+    elif DB_WRITE_BUFFER_ENABLED and DB_MANAGER.write_buffer is None:
+        DB_MANAGER.enable_write_buffer()
 
     logger.debug(f"[{BOT_ID}] INITIALIZE: Fetching bot configuration...")
     BOT_CONFIG = DB_MANAGER.fetch_bot_configuration(BOT_ID)
@@ -149,6 +270,14 @@ def initialize_bot_resources() -> bool:
         logger.error(f"[{BOT_ID}] INITIALIZE: Bot config is incomplete (Country, DeviceName, UDID required).")
         return False
 
+    # ★ V109 追加: 端末の表示言語に合わせたセレクタ・件数表記を使う (日本語以外の端末で全セレクタがタイムアウトするのを防ぐ)
+    try:
+        locale = use_locale_for_country(TARGET_COUNTRY_CODE)
+        logger.info(f"[{BOT_ID}] INITIALIZE: Using locale pack '{locale}' for {TARGET_COUNTRY_CODE}.")
+    except Exception as e:
+        logger.error(f"[{BOT_ID}] INITIALIZE: Locale pack could not be applied: {e}")
+        return False
+
     logger.debug(f"[{BOT_ID}] INITIALIZE: Initializing Appium driver (Device: {DEVICE_NAME}, UDID: {UDID})...")
     try:
         # ★ 修正: ADB連携のため、ホストとポートも渡す
@@ -162,18 +291,136 @@ def initialize_bot_resources() -> bool:
         logger.error(traceback.format_exc())
         return False
 
-    logger.debug(f"[{BOT_ID}] INITIALIZE: Rebooting TikTok App...")
-    if not APPIUM_DRIVER_HELPER.reboot_tiktok_app():
+    # ★ V116 修正: 既存のセッションに再接続した場合は、ホームフィードが操作可能なら再起動を省略する
+    if APPIUM_DRIVER_HELPER.reattached:
+        app_ready = APPIUM_DRIVER_HELPER.ensure_app_ready()
+    else:
+        logger.debug(f"[{BOT_ID}] INITIALIZE: Rebooting TikTok App...")
+        app_ready = APPIUM_DRIVER_HELPER.reboot_tiktok_app()
+    if not app_ready:
         logger.warning(f"[{BOT_ID}] INITIALIZE: TikTok app reboot failed, continuing anyway.")
 
     logger.debug(f"[{BOT_ID}] INITIALIZE: Fetching Like Threshold for {TARGET_COUNTRY_CODE}...")
     threshold = DB_MANAGER.get_like_threshold(TARGET_COUNTRY_CODE)
     MIN_LIKES_THRESHOLD = threshold if threshold is not None else MIN_LIKES_DEFAULT
 
+    # ★ V100 追加: 指紋キャッシュの生成と事前ロード (再初期化時は既存のキャッシュを引き継ぐ)
+    if USE_FINGERPRINT_CACHE and FINGERPRINT_CACHE is None:
+        FINGERPRINT_CACHE = VideoFingerprintCache(FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS)
+        try:
+            FINGERPRINT_CACHE.warm(DB_MANAGER.fetch_recent_video_fingerprints(FINGERPRINT_CACHE_WARM_ROWS))
+        except Exception as e:
+            logger.warning(f"[{BOT_ID}] INITIALIZE: Fingerprint cache warm-up failed: {e}. Starting empty.")
+
+    # ★ V107 追加: スクリーンショットの保存先 (DB には参照のみを記録する)
+    if CAPTURE_SCREENSHOTS and SCREENSHOT_STORE_ENABLED and SCREENSHOT_STORE is None:
+        SCREENSHOT_STORE = create_screenshot_store(SCREENSHOT_STORE_BACKEND, **SCREENSHOT_STORE_OPTIONS)
+
+    # ★ V108 追加: 転載動画検出用の知覚ハッシュ・インデックス (ハッシュの計算には Pillow が必要)
+    if CAPTURE_SCREENSHOTS and PHASH_ENABLED and screenshot_codec.is_available() and PHASH_INDEX is None:
+        PHASH_INDEX = MultiIndexHashIndex(max_bucket_scan=PHASH_MAX_BUCKET_SCAN)
+        started = time.time()
+        try:
+            for row in DB_MANAGER.fetch_perceptual_hashes(PHASH_INDEX_WARM_ROWS):
+                # ★ V108 修正: 単色・暗転フレームのハッシュ (修正前に記録されたもの) は読み込まない
+                if is_informative_hash(int(row['screenshot_phash']), PHASH_MIN_SET_BITS):
+                    PHASH_INDEX.add(int(row['screenshot_phash']), row['video_id'])
+            logger.info(f"[{BOT_ID}] INITIALIZE: Perceptual hash index loaded ({len(PHASH_INDEX):,} hashes, "
+                        f"{time.time() - started:.1f}s).")
+        except Exception as e:
+            logger.warning(f"[{BOT_ID}] INITIALIZE: Perceptual hash index warm-up failed: {e}. Starting empty.")
+
+    # ★ V106 追加: スクリーンショットのワーカープール (再初期化時は既存のプールを引き継ぐ)
+    if CAPTURE_SCREENSHOTS and SCREENSHOT_ASYNC and SCREENSHOT_POOL is None:
+        SCREENSHOT_POOL = ScreenshotWorkerPool(
+            SCREENSHOT_WORKERS, SCREENSHOT_QUEUE_MAX, SCREENSHOT_QUEUE_PUT_TIMEOUT_SECONDS,
+            SCREENSHOT_CAPTURE_TIMEOUT_SECONDS,
+            encoder=lambda data, raw: APPIUM_DRIVER_HELPER.encode_screenshot_data(data, raw),
+            store_factory=_create_screenshot_store,
+            # store を作れなかった場合の解除 (再初期化後の DB_MANAGER を使うよう呼び出し時に参照する)
+            release=lambda video_id: DB_MANAGER.release_screenshot_wait(video_id))
+        released = DB_MANAGER.release_stale_screenshot_waits(SCREENSHOT_ATTACH_WAIT_MAX_SECONDS)
+        if released:
+            logger.warning(f"[{BOT_ID}] INITIALIZE: Released {released} stale screenshot waits for review.")
+
     logger.info(f"[{BOT_ID}] INITIALIZE: Initialization complete. Threshold={MIN_LIKES_THRESHOLD}")
     return True
 
 
+def _create_writer_db() -> TikTokDBManager:
+    """[V120 新規] ライタースレッド専用の接続 (応答しないサーバーで書き込みが止まり続けないよう読み書きに上限を設ける)"""
+    return TikTokDBManager(dict(MYSQL_CONFIG, read_timeout=DB_WRITER_QUERY_TIMEOUT_SECONDS,
+                                write_timeout=DB_WRITER_QUERY_TIMEOUT_SECONDS))
+
+
+def _create_screenshot_store():
+    """[V106 新規] ワーカースレッドごとに専用のDB接続を作り、スクショ添付用の関数を返す (pymysql の接続はスレッド間で共有しない)"""
+    # ★ V120 修正: ライターがある場合、DB_MANAGER の書き込みはキューに入れるだけのため接続を作らずに共有する
+    # (挿入と同じキューを通るため、スクショの添付は必ず挿入の後に書き込まれる)
+    db = DB_MANAGER if DB_WRITER is not None else TikTokDBManager()
+
+    def store(video_id: str, data: Optional[bytes], info: Dict[str, Any]) -> bool:
+        # ★ V106 修正: 添付できなかった場合 (data=None) もスクショ無しで確認 Bot に渡せるよう添付待ちを解除する
+        if data is None:
+            db.release_screenshot_wait(video_id)
+            return False
+        # ★ V108 追加: 挿入後に判明した転載は、ここで元動画に紐付ける
+        # (★ V106 修正: 添付で確認待ちになる前に紐付けるため、添付より先に行う)
+        if info.get('phash') is not None and PHASH_INDEX is not None:
+            link_perceptual_duplicate(db, video_id, info['phash'])
+        # ★ V107 修正: ストアがあればファイルに保存し、DBにはダイジェストと寸法のみを記録する
+        if SCREENSHOT_STORE is None:
+            return db.update_video_screenshot(video_id, data)
+        ref = SCREENSHOT_STORE.save(data, info.get('width'), info.get('height'))
+        stored = db.update_video_screenshot_ref(video_id, ref['digest'], ref['width'], ref['height'])
+        if not stored:
+            SCREENSHOT_STORE.discard(ref)  # ★ V107 修正: 参照を記録できなかったファイルは残さない
+        return stored
+
+    return store
+
+
+def find_perceptual_duplicate(video_id: str, phash: int) -> Optional[Tuple[int, str]]:
+    """
+    [V108 新規] インデックスから転載元 (距離, video_id) を探す。自分自身は除く
+    ★ V108 修正: 情報量の少ないハッシュは無関係な動画と一致するため探さない
+    """
+    if not is_informative_hash(phash, PHASH_MIN_SET_BITS):
+        return None
+    for distance, candidate_id in PHASH_INDEX.query(phash, PHASH_MAX_DISTANCE):
+        if candidate_id != video_id:
+            return distance, candidate_id
+    return None
+
+
+def register_perceptual_hash(video_id: str, phash: int):
+    """[V108 新規] 元動画としてインデックスに登録する (情報量の少ないハッシュは登録しない)"""
+    if is_informative_hash(phash, PHASH_MIN_SET_BITS):
+        PHASH_INDEX.add(phash, video_id)
+
+
+def link_perceptual_duplicate(db: TikTokDBManager, video_id: str, phash: int) -> Optional[str]:
+    """
+    [V108 新規] 挿入済みのレコードに知覚ハッシュを記録する。
+    転載元が見つかれば DUPLICATE_CONTENT として紐付けてその ID を返し、見つからなければ元動画としてインデックスに登録する。
+    """
+    with PHASH_LINK_LOCK:
+        match = find_perceptual_duplicate(video_id, phash)
+        if match is None:
+            register_perceptual_hash(video_id, phash)
+    if match is None:
+        db.update_video_phash(video_id, phash)
+        return None
+    distance, canonical_video_id = match
+    # ★ V120 修正: 履歴は紐付けた場合のみ、同じ書き込みの中で記録する
+    if not db.update_video_phash(video_id, phash, canonical_video_id,
+                                 f"Near-duplicate of {canonical_video_id} (Distance={distance}).", str(BOT_ID)):
+        logger.debug(f"PHASH: {video_id} matches {canonical_video_id} but is no longer waiting. Not linked.")
+        return None
+    logger.info(f"PHASH: {video_id} linked to {canonical_video_id} (Distance: {distance}).")
+    return canonical_video_id
+
+
 # =====================================================================
 # III. 収集戦略
 # =====================================================================
@@ -200,24 +447,17 @@ def collect_via_search(count: int):
     try:
         APPIUM_DRIVER_HELPER.perform_search(search_word)
 
-    except TimeoutException as e_timeout:
-        logger.error(f"COLLECTION: perform_search failed (Timeout): {e_timeout}. Rebooting.")
-        APPIUM_DRIVER_HELPER.reboot_tiktok_app()
-        return
-
     except Exception as e:
         logger.warning(
             f"COLLECTION: perform_search failed (e.g., no videos found or ad-only): {e}. Skipping this search word.")
         # ★ V61 修正: 検索失敗時はホームに戻る
-        try:
-            APPIUM_DRIVER_HELPER._recover_from_search_menu_to_home()
-        except Exception as recover_e:
-            logger.error(f"COLLECTION: Recovery failed: {recover_e}. Rebooting.")
-            APPIUM_DRIVER_HELPER.reboot_tiktok_app()
+        # ★ V117 修正: 画面を診断し、安い操作から順に試してホームに戻す (再起動は最後の手段)
+        recover_screen('home', f"perform_search: {type(e).__name__}")
         return
 
     # perform_searchが成功した場合のみ、以下のループが実行される
     processed_count = 0
+    recoveries = 0
     for i in range(count):
         logger.debug(
             f"[{BOT_ID}] COLLECTION: Processing search video {i + 1}/{count} (Keyword: {search_word}).")
@@ -230,29 +470,23 @@ def collect_via_search(count: int):
 
             # 4. 次の動画へスワイプ (★V61 修正: V50ロジック)
             logger.debug("COLLECTION: Swiping to next search video.")
-            APPIUM_DRIVER_HELPER.swipe_up()
+            if not APPIUM_DRIVER_HELPER.swipe_to_next_video():
+                logger.warning(f"[{BOT_ID}] COLLECTION: Feed did not move after retries. Continuing anyway.")
 
-        except TimeoutException as e:
-            logger.warning(f"[{BOT_ID}] TIMEOUT: Error processing search video (Timeout): {e}. Skipping video.")
-            try:
-                APPIUM_DRIVER_HELPER.swipe_up()
-            except Exception as swipe_e:
-                logger.error(f"[{BOT_ID}] CRITICAL: Swipe failed after Timeout. Rebooting App. Error: {swipe_e}")
-                break
         except Exception as e:
-            logger.error(f"[{BOT_ID}] CRITICAL: Error processing search video: {e}. Rebooting App.")
-            logger.error(traceback.format_exc())
-            APPIUM_DRIVER_HELPER.reboot_tiktok_app()
-            break
+            log_collection_error('search', e)
+            # ★ V117 修正: 再起動してサイクルを打ち切るのではなく、検索の動画フィードに戻して次の動画から続ける
+            # (ホーム・検索画面まで戻ってしまった場合は検索条件が失われているため、このキーワードを終える)
+            recoveries += 1
+            if recoveries > RECOVERY_MAX_PER_CYCLE or not recover_and_skip('video_feed', e):
+                logger.error(f"[{BOT_ID}] COLLECTION: Could not resume the search feed. Ending this search word.")
+                break
 
     logger.info(f"[{BOT_ID}] COLLECTION: Finished search collection (Target: {count}, Processed: {processed_count}).")
     # ★ V61 修正: 検索終了後、ホームに戻る
-    try:
-        logger.debug("COLLECTION: Returning to home after search cycle.")
-        APPIUM_DRIVER_HELPER._recover_from_search_menu_to_home()
-    except Exception as e:
-        logger.error(f"COLLECTION: Failed to return home after search: {e}. Rebooting.")
-        APPIUM_DRIVER_HELPER.reboot_tiktok_app()
+    # ★ V117 修正: 固定回数の「戻る」ではなく、画面を診断しながらホームに戻す
+    logger.debug("COLLECTION: Returning to home after search cycle.")
+    recover_screen('home', 'search cycle finished')
 
 
 def collect_via_recommended(count: int):
@@ -266,21 +500,19 @@ def collect_via_recommended(count: int):
     # 1. ホーム画面への移動
     try:
         APPIUM_DRIVER_HELPER.collect_via_recommended()
-    except TimeoutException as e:
-        logger.error(f"[{BOT_ID}] CRITICAL: Timeout navigating to recommended feed: {e}. Rebooting App.")
-        APPIUM_DRIVER_HELPER.reboot_tiktok_app()
-        return
     except Exception as e:
-        logger.error(f"[{BOT_ID}] CRITICAL: Error navigating to recommended feed: {e}. Rebooting App.")
-        APPIUM_DRIVER_HELPER.reboot_tiktok_app()
-        return
+        logger.error(f"[{BOT_ID}] CRITICAL: Error navigating to recommended feed: {e}. Recovering.")
+        # ★ V117 修正: 再起動ではなく、画面を診断して安い操作から順に試す
+        if not recover_screen('home', f"navigate to recommended: {type(e).__name__}"):
+            return
 
     # ★★★ V61 修正: 「予防的スワイプ」を削除 ★★★
     # V50 (動作していたバージョン) は1本目の動画から処理していた。
 
     processed_count = 0
+    recoveries = 0
     for i in range(count):
-        logger.debug(f"[{BOT_ID}] COLLECTION: Processing recommended video {i + 1}/{count}")
+        logger.debug("[%s] COLLECTION: Processing recommended video %d/%d", BOT_ID, i + 1, count)
 
         try:
             # 2. 情報を収集し、DBに保存 (1本目の動画から)
@@ -290,142 +522,392 @@ def collect_via_recommended(count: int):
 
             # 3. 次の動画へスワイプ (★V61 修正: V50ロジック)
             logger.debug("COLLECTION: Swiping to next recommended video.")
-            APPIUM_DRIVER_HELPER.swipe_up()
+            if not APPIUM_DRIVER_HELPER.swipe_to_next_video():
+                logger.warning(f"[{BOT_ID}] COLLECTION: Feed did not move after retries. Continuing anyway.")
 
-        except TimeoutException as e:
-            logger.warning(f"[{BOT_ID}] TIMEOUT: Error processing recommended video (Timeout): {e}. Skipping video.")
-            try:
-                APPIUM_DRIVER_HELPER.swipe_up()
-            except Exception as swipe_e:
-                logger.error(f"[{BOT_ID}] CRITICAL: Swipe failed after Timeout. Rebooting App. Error: {swipe_e}")
-                break
         except Exception as e:
-            logger.error(f"[{BOT_ID}] CRITICAL: Error processing recommended video: {e}. Rebooting App.")
-            logger.error(traceback.format_exc())
-            APPIUM_DRIVER_HELPER.reboot_tiktok_app()
-            break
+            log_collection_error('recommended', e)
+            # ★ V117 修正: 再起動してサイクルを打ち切るのではなく、おすすめフィードに戻して次の動画から続ける
+            recoveries += 1
+            if recoveries > RECOVERY_MAX_PER_CYCLE or not recover_and_skip('home', e):
+                logger.error(f"[{BOT_ID}] COLLECTION: Could not resume the recommended feed. Ending this cycle.")
+                break
 
     logger.info(
         f"[{BOT_ID}] COLLECTION: Finished recommended collection (Target: {count}, Processed: {processed_count}).")
 
 
+def log_collection_error(feed: str, error: Exception):
+    if isinstance(error, TimeoutException):
+        # 要素探索のタイムアウト (リカバリ可能)
+        logger.warning(f"[{BOT_ID}] TIMEOUT: Error processing {feed} video (Timeout): {error}.")
+    else:
+        logger.error(f"[{BOT_ID}] CRITICAL: Error processing {feed} video: {error}.")
+        logger.error(traceback.format_exc())
+
+
+def recover_screen(target: str, reason: str) -> bool:
+    """[V117 新規] 画面を診断し、目的の画面 (recovery.TARGET_SCREENS) に戻す"""
+    return RecoveryManager(APPIUM_DRIVER_HELPER).recover(target, reason).ok
+
+
+def recover_and_skip(target: str, error: Exception) -> bool:
+    """
+    [V117 新規] 動画の処理に失敗した後、目的の画面に戻して次の動画へ進める。
+    アプリを再起動した場合は新しいフィードの先頭から続ける (スワイプしない)。
+    """
+    result = RecoveryManager(APPIUM_DRIVER_HELPER).recover(target, f"{type(error).__name__}: {error}")
+    if not result.ok:
+        return False
+    if result.restarted:
+        return True
+    try:
+        if not APPIUM_DRIVER_HELPER.swipe_to_next_video():
+            logger.warning(f"[{BOT_ID}] COLLECTION: Feed did not move after recovery. Continuing anyway.")
+        return True
+    except Exception as e:
+        logger.error(f"[{BOT_ID}] COLLECTION: Swipe failed after recovery: {e}")
+        return False
+
+
 # =====================================================================
 # IV. 単一動画の収集ロジック (エラーハンドリング含む)
+#
+# ★ V101 修正: 各処理を名前付きステージとしてパイプライン化し、
+# 安価で棄却率の高いフィルター (いいね数/静止画/広告/ブロックリスト) を
+# 高コストなURL取得 (シェアメニュー) より前に実行する。実行順は config.VIDEO_PIPELINE_ORDER。
 # =====================================================================
 
+def _stage_snapshot(ctx: Dict[str, Any]) -> Optional[str]:
+    """page_source を1回だけ取得し、以降のステージが使うメタデータを評価する"""
+    if USE_SNAPSHOT_EXTRACTION:
+        ctx['fields'] = APPIUM_DRIVER_HELPER.extract_video_snapshot()
+    return None
+
+
+def _stage_seen_cache(ctx: Dict[str, Any]) -> Optional[str]:
+    """[V100] 指紋キャッシュで収集済みの動画を判定する"""
+    fields = ctx.get('fields')
+    if FINGERPRINT_CACHE is None or not fields:
+        return None
+    # ★ V100 修正: 省略されたキャプションでは別動画と区別できないため判定しない
+    cached_video_id = FINGERPRINT_CACHE.lookup(fields['channel_name'], fields['caption_text'], fields['likes_count'],
+                                               fields.get('caption_truncated', False))
+    if cached_video_id:
+        ctx['duplicate'] = True
+        return f"Already collected (ID {cached_video_id}, fingerprint cache hit)."
+    return None
+
+
+def _stage_likes(ctx: Dict[str, Any]) -> Optional[str]:
+    """いいね数の閾値フィルター"""
+    fields = ctx.get('fields')
+    likes = fields['likes_count'] if fields else APPIUM_DRIVER_HELPER.get_like_count()
+    ctx['likes'] = likes
+    logger.debug("PROCESS: Read Likes=%s. Threshold=%s", likes, MIN_LIKES_THRESHOLD)
+    if not APPIUM_DRIVER_HELPER.is_likes_above_threshold(likes, MIN_LIKES_THRESHOLD):
+        return f"Skipped: Likes ({likes}) below threshold ({MIN_LIKES_THRESHOLD})."
+    return None
+
+
+def _stage_photo(ctx: Dict[str, Any]) -> Optional[str]:
+    """静止画 (Photo) 投稿のフィルター"""
+    fields = ctx.get('fields')
+    is_video = fields['is_video'] if fields else APPIUM_DRIVER_HELPER.is_video_post()
+    if not is_video:
+        return "Skipped: Static Image Post detected."
+    return None
+
+
+def _stage_ad(ctx: Dict[str, Any]) -> Optional[str]:
+    """広告投稿のフィルター (スナップショットがある場合のみ。無い場合は追加の往復を避けて判定しない)"""
+    fields = ctx.get('fields')
+    if fields and fields.get('is_ad'):
+        return "Skipped: Ad post detected."
+    return None
+
+
+def _stage_blocklist(ctx: Dict[str, Any]) -> Optional[str]:
+    """ブロックリストに登録されたチャンネルのフィルター"""
+    if not CHANNEL_BLOCKLIST:
+        return None
+    channel_name = _read_channel_and_caption(ctx)['channel_name']
+    if channel_name in CHANNEL_BLOCKLIST:
+        return f"Skipped: Channel '{channel_name}' is blocklisted."
+    return None
+
+
+def _stage_url(ctx: Dict[str, Any]) -> Optional[str]:
+    """シェアメニュー経由でURLとVideoIDを取得する (最も高コスト)"""
+    fields = ctx.get('fields')
+    url = APPIUM_DRIVER_HELPER.get_current_video_url_full(
+        share_button_bounds=fields['share_button_bounds'] if fields else None)
+    if not url:
+        return "URL/Video ID extraction failed."
+    video_id = APPIUM_DRIVER_HELPER._extract_video_id_from_url(url)
+    if not video_id:
+        return f"Could not parse Video ID from URL: {url}."
+    ctx['url'] = url
+    ctx['video_id'] = video_id
+    ctx['status_from'] = f'COLLECTING (ID: {video_id})'
+    return None
+
+
+def _stage_metadata(ctx: Dict[str, Any]) -> Optional[str]:
+    """DB挿入用のメタデータを組み立てる"""
+    ui = _read_channel_and_caption(ctx, full_caption=True)
+    ctx['metadata'].update({
+        'likes_count': ctx.get('likes', 0),
+        'found_source': ctx['source'],
+        'searched_by_keyword': ctx['keyword'],
+        'channel_name': ui.get('channel_name', 'N/A'),
+        'caption_text': ui.get('caption_text', ''),
+        'country_code': TARGET_COUNTRY_CODE,
+    })
+    # ★ V38 新ロジック 4: スクショ取得
+    # ★ V105 修正: exec-out での直接取得 + 縮小・再エンコードで十分安価になったため再有効化
+    # ★ V106 修正: ワーカープールがある場合はシャッターまでだけ待ち、受信・エンコード・DB添付は挿入後に非同期で行う
+    ctx['screenshot'] = None
+    if CAPTURE_SCREENSHOTS and SCREENSHOT_POOL is not None:
+        ctx['screenshot_capture'] = APPIUM_DRIVER_HELPER.start_screenshot_capture()
+    elif CAPTURE_SCREENSHOTS:
+        ctx['screenshot'] = APPIUM_DRIVER_HELPER.get_screenshot_binary_via_adb()
+        info = (APPIUM_DRIVER_HELPER.last_screenshot_info or {}) if ctx['screenshot'] else {}
+        if ctx['screenshot'] and SCREENSHOT_STORE is not None:
+            # ★ V107 修正: ファイルは挿入に成功してから書き込む (失敗・重複の動画のファイルを残さない)
+            ref = SCREENSHOT_STORE.reference(ctx['screenshot'], info.get('width'), info.get('height'))
+            ctx['metadata'].update({'screenshot_digest': ref['digest'], 'screenshot_width': ref['width'],
+                                    'screenshot_height': ref['height']})
+            ctx['screenshot_file'] = ctx['screenshot']
+            ctx['screenshot'] = None
+        # ★ V108 追加: 同期取得では挿入前に転載かどうか判定できるため、最初から DUPLICATE_CONTENT で挿入する
+        if info.get('phash') is not None and PHASH_INDEX is not None:
+            ctx['metadata']['screenshot_phash'] = info['phash']
+            match = find_perceptual_duplicate(ctx['video_id'], info['phash'])
+            if match is not None:
+                ctx['metadata'].update({'analysis_status': DUPLICATE_CONTENT, 'canonical_video_id': match[1]})
+                logger.info(f"PHASH: {ctx['video_id']} is a near-duplicate of {match[1]} (Distance: {match[0]}).")
+    return None
+
+
+def _stage_insert(ctx: Dict[str, Any]) -> Optional[str]:
+    """DBへの挿入と成功履歴の記録"""
+    video_id = ctx['video_id']
+    metadata = ctx['metadata']
+    metadata['url'] = ctx['url']
+    metadata['video_id'] = video_id
+
+    # ★ V106 修正: スクショを後から添付する場合は添付待ちで挿入し、確認 Bot がスクショ無しで取らないようにする
+    # (ワーカーが添付した時点で WAITING_SCREENSHOT_CHECK になる)
+    if ctx.get('screenshot_capture') is not None and SCREENSHOT_POOL is not None:
+        metadata.setdefault('analysis_status', WAITING_SCREENSHOT_ATTACH)
+
+    logger.debug("PROCESS: (Insert) Inserting record into DB for ID: %s (Source: %s)", video_id, ctx['source'])
+    insert_result = DB_MANAGER.insert_new_video_record(metadata, ctx.get('screenshot'))
+
+    if insert_result == 'DUPLICATE':
+        ctx['duplicate'] = True
+        remember_collected_video(metadata)
+        return f"ID {video_id} is DUPLICATE."
+    elif insert_result.startswith('ERROR_'):
+        logger.error(f"PROCESS: DB Insert failed: {insert_result}")
+        return insert_result
+
+    # 成功履歴を記録 (V42: ログメッセージ修正)
+    log_message = f"Successfully collected. Likes={ctx.get('likes', 0):,}"
+    # ★ V108 修正: 転載と判定済みの場合は DUPLICATE_CONTENT (元動画ID を添える)
+    status_to = metadata.get('analysis_status', WAITING_SCREENSHOT_CHECK)
+    if metadata.get('canonical_video_id'):
+        log_message += f". Near-duplicate of {metadata['canonical_video_id']}"
+    DB_MANAGER.log_history(video_id, ctx['status_from'], status_to, log_message, str(BOT_ID))
+    remember_collected_video(metadata)
+    if metadata.get('screenshot_phash') is not None and not metadata.get('canonical_video_id'):
+        register_perceptual_hash(video_id, metadata['screenshot_phash'])
+    screenshot_file = ctx.pop('screenshot_file', None)
+    if screenshot_file is not None:
+        DB_MANAGER.after_flush(lambda: _save_screenshot_file(video_id, screenshot_file))
+    capture = ctx.pop('screenshot_capture', None)
+    if capture is not None and SCREENSHOT_POOL is not None:
+        # ★ V119 修正: ワーカーは挿入済みのレコードを UPDATE するため、書き込みバッファのコミット後に渡す
+        DB_MANAGER.after_flush(lambda: _submit_screenshot(video_id, capture))
+    return None
+
+
+def _save_screenshot_file(video_id: str, data: bytes):
+    """[V107 新規] 挿入 (のコミット) 後に、同期取得したスクショをストアに書き込む"""
+    try:
+        SCREENSHOT_STORE.save(data)
+    except Exception as e:
+        logger.error(f"SCREENSHOT STORE: Could not save the screenshot for {video_id}: {e}")
+
+
+def _submit_screenshot(video_id: str, capture):
+    """[V106 新規] ワーカーに渡す。キューが満杯で破棄された場合は添付待ちを解除する"""
+    if not SCREENSHOT_POOL.submit(video_id, capture):
+        DB_MANAGER.release_screenshot_wait(video_id)
+
+
+def _read_channel_and_caption(ctx: Dict[str, Any], full_caption: bool = False) -> Dict[str, Any]:
+    """チャンネル名とキャプションを (スナップショットがあればそこから) 1回だけ読み取ってキャッシュする"""
+    ui = ctx.get('ui')
+    if ui is None:
+        fields = ctx.get('fields')
+        if fields:
+            ui = {'channel_name': fields['channel_name'], 'caption_text': fields['caption_text'],
+                  'caption_truncated': fields['caption_truncated']}
+        else:
+            ui = APPIUM_DRIVER_HELPER.scrape_video_data(TARGET_COUNTRY_CODE)
+            ui['caption_truncated'] = False
+        ctx['ui'] = ui
+    if full_caption and ui.get('caption_truncated'):
+        # 「もっと見る」で省略されている場合のみ、従来方式で全文を取得する
+        ui['caption_text'] = APPIUM_DRIVER_HELPER.get_full_caption_text() or ui['caption_text']
+        ui['caption_truncated'] = False
+    return ui
+
+
+# ステージ名 → (関数, 必須の先行ステージ, 実行順に含まれる場合の先行ステージ)
+PIPELINE_STAGE_DEFINITIONS = {
+    'snapshot': (_stage_snapshot, (), ()),
+    'seen_cache': (_stage_seen_cache, (), ('snapshot',)),
+    'likes': (_stage_likes, (), ('snapshot',)),
+    'photo': (_stage_photo, (), ('snapshot',)),
+    'ad': (_stage_ad, (), ('snapshot',)),
+    'blocklist': (_stage_blocklist, (), ('snapshot',)),
+    'url': (_stage_url, (), ('snapshot',)),
+    'metadata': (_stage_metadata, ('likes',), ()),
+    'insert': (_stage_insert, ('url', 'metadata'), ()),
+}
+
+
+def build_video_pipeline() -> VideoPipeline:
+    stages = [PipelineStage(name, func, requires, after)
+              for name, (func, requires, after) in PIPELINE_STAGE_DEFINITIONS.items()]
+    return VideoPipeline(stages, VIDEO_PIPELINE_ORDER)
+
+
 def process_single_video(source: str, keyword: Optional[str]) -> bool:
     """
     [V58 修正] 単一の動画を処理し、DB挿入まで行う。
     (スキップログ強化とNoneチェック)
+    [V101 修正] VIDEO_PIPELINE のステージを設定順に実行する。
     """
-    global APPIUM_DRIVER_HELPER, DB_MANAGER, TARGET_COUNTRY_CODE, MIN_LIKES_THRESHOLD, BOT_ID
+    global VIDEO_PIPELINE
 
     if not APPIUM_DRIVER_HELPER or not DB_MANAGER:
         logger.error("PROCESS: Helper or DB Manager not initialized!")
         raise Exception("Helper or DB Manager not initialized")
 
-    video_id: Optional[str] = None
-    status_from = 'INITIAL_COLLECTION'
-    metadata: Dict[str, Any] = {}
+    if VIDEO_PIPELINE is None:
+        VIDEO_PIPELINE = build_video_pipeline()
 
-    logger.debug(f"PROCESS: [START] Executing single video scrape (Source: {source}).")
+    ctx: Dict[str, Any] = {
+        'source': source,
+        'keyword': keyword,
+        'video_id': None,
+        'status_from': 'INITIAL_COLLECTION',
+        'metadata': {},
+    }
 
-    try:
-        # ★ V38 新ロジック 1: URLとVideoIDの取得 (最優先)
-        logger.debug("PROCESS: (Step 1) Extracting URL...")
-        url = APPIUM_DRIVER_HELPER.get_current_video_url_full()
+    logger.debug("PROCESS: [START] Executing single video scrape (Source: %s).", source)
 
-        if not url:
-            logger.warning("PROCESS: (Step 1) URL/Video ID extraction failed. Skipping record (Return False).")
-            return False
+    # ★ V115 追加: この動画の Appium コマンド時間の集計を始める (/status の往復時間は一定間隔でのみ測り直す)
+    transport = APPIUM_DRIVER_HELPER.transport
+    if transport is not None:
+        transport.probe_transport()
+        transport.timings.start_window()
 
-        video_id = APPIUM_DRIVER_HELPER._extract_video_id_from_url(url)
-        if not video_id:
-            logger.warning(
-                f"PROCESS: (Step 1) Could not parse Video ID from URL: {url}. Skipping record (Return False).")
-            return False
-
-        metadata['url'] = url
-        metadata['video_id'] = video_id
-        status_from = f'COLLECTING (ID: {video_id})'
-
-        # ★ V38 新ロジック 2: フィルタリング (いいね数取得)
-        logger.debug("PROCESS: (Step 2) Checking likes threshold.")
-        likes = APPIUM_DRIVER_HELPER.get_like_count()
-        logger.debug(f"PROCESS: Read Likes={likes:,}. Threshold={MIN_LIKES_THRESHOLD:,}")
-
-        if not APPIUM_DRIVER_HELPER.is_likes_above_threshold(likes, MIN_LIKES_THRESHOLD):
-            # ★ V58 修正: スキップ理由を明確にログ出力
-            log_message = f"Skipped: Likes ({likes}) below threshold ({MIN_LIKES_THRESHOLD})."
-            logger.info(f"PROCESS: SKIPPED (ID: {video_id}). Reason: {log_message}")
-            DB_MANAGER.isolate_record_due_to_error(video_id, log_message, status_from, str(BOT_ID))
-            return False
-
-        # ★ V38 新ロジック 3: メタデータの取得
-        logger.debug("PROCESS: (Step 3) Extracting metadata from UI (Channel/Caption).")
-        metadata_ui = APPIUM_DRIVER_HELPER.scrape_video_data(TARGET_COUNTRY_CODE)
-        metadata['likes_count'] = likes
-        metadata['found_source'] = source
-        metadata['searched_by_keyword'] = keyword
-        metadata['channel_name'] = metadata_ui.get('channel_name', 'N/A')
-        metadata['caption_text'] = metadata_ui.get('caption_text', '')
-        metadata['country_code'] = TARGET_COUNTRY_CODE
-
-        # ★ V38 新ロジック 4: スクショ取得 (コメントアウト中)
-        logger.debug("PROCESS: (Step 4) Acquiring screenshot binary via ADB.")
-        # screenshot_binary_data = APPIUM_DRIVER_HELPER.get_screenshot_binary_via_adb()
-        # if screenshot_binary_data is None:
-        #     logger.warning("PROCESS: Failed to acquire screenshot binary data via ADB. Proceeding without image.")
-        screenshot_binary_data = None
-
-        # ★ V38 新ロジック 5: 静止画フィルタリング (最後)
-        logger.debug("PROCESS: (Step 5) Checking if static image post.")
-        if not APPIUM_DRIVER_HELPER.is_video_post():
-            # ★ V58 修正: スキップ理由を明確にログ出力
-            log_message = f"Skipped: Static Image Post detected."
-            logger.info(f"PROCESS: SKIPPED (ID: {video_id}). Reason: {log_message}")
-            DB_MANAGER.isolate_record_due_to_error(video_id, log_message, status_from, str(BOT_ID))
-            return False
-
-        # 6. DBへの挿入
-        # ★ V58 修正: video_id が None でないことを最終確認
-        if not video_id:
-            logger.error(f"PROCESS: FATAL (Step 6) video_id became None before DB Insert. Metadata: {metadata}")
-            return False
-
-        logger.debug(f"PROCESS: (Step 6) Inserting record into DB for ID: {video_id} (Source: {source})")
-        insert_result = DB_MANAGER.insert_new_video_record(metadata, screenshot_binary_data)
-
-        if insert_result == 'DUPLICATE':
-            # ★ V58 修正: スキップ理由を明確にログ出力
-            logger.info(f"PROCESS: SKIPPED (ID {video_id} is DUPLICATE).")
-            return False
-        elif insert_result.startswith('ERROR_'):
-            logger.error(f"PROCESS: DB Insert failed: {insert_result}")
-            DB_MANAGER.isolate_record_due_to_error(video_id, insert_result, status_from, str(BOT_ID))
-            return False
-
-        # 7. 成功履歴を記録 (V42: ログメッセージ修正)
-        log_message = f"Successfully collected. Likes={likes:,}"
-        DB_MANAGER.log_history(video_id, status_from, WAITING_SCREENSHOT_CHECK, log_message, str(BOT_ID))
-        logger.info(f"SUCCESS: Collected new video. DB_ID: {video_id} (Likes: {likes:,})")
-        return True
+    try:
+        accepted, rejected_stage, reason = VIDEO_PIPELINE.run(ctx)
+        if accepted:
+            metrics.VIDEOS_TOTAL.inc(outcome='processed')
+            logger.info("SUCCESS: Collected new video. DB_ID: %s (Likes: %s)", ctx['video_id'], ctx.get('likes', 0))
+            log_video_decision(ctx, 'processed')
+            return True
+
+        outcome = 'duplicate' if ctx.get('duplicate') else 'skipped'
+        metrics.VIDEOS_TOTAL.inc(outcome=outcome)
+        log_video_decision(ctx, outcome, stage=rejected_stage, reason=reason)
+
+        # ★ V58 修正: スキップ理由を明確にログ出力
+        video_id = ctx['video_id']
+        logger.info(f"PROCESS: SKIPPED at stage '{rejected_stage}' (ID: {video_id}). Reason: {reason}")
+        # VideoID 取得後の棄却のみ、従来どおりレコードを隔離して履歴に残す (重複は除く)
+        if video_id and not ctx.get('duplicate'):
+            DB_MANAGER.isolate_record_due_to_error(video_id, reason, ctx['status_from'], str(BOT_ID))
+        return False
 
     except TimeoutException as e:
         # 要素探索のタイムアウト (リカバリ可能)
         logger.warning(f"PROCESS: TimeoutException during video processing: {e}")
-        if video_id:
-            DB_MANAGER.isolate_record_due_to_error(video_id, str(e), status_from, str(BOT_ID))
+        metrics.VIDEOS_TOTAL.inc(outcome='error')
+        log_video_decision(ctx, 'error', reason=f"TimeoutException: {e}")
+        if ctx['video_id']:
+            DB_MANAGER.isolate_record_due_to_error(ctx['video_id'], str(e), ctx['status_from'], str(BOT_ID))
         raise e
 
     except Exception as e:
         # Appiumクラッシュ、ハングアップなど、予期せぬ致命的エラー
         logger.error(f"PROCESS: FATAL error during video processing: {e}")
         logger.error(traceback.format_exc())
-        if video_id:
-            DB_MANAGER.isolate_record_due_to_error(video_id, str(e), status_from, str(BOT_ID))
+        metrics.VIDEOS_TOTAL.inc(outcome='error')
+        log_video_decision(ctx, 'error', reason=f"{type(e).__name__}: {e}")
+        if ctx['video_id']:
+            DB_MANAGER.isolate_record_due_to_error(ctx['video_id'], str(e), ctx['status_from'], str(BOT_ID))
         raise e
 
+    finally:
+        # 挿入まで到達せずワーカーに渡されなかったスクショは、受信途中の adb プロセスを止める
+        capture = ctx.pop('screenshot_capture', None)
+        if capture is not None:
+            capture.discard()
+        # ★ V119 追加: 行数・経過時間が上限に達していれば溜めた行を書き込む
+        DB_MANAGER.flush_writes_if_due()
+
+
+def log_video_decision(ctx: Dict[str, Any], outcome: str, stage: Optional[str] = None,
+                       reason: Optional[str] = None):
+    """[V112 新規] 動画1本分の判定を decisions ログに1行で残す"""
+    log_decision(ctx.get('video_id'), outcome, bot_id=BOT_ID, source=ctx['source'], keyword=ctx['keyword'],
+                 likes=ctx.get('likes'), stage=stage, reason=reason,
+                 canonical_video_id=ctx['metadata'].get('canonical_video_id'),
+                 stage_seconds=ctx.get('stage_seconds'), appium=measure_appium_time())
+
+
+def measure_appium_time() -> Optional[Dict[str, Any]]:
+    """
+    [V115 新規] 動画1本分の Appium 時間を通信 (推定) と端末側 (サーバー・UiAutomator2 の処理) に分ける。
+    Appium はサーバー側の処理時間を返さないため、通信分は「コマンド数 × GET /status の往復時間」で見積もる。
+    """
+    transport = APPIUM_DRIVER_HELPER.transport if APPIUM_DRIVER_HELPER else None
+    if transport is None:
+        return None
+    split = transport.split_window()
+    if split['transport_seconds'] is not None:
+        metrics.VIDEO_APPIUM_SECONDS.observe(split['transport_seconds'], part='transport')
+        metrics.VIDEO_APPIUM_SECONDS.observe(split['device_seconds'], part='device')
+    logger.debug("PROCESS: Appium time %.3fs over %d commands (transport ~%ss, device ~%ss).",
+                 split['appium_seconds'], split['appium_commands'], split['transport_seconds'],
+                 split['device_seconds'])
+    return split
+
+
+def report_video_pipeline():
+    """[V101 新規] ステージ別の計測結果を出力し、設定に応じて推奨順へ並び替える"""
+    if VIDEO_PIPELINE is None:
+        return
+    logger.info(VIDEO_PIPELINE.report())
+    if VIDEO_PIPELINE_AUTO_ORDER:
+        VIDEO_PIPELINE.apply_suggested_order()
+
+
+def remember_collected_video(metadata: Dict[str, Any]):
+    """[V100 新規] DBに存在する動画を指紋キャッシュに登録する"""
+    if FINGERPRINT_CACHE is None:
+        return
+    FINGERPRINT_CACHE.add(metadata.get('channel_name'), metadata.get('caption_text'),
+                          metadata.get('likes_count'), metadata.get('video_id'))
+
 
 # =====================================================================
 # V. メインエントリポイント
@@ -433,9 +915,10 @@ def process_single_video(source: str, keyword: Optional[str]) -> bool:
 
 if __name__ == '__main__':
     # --- ロガーの初期設定 (一度だけ実行) ---
-    setup_logging_handlers()
+    # ★ V112 修正: Bot ごとに別のログファイルへ出力する (logs/bot_<BOT_ID>.jsonl)
+    setup_logging_handlers(f"bot_{sys.argv[1]}" if len(sys.argv) > 1 else 'tiktok_bot')
 
-    logger.info(f"Config LOG_LEVEL is ({LOG_LEVEL}). Logger forced to DEBUG by app_logger.py.")
+    logger.info(f"Config LOG_LEVEL is ({LOG_LEVEL}).")
 
     logger.info("==================================================")
     logger.info("Application starting...")
@@ -51,11 +51,272 @@ SEARCHED_VIDEOS_COUNT = 100
 TEST_RECOMMENDED_VIDEOS_COUNT = 2
 TEST_SEARCHED_VIDEOS_COUNT = 2
 
+# ★ V96 追加: 動画メタデータを page_source の単一スナップショットから一括抽出する
+# False にすると従来の要素ごとの find_element_with_fallbacks 方式に戻る
+USE_SNAPSHOT_EXTRACTION = True
+
+# ★ V102 追加: 同じ画面状態の間はスナップショットを再利用する (ジェスチャー/クリックで無効化)
+# 画面が自発的に変わる (読み込み完了など) ケースに備えて有効期限も設ける
+SNAPSHOT_CACHE_MAX_AGE_SECONDS = 3.0
+
+# ★ V103 追加: selector_compiler.py が生成する高速ロケーター表と、その検証用 DOM ダンプの保存先
+USE_COMPILED_SELECTORS = True
+COMPILED_SELECTORS_PATH = 'compiled_selectors.json'
+DOM_DUMPS_DIR = 'dom_dumps'
+
+# ★ V97 追加: セレクタの適応的並び替え (ヒット率統計はデバイスUDIDごとのJSONに保存)
+ADAPTIVE_SELECTOR_ORDERING = True
+SELECTOR_STATS_DIR = 'selector_stats'
+SELECTOR_PROBE_RATE = 0.05  # 先頭以外のセレクタを先に試す確率 (復活検出用)
+# 後方のセレクタが「何にでも一致する最終手段」であるリストは、記述順を固定する
+FIXED_ORDER_SELECTOR_LISTS = {
+    'SEARCH_INPUT_BOX_SELECTORS',
+    'SEARCH_RESULT_VIDEO_ITEM_SELECTORS',
+    'SEARCH_BACK_BUTTON_SELECTORS',
+}
+
+# ★ V98 追加: 固定 sleep の代わりに使う条件待機の上限時間 (秒)
+SWIPE_SETTLE_TIMEOUT_SECONDS = 4.0   # スワイプ後、次の動画に切り替わるまで
+SWIPE_SETTLE_POLL_SECONDS = 0.25
+# ★ V102 修正: キャプション要素1つでの切り替わり検知はこの時間まで (残りはスナップショットでのシグネチャ判定に使う)
+SWIPE_PROBE_TIMEOUT_SECONDS = 1.5
+CLIPBOARD_TIMEOUT_SECONDS = 3.0      # 「リンクをコピー」後、クリップボードにURLが入るまで
+CLIPBOARD_POLL_SECONDS = 0.2
+APP_STOP_TIMEOUT_SECONDS = 3.0       # terminate_app 後、アプリが停止するまで
+APP_READY_TIMEOUT_SECONDS = 15.0     # activate_app 後、ホームフィードが操作可能になるまで
+
+# ★ V110 追加: ジェスチャー (gesture_engine.py)
+# 'auto': 最初の数回のスワイプで各方式を計測し、端末ごとに最速の方式を GESTURE_PROFILE_DIR に保存する
+GESTURE_BACKEND = 'auto'             # 'auto' / 'w3c' / 'swipe_gesture' / 'adb'
+GESTURE_BENCHMARK_TRIALS = 3         # 'auto' で方式ごとに計測するスワイプ回数
+GESTURE_PROFILE_DIR = 'gesture_profiles'
+GESTURE_PROFILE_MAX_AGE_SECONDS = 7 * 24 * 3600  # これより古い計測結果は計測し直す
+# ジェスチャー名 → (開始X, 開始Y, 終了X, 終了Y: 画面に対する割合, 所要時間 ms)
+GESTURE_PATHS = {
+    'next_video': (0.5, 0.75, 0.5, 0.25, 400),
+    'filter_scroll': (0.5, 0.80, 0.5, 0.30, 600),
+}
+
+# ★ V99 追加: perform_search の各ステップ待機 (要素出現までのポーリング + 上限)
+# ★ V99 修正: 要素が既に表示済みなら待たない (見つからなかった場合のみポーリング間隔だけ待つ)
+SEARCH_STEP_JITTER_SECONDS = 0.3    # ポーリング間隔に加えるランダム幅 (操作間隔を一定にしないため)
+SEARCH_STEP_POLL_SECONDS = 0.25
+SEARCH_STEP_DEFAULT_CEILING_SECONDS = 8.0
+SEARCH_STEP_CEILINGS = {
+    'search_input': 6.0,
+    'search_submit': 4.0,
+    'search_results': 12.0,   # 検索結果のロード
+    'filter_menu': 6.0,
+    'filter_sort': 6.0,
+    'filter_unwatched': 1.5,  # (オプション) 無い場合はスキップ
+    'filter_6_months': 6.0,
+    'filter_apply': 6.0,
+    'video_tab': 12.0,        # フィルター適用後の結果ロード
+}
+
+# ★ V100 追加: 収集済み動画の指紋キャッシュ (シェアメニューでのURL取得を省略する)
+USE_FINGERPRINT_CACHE = True
+FINGERPRINT_CACHE_MAX_ENTRIES = 50000
+FINGERPRINT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+FINGERPRINT_CACHE_WARM_ROWS = 20000  # 起動時に tiktok_videos から読み込む件数
+
+# ★ V101 追加: 単一動画処理パイプラインの実行順
+# 安価で棄却率の高いフィルターを、高コストな 'url' (シェアメニュー) より前に置く
+VIDEO_PIPELINE_ORDER = ['snapshot', 'seen_cache', 'likes', 'photo', 'ad', 'blocklist', 'url', 'metadata', 'insert']
+VIDEO_PIPELINE_AUTO_ORDER = False  # True の場合、計測結果に基づきサイクルごとに推奨順へ並び替える
+CHANNEL_BLOCKLIST = set()  # 収集対象外のチャンネル名 (例: {'@spam_account'})
+
+# ★ V105 追加: スクリーンショット取得 (端末のストレージを経由せずに adb exec-out で直接受け取る)
+CAPTURE_SCREENSHOTS = True
+SCREENSHOT_CAPTURE_MODE = 'stream'   # 'stream' (exec-out) / 'sdcard' (従来の screencap → pull → rm)
+# 'png': 端末側で PNG 圧縮してから転送 (ネットワーク越しの adb 向け) / 'raw': 無圧縮 RGBA を転送 (USB 接続向け, 要 Pillow)
+SCREENSHOT_STREAM_FORMAT = 'png'
+SCREENSHOT_CAPTURE_TIMEOUT_SECONDS = 10
+SCREENSHOT_MAX_WIDTH = 540           # 縮小後の幅 (px)。None で縮小しない
+SCREENSHOT_IMAGE_FORMAT = 'WEBP'     # 'WEBP' / 'JPEG' / 'PNG' (再エンコードには Pillow が必要)
+SCREENSHOT_QUALITY = 60
+
+# ★ V106 追加: スクリーンショットの非同期処理 (メインループはシャッターまでだけ待つ)
+SCREENSHOT_ASYNC = True
+SCREENSHOT_WORKERS = 2
+SCREENSHOT_QUEUE_MAX = 8                     # 未処理のスクリーンショットの上限 (受信途中の adb プロセス数の上限)
+SCREENSHOT_QUEUE_PUT_TIMEOUT_SECONDS = 2.0   # キューが満杯の時に待つ上限。超えたらその動画のスクショは破棄
+SCREENSHOT_ATTACH_WAIT_MAX_SECONDS = 600     # ★ V106 修正: 起動時、これより古い添付待ち (前回の異常終了の残り) を確認待ちに戻す
+
+# ★ V107 追加: スクリーンショットを DB の BLOB ではなくコンテンツアドレス方式のストアに保存する
+# DB (tiktok_videos) には screenshot_digest / screenshot_width / screenshot_height のみを記録する
+SCREENSHOT_STORE_ENABLED = True
+SCREENSHOT_STORE_BACKEND = 'local'
+SCREENSHOT_STORE_OPTIONS = {'root': 'screenshots'}  # バックエンドのコンストラクタ引数
+SCREENSHOT_MIGRATION_CHUNK_SIZE = 50                # migrate_screenshots.py が1回に読み込む件数 (BLOB は1件数MBある)
+
+# ★ V108 追加: 知覚ハッシュ (dHash) による転載動画の検出 (perceptual_hash.py, 要 Pillow)
+# ハミング距離が閾値以内の既存レコードがあれば、AI 確認待ちにせず canonical_video_id で元レコードに紐付ける
+PHASH_ENABLED = True
+PHASH_MAX_DISTANCE = 6                 # 64bit 中の許容ビット差 (大きいほど別動画を誤って紐付けやすい)
+# ハッシュ対象の領域 (左, 上, 右, 下: 画面に対する割合)。チャンネル名・キャプション・右側のボタン列を除外する
+PHASH_CROP_BOX = (0.0, 0.12, 0.80, 0.70)
+PHASH_INDEX_WARM_ROWS = 200000         # 起動時にインデックスへ読み込む件数 (★ V108 修正: 1件あたり 約150バイト。新しい順)
+# ★ V108 修正: 単色・暗転したフレームは無関係な動画と一致してしまうため、ハッシュしない / 紐付けに使わない
+PHASH_MIN_PIXEL_STDDEV = 8.0           # 縮小後の輝度の標準偏差 (0〜255) がこれ未満のフレームはハッシュしない
+PHASH_MIN_SET_BITS = 8                 # 立っているビットが これ未満 / 64 - これ 超 のハッシュは紐付けに使わない
+PHASH_MAX_BUCKET_SCAN = 512            # 検索時に1バケットで調べる件数の上限 (偏ったセグメント値で検索が遅くならないように)
+
+# ★ V111 追加: ステップ別レイテンシ・ヒストグラムとカウンターの出力 (metrics.py, Prometheus テキスト形式)
+METRICS_ENABLED = True
+METRICS_EXPORT_MODE = 'textfile'      # 'textfile' (node_exporter の textfile collector 用) / 'http'
+METRICS_TEXTFILE_DIR = 'metrics'      # textfile: <DIR>/tiktok_bot_<BOT_ID>.prom
+METRICS_EXPORT_INTERVAL_SECONDS = 15
+METRICS_HTTP_HOST = '127.0.0.1'
+METRICS_HTTP_PORT_BASE = 9400         # http: ポート = METRICS_HTTP_PORT_BASE + BOT_ID
+
+# ★ V109 追加: 端末の表示言語パック (locales/<locale>.py)。Bot の target_country から選び、必要な時だけ読み込む
+# element_ids.py は日本語 UI で書かれているため、'ja' 以外のパックはセレクタ中の文字列を置き換える
+DEFAULT_LOCALE = 'ja'
+LOCALE_BY_COUNTRY = {
+    'JP': 'ja',
+    'US': 'en', 'GB': 'en', 'CA': 'en', 'AU': 'en', 'NZ': 'en', 'IE': 'en', 'PH': 'en', 'SG': 'en',
+    'KR': 'ko',
+    'TW': 'zh_TW', 'HK': 'zh_TW',
+    'DE': 'de', 'AT': 'de', 'CH': 'de',
+}
+
+# ★ V104 追加: 実機なしでスループットを計測するための再生サーバー (replay_server.py) とベンチマーク
+REPLAY_MANIFEST_PATH = 'replay/manifest.json'  # 画面ごとの DOM ダンプと遷移の定義
+# コマンド別の応答遅延 (秒)。実機の UiAutomator2 で計測したおおよその値。jitter は ±割合
+REPLAY_LATENCY_SECONDS = {
+    'default': 0.05,
+    'newSession': 1.0,
+    'getPageSource': 0.35,
+    'findElement': 0.12,
+    'findElements': 0.12,
+    'elementClick': 0.15,
+    'elementSendKeys': 0.3,
+    'performActions': 0.25,
+    'getClipboard': 0.08,
+    'setClipboard': 0.08,
+    'activateApp': 1.0,
+    'terminateApp': 0.5,
+    'jitter': 0.2,
+}
+# ベンチマーク用のローカルDB (本番の 'tiktok' とは必ず別のデータベースを指定する)
+BENCHMARK_MYSQL_CONFIG = dict(MYSQL_CONFIG, host='127.0.0.1', database='tiktok_bench')
+BENCHMARK_BASELINE_PATH = 'benchmarks/throughput_baseline.json'
+BENCHMARK_REGRESSION_TOLERANCE = 0.10  # ベースライン比でこの割合を超えて悪化したら回帰とみなす
+
 # --- ワークフロー設定 (DBステータス) ---
 WAITING_SCREENSHOT_CHECK = 'WAITING_SCREENSHOT_CHECK'
+# ★ V106 修正: 非同期のスクショが添付されるまでの状態 (確認 Bot はまだ取らない)。添付後 (失敗時も) WAITING_SCREENSHOT_CHECK にする
+WAITING_SCREENSHOT_ATTACH = 'WAITING_SCREENSHOT_ATTACH'
 ERROR_NEEDS_REVIEW = 'ERROR_NEEDS_REVIEW'
+DUPLICATE_CONTENT = 'DUPLICATE_CONTENT'  # ★ V108: 既存動画の転載 (canonical_video_id に元動画)
 # ... (他のステータスもここに追加) ...
 
 # --- ロギング設定 ---
 # app_logger.py がこのレベルを読み込んで使用する
 LOG_LEVEL = logging.DEBUG # 開発中はDEBUG、運用時はINFOに変更
+# ★ V112 追加: 出力はキュー経由で別スレッドが行う (app_logger.py)
+LOG_TO_CONSOLE = True
+LOG_DIR = 'logs'
+LOG_JSON_ENABLED = True  # logs/<bot>.jsonl に1行1レコードの JSON で出力
+LOG_DECISIONS_ENABLED = True  # logs/<bot>.decisions.jsonl に動画ごとの判定を1行で出力
+LOG_MAX_BYTES = 20 * 1024 * 1024  # これを超えたらローテーション
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_MAX = 10000  # 出力が追いつかない場合、これを超えた分は破棄 (Bot を止めない)
+# メッセージ種別 (先頭の "XXX:") → (窓あたりの最大件数, 窓の秒数)。WARNING 以上は制限しない
+LOG_RATE_LIMITS = {
+    'FIND': (60, 10.0),
+    'DB EXECUTE': (60, 10.0),
+    'DOM': (30, 10.0),
+    'GESTURE': (30, 10.0),
+}
+
+# --- フリート監視設定 (V113) ---
+# fleet_supervisor.py が bot_configurations の is_active = 1 の行ごとに collector_bot_main.py を1プロセス起動する
+FLEET_POLL_INTERVAL_SECONDS = 30  # bot_configurations を読み直す間隔 (行の追加・無効化を反映)
+FLEET_START_STAGGER_SECONDS = 20  # 起動の最小間隔 (全 Bot が同時に Appium セッションを作らないように)
+FLEET_RESTART_BACKOFF_BASE_SECONDS = 10  # 異常終了後の再起動待ち (連続するごとに2倍)
+FLEET_RESTART_BACKOFF_MAX_SECONDS = 600
+FLEET_STABLE_RUN_SECONDS = 300  # これ以上動いてから終了した場合は連続失敗とみなさない (待ち時間を戻す)
+FLEET_STOP_TIMEOUT_SECONDS = 30  # 停止要求後、これを過ぎても終了しないプロセスは強制終了する
+
+# --- asyncio ランタイム設定 (V114) ---
+# async_collector.py: 1プロセスで複数端末を動かす (端末ごとに1タスク。おすすめフィードのみ)
+ASYNC_APPIUM_POOL_CONNECTIONS = 16  # Appium サーバーへの keep-alive 接続数の上限 (全端末で共有)
+ASYNC_DB_POOL_SIZE = 4  # DB 接続数 (= DB 呼び出し用スレッド数。全端末で共有)
+ASYNC_COMMAND_TIMEOUT_SECONDS = 60.0  # WebDriver コマンド1回の上限
+ASYNC_ERROR_BACKOFF_SECONDS = 30.0  # 端末のループでエラーが起きた場合、セッションを作り直すまでの待ち時間
+
+# --- Appium 接続設定 (V115) ---
+# TiktokAppiumHelper.initialize_driver が使う keep-alive 接続プール (appium_transport.py)
+APPIUM_HTTP_POOL_MAXSIZE = 4  # Appium サーバーへの同時接続数の上限 (1 Bot = 1 セッションのため少数でよい)
+APPIUM_HTTP_CONNECT_TIMEOUT_SECONDS = 5.0  # 接続確立の上限 (ホストが落ちている場合に早く失敗させる)
+APPIUM_HTTP_READ_TIMEOUT_SECONDS = 120.0  # 応答待ちの上限 (アプリ起動・page_source の遅い応答を許容する)
+APPIUM_TRANSPORT_PROBE_INTERVAL_SECONDS = 30  # GET /status で通信の往復時間を測る間隔
+
+# --- Appium セッション再接続設定 (V116) ---
+# Bot の再起動・再初期化時、端末ごとに保存したセッションが生きていれば新規作成せずに再接続する
+APPIUM_SESSION_REATTACH = True
+APPIUM_SESSION_STATE_DIR = 'appium_sessions'
+# 一度セッションを作成できた端末では、新規作成の初回試行で UiAutomator2 サーバーのインストールと端末の初期化を省略する
+APPIUM_SKIP_PREPARED_DEVICE_INIT = True
+
+# --- リカバリ設定 (V117) ---
+# recovery.py: 収集ループの例外後、画面を診断して安い操作から順に試す (閉じる → 戻る → ホーム → 前面に戻す → ディープリンク → 再起動)
+RECOVERY_SETTLE_TIMEOUT_SECONDS = 3.0  # 操作1回ごとに、目的の画面になるまで待つ上限
+RECOVERY_POLL_SECONDS = 0.3
+RECOVERY_DEEP_LINK_URL = 'https://www.tiktok.com/foryou'  # おすすめフィードを開くリンク (None で使わない)
+RECOVERY_MAX_PER_CYCLE = 5  # 1サイクル内でこれを超えてリカバリが必要になった場合はサイクルを打ち切る
+
+# --- Appium コマンドの期限 (V118) ---
+# appium_transport.py の監視スレッドが、期限を過ぎたコマンドの HTTP 接続を切断する
+# (キーは実際に送られる WebDriver のコマンド名。w3cExecuteScript で送られる拡張コマンドは 'mobile: xxx' のスクリプト名)
+APPIUM_COMMAND_DEADLINES = {
+    'getPageSource': 30.0,
+    'findElement': 20.0,
+    'findElements': 20.0,
+    'clickElement': 10.0,
+    'getElementAttribute': 10.0,
+    'getElementText': 10.0,
+    'actions': 15.0,  # W3C Actions (タップ・スワイプ)
+    'goBack': 10.0,  # driver.back()
+    'updateSettings': 15.0,
+    'screenshot': 30.0,
+    'newSession': 180.0,  # サーバーのインストール・端末の初期化を含む
+    'mobile: getClipboard': 10.0,
+    'mobile: setClipboard': 10.0,
+    'mobile: queryAppState': 10.0,  # 期限切れ後の生存確認 (is_session_alive) にも使う
+    'mobile: activateApp': 30.0,
+    'mobile: terminateApp': 30.0,
+    'mobile: deepLink': 30.0,
+    'mobile: swipeGesture': 15.0,
+    'mobile: clickGesture': 10.0,
+    'mobile: pressKey': 10.0,
+}
+APPIUM_COMMAND_DEFAULT_DEADLINE_SECONDS = 60.0  # 上記以外のコマンド
+APPIUM_WATCHDOG_POLL_SECONDS = 0.5  # 期限の確認間隔 (期限切れの検知はこの分だけ遅れる)
+
+# --- DB 書き込みバッファ設定 (V119) ---
+# 収集 Bot の TikTokDBManager は動画の挿入・隔離と履歴をメモリに溜め、複数行の executemany でまとめて1トランザクションで書き込む
+DB_WRITE_BUFFER_ENABLED = True
+DB_WRITE_BUFFER_MAX_ROWS = 16  # 溜まった行数 (動画 + 隔離 + 履歴) がこれに達したら書き込む (動画1本 ≒ 2行)
+DB_WRITE_BUFFER_MAX_AGE_SECONDS = 15.0  # 最初の行を溜めてからこれを過ぎたら書き込む (スクショの添付もこの分だけ遅れる)
+# ★ V119 修正: DB に接続できない間に溜めておく行数の上限 (超えた分は古い順に破棄する)
+DB_WRITE_BUFFER_MAX_PENDING_ROWS = 2000
+
+# --- バックグラウンド DB ライター設定 (V120) ---
+# db_writer.py: 収集 Bot の書き込みはキューに入れるだけにし、専用スレッドが MySQL に書き込む。
+# MySQL に書き込めない間は端末ごとのローカルスプール (SQLite) に追記し、復旧後に受け付け順に再送する。
+# (有効な場合、V119 の書き込みバッファの代わりに使う)
+DB_WRITER_ENABLED = True
+DB_WRITER_QUEUE_MAX = 512  # メモリ上のキューの上限。満杯の時はスプールに直接追記する (収集ループは待たない)
+DB_WRITER_BATCH_ROWS = 50  # 1トランザクションで書き込む操作数の上限
+DB_WRITER_BATCH_WAIT_SECONDS = 2.0  # 最初の操作を受け取ってから、まとめるために待つ上限
+DB_WRITER_RETRY_SECONDS = 10.0  # 書き込みに失敗した後、スプールの再送を試すまでの間隔
+DB_WRITER_QUERY_TIMEOUT_SECONDS = 30  # ライターの接続の読み書きの上限 (応答しないサーバーで止まり続けない)
+DB_WRITER_CLOSE_TIMEOUT_SECONDS = 60.0  # 終了時に残りを書き込むのを待つ上限 (書き込めなかった分はスプールに残る)
+DB_SPOOL_DIR = 'db_spool'  # Bot ごとに bot_<BOT_ID>.sqlite3
+# ★ V120 修正: ロック待ちタイムアウト (1205)・デッドロック (1213) はトランザクションを最初から上限回数までやり直す
+# (それでも書き込めない場合はデータの問題と同じく1件ずつ書き込み、書き込めない記録だけを外す)
+DB_LOCK_RETRY_ATTEMPTS = 3
+DB_LOCK_RETRY_WAIT_SECONDS = 0.5  # やり直すたびに (回数 x この秒数) 待つ
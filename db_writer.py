@@ -0,0 +1,339 @@
+# =====================================================================
+# db_writer.py: バックグラウンドの DB 書き込みとローカルスプール (V120)
+#
+# MySQL が遅い・落ちている間、execute_query の例外で収集ループが止まったりサイクルを捨てたりすると、
+# それまでの Appium 操作で集めた動画が失われる。ここでは
+#   1. 書き込み (TikTokDBManager の WriteRecord) を上限付きのキューに入れるだけにし、専用スレッドが
+#      まとめて1トランザクションで書き込む (収集ループは DB を待たない)
+#   2. 書き込めない間は、受け付け順の番号 (seq) を付けてローカルの SQLite スプールに追記する
+#      (キューが満杯の場合も、呼び出し側はスプールに直接追記して戻る)
+#   3. 一定間隔で再送を試し、復旧したら seq の順に書き込み、書き込めた分だけスプールから消す
+#      (消す前に落ちても、動画は ON DUPLICATE KEY、履歴は重複防止キーで二重にならない)
+#   4. 接続ではなくデータの問題で書き込めない記録は、1件ずつ試して rejected テーブルに移す (後続を止めない)
+# =====================================================================
+import base64
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app_logger import logger
+from base_db import is_connection_error
+from config import DB_WRITER_QUEUE_MAX, DB_WRITER_BATCH_ROWS, DB_WRITER_BATCH_WAIT_SECONDS
+from config import DB_WRITER_RETRY_SECONDS, DB_WRITER_CLOSE_TIMEOUT_SECONDS
+from metrics import DB_FLUSH_SECONDS, DB_WRITER_RECORDS_TOTAL
+
+# (seq, 重複防止キー, op, 値)
+SpoolRecord = Tuple[int, str, str, Tuple[Any, ...]]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {'$b64': base64.b64encode(value).decode('ascii')}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and '$b64' in value:
+        return base64.b64decode(value['$b64'])
+    return value
+
+
+class DBSpool:
+    """SQLite の追記専用スプール (スレッド間で共有する。操作ごとにロックを取る)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY, record_key TEXT NOT NULL, op TEXT NOT NULL,
+                payload TEXT NOT NULL, spooled_at REAL NOT NULL)
+        """)
+        # ★ V120 修正: seq は再起動後に 1 から振り直されるため、rejected の主キーには使わない (上書きされる)。
+        # 連番の id を主キーにし、同じ記録 (record_key) の二重登録だけを防ぐ
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(rejected)")]
+        if columns and 'id' not in columns:
+            self._conn.execute("ALTER TABLE rejected RENAME TO rejected_by_seq")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rejected (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, seq INTEGER NOT NULL, record_key TEXT NOT NULL UNIQUE,
+                op TEXT NOT NULL, payload TEXT NOT NULL, error TEXT, rejected_at REAL NOT NULL)
+        """)
+        if columns and 'id' not in columns:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO rejected (seq, record_key, op, payload, error, rejected_at) "
+                "SELECT seq, record_key, op, payload, error, rejected_at FROM rejected_by_seq ORDER BY rejected_at")
+            self._conn.execute("DROP TABLE rejected_by_seq")
+
+    @staticmethod
+    def _payload(values: Tuple[Any, ...]) -> str:
+        return json.dumps([_encode_value(value) for value in values], ensure_ascii=False)
+
+    def append(self, records: List[SpoolRecord]):
+        if not records:
+            return
+        now = time.time()
+        rows = [(seq, key, op, self._payload(values), now) for seq, key, op, values in records]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO spool (seq, record_key, op, payload, spooled_at) VALUES (?, ?, ?, ?, ?)",
+                    rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def read(self, limit: int) -> List[SpoolRecord]:
+        """古い順 (seq 順) に limit 件"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, record_key, op, payload FROM spool ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, key, op, tuple(_decode_value(value) for value in json.loads(payload)))
+                for seq, key, op, payload in rows]
+
+    def delete_through(self, seq: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM spool WHERE seq <= ?", (seq,))
+
+    def reject(self, record: SpoolRecord, error: Exception):
+        seq, key, op, values = record
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO rejected (seq, record_key, op, payload, error, rejected_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (seq, key, op, self._payload(values), str(error), time.time()))
+            self._conn.execute("DELETE FROM spool WHERE seq = ?", (seq,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def max_seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BackgroundDBWriter:
+    """
+    TikTokDBManager の書き込みを専用スレッドで行う。
+    db_factory はライタースレッド内で呼ばれ、書き込み専用の TikTokDBManager を返す (pymysql の接続はスレッド間で共有しない)。
+    """
+
+    def __init__(self, db_factory: Callable[[], Any], spool_path: str, max_queue: int = DB_WRITER_QUEUE_MAX,
+                 batch_rows: int = DB_WRITER_BATCH_ROWS, batch_wait_seconds: float = DB_WRITER_BATCH_WAIT_SECONDS,
+                 retry_seconds: float = DB_WRITER_RETRY_SECONDS):
+        self.db_factory = db_factory
+        self.batch_rows = batch_rows
+        self.batch_wait_seconds = batch_wait_seconds
+        self.retry_seconds = retry_seconds
+        self.spool = DBSpool(spool_path)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        # seq の採番・キューへの投入・スプールへの追記の順序を揃えるロック
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:12]
+        self._seq = itertools.count(self.spool.max_seq() + 1)
+        self._spooled = self.spool.count() > 0  # スプールに未送信の記録がある (新しい記録もスプール経由で送る)
+        self._closed = False
+        self._stop = threading.Event()
+        self._db = None
+        self._db_healthy = False
+        self._next_retry_at = 0.0
+        self._outage_started_at: Optional[float] = None
+        self.metrics = {'submitted': 0, 'written': 0, 'spooled': 0, 'replayed': 0, 'rejected': 0,
+                        'write_seconds': 0.0, 'writes': 0}
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        if self._spooled:
+            logger.warning(f"DB WRITER: {self.spool.count()} records left in the spool {self.spool.path}. "
+                           f"They will be replayed first.")
+
+    def start(self):
+        self._thread.start()
+        logger.info(f"DB WRITER: Started (Queue: {self._queue.maxsize}, Batch: {self.batch_rows} rows / "
+                    f"{self.batch_wait_seconds}s, Spool: {self.spool.path}).")
+
+    def submit(self, op: str, values: Tuple[Any, ...]):
+        """書き込みを受け付ける (DB を待たない。キューが満杯・停止後はスプールに追記する)"""
+        with self._lock:
+            seq = next(self._seq)
+            record = (seq, f"{self._token}-{seq}", op, tuple(values))
+            self.metrics['submitted'] += 1
+            if not self._closed:
+                try:
+                    self._queue.put_nowait(record)
+                    return
+                except queue.Full:
+                    pass
+            self._spill([record], 'queue full' if not self._closed else 'writer stopped')
+
+    def _spill(self, records: List[SpoolRecord], reason: str):
+        """スプールに追記する (self._lock を取った状態で呼ぶ)"""
+        if not records:
+            return
+        self.spool.append(records)
+        self._spooled = True
+        self.metrics['spooled'] += len(records)
+        DB_WRITER_RECORDS_TOTAL.inc(len(records), result='spooled')
+        if self._outage_started_at is None:
+            self._outage_started_at = time.time()
+            logger.warning(f"DB WRITER: Spooling writes to {self.spool.path} ({reason}).")
+
+    def _drain(self) -> List[SpoolRecord]:
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                return records
+
+    def _take_batch(self) -> List[SpoolRecord]:
+        """最初の1件を待ち、batch_rows 件か batch_wait_seconds になるまでまとめる"""
+        try:
+            records = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + (0.0 if self._stop.is_set() else self.batch_wait_seconds)
+        while len(records) < self.batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                records.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            batch = self._take_batch()
+            with self._lock:
+                if batch and self._spooled:
+                    # 先に受け付けた記録がスプールにあるため、順序を保つようスプールの後ろに並べる
+                    self._spill(batch + self._drain(), 'replay pending')
+                    batch = []
+            if batch and self._write(batch) is not None:
+                with self._lock:
+                    self._spill(batch + self._drain(), 'database unavailable')
+            if self._spooled and time.monotonic() >= self._next_retry_at:
+                self._replay()
+            if stopping and self._queue.empty():
+                break
+        if self._db is not None:
+            self._db.close()
+
+    def _connection(self):
+        if self._db is None:
+            self._db = self.db_factory()
+        elif not self._db_healthy and not self._db.ensure_connection():
+            raise ConnectionError("DB接続が失われています。")
+        return self._db
+
+    def _write(self, records: List[SpoolRecord]) -> Optional[Exception]:
+        """1トランザクションで書き込む。失敗した場合はその例外を返す"""
+        started = time.perf_counter()
+        try:
+            db = self._connection()
+            # ★ V120 修正: ロック競合は上限回数までやり直す
+            db.run_transaction(lambda: db.apply_writes([(key, op, values) for _, key, op, values in records]))
+        except Exception as e:
+            DB_FLUSH_SECONDS.observe(time.perf_counter() - started, result='error')
+            self._db_healthy = False
+            if self._db is not None:
+                try:
+                    self._db.rollback()
+                except Exception:
+                    pass
+            if is_connection_error(e):
+                self._next_retry_at = time.monotonic() + self.retry_seconds
+                logger.warning(f"DB WRITER: Write of {len(records)} records failed: {e}. "
+                               f"Retrying in {self.retry_seconds:.0f}s.")
+            return e
+        seconds = time.perf_counter() - started
+        DB_FLUSH_SECONDS.observe(seconds, result='ok')
+        DB_WRITER_RECORDS_TOTAL.inc(len(records), result='written')
+        self._db_healthy = True
+        self.metrics['written'] += len(records)
+        self.metrics['writes'] += 1
+        self.metrics['write_seconds'] += seconds
+        return None
+
+    def _replay(self):
+        """スプールの記録を seq の順に書き込む (書き込めなくなった時点で中断し、次の再送を待つ)"""
+        replayed = 0
+        while True:
+            with self._lock:
+                # キューに残っている記録はスプールの記録より新しいため、後ろに並べてから読む
+                self._spill(self._drain(), 'replay pending')
+                chunk = self.spool.read(self.batch_rows)
+                if not chunk:
+                    self._spooled = False
+                    break
+            error = self._write(chunk)
+            if error is None:
+                self.spool.delete_through(chunk[-1][0])
+                replayed += len(chunk)
+                continue
+            if is_connection_error(error):
+                break
+            # データ自体の問題: 1件ずつ書き込み、書き込めない記録だけを rejected に移す
+            for record in chunk:
+                error = self._write([record])
+                if error is None:
+                    self.spool.delete_through(record[0])
+                    replayed += 1
+                elif is_connection_error(error):
+                    break
+                else:
+                    self.spool.reject(record, error)
+                    self.metrics['rejected'] += 1
+                    DB_WRITER_RECORDS_TOTAL.inc(result='rejected')
+                    logger.error(f"DB WRITER: Rejected {record[2]} record {record[1]} for {record[3][0]}: {error}")
+            if error is not None and is_connection_error(error):
+                break
+
+        if replayed:
+            self.metrics['replayed'] += replayed
+            DB_WRITER_RECORDS_TOTAL.inc(replayed, result='replayed')
+            logger.info(f"DB WRITER: Replayed {replayed} spooled records (Remaining: {self.spool.count()}).")
+        with self._lock:
+            if not self._spooled and self._outage_started_at is not None:
+                logger.info(f"DB WRITER: Spool drained. Writing directly again after "
+                            f"{time.time() - self._outage_started_at:.0f}s.")
+                self._outage_started_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        writes = metrics.pop('writes')
+        write_seconds = metrics.pop('write_seconds')
+        metrics.update({'queue_depth': self._queue.qsize(), 'spool_depth': self.spool.count(),
+                        'avg_write_seconds': write_seconds / (writes or 1)})
+        return metrics
+
+    def close(self, timeout_seconds: float = DB_WRITER_CLOSE_TIMEOUT_SECONDS):
+        """キューの残りを書き込んでから停止する。書き込めなかった記録はスプールに残り、次回の起動時に再送する"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout_seconds)
+        with self._lock:
+            self._closed = True
+            self._spill(self._drain(), 'writer stopped')
+        alive = self._thread.is_alive()
+        logger.info(f"DB WRITER: Stopped (Still running: {alive}). Stats: {self.stats()}")
+        if not alive:
+            self.spool.close()
@@ -0,0 +1,464 @@
+# =====================================================================
+# dom_snapshot.py: page_source の単一スナップショット評価エンジン (V96)
+#
+# 1. driver.page_source を1回だけ取得し、ローカルで XML として解析する
+# 2. element_ids.py のセレクタ (ID / XPath / accessibility id) を
+#    Appium へ問い合わせずにスナップショット上で評価する
+# 3. XPath は element_ids.py で実際に使っている構文のサブセットのみ対応
+# 4. (V103) selector_compiler.py が生成する -android uiautomator (UiSelector) のサブセットにも対応
+# =====================================================================
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# AppiumBy の値 (appium を import せずに判定できるよう文字列で保持)
+BY_ID = 'id'
+BY_XPATH = 'xpath'
+BY_ACCESSIBILITY_ID = 'accessibility id'
+BY_CLASS_NAME = 'class name'
+BY_ANDROID_UIAUTOMATOR = '-android uiautomator'
+
+_BOUNDS_PATTERN = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+
+
+class SnapshotSelectorError(Exception):
+    """スナップショットで評価できないセレクタ (未対応の XPath 構文など)"""
+    pass
+
+
+# =====================================================================
+# I. ノードラッパー
+# =====================================================================
+
+class SnapshotNode:
+    """スナップショット上の1要素。WebElement の読み取り系APIに近い形で属性を提供する"""
+    __slots__ = ('element',)
+
+    def __init__(self, element: ET.Element):
+        self.element = element
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        return self.element.get(name)
+
+    @property
+    def tag_name(self) -> str:
+        return self.element.tag
+
+    @property
+    def text(self) -> str:
+        return self.element.get('text', '') or ''
+
+    @property
+    def content_desc(self) -> str:
+        return self.element.get('content-desc', '') or ''
+
+    @property
+    def resource_id(self) -> str:
+        return self.element.get('resource-id', '') or ''
+
+    @property
+    def bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """bounds="[x1,y1][x2,y2]" を (x1, y1, x2, y2) に変換する"""
+        return parse_bounds(self.element.get('bounds'))
+
+    @property
+    def center(self) -> Optional[Tuple[int, int]]:
+        b = self.bounds
+        if not b:
+            return None
+        return (b[0] + b[2]) // 2, (b[1] + b[3]) // 2
+
+    @property
+    def rect(self) -> Optional[Dict[str, int]]:
+        b = self.bounds
+        if not b:
+            return None
+        return {'x': b[0], 'y': b[1], 'width': b[2] - b[0], 'height': b[3] - b[1]}
+
+    def __repr__(self) -> str:
+        return f"<SnapshotNode {self.tag_name} id={self.resource_id!r} desc={self.content_desc[:20]!r}>"
+
+
+def parse_bounds(bounds: Optional[str]) -> Optional[Tuple[int, int, int, int]]:
+    if not bounds:
+        return None
+    match = _BOUNDS_PATTERN.fullmatch(bounds.strip())
+    if not match:
+        return None
+    return tuple(int(v) for v in match.groups())  # type: ignore[return-value]
+
+
+# =====================================================================
+# II. XPath サブセット・コンパイラ
+#
+# 対応構文:
+#   //tag, /tag, *, (path)[n], following-sibling::tag,
+#   [@a="v"], [@a!="v"], [starts-with(@a, "v")], [contains(@a, "v")],
+#   [n], [... and ...], [... or ...], [not(...)], [.//tag[...]] (存在判定)
+# =====================================================================
+
+_TOKEN_PATTERN = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<string>"[^"]*"|'[^']*')
+    | (?P<number>\d+)
+    | (?P<op>//|::|!=|[/\[\]()@=,.*])
+    | (?P<name>[A-Za-z_][\w.\-]*)
+""", re.VERBOSE)
+
+_DOCUMENT = object()  # 仮想ドキュメントノード (ルート要素の親)
+
+
+def _tokenize(expr: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(expr):
+        match = _TOKEN_PATTERN.match(expr, pos)
+        if not match:
+            raise SnapshotSelectorError(f"Unsupported XPath syntax at {pos}: {expr!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'ws':
+            continue
+        value = match.group(kind)
+        if kind == 'string':
+            value = value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """トークン列を評価関数 (クロージャ) に変換する再帰下降パーサ"""
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+
+    # --- トークン操作 ---
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        idx = self.pos + offset
+        return self.tokens[idx] if idx < len(self.tokens) else (None, None)
+
+    def accept(self, value: str) -> bool:
+        if self.peek()[1] == value and self.peek()[0] in ('op', 'name'):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise SnapshotSelectorError(f"Expected {value!r} in XPath: {self.expr!r}")
+
+    def next_of(self, kind: str) -> str:
+        tok_kind, tok_value = self.peek()
+        if tok_kind != kind:
+            raise SnapshotSelectorError(f"Expected {kind} but got {tok_value!r} in XPath: {self.expr!r}")
+        self.pos += 1
+        return tok_value
+
+    # --- 文法 ---
+    def parse(self) -> Callable[['DomSnapshot', List[Any]], List[ET.Element]]:
+        path = self.parse_path()
+        if self.pos != len(self.tokens):
+            raise SnapshotSelectorError(f"Trailing tokens in XPath: {self.expr!r}")
+        return path
+
+    def parse_path(self):
+        # (path)[n] 形式: ドキュメント順で全体から n 番目
+        if self.peek() == ('op', '('):
+            self.pos += 1
+            inner = self.parse_path()
+            self.expect(')')
+            predicates = self.parse_predicates()
+
+            def grouped(snapshot, context):
+                nodes = snapshot._sort(inner(snapshot, context))
+                return _apply_predicates(snapshot, nodes, predicates)
+            return grouped
+
+        steps = []
+        relative = False
+        if self.accept('.'):
+            relative = True
+        while self.peek()[1] in ('/', '//'):
+            separator = self.next_of('op')
+            steps.append((separator == '//',) + self.parse_step())
+        if not steps:
+            raise SnapshotSelectorError(f"Empty location path in XPath: {self.expr!r}")
+
+        def location(snapshot, context):
+            nodes = list(context) if relative else [_DOCUMENT]
+            for descendant, axis, test, predicates in steps:
+                nodes = snapshot._step(nodes, descendant, axis, test, predicates)
+            return nodes
+        return location
+
+    def parse_step(self):
+        axis = 'child'
+        if self.peek(1) == ('op', '::'):
+            axis = self.next_of('name')
+            self.pos += 1
+            if axis not in ('child', 'following-sibling', 'descendant'):
+                raise SnapshotSelectorError(f"Unsupported XPath axis {axis!r}: {self.expr!r}")
+        if self.accept('*'):
+            test = '*'
+        else:
+            test = self.next_of('name')
+        return axis, test, self.parse_predicates()
+
+    def parse_predicates(self):
+        predicates = []
+        while self.accept('['):
+            if self.peek()[0] == 'number':
+                predicates.append(int(self.next_of('number')))
+            else:
+                predicates.append(self.parse_or())
+            self.expect(']')
+        return predicates
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('or'):
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda s, el: any(t(s, el) for t in terms)
+
+    def parse_and(self):
+        terms = [self.parse_atom()]
+        while self.accept('and'):
+            terms.append(self.parse_atom())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda s, el: all(t(s, el) for t in terms)
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        if (kind, value) == ('op', '('):
+            self.pos += 1
+            inner = self.parse_or()
+            self.expect(')')
+            return inner
+        if (kind, value) == ('op', '@'):
+            self.pos += 1
+            attr = self.next_of('name')
+            if self.accept('='):
+                expected = self.next_of('string')
+                return lambda s, el: el.get(attr) == expected
+            if self.accept('!='):
+                expected = self.next_of('string')
+                return lambda s, el: el.get(attr) is not None and el.get(attr) != expected
+            return lambda s, el: el.get(attr) is not None
+        if (kind, value) == ('op', '.'):
+            sub_path = self.parse_path()
+            return lambda s, el: bool(sub_path(s, [el]))
+        if kind == 'name' and self.peek(1) == ('op', '('):
+            func = value
+            self.pos += 2
+            if func == 'not':
+                inner = self.parse_or()
+                self.expect(')')
+                return lambda s, el: not inner(s, el)
+            if func in ('starts-with', 'contains'):
+                self.expect('@')
+                attr = self.next_of('name')
+                self.expect(',')
+                expected = self.next_of('string')
+                self.expect(')')
+                if func == 'starts-with':
+                    return lambda s, el: (el.get(attr) or '').startswith(expected)
+                return lambda s, el: expected in (el.get(attr) or '')
+            raise SnapshotSelectorError(f"Unsupported XPath function {func!r}: {self.expr!r}")
+        raise SnapshotSelectorError(f"Unsupported XPath predicate near {value!r}: {self.expr!r}")
+
+
+def _apply_predicates(snapshot: 'DomSnapshot', nodes: List[ET.Element], predicates: List[Any]) -> List[ET.Element]:
+    for predicate in predicates:
+        if isinstance(predicate, int):
+            nodes = nodes[predicate - 1:predicate] if predicate >= 1 else []
+        else:
+            nodes = [el for el in nodes if predicate(snapshot, el)]
+    return nodes
+
+
+_XPATH_CACHE: Dict[str, Callable] = {}
+
+
+def compile_xpath(expr: str) -> Callable:
+    """XPath サブセットを評価関数にコンパイルする (結果はプロセス内でキャッシュ)"""
+    compiled = _XPATH_CACHE.get(expr)
+    if compiled is None:
+        compiled = _Parser(expr).parse()
+        _XPATH_CACHE[expr] = compiled
+    return compiled
+
+
+# =====================================================================
+# II-2. UiSelector サブセット (-android uiautomator)
+#
+# 対応メソッド: className, resourceId, resourceIdMatches, description, descriptionStartsWith,
+#   descriptionContains, text, textStartsWith, textContains, selected, clickable, instance, index
+# =====================================================================
+
+_UISELECTOR_CALL_PATTERN = re.compile(r'\.(\w+)\(\s*("(?:[^"\\]|\\.)*"|true|false|\d+)\s*\)')
+
+_UISELECTOR_ATTRIBUTE_TESTS: Dict[str, Callable[[str, str], bool]] = {
+    'className': lambda attr, arg: attr == arg,
+    'resourceId': lambda attr, arg: attr == arg,
+    'resourceIdMatches': lambda attr, arg: re.fullmatch(arg, attr) is not None,
+    'description': lambda attr, arg: attr == arg,
+    'descriptionStartsWith': lambda attr, arg: attr.startswith(arg),
+    'descriptionContains': lambda attr, arg: arg in attr,
+    'text': lambda attr, arg: attr == arg,
+    'textStartsWith': lambda attr, arg: attr.startswith(arg),
+    'textContains': lambda attr, arg: arg in attr,
+    'selected': lambda attr, arg: attr == arg,
+    'clickable': lambda attr, arg: attr == arg,
+}
+_UISELECTOR_ATTRIBUTES = {
+    'className': 'class', 'resourceId': 'resource-id', 'resourceIdMatches': 'resource-id',
+    'description': 'content-desc', 'descriptionStartsWith': 'content-desc', 'descriptionContains': 'content-desc',
+    'text': 'text', 'textStartsWith': 'text', 'textContains': 'text',
+    'selected': 'selected', 'clickable': 'clickable',
+}
+
+
+def compile_uiselector(expr: str) -> Callable[['DomSnapshot'], List[ET.Element]]:
+    """'new UiSelector().className("...").instance(0)' 形式を評価関数にコンパイルする"""
+    body = expr.strip().rstrip(';')
+    if not body.startswith('new UiSelector()'):
+        raise SnapshotSelectorError(f"Unsupported UiSelector expression: {expr!r}")
+    rest = body[len('new UiSelector()'):]
+    tests: List[Tuple[str, Callable[[str, str], bool], str]] = []
+    instance: Optional[int] = None
+    index: Optional[int] = None
+    pos = 0
+    while pos < len(rest):
+        match = _UISELECTOR_CALL_PATTERN.match(rest, pos)
+        if not match:
+            raise SnapshotSelectorError(f"Unsupported UiSelector syntax at {pos}: {expr!r}")
+        pos = match.end()
+        method, raw_arg = match.group(1), match.group(2)
+        arg = raw_arg[1:-1].replace('\\"', '"').replace('\\\\', '\\') if raw_arg.startswith('"') else raw_arg
+        if method == 'instance':
+            instance = int(arg)
+        elif method == 'index':
+            index = int(arg)
+        elif method in _UISELECTOR_ATTRIBUTE_TESTS:
+            tests.append((_UISELECTOR_ATTRIBUTES[method], _UISELECTOR_ATTRIBUTE_TESTS[method], arg))
+        else:
+            raise SnapshotSelectorError(f"Unsupported UiSelector method {method!r}: {expr!r}")
+
+    def evaluate(snapshot: 'DomSnapshot') -> List[ET.Element]:
+        matched = []
+        for el in snapshot.root.iter():
+            if el is snapshot.root:
+                continue
+            if index is not None and el.get('index') != str(index):
+                continue
+            if all(test(el.get(attr, el.tag if attr == 'class' else '') or '', arg) for attr, test, arg in tests):
+                matched.append(el)
+        if instance is not None:
+            return matched[instance:instance + 1]
+        return matched
+    return evaluate
+
+
+_UISELECTOR_CACHE: Dict[str, Callable] = {}
+
+
+# =====================================================================
+# III. スナップショット本体
+# =====================================================================
+
+class DomSnapshot:
+    """
+    page_source 1回分の解析済みツリー。
+    find / find_all / find_first は Appium への追加の往復を一切発生させない。
+    """
+
+    def __init__(self, page_source: str, captured_at: Optional[float] = None):
+        self.page_source = page_source
+        self.captured_at = captured_at
+        self.root = ET.fromstring(page_source.encode('utf-8') if isinstance(page_source, str) else page_source)
+        self._parents: Dict[ET.Element, ET.Element] = {}
+        self._order: Dict[ET.Element, int] = {}
+        for index, element in enumerate(self.root.iter()):
+            self._order[element] = index
+            for child in element:
+                self._parents[child] = element
+
+    # --- 内部: ツリー走査 ---
+    def _children(self, node) -> List[ET.Element]:
+        if node is _DOCUMENT:
+            return [self.root]
+        return list(node)
+
+    def _descendants_or_self(self, node) -> List[Any]:
+        if node is _DOCUMENT:
+            return [_DOCUMENT] + list(self.root.iter())
+        return list(node.iter())
+
+    def _sort(self, nodes: List[ET.Element]) -> List[ET.Element]:
+        return sorted(set(nodes), key=self._order.__getitem__)
+
+    def _step(self, context: List[Any], descendant: bool, axis: str, test: str, predicates: List[Any]):
+        results: List[ET.Element] = []
+        seen = set()
+        for node in context:
+            origins = self._descendants_or_self(node) if descendant else [node]
+            for origin in origins:
+                if axis == 'following-sibling':
+                    parent = self._parents.get(origin)
+                    if parent is None:
+                        continue
+                    siblings = list(parent)
+                    candidates = siblings[siblings.index(origin) + 1:]
+                elif axis == 'descendant':
+                    candidates = list(origin.iter())[1:] if origin is not _DOCUMENT else list(self.root.iter())
+                else:
+                    candidates = self._children(origin)
+                matched = [el for el in candidates if test == '*' or el.tag == test]
+                for el in _apply_predicates(self, matched, predicates):
+                    if el not in seen:
+                        seen.add(el)
+                        results.append(el)
+        return self._sort(results)
+
+    # --- 公開API ---
+    def find_all(self, by: str, value: str) -> List[SnapshotNode]:
+        """単一セレクタに一致する全要素をドキュメント順で返す"""
+        if by == BY_ID:
+            elements = [el for el in self.root.iter() if el.get('resource-id') == value]
+        elif by == BY_ACCESSIBILITY_ID:
+            elements = [el for el in self.root.iter() if el.get('content-desc') == value]
+        elif by == BY_CLASS_NAME:
+            elements = [el for el in self.root.iter() if el.get('class', el.tag) == value]
+        elif by == BY_XPATH:
+            elements = compile_xpath(value)(self, [])
+        elif by == BY_ANDROID_UIAUTOMATOR:
+            compiled = _UISELECTOR_CACHE.get(value)
+            if compiled is None:
+                compiled = _UISELECTOR_CACHE[value] = compile_uiselector(value)
+            elements = compiled(self)
+        else:
+            raise SnapshotSelectorError(f"Unsupported locator strategy for snapshot: {by}")
+        return [SnapshotNode(el) for el in elements]
+
+    def find(self, by: str, value: str) -> Optional[SnapshotNode]:
+        nodes = self.find_all(by, value)
+        return nodes[0] if nodes else None
+
+    def find_first(self, selectors_list: List[Tuple[str, str]]) -> Optional[SnapshotNode]:
+        """セレクタの優先順位リストを順に評価し、最初に一致した要素を返す"""
+        for by, value in selectors_list:
+            try:
+                node = self.find(by, value)
+            except SnapshotSelectorError:
+                continue
+            if node is not None:
+                return node
+        return None
+
+    def exists(self, selectors_list: List[Tuple[str, str]]) -> bool:
+        return self.find_first(selectors_list) is not None
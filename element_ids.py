@@ -98,6 +98,12 @@ PHOTO_MODE_INDICATOR_SELECTORS = [
     ID('wex')
 ]
 
+# --- 広告ラベル ---
+AD_LABEL_SELECTORS = [
+    (AppiumBy.XPATH, '//*[@text="広告"]'),
+    (AppiumBy.XPATH, '//*[@text="スポンサー"]')
+]
+
 # =====================================================================
 # III. 検索フロー
 # =====================================================================
@@ -149,6 +155,11 @@ SEARCH_BACK_BUTTON_SELECTORS = [
     (AppiumBy.XPATH, '(//android.widget.ImageView)[1]'),
 ]
 
+# --- 検索結果「動画」タブ ---
+SEARCH_VIDEO_TAB_SELECTORS = [
+    (AppiumBy.XPATH, '//android.widget.FrameLayout[@content-desc="動画"]')
+]
+
 # --- フィルター画面 ---
 FILTER_INTERMEDIATE_BUTTON_SELECTORS = [
     (AppiumBy.XPATH, '//*[contains(@content-desc, "フィルター")]')
@@ -164,4 +175,23 @@ FILTER_6_MONTHS_SELECTORS = [
 ]
 FILTER_APPLY_BUTTON_SELECTORS = [
     (AppiumBy.XPATH, '//*[@text="適用"]')
-]
\ No newline at end of file
+]
+# =====================================================================
+# IV. ポップアップ・異常画面 (★ V117 追加: recovery.py の画面診断)
+# =====================================================================
+
+# --- ポップアップ・広告オーバーレイの「閉じる」系ボタン (上から順に試す) ---
+POPUP_DISMISS_SELECTORS = [
+    (AppiumBy.XPATH, '//*[@content-desc="閉じる"]'),
+    (AppiumBy.XPATH, '//*[@text="閉じる"]'),
+    (AppiumBy.XPATH, '//*[@text="今はしない"]'),
+    (AppiumBy.XPATH, '//*[@text="スキップ"]'),
+    (AppiumBy.XPATH, '//*[@text="許可しない"]'),
+]
+
+# --- アプリのクラッシュ・応答なしダイアログ (Android のシステム UI) ---
+CRASH_DIALOG_SELECTORS = [
+    (AppiumBy.ID, 'android:id/aerr_close'),
+    (AppiumBy.ID, 'android:id/aerr_wait'),
+    (AppiumBy.XPATH, '//*[@text="アプリを閉じる"]'),
+]
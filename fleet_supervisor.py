@@ -0,0 +1,267 @@
+# =====================================================================
+# fleet_supervisor.py: bot_configurations の稼働対象ごとに収集 Bot を起動・監視する (V113)
+#
+# 1. is_active = 1 の行ごとに collector_bot_main.py <BOT_ID> を1プロセス起動する
+#    (FLEET_POLL_INTERVAL_SECONDS ごとに読み直すため、端末の追加は行の INSERT だけでよい)
+# 2. 起動は FLEET_START_STAGGER_SECONDS 以上の間隔をあける (Appium サーバーへのセッション作成を分散)
+# 3. 終了したプロセスは指数バックオフで再起動する
+#    FLEET_STABLE_RUN_SECONDS 以上動いていた場合は、待ち時間を初期値に戻す
+# 4. 行が無効化・削除されたら停止し、端末設定 (UDID など) が変わったら再起動する
+# 5. 起動時に last_started_at を更新する
+#
+# Bot の出力 (標準出力・標準エラー) は LOG_DIR/bot_<BOT_ID>.console.log に追記する。
+#
+# 使い方:
+#   python fleet_supervisor.py
+#   python fleet_supervisor.py --stagger 30 --poll-interval 60
+# =====================================================================
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_logger import logger, setup_logging_handlers
+from config import (LOG_DIR, FLEET_POLL_INTERVAL_SECONDS, FLEET_START_STAGGER_SECONDS,
+                    FLEET_RESTART_BACKOFF_BASE_SECONDS, FLEET_RESTART_BACKOFF_MAX_SECONDS, FLEET_STABLE_RUN_SECONDS,
+                    FLEET_STOP_TIMEOUT_SECONDS)
+from tiktok_db_manager import TikTokDBManager
+
+COLLECTOR_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'collector_bot_main.py')
+
+# この列が変わったら Bot を再起動する (last_started_at などは対象外)
+RESTART_ON_CHANGE_COLUMNS = ('appium_device_name', 'appium_udid', 'target_country', 'bot_type',
+                             'appium_host', 'appium_port')
+
+
+def restart_backoff_seconds(failures: int, base_seconds: float, max_seconds: float) -> float:
+    """連続失敗回数 (1始まり) に対する再起動までの待ち時間"""
+    return min(max_seconds, base_seconds * (2 ** max(failures - 1, 0)))
+
+
+class BotProcess:
+    """1 Bot 分のプロセスと再起動の状態"""
+
+    def __init__(self, bot_id: int, signature: Tuple[Any, ...]):
+        self.bot_id = bot_id
+        self.signature = signature
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.next_start_at = 0.0  # この時刻以降に (再) 起動してよい
+        self.failures = 0  # 連続で早期終了した回数
+        self.starts = 0
+        self._output = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def spawn(self):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        self._output = open(os.path.join(LOG_DIR, f"bot_{self.bot_id}.console.log"), 'ab')
+        # 端末の Ctrl+C が Bot に直接届かないよう別グループで起動する (停止は監視側から1回だけ送る)
+        kwargs: Dict[str, Any] = {}
+        if os.name == 'nt':
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs['start_new_session'] = True
+        self.process = subprocess.Popen([sys.executable, COLLECTOR_SCRIPT, str(self.bot_id)],
+                                        cwd=os.path.dirname(COLLECTOR_SCRIPT), stdout=self._output,
+                                        stderr=subprocess.STDOUT, **kwargs)
+        self.started_at = time.time()
+        self.starts += 1
+
+    def request_stop(self):
+        """終了処理 (セレクタ統計の保存、ドライバーの quit など) を行えるよう、まず割り込みで止める"""
+        if not self.running:
+            return
+        try:
+            if os.name == 'nt':
+                self.process.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                self.process.send_signal(signal.SIGINT)
+        except OSError:
+            pass
+
+    def wait_stopped(self, timeout_seconds: float):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=timeout_seconds)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"FLEET: Bot {self.bot_id} did not stop within {timeout_seconds:.0f}s. Killing.")
+            self.process.kill()
+            self.process.wait()
+        self.close_output()
+
+    def close_output(self):
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+
+
+class FleetSupervisor:
+    def __init__(self, db: TikTokDBManager, poll_interval_seconds: float = FLEET_POLL_INTERVAL_SECONDS,
+                 stagger_seconds: float = FLEET_START_STAGGER_SECONDS,
+                 backoff_base_seconds: float = FLEET_RESTART_BACKOFF_BASE_SECONDS,
+                 backoff_max_seconds: float = FLEET_RESTART_BACKOFF_MAX_SECONDS,
+                 stable_run_seconds: float = FLEET_STABLE_RUN_SECONDS,
+                 stop_timeout_seconds: float = FLEET_STOP_TIMEOUT_SECONDS):
+        self.db = db
+        self.poll_interval_seconds = poll_interval_seconds
+        self.stagger_seconds = stagger_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.stable_run_seconds = stable_run_seconds
+        self.stop_timeout_seconds = stop_timeout_seconds
+        self.bots: Dict[int, BotProcess] = {}
+        self._next_spawn_at = 0.0  # 次の起動を許可する時刻 (起動の間隔をあける)
+        self._stopping = False
+
+    # -----------------------------------------------------------------
+    # 設定の反映
+    # -----------------------------------------------------------------
+
+    @staticmethod
+    def _signature(row: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(row.get(column) for column in RESTART_ON_CHANGE_COLUMNS)
+
+    def sync(self, rows: List[Dict[str, Any]]):
+        """稼働対象の一覧を反映する (追加 → 起動予約、削除・無効化 → 停止、設定変更 → 再起動)"""
+        active = {int(row['bot_id']): self._signature(row) for row in rows}
+        for bot_id in sorted(set(self.bots) - set(active)):
+            logger.info(f"FLEET: Bot {bot_id} is no longer active. Stopping.")
+            self._stop_bot(self.bots.pop(bot_id))
+        for bot_id, signature in active.items():
+            bot = self.bots.get(bot_id)
+            if bot is None:
+                logger.info(f"FLEET: Bot {bot_id} added.")
+                self.bots[bot_id] = BotProcess(bot_id, signature)
+            elif bot.signature != signature:
+                logger.info(f"FLEET: Bot {bot_id} configuration changed. Restarting.")
+                self._stop_bot(bot)
+                bot.signature = signature
+                bot.failures = 0
+                bot.next_start_at = 0.0
+
+    def poll_configurations(self) -> bool:
+        try:
+            rows = self.db.fetch_active_bot_configurations()
+            # 読み取りのスナップショットを保持し続けないよう、トランザクションを閉じる
+            self.db.commit()
+        except Exception as e:
+            logger.warning(f"FLEET: Could not read bot_configurations ({e}). Keeping the current fleet.")
+            return False
+        self.sync(rows)
+        return True
+
+    # -----------------------------------------------------------------
+    # プロセスの監視
+    # -----------------------------------------------------------------
+
+    def tick(self, now: Optional[float] = None):
+        """終了したプロセスに再起動を予約し、起動してよい Bot を (間隔をあけて1つずつ) 起動する"""
+        now = time.time() if now is None else now
+        for bot in self.bots.values():
+            if bot.process is not None and not bot.running:
+                self._on_exit(bot, now)
+        if now < self._next_spawn_at:
+            return
+        waiting = [bot for bot in self.bots.values() if bot.process is None and bot.next_start_at <= now]
+        if not waiting:
+            return
+        bot = min(waiting, key=lambda b: (b.next_start_at, b.bot_id))
+        self._start_bot(bot, now)
+
+    def _on_exit(self, bot: BotProcess, now: float):
+        return_code = bot.process.returncode
+        ran_seconds = now - bot.started_at
+        bot.process = None
+        bot.close_output()
+        bot.failures = 1 if ran_seconds >= self.stable_run_seconds else bot.failures + 1
+        delay = restart_backoff_seconds(bot.failures, self.backoff_base_seconds, self.backoff_max_seconds)
+        bot.next_start_at = now + delay
+        logger.warning(f"FLEET: Bot {bot.bot_id} exited (Code: {return_code}, Ran: {ran_seconds:.0f}s, "
+                       f"Consecutive: {bot.failures}). Restarting in {delay:.0f}s.")
+
+    def _start_bot(self, bot: BotProcess, now: float):
+        try:
+            bot.spawn()
+        except OSError as e:
+            bot.failures += 1
+            bot.next_start_at = now + restart_backoff_seconds(bot.failures, self.backoff_base_seconds,
+                                                              self.backoff_max_seconds)
+            logger.error(f"FLEET: Failed to start bot {bot.bot_id}: {e}")
+            return
+        self._next_spawn_at = now + self.stagger_seconds
+        logger.info(f"FLEET: Started bot {bot.bot_id} (PID: {bot.process.pid}, Start #{bot.starts}).")
+        self.db.mark_bot_started(bot.bot_id)
+
+    def _stop_bot(self, bot: BotProcess):
+        bot.request_stop()
+        bot.wait_stopped(self.stop_timeout_seconds)
+        bot.process = None
+
+    def stop_all(self):
+        """全 Bot に停止を要求し、まとめて終了を待つ"""
+        running = [bot for bot in self.bots.values() if bot.running]
+        if running:
+            logger.info(f"FLEET: Stopping {len(running)} bots...")
+        for bot in running:
+            bot.request_stop()
+        for bot in running:
+            bot.wait_stopped(self.stop_timeout_seconds)
+            bot.process = None
+
+    def status_line(self) -> str:
+        parts = []
+        for bot_id, bot in sorted(self.bots.items()):
+            state = f"up {time.time() - bot.started_at:.0f}s" if bot.running else \
+                f"waiting {max(bot.next_start_at - time.time(), 0):.0f}s"
+            parts.append(f"{bot_id}({state}, starts={bot.starts})")
+        return ', '.join(parts) or 'no active bots'
+
+    def request_shutdown(self, signum=None, frame=None):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.request_shutdown)
+        signal.signal(signal.SIGTERM, self.request_shutdown)
+        logger.info(f"FLEET: Supervisor started (Poll: {self.poll_interval_seconds:.0f}s, "
+                    f"Stagger: {self.stagger_seconds:.0f}s, Backoff: {self.backoff_base_seconds:.0f}s"
+                    f"-{self.backoff_max_seconds:.0f}s).")
+        next_poll_at = 0.0
+        try:
+            while not self._stopping:
+                now = time.time()
+                if now >= next_poll_at:
+                    self.poll_configurations()
+                    logger.info(f"FLEET: {self.status_line()}")
+                    next_poll_at = now + self.poll_interval_seconds
+                self.tick(now)
+                time.sleep(1.0)
+        finally:
+            self.stop_all()
+            logger.info("FLEET: Supervisor stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise one collector process per active bot.")
+    parser.add_argument('--poll-interval', type=float, default=FLEET_POLL_INTERVAL_SECONDS,
+                        help="Seconds between bot_configurations reads")
+    parser.add_argument('--stagger', type=float, default=FLEET_START_STAGGER_SECONDS,
+                        help="Minimum seconds between two bot starts")
+    args = parser.parse_args()
+
+    setup_logging_handlers('fleet_supervisor')
+    db = TikTokDBManager()
+    try:
+        FleetSupervisor(db, poll_interval_seconds=args.poll_interval, stagger_seconds=args.stagger).run()
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
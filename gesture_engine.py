@@ -0,0 +1,344 @@
+# =====================================================================
+# gesture_engine.py: スワイプなどのジェスチャー実行 (V110)
+#
+# 1. 画面サイズはセッションごとに1回だけ取得してキャッシュする
+#    (回転はスナップショットの hierarchy の rotation 属性で検知し、その時だけ取り直す)
+# 2. ジェスチャー (config.GESTURE_PATHS: 画面に対する割合) は実座標とコマンド本体を事前に組み立てておく
+# 3. 実行方法 (バックエンド) を選べる:
+#    'w3c'           : W3C Actions (performActions を1回送る)
+#    'swipe_gesture' : UiAutomator2 の mobile: swipeGesture
+#    'adb'           : adb shell input swipe (Appium を経由しない)
+# 4. 'auto' の場合は最初の数回のスワイプで各バックエンドを交互に計測し、端末ごとに最速のものを選んで保存する
+#
+# 単体で計測する場合:
+#   python gesture_engine.py <BOT_ID> [--trials 5]
+# =====================================================================
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from selenium.webdriver.remote.command import Command
+
+from app_logger import logger
+from config import GESTURE_BACKEND, GESTURE_PATHS, GESTURE_BENCHMARK_TRIALS, GESTURE_PROFILE_MAX_AGE_SECONDS
+from metrics import GESTURE_SECONDS
+
+# 'auto' の計測で最後に頼るバックエンド (どの環境でも動く)
+FALLBACK_BACKEND = 'w3c'
+# mobile: swipeGesture に渡す領域の幅 (スワイプ方向と直交する向き, px)
+SWIPE_GESTURE_BAND_PX = 100
+
+
+class ScreenGeometry:
+    __slots__ = ('width', 'height', 'rotation')
+
+    def __init__(self, width: int, height: int, rotation: Optional[str] = None):
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+
+
+class GesturePath:
+    """実座標に変換済みのジェスチャー。各バックエンドに送るコマンド本体もここで1回だけ組み立てる"""
+
+    def __init__(self, name: str, start: Tuple[int, int], end: Tuple[int, int], duration_ms: int):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.duration_ms = duration_ms
+        self.actions_payload = self._build_actions_payload()
+        self.swipe_gesture_args = self._build_swipe_gesture_args()
+        self.input_swipe_args = [str(start[0]), str(start[1]), str(end[0]), str(end[1]), str(duration_ms)]
+
+    def _build_actions_payload(self) -> Dict[str, Any]:
+        return {'actions': [{
+            'type': 'pointer',
+            'id': 'finger1',
+            'parameters': {'pointerType': 'touch'},
+            'actions': [
+                {'type': 'pointerMove', 'duration': 0, 'x': self.start[0], 'y': self.start[1], 'origin': 'viewport'},
+                {'type': 'pointerDown', 'button': 0},
+                {'type': 'pointerMove', 'duration': self.duration_ms, 'x': self.end[0], 'y': self.end[1],
+                 'origin': 'viewport'},
+                {'type': 'pointerUp', 'button': 0},
+            ],
+        }]}
+
+    def _build_swipe_gesture_args(self) -> Optional[Dict[str, Any]]:
+        """swipeGesture は上下左右の直線のみ。斜めのジェスチャーは None (このバックエンドでは実行できない)"""
+        (start_x, start_y), (end_x, end_y) = self.start, self.end
+        seconds = max(self.duration_ms, 1) / 1000
+        if start_x == end_x and start_y != end_y:
+            distance = abs(end_y - start_y)
+            return {'left': max(start_x - SWIPE_GESTURE_BAND_PX // 2, 0), 'top': min(start_y, end_y),
+                    'width': SWIPE_GESTURE_BAND_PX, 'height': distance,
+                    'direction': 'up' if end_y < start_y else 'down', 'percent': 1.0, 'speed': int(distance / seconds)}
+        if start_y == end_y and start_x != end_x:
+            distance = abs(end_x - start_x)
+            return {'left': min(start_x, end_x), 'top': max(start_y - SWIPE_GESTURE_BAND_PX // 2, 0),
+                    'width': distance, 'height': SWIPE_GESTURE_BAND_PX,
+                    'direction': 'left' if end_x < start_x else 'right', 'percent': 1.0,
+                    'speed': int(distance / seconds)}
+        return None
+
+
+# =====================================================================
+# I. バックエンド
+# =====================================================================
+
+class GestureBackend:
+    name = ''
+
+    def supports(self, path: GesturePath) -> bool:
+        return True
+
+    def perform(self, path: GesturePath):
+        raise NotImplementedError
+
+
+class W3CActionsBackend(GestureBackend):
+    name = 'w3c'
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def perform(self, path: GesturePath):
+        # ActionChains を毎回組み立てず、事前に作ったコマンド本体をそのまま送る
+        self.driver.execute(Command.W3C_ACTIONS, path.actions_payload)
+
+
+class SwipeGestureBackend(GestureBackend):
+    name = 'swipe_gesture'
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def supports(self, path: GesturePath) -> bool:
+        return path.swipe_gesture_args is not None
+
+    def perform(self, path: GesturePath):
+        self.driver.execute_script('mobile: swipeGesture', path.swipe_gesture_args)
+
+
+class AdbInputBackend(GestureBackend):
+    name = 'adb'
+
+    def __init__(self, adb_host: str, adb_port: int):
+        self.cmd_prefix = ['adb', '-H', str(adb_host), '-P', str(adb_port), 'shell', 'input', 'swipe']
+
+    def perform(self, path: GesturePath):
+        timeout = path.duration_ms / 1000 + 10
+        result = subprocess.run(self.cmd_prefix + path.input_swipe_args, capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"adb input swipe failed (Code: {result.returncode}): "
+                               f"{result.stderr.decode('utf-8', errors='ignore').strip()}")
+
+
+# =====================================================================
+# II. ジェスチャー・エンジン
+# =====================================================================
+
+class GestureEngine:
+
+    def __init__(self, driver, adb_host: str, adb_port: int, backend_name: str = GESTURE_BACKEND,
+                 profile_path: Optional[str] = None, trials: int = GESTURE_BENCHMARK_TRIALS,
+                 on_performed: Optional[Callable[[], None]] = None):
+        self.driver = driver
+        self.backends: Dict[str, GestureBackend] = {
+            backend.name: backend for backend in (W3CActionsBackend(driver), SwipeGestureBackend(driver),
+                                                  AdbInputBackend(adb_host, adb_port))
+        }
+        if backend_name != 'auto' and backend_name not in self.backends:
+            raise ValueError(f"Unknown gesture backend '{backend_name}'. Available: {sorted(self.backends)} or 'auto'")
+        self.profile_path = profile_path
+        self.trials = trials
+        self.on_performed = on_performed
+        self._geometry: Optional[ScreenGeometry] = None
+        self._paths: Dict[str, GesturePath] = {}
+        self._timings: Dict[str, List[float]] = {name: [] for name in self.backends}
+        self._disqualified: Dict[str, str] = {}
+        self._last_backend: Optional[str] = None
+        self.backend_name: Optional[str] = None if backend_name == 'auto' else backend_name
+        if self.backend_name is None:
+            self.backend_name = self._load_profile()
+
+    # --- 画面サイズ ---
+
+    def geometry(self) -> ScreenGeometry:
+        if self._geometry is None:
+            size = self.driver.get_window_size()
+            self._geometry = ScreenGeometry(int(size['width']), int(size['height']))
+            logger.debug(f"GESTURE: Screen geometry {self._geometry.width}x{self._geometry.height} cached.")
+        return self._geometry
+
+    def invalidate_geometry(self):
+        self._geometry = None
+        self._paths.clear()
+
+    def observe_snapshot(self, snapshot):
+        """取得済みのスナップショット (hierarchy の rotation / width / height) から回転を検知する (往復なし)"""
+        root = snapshot.root
+        rotation = root.get('rotation')
+        if rotation is None:
+            return
+        width, height = root.get('width'), root.get('height')
+        geometry = self._geometry
+        if geometry is not None and geometry.rotation == rotation:
+            return
+        if geometry is not None and geometry.rotation is not None:
+            logger.info(f"GESTURE: Screen rotation changed ({geometry.rotation} -> {rotation}). Recomputing paths.")
+        self._paths.clear()
+        if width and height:
+            self._geometry = ScreenGeometry(int(width), int(height), rotation)
+        else:
+            self._geometry = None
+
+    # --- ジェスチャーの組み立て ---
+
+    def path(self, name: str, duration_ms: Optional[int] = None) -> GesturePath:
+        if duration_ms is None and name in self._paths:
+            return self._paths[name]
+        start_x, start_y, end_x, end_y, default_duration = GESTURE_PATHS[name]
+        geometry = self.geometry()
+        path = GesturePath(name, (int(geometry.width * start_x), int(geometry.height * start_y)),
+                           (int(geometry.width * end_x), int(geometry.height * end_y)),
+                           duration_ms if duration_ms is not None else default_duration)
+        if duration_ms is None:
+            self._paths[name] = path
+        return path
+
+    # --- 実行 ---
+
+    def perform(self, name: str, duration_ms: Optional[int] = None) -> float:
+        """ジェスチャーを実行し、所要時間 (秒) を返す"""
+        path = self.path(name, duration_ms)
+        backend = self._choose_backend(path)
+        started = time.time()
+        try:
+            backend.perform(path)
+        except Exception as e:
+            if backend.name == FALLBACK_BACKEND:
+                raise
+            self._disqualify(backend.name, f"{type(e).__name__}: {e}")
+            backend = self.backends[FALLBACK_BACKEND]
+            started = time.time()
+            backend.perform(path)
+        elapsed = time.time() - started
+        GESTURE_SECONDS.observe(elapsed, gesture=name, backend=backend.name)
+        self._last_backend = backend.name
+        # 画面が動くため、どのバックエンドでも呼び出し側のキャッシュを無効化させる
+        if self.on_performed:
+            self.on_performed()
+        if self.backend_name is None:
+            self._timings[backend.name].append(elapsed)
+            self._finish_trial_if_done()
+        logger.debug("GESTURE: %s via %s in %.3fs.", name, backend.name, elapsed)
+        return elapsed
+
+    def report_ineffective(self):
+        """直前のジェスチャーが画面に反映されなかった (動画が切り替わらなかった) ことを通知する"""
+        if self.backend_name is None and self._last_backend and self._last_backend != FALLBACK_BACKEND:
+            self._disqualify(self._last_backend, "gesture did not register")
+
+    def _choose_backend(self, path: GesturePath) -> GestureBackend:
+        if self.backend_name is not None:
+            backend = self.backends[self.backend_name]
+            return backend if backend.supports(path) else self.backends[FALLBACK_BACKEND]
+        # 計測中: 計測回数が最も少ないバックエンドを使う (交互に計測される)
+        candidates = [b for b in self.backends.values() if b.name not in self._disqualified and b.supports(path)]
+        return min(candidates, key=lambda b: len(self._timings[b.name]))
+
+    def _disqualify(self, backend_name: str, reason: str):
+        if backend_name not in self._disqualified:
+            self._disqualified[backend_name] = reason
+            logger.warning(f"GESTURE: Backend '{backend_name}' excluded ({reason}).")
+        if self.backend_name == backend_name:
+            self.backend_name = FALLBACK_BACKEND
+        elif self.backend_name is None:
+            self._finish_trial_if_done()
+
+    def _finish_trial_if_done(self):
+        remaining = [name for name in self.backends
+                     if name not in self._disqualified and len(self._timings[name]) < self.trials]
+        if remaining:
+            return
+        medians = {name: statistics.median(timings) for name, timings in self._timings.items()
+                   if timings and name not in self._disqualified}
+        self.backend_name = min(medians, key=medians.get) if medians else FALLBACK_BACKEND
+        logger.info(f"GESTURE: Selected backend '{self.backend_name}' "
+                    f"(Medians: { {k: round(v, 3) for k, v in medians.items()} }, Excluded: {self._disqualified}).")
+        self._save_profile(medians)
+
+    def run_benchmark(self, name: str = 'next_video', trials: Optional[int] = None) -> Dict[str, float]:
+        """全バックエンドを trials 回ずつ実行して計測し、最速のものを選ぶ (実機で明示的に計測する場合)"""
+        self.backend_name = None
+        self.trials = trials or self.trials
+        self._timings = {backend_name: [] for backend_name in self.backends}
+        self._disqualified = {}
+        while self.backend_name is None:
+            self.perform(name)
+            time.sleep(1.0)  # 画面の切り替わりを待つ (次の計測に影響させない)
+        return {name: statistics.median(t) for name, t in self._timings.items() if t}
+
+    # --- 端末ごとの計測結果 ---
+
+    def _load_profile(self) -> Optional[str]:
+        if not self.profile_path or not os.path.exists(self.profile_path):
+            return None
+        try:
+            with open(self.profile_path, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        except Exception as e:
+            logger.warning(f"GESTURE: Failed to load profile {self.profile_path}: {e}")
+            return None
+        if time.time() - profile.get('measured_at', 0) > GESTURE_PROFILE_MAX_AGE_SECONDS:
+            logger.info(f"GESTURE: Profile {self.profile_path} is stale. Re-measuring backends.")
+            return None
+        backend_name = profile.get('backend')
+        if backend_name not in self.backends:
+            return None
+        logger.info(f"GESTURE: Using backend '{backend_name}' from profile {self.profile_path}.")
+        return backend_name
+
+    def _save_profile(self, medians: Dict[str, float]):
+        if not self.profile_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.profile_path) or '.', exist_ok=True)
+            with open(self.profile_path, 'w', encoding='utf-8') as f:
+                json.dump({'backend': self.backend_name, 'medians': medians, 'excluded': self._disqualified,
+                           'measured_at': time.time()}, f, indent=1)
+        except Exception as e:
+            logger.warning(f"GESTURE: Failed to save profile {self.profile_path}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gesture backends on a bot's device and save the fastest.")
+    parser.add_argument('bot_id', type=int)
+    parser.add_argument('--trials', type=int, default=5)
+    args = parser.parse_args()
+
+    from app_logger import setup_logging_handlers
+    from tiktok_db_manager import TikTokDBManager
+    from tiktok_appium_helper import TiktokAppiumHelper
+    setup_logging_handlers()
+    bot_config = TikTokDBManager().fetch_bot_configuration(args.bot_id)
+    helper = TiktokAppiumHelper.initialize_driver(bot_config['appium_device_name'], bot_config['appium_udid'],
+                                                  bot_config['appium_host'], bot_config['appium_port'],
+                                                  reuse_session=False)
+    try:
+        helper.collect_via_recommended()
+        medians = helper.gestures.run_benchmark(trials=args.trials)
+        for backend_name, seconds in sorted(medians.items(), key=lambda item: item[1]):
+            logger.info(f"GESTURE: {backend_name:<14} median {seconds * 1000:.0f} ms")
+        logger.info(f"GESTURE: Selected '{helper.gestures.backend_name}' (Saved to {helper.gestures.profile_path}).")
+    finally:
+        helper.quit()
+
+
+if __name__ == '__main__':
+    main()
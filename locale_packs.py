@@ -0,0 +1,187 @@
+# =====================================================================
+# locale_packs.py: 端末の表示言語ごとの UI 文字列・数値表記パック (V109)
+#
+# element_ids.py のセレクタは日本語 UI の文字列 ("ホーム", "リンクをコピー" など) を含む。
+# 日本以外の端末ではどのセレクタにも一致せず、毎回タイムアウトまで待つことになるため、
+# Bot の target_country に対応する言語パック (locales/<locale>.py) を必要な時だけ読み込み、
+# セレクタ中の日本語文字列をその言語の文字列に置き換える。
+#
+# パックのモジュールは以下を定義する:
+#   STRINGS             : キー → UI 文字列 (キーは locales/ja.py と共通)
+#   COUNT_MULTIPLIERS   : 数値の接尾辞 → 倍率 (例: {'K': 1000, '万': 10000})
+#   DECIMAL_SEPARATOR   : 小数点 ('.' または ',')
+#   LIKES_DESC_TEMPLATE : いいねボタンの content-desc から数値部分を取り出す正規表現 ({count} に数値表記が入る)
+# =====================================================================
+import importlib
+import re
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from app_logger import logger
+
+BASE_LOCALE = 'ja'  # element_ids.py に書かれている言語
+
+_PACK_CACHE: Dict[str, 'LocalePack'] = {}
+_BASE_LISTS: Dict[str, List[Tuple[str, str]]] = {}
+_ACTIVE_PACK: Optional['LocalePack'] = None
+
+# accessibility id はセレクタの値そのものが UI 文字列
+ACCESSIBILITY_ID = 'accessibility id'
+
+# 数値部分 (桁区切りには , . と各種スペースが使われる)
+GROUP_SEPARATORS = {',', '.', ' ', '\u00a0', '\u202f'}
+NUMBER_PATTERN = r'\d(?:[\d,.\u00a0\u202f ]*\d)?'
+
+
+class LocalePackError(Exception):
+    pass
+
+
+class CountParser:
+    """
+    「1.2万」「3,4 Mio.」「12,345」「1.5B」のような件数表記を整数に変換する。
+    接尾辞と区切り文字から正規表現を1回だけ組み立てる (呼び出しごとに文字列置換を繰り返さない)。
+    """
+
+    def __init__(self, multipliers: Dict[str, int], decimal_separator: str = '.'):
+        if decimal_separator not in ('.', ','):
+            raise LocalePackError(f"Unsupported decimal separator '{decimal_separator}'.")
+        if not multipliers:
+            raise LocalePackError("At least one count suffix is required.")
+        self.multipliers = {suffix.upper(): value for suffix, value in multipliers.items()}
+        self.decimal_separator = decimal_separator
+        self.group_separators = GROUP_SEPARATORS - {decimal_separator}
+        # 長い接尾辞から先に試す (例: 'MIO.' を 'M' より優先)
+        suffixes = '|'.join(re.escape(s) for s in sorted(self.multipliers, key=len, reverse=True))
+        self.count_pattern = rf'{NUMBER_PATTERN}\s?(?:{suffixes})?'
+        self._regex = re.compile(rf'\s*({NUMBER_PATTERN})\s?({suffixes})?\s*', re.IGNORECASE)
+        self._numeric = re.compile(self.count_pattern, re.IGNORECASE)
+
+    def parse(self, text: str) -> int:
+        if not text:
+            return 0
+        match = self._regex.fullmatch(str(text))
+        if not match:
+            return 0
+        number, suffix = match.group(1), match.group(2)
+        for separator in self.group_separators:
+            number = number.replace(separator, '')
+        if self.decimal_separator == ',':
+            number = number.replace(',', '.')
+        try:
+            value = float(number)
+        except ValueError:
+            return 0
+        if suffix:
+            value *= self.multipliers[suffix.upper()]
+        return int(round(value))
+
+    def is_count(self, text: str) -> bool:
+        """キャプションが数値表記だけ (= いいね数などを誤って拾った) かどうか"""
+        return bool(self._numeric.fullmatch(text))
+
+
+class LocalePack:
+    def __init__(self, locale: str, strings: Dict[str, str], count_parser: CountParser, likes_desc_template: str):
+        self.locale = locale
+        self.strings = strings
+        self.count_parser = count_parser
+        self.likes_desc_pattern = re.compile(likes_desc_template.format(count=f'({count_parser.count_pattern})'),
+                                             re.IGNORECASE)
+
+    def parse_count(self, text: str) -> int:
+        return self.count_parser.parse(text)
+
+
+def load_locale_pack(locale: str) -> LocalePack:
+    """locales/<locale>.py を初めて必要になった時に読み込む (読み込み済みならキャッシュを返す)"""
+    pack = _PACK_CACHE.get(locale)
+    if pack is not None:
+        return pack
+    try:
+        module = importlib.import_module(f'locales.{locale}')
+    except ImportError as e:
+        raise LocalePackError(f"Locale pack '{locale}' not found: {e}") from e
+    pack = LocalePack(locale, dict(module.STRINGS),
+                      CountParser(module.COUNT_MULTIPLIERS, getattr(module, 'DECIMAL_SEPARATOR', '.')),
+                      module.LIKES_DESC_TEMPLATE)
+    _PACK_CACHE[locale] = pack
+    logger.debug(f"LOCALE: Loaded pack '{locale}' ({len(pack.strings)} strings).")
+    return pack
+
+
+def resolve_locale(country_code: Optional[str], locale_by_country: Dict[str, str], default_locale: str) -> str:
+    return locale_by_country.get((country_code or '').upper(), default_locale)
+
+
+def active_pack() -> LocalePack:
+    """現在適用中のパック (未適用なら element_ids.py と同じ日本語パック)"""
+    global _ACTIVE_PACK
+    if _ACTIVE_PACK is None:
+        _ACTIVE_PACK = load_locale_pack(BASE_LOCALE)
+    return _ACTIVE_PACK
+
+
+def _translate(selector: Tuple[str, str], replacements: Dict[str, str]) -> Tuple[str, str]:
+    by, value = selector
+    if by == ACCESSIBILITY_ID:
+        return by, replacements.get(value, value)
+    # XPath / UiSelector 中の引用符で囲まれた文字列だけを置き換える (部分一致で他の文字列を壊さない)
+    for source, target in replacements.items():
+        for quote in ('"', "'"):
+            value = value.replace(f'{quote}{source}{quote}', f'{quote}{target}{quote}')
+    return by, value
+
+
+def _selector_lists(namespace) -> Dict[str, list]:
+    return {name: value for name, value in vars(namespace).items()
+            if name.endswith('_SELECTORS') and isinstance(value, list)}
+
+
+def _translated_lists(locale: str, lists: Dict[str, list]) -> Dict[str, List[Tuple[str, str]]]:
+    """element_ids.py の元の内容 (日本語) から、指定した言語に置き換えたセレクタリストを作る"""
+    if not _BASE_LISTS:
+        _BASE_LISTS.update({name: list(value) for name, value in lists.items()})
+
+    base = load_locale_pack(BASE_LOCALE)
+    pack = load_locale_pack(locale)
+    replacements = {text: pack.strings[key] for key, text in base.strings.items()
+                    if key in pack.strings and pack.strings[key] != text}
+    missing = sorted(set(base.strings) - set(pack.strings))
+    if missing:
+        logger.warning(f"LOCALE: Pack '{locale}' has no strings for {missing}. Japanese selectors are kept for them.")
+
+    translated_lists = {}
+    for name, target in lists.items():
+        original = _BASE_LISTS.get(name, target)
+        translated = [_translate(sel, replacements) for sel in original]
+        # 翻訳後に同じになったセレクタ (例: 両言語で同じ文字列) は重複させない
+        translated_lists[name] = list(dict.fromkeys(translated))
+    return translated_lists
+
+
+def apply_locale_pack(locale: str, namespace) -> int:
+    """
+    namespace (element_ids) のセレクタリストを、指定した言語の文字列に「その場で」置き換える。
+    リストの同一性を保つため、統計キーや import 済みの参照はそのまま有効。変更したリスト数を返す。
+    何度呼んでも element_ids.py の元の内容 (日本語) から置き換える。
+    """
+    global _ACTIVE_PACK
+    lists = _selector_lists(namespace)
+    changed = 0
+    for name, translated in _translated_lists(locale, lists).items():
+        target = lists[name]
+        if translated != target:
+            changed += 1
+        target[:] = translated
+    _ACTIVE_PACK = load_locale_pack(locale)
+    logger.info(f"LOCALE: Applied locale pack '{locale}' ({changed} selector lists changed).")
+    return changed
+
+
+def localized_selectors(locale: str, namespace) -> SimpleNamespace:
+    """
+    [V114 新規] namespace (element_ids) を変更せずに、指定した言語のセレクタリストを持つ別の名前空間を返す。
+    1プロセスで言語の異なる複数の端末を動かす場合 (async_collector.py) に端末ごとに使う。
+    """
+    return SimpleNamespace(**_translated_lists(locale, _selector_lists(namespace)))
@@ -0,0 +1,4 @@
+# =====================================================================
+# locales: 表示言語ごとの UI 文字列・数値表記パック (V109)
+# 読み込みと適用は locale_packs.py が行う。パックは Bot の国に対応するものだけが import される。
+# =====================================================================
@@ -0,0 +1,33 @@
+# =====================================================================
+# locales/de.py: ドイツ語 UI (小数点がカンマ: "1,2 Mio.") (V109)
+# 新しいアプリバージョンで文字列が変わった場合は DOM ダンプ (DOM_DUMPS_DIR) で確認して更新する
+# =====================================================================
+
+STRINGS = {
+    'home': 'Startseite',
+    'search': 'Suchen',
+    'share_video': 'Video teilen',
+    'copy_link': 'Link kopieren',
+    'like_video': 'Video liken',
+    'see_more': 'mehr',
+    'ad': 'Werbung',
+    'sponsored': 'Gesponsert',
+    'back': 'Zurück',
+    'videos_tab': 'Videos',
+    'filters': 'Filter',
+    'date_posted': 'Veröffentlichungsdatum',
+    'unwatched': 'Nicht angesehen',
+    'past_6_months': 'Letzte 6 Monate',
+    'apply': 'Anwenden',
+    # ★ V117 追加: ポップアップ・クラッシュダイアログ (recovery.py)
+    'close': 'Schließen',
+    'not_now': 'Jetzt nicht',
+    'skip': 'Überspringen',
+    'dont_allow': 'Nicht zulassen',
+    'close_app': 'App schließen',
+}
+
+COUNT_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'Tsd.': 1_000, 'Mio.': 1_000_000, 'Mrd.': 1_000_000_000}
+DECIMAL_SEPARATOR = ','
+# 例: "Video liken. 1,2 Mio. Likes"
+LIKES_DESC_TEMPLATE = r'{count}\s*Likes'
@@ -0,0 +1,33 @@
+# =====================================================================
+# locales/en.py: 英語 UI (V109)
+# 新しいアプリバージョンで文字列が変わった場合は DOM ダンプ (DOM_DUMPS_DIR) で確認して更新する
+# =====================================================================
+
+STRINGS = {
+    'home': 'Home',
+    'search': 'Search',
+    'share_video': 'Share video',
+    'copy_link': 'Copy link',
+    'like_video': 'Like video',
+    'see_more': 'more',
+    'ad': 'Ad',
+    'sponsored': 'Sponsored',
+    'back': 'Back',
+    'videos_tab': 'Videos',
+    'filters': 'Filters',
+    'date_posted': 'Date posted',
+    'unwatched': 'Unwatched',
+    'past_6_months': 'Past 6 months',
+    'apply': 'Apply',
+    # ★ V117 追加: ポップアップ・クラッシュダイアログ (recovery.py)
+    'close': 'Close',
+    'not_now': 'Not now',
+    'skip': 'Skip',
+    'dont_allow': "Don't allow",
+    'close_app': 'Close app',
+}
+
+COUNT_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+DECIMAL_SEPARATOR = '.'
+# 例: "Like video. 12.3K likes"
+LIKES_DESC_TEMPLATE = r'{count}\s*likes'
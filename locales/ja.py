@@ -0,0 +1,32 @@
+# =====================================================================
+# locales/ja.py: 日本語 UI (element_ids.py に書かれている文字列と一致させること) (V109)
+# =====================================================================
+
+STRINGS = {
+    'home': 'ホーム',
+    'search': '検索',
+    'share_video': '動画をシェアします',
+    'copy_link': 'リンクをコピー',
+    'like_video': '動画に「いいね」をします',
+    'see_more': 'もっと見る',
+    'ad': '広告',
+    'sponsored': 'スポンサー',
+    'back': '戻る',
+    'videos_tab': '動画',
+    'filters': 'フィルター',
+    'date_posted': '投稿日',
+    'unwatched': '未視聴',
+    'past_6_months': '過去6か月間',
+    'apply': '適用',
+    # ★ V117 追加: ポップアップ・クラッシュダイアログ (recovery.py)
+    'close': '閉じる',
+    'not_now': '今はしない',
+    'skip': 'スキップ',
+    'dont_allow': '許可しない',
+    'close_app': 'アプリを閉じる',
+}
+
+COUNT_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000, '千': 1_000, '万': 10_000, '億': 100_000_000}
+DECIMAL_SEPARATOR = '.'
+# 例: "動画に「いいね」をします。1.2万件"
+LIKES_DESC_TEMPLATE = r'{count}件'
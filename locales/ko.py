@@ -0,0 +1,33 @@
+# =====================================================================
+# locales/ko.py: 韓国語 UI (V109)
+# 新しいアプリバージョンで文字列が変わった場合は DOM ダンプ (DOM_DUMPS_DIR) で確認して更新する
+# =====================================================================
+
+STRINGS = {
+    'home': '홈',
+    'search': '검색',
+    'share_video': '동영상 공유',
+    'copy_link': '링크 복사',
+    'like_video': '동영상 좋아요',
+    'see_more': '더 보기',
+    'ad': '광고',
+    'sponsored': '스폰서',
+    'back': '뒤로',
+    'videos_tab': '동영상',
+    'filters': '필터',
+    'date_posted': '게시 날짜',
+    'unwatched': '시청하지 않음',
+    'past_6_months': '지난 6개월',
+    'apply': '적용',
+    # ★ V117 追加: ポップアップ・クラッシュダイアログ (recovery.py)
+    'close': '닫기',
+    'not_now': '나중에',
+    'skip': '건너뛰기',
+    'dont_allow': '허용 안함',
+    'close_app': '앱 닫기',
+}
+
+COUNT_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000, '천': 1_000, '만': 10_000, '억': 100_000_000}
+DECIMAL_SEPARATOR = '.'
+# 例: "동영상 좋아요. 1.2만개"
+LIKES_DESC_TEMPLATE = r'{count}\s*개'
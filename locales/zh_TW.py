@@ -0,0 +1,33 @@
+# =====================================================================
+# locales/zh_TW.py: 繁体字中国語 UI (台湾・香港) (V109)
+# 新しいアプリバージョンで文字列が変わった場合は DOM ダンプ (DOM_DUMPS_DIR) で確認して更新する
+# =====================================================================
+
+STRINGS = {
+    'home': '首頁',
+    'search': '搜尋',
+    'share_video': '分享影片',
+    'copy_link': '複製連結',
+    'like_video': '對影片按讚',
+    'see_more': '更多',
+    'ad': '廣告',
+    'sponsored': '贊助',
+    'back': '返回',
+    'videos_tab': '影片',
+    'filters': '篩選條件',
+    'date_posted': '發布日期',
+    'unwatched': '未觀看',
+    'past_6_months': '過去 6 個月',
+    'apply': '套用',
+    # ★ V117 追加: ポップアップ・クラッシュダイアログ (recovery.py)
+    'close': '關閉',
+    'not_now': '稍後再說',
+    'skip': '略過',
+    'dont_allow': '不允許',
+    'close_app': '關閉應用程式',
+}
+
+COUNT_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000, '千': 1_000, '萬': 10_000, '億': 100_000_000}
+DECIMAL_SEPARATOR = '.'
+# 例: "對影片按讚。1.2萬 個讚"
+LIKES_DESC_TEMPLATE = r'{count}\s*個'
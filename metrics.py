@@ -0,0 +1,278 @@
+# =====================================================================
+# metrics.py: プロセス内のレイテンシ・ヒストグラムとカウンター (V111)
+#
+# 1. ヒストグラムは固定バケット (境界の二分探索 + 加算のみ) で記録する。サンプルは保持しない
+# 2. ラベル (例: stage="url") ごとに系列を持つ。ラベルの組み合わせは少数であることを前提とする
+# 3. Prometheus のテキスト形式で出力する
+#    - テキストファイル (node_exporter の textfile collector 用。一時ファイルに書いて置き換える)
+#    - ローカル HTTP エンドポイント (GET /metrics)
+# 4. Bot ID などの共通ラベルは set_constant_labels() で全系列に付ける
+# =====================================================================
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app_logger import logger
+
+# 既定のレイテンシ・バケット (秒)。要素検索の数十 ms からアプリ再起動の数十秒までを想定
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, bucket_count: int):
+        self.counts = [0] * (bucket_count + 1)  # 最後は +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.counts[index] += 1
+            series.total += value
+            series.count += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self, constant_labels: LabelKey) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s.counts), s.total, s.count) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            pairs = list(constant_labels) + list(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self, constant_labels: LabelKey) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for key, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(list(constant_labels) + list(key))} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._constant_labels: LabelKey = ()
+
+    def set_constant_labels(self, **labels):
+        self._constant_labels = _label_key(labels)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Histogram(name, help_text, buckets)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Counter(name, help_text)
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render(self._constant_labels))
+        return '\n'.join(lines) + '\n'
+
+
+# プロセス全体で共有するレジストリ (Bot 1プロセス = 1レジストリ)
+REGISTRY = MetricsRegistry()
+
+# --- 計測対象 (名前と説明はここに集約する) ---
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    'tiktok_pipeline_stage_seconds', 'Time spent in each process_single_video stage.')
+VIDEOS_TOTAL = REGISTRY.counter(
+    'tiktok_videos_total', 'Videos handled by process_single_video, by outcome.')
+FIND_ELEMENT_SECONDS = REGISTRY.histogram(
+    'tiktok_find_element_seconds', 'find_element_with_fallbacks latency, by selector list and result.')
+SEARCH_STEP_SECONDS = REGISTRY.histogram(
+    'tiktok_search_step_seconds', 'perform_search wait per step.')
+APP_REBOOT_SECONDS = REGISTRY.histogram(
+    'tiktok_app_reboot_seconds', 'reboot_tiktok_app duration, by result.')
+GESTURE_SECONDS = REGISTRY.histogram(
+    'tiktok_gesture_seconds', 'Gesture command latency, by gesture and backend.')
+# ★ V115 追加: Appium コマンドの往復時間と、動画1本あたりの通信 / 端末側の時間
+APPIUM_COMMAND_SECONDS = REGISTRY.histogram(
+    'tiktok_appium_command_seconds', 'WebDriver command round-trip time, by command name.')
+APPIUM_CONNECTIONS_TOTAL = REGISTRY.counter(
+    'tiktok_appium_connections_total', 'New HTTP connections opened to the Appium server.')
+APPIUM_COMMAND_DEADLINE_EXCEEDED_TOTAL = REGISTRY.counter(
+    'tiktok_appium_command_deadline_exceeded_total', 'Appium commands aborted by the deadline watchdog, by command.')
+VIDEO_APPIUM_SECONDS = REGISTRY.histogram(
+    'tiktok_video_appium_seconds', 'Appium time per video, split into estimated transport and device time.')
+# ★ V117 追加: 画面診断によるリカバリ
+RECOVERY_TOTAL = REGISTRY.counter(
+    'tiktok_recovery_total', 'Recoveries, by initial screen diagnosis, last action and result.')
+RECOVERY_SECONDS = REGISTRY.histogram(
+    'tiktok_recovery_seconds', 'Recovery duration, by last action taken.')
+# ★ V119 追加: DB 書き込みバッファ
+DB_FLUSH_SECONDS = REGISTRY.histogram(
+    'tiktok_db_flush_seconds', 'Write buffer flush duration (one transaction), by result.')
+DB_BUFFERED_ROWS_TOTAL = REGISTRY.counter(
+    'tiktok_db_buffered_rows_total', 'Rows written through the write buffer, by kind.')
+DB_BUFFER_DROPPED_ROWS_TOTAL = REGISTRY.counter(
+    'tiktok_db_buffer_dropped_rows_total', 'Buffered rows dropped without being written, by reason.')
+# ★ V120 追加: バックグラウンド DB ライターとローカルスプール
+DB_WRITER_RECORDS_TOTAL = REGISTRY.counter(
+    'tiktok_db_writer_records_total', 'Write operations handled by the background DB writer, by result.')
+
+
+# =====================================================================
+# 出力
+# =====================================================================
+
+def write_textfile(path: str, registry: MetricsRegistry = REGISTRY):
+    """textfile collector が書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.prom')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsExporter:
+    """
+    mode='textfile': interval_seconds ごとに path へ書き出す (停止時にも1回書く)
+    mode='http'    : host:port で GET /metrics に応答する
+    """
+
+    def __init__(self, mode: str, path: Optional[str] = None, host: str = '127.0.0.1', port: int = 0,
+                 interval_seconds: float = 15.0, registry: MetricsRegistry = REGISTRY):
+        if mode not in ('textfile', 'http'):
+            raise ValueError(f"Unknown metrics export mode '{mode}'. Use 'textfile' or 'http'.")
+        if mode == 'textfile' and not path:
+            raise ValueError("A path is required for textfile export.")
+        self.mode = mode
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.registry = registry
+        self._stop = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+        if mode == 'http':
+            handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+            self._server = ThreadingHTTPServer((host, port), handler)
+            self._server.daemon_threads = True
+            self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsHTTP', daemon=True)
+            logger.info(f"METRICS: Serving http://{host}:{self._server.server_address[1]}/metrics")
+        else:
+            self._thread = threading.Thread(target=self._write_loop, name='MetricsTextfile', daemon=True)
+            logger.info(f"METRICS: Writing {path} every {interval_seconds:.0f}s")
+        self._thread.start()
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            self._write()
+
+    def _write(self):
+        try:
+            write_textfile(self.path, self.registry)
+        except Exception as e:
+            logger.warning(f"METRICS: Failed to write {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        else:
+            self._write()
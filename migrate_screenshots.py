@@ -0,0 +1,88 @@
+# =====================================================================
+# migrate_screenshots.py: tiktok_videos.screenshot_data (BLOB) をスクリーンショットストアへ移行する (V107)
+#
+# 1. BLOB が残っている行を主キー順に少しずつ (チャンク単位で) 読み込む
+# 2. ストアに保存し、ダイジェスト・寸法を記録して BLOB を NULL にする (1行ずつコミット)
+# 3. 途中で止めても、再実行すれば残りの行から続きを処理する
+#
+# 移行後、ディスク領域を解放するには別途 OPTIMIZE TABLE tiktok_videos を実行すること。
+#
+# 使い方:
+#   python migrate_screenshots.py                   (全件)
+#   python migrate_screenshots.py --max-chunks 10 --pause 1.0
+#   python migrate_screenshots.py --dry-run         (件数とサイズの確認のみ)
+# =====================================================================
+import argparse
+import time
+
+from app_logger import logger, setup_logging_handlers
+from config import SCREENSHOT_STORE_BACKEND, SCREENSHOT_STORE_OPTIONS, SCREENSHOT_MIGRATION_CHUNK_SIZE
+from screenshot_store import create_screenshot_store
+from tiktok_db_manager import TikTokDBManager
+
+
+def migrate(db: TikTokDBManager, chunk_size: int, max_chunks: int, pause_seconds: float, dry_run: bool):
+    store = create_screenshot_store(SCREENSHOT_STORE_BACKEND, **SCREENSHOT_STORE_OPTIONS)
+    last_video_id = ''
+    moved = failed = chunks = 0
+    moved_bytes = 0
+    started = time.time()
+
+    while not max_chunks or chunks < max_chunks:
+        rows = db.fetch_inline_screenshots(last_video_id, chunk_size)
+        # 読み取りのスナップショットを保持し続けないよう、チャンクごとにトランザクションを閉じる
+        db.commit()
+        if not rows:
+            break
+        chunks += 1
+        for row in rows:
+            last_video_id = row['video_id']
+            data = row['screenshot_data']
+            if dry_run:
+                moved += 1
+                moved_bytes += len(data)
+                continue
+            try:
+                ref = store.save(data)
+            except Exception as e:
+                failed += 1
+                logger.error(f"MIGRATE: Failed to store screenshot for {last_video_id}: {e}")
+                continue
+            # ストアへの書き込みが終わってから BLOB を消す (途中で落ちても画像は失われない)
+            if db.update_video_screenshot_ref(last_video_id, ref['digest'], ref['width'], ref['height'],
+                                              clear_blob=True):
+                moved += 1
+                moved_bytes += len(data)
+            else:
+                failed += 1
+                store.discard(ref)  # ★ V107 修正: 参照を記録できなかったファイルは残さない (BLOB は残っている)
+        logger.info(f"MIGRATE: Chunk {chunks} done (Moved: {moved}, Failed: {failed}, "
+                    f"Bytes: {moved_bytes:,}, Last ID: {last_video_id}).")
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    logger.info(f"MIGRATE: Finished in {time.time() - started:.1f}s. Moved={moved}, Failed={failed}, "
+                f"Bytes={moved_bytes:,}, Newly stored={store.saved}, Deduplicated={store.deduplicated}"
+                f"{' (DRY RUN)' if dry_run else ''}.")
+    if moved and not dry_run:
+        logger.info("MIGRATE: Run 'OPTIMIZE TABLE tiktok_videos' to reclaim the freed space.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move inline screenshot BLOBs into the screenshot store.")
+    parser.add_argument('--chunk-size', type=int, default=SCREENSHOT_MIGRATION_CHUNK_SIZE)
+    parser.add_argument('--max-chunks', type=int, default=0, help="Stop after this many chunks (0 = no limit)")
+    parser.add_argument('--pause', type=float, default=0.5, help="Seconds to sleep between chunks")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    setup_logging_handlers()
+    db = TikTokDBManager()
+    try:
+        migrate(db, args.chunk_size, args.max_chunks, args.pause, args.dry_run)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# =====================================================================
+# perceptual_hash.py: 知覚ハッシュ (dHash) と近傍検索インデックス (V108)
+#
+# 同じクリップが別チャンネルから転載されると video_id は異なるが、画面はほぼ同じになる。
+# スクリーンショットから 64bit の dHash を求め、ハミング距離が閾値以内の既存レコードを
+# マルチインデックス・ハッシング (64bit を 4 つの 16bit セグメントに分割) で高速に探す。
+#
+# 鳩の巣原理: 距離 r 以内の2つのハッシュは、4 セグメントのうち少なくとも1つで距離 r // 4 以内になる。
+# 各セグメントの値 (と r // 4 ビット以内の変化) をキーとして候補を引き、全体の距離で絞り込む。
+#
+# ★ V108 修正: 単色・暗転したフレームは内容に関係なくハッシュがほぼ 0 になり、無関係な動画同士が
+# 転載として紐付いてしまうため、情報量の少ないフレーム・ハッシュはハッシュを求めず、インデックスにも入れない。
+# =====================================================================
+import threading
+from array import array
+from itertools import combinations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+HASH_BITS = 64
+DHASH_WIDTH = 9   # 横方向の隣接ピクセル差分を取るため 9x8 に縮小する
+DHASH_HEIGHT = 8
+MIN_PIXEL_STDDEV = 8.0   # 縮小後の輝度 (0〜255) の標準偏差がこれ未満のフレームはハッシュしない
+MIN_SET_BITS = 8         # 立っているビット数がこれ未満 (または 64 - これ より多い) のハッシュは比較に使わない
+
+
+def is_informative_hash(value: int, min_set_bits: int = MIN_SET_BITS) -> bool:
+    """[V108 新規] 単色・暗転フレームのような、ほぼ全ビットが同じハッシュでないか"""
+    set_bits = bin(value).count('1')
+    return min_set_bits <= set_bits <= HASH_BITS - min_set_bits
+
+
+def dhash_image(image, crop_box: Optional[Sequence[float]] = None,
+                min_stddev: float = MIN_PIXEL_STDDEV) -> Optional[int]:
+    """
+    Pillow の Image から 64bit の dHash を求める。
+    crop_box (左, 上, 右, 下: 0.0〜1.0 の割合) で、チャンネル名やキャプションなど
+    転載ごとに異なるオーバーレイ部分を除外できる。
+    ★ V108 修正: 輝度の変化がほとんど無い (単色・暗転) フレームは None を返す
+    """
+    if crop_box:
+        width, height = image.size
+        image = image.crop((int(crop_box[0] * width), int(crop_box[1] * height),
+                            int(crop_box[2] * width), int(crop_box[3] * height)))
+    small = image.convert('L').resize((DHASH_WIDTH, DHASH_HEIGHT))
+    pixels = list(small.getdata())
+    mean = sum(pixels) / len(pixels)
+    if (sum((pixel - mean) ** 2 for pixel in pixels) / len(pixels)) ** 0.5 < min_stddev:
+        return None
+    value = 0
+    for row in range(DHASH_HEIGHT):
+        offset = row * DHASH_WIDTH
+        for col in range(DHASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class MultiIndexHashIndex:
+    """
+    64bit ハッシュ → video_id の近傍検索インデックス (スレッドセーフ)
+    ★ V108 修正: メモリ削減のため、ハッシュと video_id は登録順の配列に1回だけ持ち、
+    各セグメントのバケットには登録番号 (uint32) だけを入れる (1件あたり video_id の文字列を含めて 約150バイト)。
+    同じセグメント値に登録が偏ると検索が遅くなるため、1バケットで調べるのは新しい方から max_bucket_scan 件までにする。
+    """
+
+    def __init__(self, segments: int = 4, max_bucket_scan: Optional[int] = None):
+        if HASH_BITS % segments:
+            raise ValueError(f"{HASH_BITS} bits cannot be split into {segments} segments.")
+        self.segments = segments
+        self.segment_bits = HASH_BITS // segments
+        self.max_bucket_scan = max_bucket_scan
+        self._mask = (1 << self.segment_bits) - 1
+        self._values = array('Q')
+        self._video_ids: List[str] = []
+        self._tables: List[Dict[int, array]] = [{} for _ in range(segments)]
+        self._lock = threading.Lock()
+        self._flip_cache: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._video_ids)
+
+    def _split(self, value: int) -> List[int]:
+        return [(value >> (i * self.segment_bits)) & self._mask for i in range(self.segments)]
+
+    def _flip_masks(self, max_bits: int) -> List[int]:
+        """セグメント内で max_bits ビット以内を反転させるマスクの一覧 (0 = そのまま を含む)"""
+        masks = self._flip_cache.get(max_bits)
+        if masks is None:
+            masks = [0]
+            for bits in range(1, max_bits + 1):
+                for positions in combinations(range(self.segment_bits), bits):
+                    mask = 0
+                    for position in positions:
+                        mask |= 1 << position
+                    masks.append(mask)
+            self._flip_cache[max_bits] = masks
+        return masks
+
+    def add(self, value: int, video_id: str):
+        with self._lock:
+            position = len(self._video_ids)
+            self._values.append(value)
+            self._video_ids.append(video_id)
+            for table, segment in zip(self._tables, self._split(value)):
+                bucket = table.get(segment)
+                if bucket is None:
+                    bucket = table[segment] = array('I')
+                bucket.append(position)
+
+    def query(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """距離 radius 以内の (距離, video_id) を距離の小さい順に返す"""
+        masks = self._flip_masks(radius // self.segments)
+        seen = set()
+        results = []
+        with self._lock:
+            for table, segment in zip(self._tables, self._split(value)):
+                for mask in masks:
+                    bucket = table.get(segment ^ mask)
+                    if not bucket:
+                        continue
+                    if self.max_bucket_scan is not None and len(bucket) > self.max_bucket_scan:
+                        bucket = bucket[-self.max_bucket_scan:]
+                    for position in bucket:
+                        if position in seen:
+                            continue
+                        seen.add(position)
+                        distance = hamming_distance(value, self._values[position])
+                        if distance <= radius:
+                            results.append((distance, self._video_ids[position]))
+        results.sort()
+        return results
+
+    def nearest(self, value: int, radius: int) -> Optional[Tuple[int, str]]:
+        results = self.query(value, radius)
+        return results[0] if results else None
@@ -0,0 +1,241 @@
+# =====================================================================
+# recovery.py: 画面診断と段階的なリカバリ (V117)
+#
+# 収集ループで例外が起きた場合、従来はほぼ常にアプリを再起動 (terminate + activate + ホーム待ち) し、
+# サイクルの残りを捨てていた。ここでは
+#   1. DOM スナップショット1回で現在の画面を診断する
+#      (シェアメニュー / ポップアップ・広告オーバーレイ / 検索画面 / 他のアプリ / クラッシュ など)
+#   2. 診断結果に応じた段階から、安い順に操作を試す
+#      閉じる → 戻る → ホームをタップ → アプリを前面に戻す → ディープリンク → アプリ再起動
+#      (操作のたびに画面を診断し直し、目的の画面に戻った時点で終了する)
+#   3. リカバリ1回ごとに診断・実行した操作・所要時間を記録する (ログ + metrics)
+#   4. ★ V118 追加: コマンドの期限切れ後は、まず生存確認をする。応答しなければ AppiumSessionUnresponsive を
+#      送出し、メインループ側でセッションを作り直す
+# 収集ループは目的の画面に戻れた場合、サイクルを中断せずに続きから再開する。
+# =====================================================================
+import time
+from typing import Any, List, Optional, Tuple
+
+import element_ids as ids
+from app_logger import logger
+from appium_transport import AppiumSessionUnresponsive
+from config import TIKTOK_PACKAGE_NAME
+from config import RECOVERY_SETTLE_TIMEOUT_SECONDS, RECOVERY_POLL_SECONDS, RECOVERY_DEEP_LINK_URL
+from metrics import RECOVERY_TOTAL, RECOVERY_SECONDS
+
+# --- 画面の診断結果 ---
+HOME_FEED = 'home_feed'  # おすすめフィード (下部ナビあり)
+VIDEO_FEED = 'video_feed'  # 検索結果から開いた動画フィード (下部ナビなし)
+SHARE_SHEET = 'share_sheet'
+POPUP = 'popup'  # ポップアップ・広告オーバーレイ (閉じるボタンあり)
+SEARCH = 'search'  # 検索入力・検索結果画面
+FOREIGN_APP = 'foreign_app'  # TikTok 以外のアプリ・ホーム画面が前面
+CRASHED = 'crashed'  # クラッシュ・応答なしダイアログ
+UNKNOWN = 'unknown'
+HUNG = 'hung'  # ★ V118 追加: コマンドが期限切れになり、生存確認にも応答しない
+
+# --- リカバリの目的 (到達すべき画面) ---
+TARGET_SCREENS = {
+    'home': (HOME_FEED,),  # おすすめフィードの収集
+    'video_feed': (VIDEO_FEED,),  # 検索フィードの収集 (検索をやり直さずに続ける)
+}
+
+# 目的ごとの操作の段階 (安い順)。
+# 検索フィードはホームに戻る・再起動すると検索条件が失われるため、その場で戻せる操作だけを使う。
+LADDERS = {
+    # 戻るは最大3回 (検索の動画フィード → 検索結果 → 検索入力 → ホーム)
+    'home': ('dismiss', 'back', 'back', 'back', 'home', 'activate', 'deep_link', 'restart'),
+    'video_feed': ('dismiss', 'dismiss', 'activate'),
+}
+
+# この画面からは目的の画面に戻せない (検索フィードの途中でホーム・検索画面に戻った場合は検索からやり直す)
+UNREACHABLE = {
+    'video_feed': (HOME_FEED, SEARCH),
+}
+
+# 診断結果ごとに、最初に試す操作 (これより安い段階は効果がないため飛ばす)
+FIRST_ACTION = {
+    SHARE_SHEET: 'dismiss',
+    POPUP: 'dismiss',
+    SEARCH: 'back',
+    VIDEO_FEED: 'back',
+    UNKNOWN: 'back',
+    HOME_FEED: 'home',
+    FOREIGN_APP: 'activate',
+    CRASHED: 'activate',
+}
+
+
+def foreground_packages(snapshot) -> set:
+    return {el.get('package') for el in snapshot.root.iter() if el.get('package')}
+
+
+def diagnose_screen(snapshot, package_name: str = TIKTOK_PACKAGE_NAME, selectors: Any = ids) -> str:
+    """スナップショット1回分から現在の画面を判定する (Appium への追加の往復なし)"""
+    if snapshot.exists(selectors.CRASH_DIALOG_SELECTORS):
+        return CRASHED
+    packages = foreground_packages(snapshot)
+    if packages and package_name not in packages:
+        return FOREIGN_APP
+    if snapshot.exists(selectors.COPY_LINK_BUTTON_SELECTORS):
+        return SHARE_SHEET
+    if snapshot.exists(selectors.POPUP_DISMISS_SELECTORS):
+        return POPUP
+    if snapshot.exists(selectors.SHARE_BUTTON_SELECTORS):
+        return HOME_FEED if snapshot.exists(selectors.HOME_ICON_SELECTORS) else VIDEO_FEED
+    if (snapshot.exists(selectors.SEARCH_FILTER_ICON_SELECTORS)
+            or snapshot.exists(selectors.SEARCH_SUBMIT_BUTTON_SELECTORS)):
+        return SEARCH
+    return UNKNOWN
+
+
+class RecoveryResult:
+    def __init__(self, target: str, diagnosis: str):
+        self.target = target
+        self.diagnosis = diagnosis  # リカバリ開始時の画面
+        self.screen = diagnosis  # 最後に確認した画面
+        self.actions: List[str] = []
+        self.ok = False
+        self.seconds = 0.0
+
+    @property
+    def restarted(self) -> bool:
+        return 'restart' in self.actions
+
+    def __repr__(self) -> str:
+        return (f"RecoveryResult(target={self.target}, diagnosis={self.diagnosis}, actions={self.actions}, "
+                f"screen={self.screen}, ok={self.ok}, seconds={self.seconds:.2f})")
+
+
+def next_step(target: str, screen: str, step: int) -> Optional[int]:
+    """
+    診断結果に対して最初に効果がありうる段階 (既に試した段階より前には戻らない)。無ければ None
+    [V114 修正] async_collector の DeviceSession と共有するため、モジュール関数にした
+    """
+    if screen in UNREACHABLE.get(target, ()):
+        return None
+    ladder = LADDERS[target]
+    first = FIRST_ACTION.get(screen, 'back')
+    if first in ladder:
+        step = max(step, ladder.index(first))
+    return step if step < len(ladder) else None
+
+
+def record_recovery(result: RecoveryResult, reason: str):
+    """リカバリ1回分をログと metrics に記録する"""
+    action = result.actions[-1] if result.actions else 'none'
+    outcome = 'ok' if result.ok else 'failed'
+    RECOVERY_TOTAL.inc(diagnosis=result.diagnosis, action=action, result=outcome)
+    RECOVERY_SECONDS.observe(result.seconds, action=action)
+    message = (f"RECOVERY: {outcome.upper()} to {result.target} from '{result.diagnosis}' via "
+               f"{' > '.join(result.actions) or 'no action'} in {result.seconds:.2f}s "
+               f"(Screen: {result.screen}). Reason: {reason}")
+    fields = {'recovery': {'target': result.target, 'diagnosis': result.diagnosis, 'actions': result.actions,
+                           'screen': result.screen, 'ok': result.ok, 'seconds': round(result.seconds, 3),
+                           'reason': reason}}
+    if result.ok:
+        logger.info(message, extra={'fields': fields})
+    else:
+        logger.warning(message, extra={'fields': fields})
+
+
+class RecoveryManager:
+    """TiktokAppiumHelper を使って、目的の画面まで段階的に戻す"""
+
+    def __init__(self, helper, selectors: Any = ids, settle_timeout_seconds: float = RECOVERY_SETTLE_TIMEOUT_SECONDS,
+                 poll_seconds: float = RECOVERY_POLL_SECONDS, deep_link_url: Optional[str] = RECOVERY_DEEP_LINK_URL):
+        self.helper = helper
+        self.selectors = selectors
+        self.settle_timeout_seconds = settle_timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.deep_link_url = deep_link_url
+
+    def diagnose(self) -> str:
+        try:
+            return diagnose_screen(self.helper.get_dom_snapshot(refresh=True), self.helper.tiktok_package_name,
+                                   self.selectors)
+        except Exception as e:
+            logger.debug("RECOVERY: Screen diagnosis failed: %s: %s", type(e).__name__, e)
+            return UNKNOWN
+
+    def recover(self, target: str, reason: str = '') -> RecoveryResult:
+        """目的の画面 (TARGET_SCREENS のキー) に戻す。戻れなかった場合は ok=False"""
+        started = time.perf_counter()
+        targets = TARGET_SCREENS[target]
+        ladder = LADDERS[target]
+        # ★ V118 追加: コマンドの期限切れが起きていた場合、画面を取得する前に端末が応答するか確かめる
+        transport = getattr(self.helper, 'transport', None)
+        if transport is not None and transport.session_suspect:
+            if not self.helper.is_session_alive():
+                result = RecoveryResult(target, HUNG)
+                result.seconds = time.perf_counter() - started
+                record_recovery(result, reason)
+                raise AppiumSessionUnresponsive(f"Session did not respond after a command deadline ({reason}).")
+            transport.session_suspect = False
+        result = RecoveryResult(target, self.diagnose())
+        screen = result.diagnosis
+
+        step = 0
+        while screen not in targets:
+            step = next_step(target, screen, step)
+            if step is None:
+                break
+            action = ladder[step]
+            result.actions.append(action)
+            screen = self._apply(action, screen, targets)
+            step += 1
+
+        result.screen = screen
+        result.ok = screen in targets
+        result.seconds = time.perf_counter() - started
+        record_recovery(result, reason)
+        return result
+
+    def _apply(self, action: str, screen: str, targets: Tuple[str, ...]) -> str:
+        try:
+            if action == 'dismiss':
+                # 閉じるボタンがあればタップし、シェアメニュー (リンクのコピーボタンで判定済み) は戻るで閉じる。
+                # どちらでもなければ何もしない (診断の失敗で UNKNOWN になった時に、戻るで検索フィードを離れないため)
+                node = self.helper.get_dom_snapshot().find_first(self.selectors.POPUP_DISMISS_SELECTORS)
+                if node is not None and node.bounds:
+                    self.helper.tap_bounds(node.bounds)
+                elif screen == SHARE_SHEET:
+                    self.helper.driver.back()
+                else:
+                    return screen
+            elif action == 'back':
+                self.helper.driver.back()
+            elif action == 'home':
+                node = self.helper.get_dom_snapshot().find_first(self.selectors.HOME_ICON_SELECTORS)
+                if node is None or not node.bounds:
+                    return screen
+                self.helper.tap_bounds(node.bounds)
+            elif action == 'activate':
+                self.helper.driver.activate_app(self.helper.tiktok_package_name)
+            elif action == 'deep_link':
+                if not self.deep_link_url:
+                    return screen
+                self.helper.driver.execute_script('mobile: deepLink', {'url': self.deep_link_url,
+                                                                       'package': self.helper.tiktok_package_name})
+            elif action == 'restart':
+                self.helper.reboot_tiktok_app()
+        except Exception as e:
+            logger.debug("RECOVERY: Action '%s' failed: %s: %s", action, type(e).__name__, e)
+        self.helper.invalidate_snapshot()
+        return self._settle(screen, targets)
+
+    def _settle(self, before: str, targets: Tuple[str, ...]) -> str:
+        """
+        操作後、画面が落ち着くまで診断し直す (最後の診断結果を返す)。
+        目的の画面になった・操作前と違う画面になった・同じ診断が2回続いた・上限時間が過ぎた のいずれかで終わる
+        (途中の画面 (検索結果 → 検索入力 → ホーム など) で上限まで待たない)
+        """
+        deadline = time.perf_counter() + self.settle_timeout_seconds
+        previous = None
+        while True:
+            screen = self.diagnose()
+            if (screen in targets or screen != before or screen == previous
+                    or time.perf_counter() >= deadline):
+                return screen
+            previous = screen
+            time.sleep(self.poll_seconds)
@@ -0,0 +1,840 @@
+# =====================================================================
+# replay_server.py: 記録済み DOM ダンプを再生する Appium 互換スタンドイン (V104)
+#
+# 1. W3C WebDriver / Appium の HTTP API のうち、TiktokAppiumHelper が使うコマンドだけを実装する
+# 2. 画面 (フィード/シェアシート/検索/フィルター) ごとに dom_dumps の XML を返し、
+#    タップ・スワイプ・戻る操作でマニフェストに従って画面を遷移させる
+# 3. コマンドごとに設定可能な遅延を入れ、実機なしでスループットを計測できるようにする
+#
+# マニフェスト (JSON) の例:
+# {
+#   "start_screen": "home_feed",
+#   "window": {"width": 1080, "height": 2400},          (省略時は最初のダンプの hierarchy から取得)
+#   "latency": {"default": 0.05, "getPageSource": 0.3}, (省略時は config.REPLAY_LATENCY_SECONDS)
+#   "transition_delay_seconds": 0.3,
+#   "app_start_delay_seconds": 2.0,
+#   "screens": {
+#     "home_feed": {"dumps": ["feed_01.xml", "feed_02.xml"], "feed": true,
+#                   "url_template": "https://www.tiktok.com/@replay/video/7{n:018d}",
+#                   "substitutions": [{"selector": ["id", "...:id/desc"], "attribute": "text",
+#                                      "template": "{value} #{n}"}]},
+#     "share_sheet": {"dump": "share_sheet.xml"}
+#   },
+#   "transitions": [
+#     {"screen": "home_feed", "on": "click", "selector": ["id", "...:id/share"], "to": "share_sheet"},
+#     {"screen": "share_sheet", "on": "click", "selector": ["accessibility id", "リンクをコピー"],
+#      "to": "@back", "copy_url": true}
+#   ]
+# }
+#   on: click / keys / swipe_up / swipe_down / back
+#   to: 画面名 / "@back" (1つ前の画面) / "@home" (開始画面) / "@stay"
+#   遷移が定義されていない swipe_up はフィード画面なら次の動画、back は1つ前の画面に戻る。
+#
+# 使い方:
+#   python replay_server.py --manifest replay/manifest.json --port 4723
+#   (TiktokAppiumHelper.initialize_driver(..., appium_url='http://127.0.0.1:4723') で接続)
+#
+# ★ V104 修正: マニフェストとダンプは実機から記録する (throughput_benchmark.py もこれを使う)
+#   python replay_server.py record --bot 1 --out replay
+#   画面ごとの案内に従って実機を操作し Enter を押すと、その画面の page_source を保存する。
+#   遷移のセレクタは element_ids.py の候補のうち、記録したダンプで実際に見つかったものを使う。
+# =====================================================================
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_logger import logger, setup_logging_handlers
+from config import REPLAY_LATENCY_SECONDS, REPLAY_MANIFEST_PATH
+from dom_snapshot import DomSnapshot, SnapshotSelectorError, parse_bounds
+
+# W3C の要素参照キー
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+# この距離 (px) 未満のポインター移動はタップとみなす
+TAP_SLOP_PIXELS = 20
+# query_app_state の値
+APP_STATE_NOT_RUNNING = 1
+APP_STATE_RUNNING_IN_FOREGROUND = 4
+
+EMPTY_HIERARCHY = '<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0"></hierarchy>'
+
+
+class ReplayError(Exception):
+    """W3C のエラーレスポンス (HTTP ステータス, error コード) に変換される例外"""
+
+    def __init__(self, status: int, error: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+
+
+class ReplayManifestError(Exception):
+    pass
+
+
+# =====================================================================
+# I. 画面状態
+# =====================================================================
+
+class ReplayScreen:
+    """マニフェストの1画面。フィード画面は複数のダンプを順番に表示する"""
+
+    def __init__(self, name: str, spec: Dict[str, Any], base_dir: str):
+        self.name = name
+        files = spec.get('dumps') or ([spec['dump']] if spec.get('dump') else [])
+        if not files:
+            raise ReplayManifestError(f"Screen '{name}' has no dumps.")
+        self.page_sources: List[str] = []
+        for file_name in files:
+            with open(os.path.join(base_dir, file_name), 'r', encoding='utf-8') as f:
+                self.page_sources.append(f.read())
+        self.is_feed = bool(spec.get('feed'))
+        self.url_template: Optional[str] = spec.get('url_template')
+        self.substitutions: List[Dict[str, Any]] = spec.get('substitutions', [])
+
+    def render(self, index: int, counter: int) -> str:
+        """index 番目のダンプに、フィード通番 counter を埋め込んだ page_source を返す"""
+        page_source = self.page_sources[index % len(self.page_sources)]
+        if not self.substitutions:
+            return page_source
+        snapshot = DomSnapshot(page_source)
+        for sub in self.substitutions:
+            for node in snapshot.find_all(*sub['selector']):
+                value = node.get_attribute(sub['attribute']) or ''
+                node.element.set(sub['attribute'], sub['template'].format(value=value, n=counter))
+        return ET.tostring(snapshot.root, encoding='unicode')
+
+
+class ReplayDevice:
+    """
+    再生中の端末の状態 (表示中の画面、画面スタック、フィード位置、クリップボード、アプリ状態)。
+    HTTP ハンドラは複数スレッドから呼ばれるため、状態の変更はすべてロック内で行う。
+    """
+
+    def __init__(self, manifest: Dict[str, Any], base_dir: str):
+        self.screens = {name: ReplayScreen(name, spec, base_dir) for name, spec in manifest['screens'].items()}
+        self.start_screen = manifest.get('start_screen') or next(iter(self.screens))
+        if self.start_screen not in self.screens:
+            raise ReplayManifestError(f"Unknown start_screen '{self.start_screen}'.")
+        self.transitions: List[Dict[str, Any]] = manifest.get('transitions', [])
+        for transition in self.transitions:
+            target = transition.get('to', '@stay')
+            if not target.startswith('@') and target not in self.screens:
+                raise ReplayManifestError(f"Transition targets unknown screen '{target}': {transition}")
+        self.transition_delay = float(manifest.get('transition_delay_seconds', 0.0))
+        self.app_start_delay = float(manifest.get('app_start_delay_seconds', 0.0))
+        self.window = manifest.get('window') or self._window_from_dump()
+
+        self._lock = threading.RLock()
+        self.stack: List[str] = [self.start_screen]
+        self.feed_positions: Dict[str, int] = {}
+        self.feed_counter = 0
+        self.clipboard = ''
+        self.app_state = APP_STATE_RUNNING_IN_FOREGROUND
+        self._pending: Optional[Tuple[List[str], float]] = None
+        self._ready_at = 0.0
+        self._generation = 0
+        self._visible: Optional[Tuple[int, DomSnapshot, List[ET.Element]]] = None
+
+    def _window_from_dump(self) -> Dict[str, int]:
+        root = ET.fromstring(self.screens[self.start_screen].page_sources[0].encode('utf-8'))
+        return {'width': int(root.get('width', 1080)), 'height': int(root.get('height', 2400))}
+
+    # --- 表示中の画面 ---
+
+    def _commit_pending(self):
+        if self._pending is not None and time.time() >= self._pending[1]:
+            self.stack = self._pending[0]
+            self._pending = None
+            self._visible = None
+
+    def visible(self) -> Tuple[int, DomSnapshot, List[ET.Element]]:
+        """(世代番号, スナップショット, 要素の並び) を返す。画面が変わるたびに世代番号が増える"""
+        with self._lock:
+            self._commit_pending()
+            if self.app_state != APP_STATE_RUNNING_IN_FOREGROUND or time.time() < self._ready_at:
+                snapshot = DomSnapshot(EMPTY_HIERARCHY, captured_at=time.time())
+                return -1, snapshot, list(snapshot.root.iter())
+            if self._visible is None:
+                self._generation += 1
+                screen = self.screens[self.stack[-1]]
+                page_source = screen.render(self.feed_positions.get(screen.name, 0), self.feed_counter)
+                snapshot = DomSnapshot(page_source, captured_at=time.time())
+                self._visible = (self._generation, snapshot, list(snapshot.root.iter()))
+            return self._visible
+
+    def current_url(self) -> Optional[str]:
+        """画面スタック上で最も手前にあるフィード画面の動画URL"""
+        for name in reversed(self.stack):
+            screen = self.screens[name]
+            if screen.is_feed and screen.url_template:
+                return screen.url_template.format(n=self.feed_counter)
+        return None
+
+    # --- 画面遷移 ---
+
+    def _schedule(self, stack: List[str], delay: Optional[float] = None):
+        delay = self.transition_delay if delay is None else delay
+        if delay <= 0:
+            self.stack = stack
+            self._pending = None
+            self._visible = None
+        else:
+            self._pending = (stack, time.time() + delay)
+
+    def _apply(self, transition: Dict[str, Any]):
+        target = transition.get('to', '@stay')
+        if transition.get('copy_url'):
+            self.clipboard = self.current_url() or ''
+        if target == '@stay':
+            return
+        if target == '@back':
+            stack = self.stack[:-1] or [self.start_screen]
+        elif target == '@home':
+            stack = [self.start_screen]
+        else:
+            stack = self.stack + [target]
+        self._schedule(stack, transition.get('delay'))
+
+    def _matching_transition(self, event: str, element: Optional[ET.Element] = None,
+                             snapshot: Optional[DomSnapshot] = None) -> Optional[Dict[str, Any]]:
+        screen = self.stack[-1]
+        for transition in self.transitions:
+            if transition.get('screen', screen) not in (screen, '*') or transition.get('on') != event:
+                continue
+            selector = transition.get('selector')
+            if selector is None:
+                return transition
+            if element is None or snapshot is None:
+                continue
+            try:
+                targets = {node.element for node in snapshot.find_all(*selector)}
+            except SnapshotSelectorError:
+                continue
+            # 一致した要素そのもの、またはその子孫が操作された場合に遷移する
+            node = element
+            while node is not None:
+                if node in targets:
+                    return transition
+                node = snapshot._parents.get(node)
+        return None
+
+    def click(self, element: ET.Element, snapshot: DomSnapshot):
+        with self._lock:
+            transition = self._matching_transition('click', element, snapshot)
+            if transition:
+                self._apply(transition)
+
+    def send_keys(self, element: ET.Element, snapshot: DomSnapshot, text: str):
+        with self._lock:
+            element.set('text', text)
+            transition = self._matching_transition('keys', element, snapshot)
+            if transition:
+                self._apply(transition)
+
+    def tap(self, x: float, y: float):
+        with self._lock:
+            _, snapshot, elements = self.visible()
+            element = self.element_at(elements, x, y)
+            if element is not None:
+                self.click(element, snapshot)
+
+    def swipe(self, direction: str):
+        with self._lock:
+            self._commit_pending()
+            transition = self._matching_transition(direction)
+            if transition:
+                self._apply(transition)
+                return
+            screen = self.screens[self.stack[-1]]
+            if direction == 'swipe_up' and screen.is_feed:
+                self.feed_positions[screen.name] = self.feed_positions.get(screen.name, 0) + 1
+                self.feed_counter += 1
+                self._schedule(list(self.stack))
+
+    def back(self):
+        with self._lock:
+            self._commit_pending()
+            transition = self._matching_transition('back')
+            self._apply(transition or {'to': '@back'})
+
+    def terminate_app(self):
+        with self._lock:
+            self.app_state = APP_STATE_NOT_RUNNING
+            self._pending = None
+            self._visible = None
+
+    def activate_app(self):
+        with self._lock:
+            if self.app_state == APP_STATE_RUNNING_IN_FOREGROUND:
+                return
+            self.app_state = APP_STATE_RUNNING_IN_FOREGROUND
+            self.stack = [self.start_screen]
+            self._pending = None
+            self._visible = None
+            # 起動完了 (app_start_delay_seconds) までは空の画面を返す
+            self._ready_at = time.time() + self.app_start_delay
+
+    @staticmethod
+    def element_at(elements: List[ET.Element], x: float, y: float) -> Optional[ET.Element]:
+        """座標を含む要素のうち、文書順で最後 (最も手前に描画される) のものを返す"""
+        hit = None
+        for element in elements:
+            bounds = parse_bounds(element.get('bounds'))
+            if bounds and bounds[0] <= x < bounds[2] and bounds[1] <= y < bounds[3]:
+                hit = element
+        return hit
+
+
+# =====================================================================
+# II. WebDriver HTTP ハンドラ
+# =====================================================================
+
+def _element_ref(generation: int, index: int) -> Dict[str, str]:
+    ref = f"{generation}.{index}"
+    return {ELEMENT_KEY: ref, 'ELEMENT': ref}
+
+
+def _normalize_locator(using: str, value: str) -> Tuple[str, str]:
+    """Selenium が By.ID / By.NAME を CSS セレクタに変換して送ってきた場合に元の戦略へ戻す"""
+    if using == 'css selector':
+        match = re.fullmatch(r'\[(id|name)="(.*)"\]', value)
+        if match:
+            return ('id' if match.group(1) == 'id' else 'accessibility id'), match.group(2)
+    return using, value
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'ReplayHTTPServer'
+
+    # (メソッド, パス正規表現, 処理名, 遅延設定のコマンド名)
+    ROUTES = [
+        ('GET', r'/status', '_status', 'status'),
+        ('POST', r'/session', '_new_session', 'newSession'),
+        ('DELETE', r'/session/[^/]+', '_delete_session', 'deleteSession'),
+        ('GET', r'/session/[^/]+/source', '_page_source', 'getPageSource'),
+        ('POST', r'/session/[^/]+/element', '_find_element', 'findElement'),
+        ('POST', r'/session/[^/]+/elements', '_find_elements', 'findElements'),
+        ('POST', r'/session/[^/]+/element/([^/]+)/element', '_find_child_element', 'findElement'),
+        ('POST', r'/session/[^/]+/element/([^/]+)/elements', '_find_child_elements', 'findElements'),
+        ('POST', r'/session/[^/]+/element/([^/]+)/click', '_element_click', 'elementClick'),
+        ('POST', r'/session/[^/]+/element/([^/]+)/value', '_element_send_keys', 'elementSendKeys'),
+        ('POST', r'/session/[^/]+/element/([^/]+)/clear', '_element_clear', 'elementClear'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/text', '_element_text', 'getElementText'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/attribute/([^/]+)', '_element_attribute', 'getElementAttribute'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/rect', '_element_rect', 'getElementRect'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/displayed', '_element_displayed', 'isElementDisplayed'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/enabled', '_element_enabled', 'isElementEnabled'),
+        ('GET', r'/session/[^/]+/element/([^/]+)/selected', '_element_selected', 'isElementSelected'),
+        ('POST', r'/session/[^/]+/actions', '_perform_actions', 'performActions'),
+        ('DELETE', r'/session/[^/]+/actions', '_release_actions', 'releaseActions'),
+        ('POST', r'/session/[^/]+/back', '_back', 'back'),
+        ('GET', r'/session/[^/]+/window/rect', '_window_rect', 'getWindowRect'),
+        ('GET', r'/session/[^/]+/window/[^/]+/size', '_window_size', 'getWindowSize'),
+        ('POST', r'/session/[^/]+/appium/device/get_clipboard', '_get_clipboard', 'getClipboard'),
+        ('POST', r'/session/[^/]+/appium/device/set_clipboard', '_set_clipboard', 'setClipboard'),
+        ('POST', r'/session/[^/]+/appium/device/activate_app', '_activate_app', 'activateApp'),
+        ('POST', r'/session/[^/]+/appium/device/terminate_app', '_terminate_app', 'terminateApp'),
+        ('POST', r'/session/[^/]+/appium/device/app_state', '_app_state', 'queryAppState'),
+        ('POST', r'/session/[^/]+/appium/device/press_keycode', '_press_keycode', 'pressKeyCode'),
+        ('POST', r'/session/[^/]+/appium/settings', '_update_settings', 'updateSettings'),
+        ('GET', r'/session/[^/]+/appium/settings', '_get_settings', 'getSettings'),
+        ('POST', r'/session/[^/]+/execute/sync', '_execute_script', 'executeScript'),
+    ]
+    COMPILED_ROUTES = [(method, re.compile(r'(?:/wd/hub)?' + pattern + r'/?$'), handler, command)
+                       for method, pattern, handler, command in ROUTES]
+
+    def log_message(self, format, *args):
+        logger.debug(f"REPLAY: {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method: str):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        path = self.path.split('?', 1)[0]
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            for route_method, pattern, handler_name, command in self.COMPILED_ROUTES:
+                match = pattern.match(path) if route_method == method else None
+                if match:
+                    self.server.apply_latency(command)
+                    value = getattr(self, handler_name)(body, *match.groups())
+                    self._respond(200, {'value': value})
+                    return
+            raise ReplayError(404, 'unknown command', f"Unsupported command: {method} {path}")
+        except ReplayError as e:
+            self._respond(e.status, {'value': {'error': e.error, 'message': str(e), 'stacktrace': ''}})
+        except Exception as e:
+            logger.warning(f"REPLAY: Error handling {method} {path}: {e}")
+            self._respond(500, {'value': {'error': 'unknown error', 'message': str(e), 'stacktrace': ''}})
+
+    def _respond(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @property
+    def device(self) -> ReplayDevice:
+        return self.server.device
+
+    def _resolve(self, element_id: str) -> Tuple[ET.Element, DomSnapshot]:
+        generation, snapshot, elements = self.device.visible()
+        try:
+            element_generation, index = (int(part) for part in element_id.split('.'))
+        except ValueError:
+            raise ReplayError(404, 'no such element', f"Unknown element id {element_id}")
+        if element_generation != generation:
+            raise ReplayError(404, 'stale element reference', f"Element {element_id} is no longer on screen")
+        return elements[index], snapshot
+
+    def _find(self, body: Dict[str, Any], parent_id: Optional[str] = None) -> List[Dict[str, str]]:
+        using, value = _normalize_locator(body.get('using', ''), body.get('value', ''))
+        generation, snapshot, elements = self.device.visible()
+        try:
+            nodes = snapshot.find_all(using, value)
+        except SnapshotSelectorError as e:
+            raise ReplayError(400, 'invalid selector', str(e))
+        if parent_id is not None:
+            parent, _ = self._resolve(parent_id)
+            descendants = set(parent.iter()) - {parent}
+            nodes = [node for node in nodes if node.element in descendants]
+        positions = {element: index for index, element in enumerate(elements)}
+        return [_element_ref(generation, positions[node.element]) for node in nodes]
+
+    # --- セッション ---
+
+    def _status(self, body):
+        return {'ready': True, 'message': 'TikTokBot replay server'}
+
+    def _new_session(self, body):
+        session_id = uuid.uuid4().hex
+        capabilities = (body.get('capabilities') or {}).get('alwaysMatch') or body.get('desiredCapabilities') or {}
+        logger.info(f"REPLAY: New session {session_id}")
+        return {'sessionId': session_id, 'capabilities': dict(capabilities, platformName='Android')}
+
+    def _delete_session(self, body):
+        return None
+
+    # --- 要素 ---
+
+    def _page_source(self, body):
+        return ET.tostring(self.device.visible()[1].root, encoding='unicode')
+
+    def _find_element(self, body, parent_id=None):
+        found = self._find(body, parent_id)
+        if not found:
+            raise ReplayError(404, 'no such element', f"No element matches {body.get('using')}={body.get('value')}")
+        return found[0]
+
+    def _find_elements(self, body):
+        return self._find(body)
+
+    def _find_child_element(self, body, parent_id):
+        return self._find_element(body, parent_id)
+
+    def _find_child_elements(self, body, parent_id):
+        return self._find(body, parent_id)
+
+    def _element_click(self, body, element_id):
+        element, snapshot = self._resolve(element_id)
+        self.device.click(element, snapshot)
+        return None
+
+    def _element_send_keys(self, body, element_id):
+        element, snapshot = self._resolve(element_id)
+        text = body.get('text') or ''.join(body.get('value', []))
+        self.device.send_keys(element, snapshot, text)
+        return None
+
+    def _element_clear(self, body, element_id):
+        element, _ = self._resolve(element_id)
+        element.set('text', '')
+        return None
+
+    def _element_text(self, body, element_id):
+        return self._resolve(element_id)[0].get('text', '')
+
+    def _element_attribute(self, body, element_id, name):
+        return self._resolve(element_id)[0].get(name)
+
+    def _element_rect(self, body, element_id):
+        bounds = parse_bounds(self._resolve(element_id)[0].get('bounds')) or (0, 0, 0, 0)
+        return {'x': bounds[0], 'y': bounds[1], 'width': bounds[2] - bounds[0], 'height': bounds[3] - bounds[1]}
+
+    def _element_displayed(self, body, element_id):
+        return self._resolve(element_id)[0].get('displayed', 'true') == 'true'
+
+    def _element_enabled(self, body, element_id):
+        return self._resolve(element_id)[0].get('enabled', 'true') == 'true'
+
+    def _element_selected(self, body, element_id):
+        return self._resolve(element_id)[0].get('selected') == 'true'
+
+    # --- ジェスチャー / 端末操作 ---
+
+    def _perform_actions(self, body):
+        for source in body.get('actions', []):
+            if source.get('type') != 'pointer':
+                continue
+            position = None
+            start = end = None
+            for action in source.get('actions', []):
+                if action.get('type') == 'pointerMove':
+                    position = self._pointer_position(action)
+                    if start is not None:
+                        end = position
+                elif action.get('type') == 'pointerDown':
+                    start = end = position
+                elif action.get('type') == 'pointerUp' and start is not None:
+                    self._gesture(start, end)
+                    start = end = None
+        return None
+
+    def _pointer_position(self, action: Dict[str, Any]) -> Tuple[float, float]:
+        origin = action.get('origin')
+        x, y = float(action.get('x', 0)), float(action.get('y', 0))
+        if isinstance(origin, dict) and ELEMENT_KEY in origin:
+            rect = self._element_rect({}, origin[ELEMENT_KEY])
+            x += rect['x'] + rect['width'] / 2
+            y += rect['y'] + rect['height'] / 2
+        return x, y
+
+    def _gesture(self, start: Tuple[float, float], end: Tuple[float, float]):
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        if abs(dx) < TAP_SLOP_PIXELS and abs(dy) < TAP_SLOP_PIXELS:
+            self.device.tap(*start)
+        elif abs(dy) >= abs(dx):
+            self.device.swipe('swipe_up' if dy < 0 else 'swipe_down')
+
+    def _release_actions(self, body):
+        return None
+
+    def _back(self, body):
+        self.device.back()
+        return None
+
+    def _window_rect(self, body):
+        return {'x': 0, 'y': 0, 'width': self.device.window['width'], 'height': self.device.window['height']}
+
+    def _window_size(self, body):
+        return {'width': self.device.window['width'], 'height': self.device.window['height']}
+
+    def _get_clipboard(self, body):
+        return base64.b64encode(self.device.clipboard.encode('utf-8')).decode('ascii')
+
+    def _set_clipboard(self, body):
+        self.device.clipboard = base64.b64decode(body.get('content') or '').decode('utf-8')
+        return None
+
+    def _activate_app(self, body):
+        self.device.activate_app()
+        return None
+
+    def _terminate_app(self, body):
+        self.device.terminate_app()
+        return True
+
+    def _app_state(self, body):
+        return self.device.app_state
+
+    def _press_keycode(self, body):
+        if body.get('keycode') == 4:  # KEYCODE_BACK
+            self.device.back()
+        return None
+
+    def _update_settings(self, body):
+        self.server.settings.update(body.get('settings', {}))
+        return None
+
+    def _get_settings(self, body):
+        return dict(self.server.settings)
+
+    def _execute_script(self, body):
+        """Appium の mobile: 拡張コマンドのうち、ヘルパーが代替経路として使うもの"""
+        script = body.get('script', '')
+        args = (body.get('args') or [{}])[0] or {}
+        if script == 'mobile: getClipboard':
+            return self._get_clipboard(args)
+        if script == 'mobile: setClipboard':
+            return self._set_clipboard(args)
+        if script == 'mobile: activateApp':
+            return self._activate_app(args)
+        if script == 'mobile: terminateApp':
+            return self._terminate_app(args)
+        if script == 'mobile: queryAppState':
+            return self._app_state(args)
+        if script == 'mobile: pressKey':
+            return self._press_keycode(args)
+        if script == 'mobile: clickGesture':
+            if args.get('elementId'):
+                rect = self._element_rect({}, args['elementId'])
+                self.device.tap(rect['x'] + rect['width'] / 2, rect['y'] + rect['height'] / 2)
+            else:
+                self.device.tap(float(args.get('x', 0)), float(args.get('y', 0)))
+            return None
+        if script == 'mobile: swipeGesture':
+            direction = args.get('direction', '')
+            if direction in ('up', 'down'):
+                self.device.swipe(f"swipe_{direction}")
+            return None
+        raise ReplayError(404, 'unknown command', f"Unsupported script: {script}")
+
+
+# =====================================================================
+# III. サーバー
+# =====================================================================
+
+class ReplayHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], device: ReplayDevice, latency: Dict[str, float]):
+        super().__init__(address, ReplayRequestHandler)
+        self.device = device
+        self.latency = latency
+        self.settings: Dict[str, Any] = {}
+
+    def apply_latency(self, command: str):
+        """コマンド別の遅延 (秒) に ±jitter の揺らぎを加えて待つ"""
+        delay = self.latency.get(command, self.latency.get('default', 0.0))
+        jitter = self.latency.get('jitter', 0.0)
+        if jitter:
+            delay *= 1 + random.uniform(-jitter, jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplayServer:
+    """別スレッドで ReplayHTTPServer を起動・停止するラッパー (ベンチマークから使う)"""
+
+    def __init__(self, manifest_path: str = REPLAY_MANIFEST_PATH, host: str = '127.0.0.1', port: int = 0,
+                 latency_scale: float = 1.0):
+        manifest = load_manifest(manifest_path)
+        latency = dict(REPLAY_LATENCY_SECONDS)
+        latency.update(manifest.get('latency', {}))
+        latency = {name: (value if name == 'jitter' else value * latency_scale) for name, value in latency.items()}
+        self.device = ReplayDevice(manifest, os.path.dirname(os.path.abspath(manifest_path)))
+        self.httpd = ReplayHTTPServer((host, port), self.device, latency)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'ReplayServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='ReplayServer', daemon=True)
+        self._thread.start()
+        logger.info(f"REPLAY: Server listening on {self.url} (Start screen: {self.device.start_screen})")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logger.info("REPLAY: Server stopped.")
+
+    def __enter__(self) -> 'ReplayServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+# =====================================================================
+# IV. 記録
+# =====================================================================
+
+# (画面名, 操作者への案内, フィード画面か)。この順に記録する
+RECORD_STEPS = [
+    ('home_feed', "Open the For You feed on a normal video (not an ad or photo post)", True),
+    ('share_sheet', "Tap the share button on the current video", False),
+    ('search_input', "Close the share sheet and tap the search icon", False),
+    ('search_results', "Type a search word and submit it", False),
+    ('filter_menu', "Tap the filter icon", False),
+    ('filter_panel', "Tap 'Filter' in the menu", False),
+    ('search_grid', "Apply the filters (date order, last 6 months) and open the Videos tab", False),
+    ('search_feed', "Tap the first video in the results", True),
+]
+
+# 検索結果のタップは click_first_video_result_by_location と同じ要素を狙う
+SEARCH_GRID_ITEM_SELECTORS = [('xpath', "//android.widget.GridView/android.widget.FrameLayout[@clickable='true']")]
+
+# (画面, 操作, element_ids のセレクタリスト名, 遷移先, 追加の設定)
+RECORD_TRANSITIONS = [
+    ('home_feed', 'click', 'SHARE_BUTTON_SELECTORS', 'share_sheet', {}),
+    ('search_feed', 'click', 'SHARE_BUTTON_SELECTORS', 'share_sheet', {}),
+    ('share_sheet', 'click', 'COPY_LINK_BUTTON_SELECTORS', '@back', {'copy_url': True}),
+    ('home_feed', 'click', 'HOME_SEARCH_ICON_SELECTORS', 'search_input', {}),
+    ('search_input', 'click', 'SEARCH_SUBMIT_BUTTON_SELECTORS', 'search_results', {}),
+    ('search_results', 'click', 'SEARCH_FILTER_ICON_SELECTORS', 'filter_menu', {}),
+    ('filter_menu', 'click', 'FILTER_INTERMEDIATE_BUTTON_SELECTORS', 'filter_panel', {}),
+    ('filter_panel', 'click', 'FILTER_APPLY_BUTTON_SELECTORS', 'search_grid', {}),
+    ('search_grid', 'click', 'SEARCH_RESULT_VIDEO_ITEM_SELECTORS', 'search_feed', {}),
+    ('search_feed', 'click', 'HOME_ICON_SELECTORS', '@home', {}),
+]
+
+RECORD_URL_TEMPLATE = 'https://www.tiktok.com/@replay/video/7{n:018d}'
+
+
+def _first_matching_selector(page_source: str, selectors: List[Tuple[str, str]]) -> Optional[List[str]]:
+    """記録したダンプで要素が見つかる最初のセレクタ ([戦略, 値])。見つからなければ None"""
+    snapshot = DomSnapshot(page_source)
+    for by, value in selectors:
+        try:
+            if snapshot.find_all(by, value):
+                return [by, value]
+        except SnapshotSelectorError:
+            continue
+    return None
+
+
+def build_manifest(dumps: Dict[str, List[Tuple[str, str]]], window: Dict[str, int]) -> Dict[str, Any]:
+    """
+    画面名 → [(ファイル名, page_source), ...] からマニフェストを組み立てる。
+    フィード画面はキャプションに通番を付け、毎回別の動画として収集されるようにする。
+    """
+    import element_ids as ids
+
+    screens: Dict[str, Any] = {}
+    for name, _, is_feed in RECORD_STEPS:
+        files = [file_name for file_name, _ in dumps.get(name, [])]
+        if not files:
+            continue
+        spec: Dict[str, Any] = {'dumps': files}
+        if is_feed:
+            spec.update({'feed': True, 'url_template': RECORD_URL_TEMPLATE})
+            caption = _first_matching_selector(dumps[name][0][1], ids.CAPTION_TEXT_SELECTORS)
+            if caption:
+                spec['substitutions'] = [{'selector': caption, 'attribute': 'text', 'template': '{value} #{n}'}]
+        screens[name] = spec
+
+    transitions = []
+    for screen, event, list_name, target, extra in RECORD_TRANSITIONS:
+        if screen not in screens or (not target.startswith('@') and target not in screens):
+            continue
+        candidates = list(getattr(ids, list_name))
+        if list_name == 'SEARCH_RESULT_VIDEO_ITEM_SELECTORS':
+            candidates = SEARCH_GRID_ITEM_SELECTORS + candidates
+        selector = _first_matching_selector(dumps[screen][0][1], candidates)
+        if selector is None:
+            logger.warning(f"REPLAY RECORD: No {list_name} selector matches the recorded '{screen}' screen. "
+                           f"Transition to '{target}' skipped.")
+            continue
+        transitions.append(dict({'screen': screen, 'on': event, 'selector': selector, 'to': target}, **extra))
+
+    return {
+        'start_screen': 'home_feed',
+        'window': window,
+        'transition_delay_seconds': 0.3,
+        'app_start_delay_seconds': 2.0,
+        'screens': screens,
+        'transitions': transitions,
+    }
+
+
+def record(driver, out_dir: str, feed_videos: int, prompt=input) -> str:
+    """案内に従って操作者が画面を開くたびに page_source を保存し、マニフェストを書き出してそのパスを返す"""
+    os.makedirs(out_dir, exist_ok=True)
+    window = driver.get_window_size()
+    window = {'width': int(window['width']), 'height': int(window['height'])}
+    dumps: Dict[str, List[Tuple[str, str]]] = {}
+    for name, instruction, is_feed in RECORD_STEPS:
+        answer = prompt(f"[{name}] {instruction}, then press Enter (s = skip): ")
+        if answer.strip().lower() == 's':
+            continue
+        for index in range(feed_videos if is_feed else 1):
+            if index:
+                # 次の動画へ (フィードの下から上へスワイプ)
+                driver.swipe(window['width'] // 2, int(window['height'] * 0.75),
+                             window['width'] // 2, int(window['height'] * 0.25), 300)
+                time.sleep(1.5)
+            file_name = f"{name}_{index + 1:02d}.xml"
+            page_source = driver.page_source
+            with open(os.path.join(out_dir, file_name), 'w', encoding='utf-8') as f:
+                f.write(page_source)
+            dumps.setdefault(name, []).append((file_name, page_source))
+        logger.info(f"REPLAY RECORD: Saved {len(dumps[name])} dump(s) for '{name}'.")
+
+    if 'home_feed' not in dumps:
+        raise ReplayManifestError("The home_feed screen is required (it is the start screen).")
+    manifest = build_manifest(dumps, window)
+    path = os.path.join(out_dir, 'manifest.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    logger.info(f"REPLAY RECORD: Wrote {path} ({len(manifest['screens'])} screens, "
+                f"{len(manifest['transitions'])} transitions).")
+    return path
+
+
+def record_main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog='replay_server.py record',
+                                     description="Record a replay manifest and DOM dumps from a real device.")
+    parser.add_argument('--bot', type=int, required=True, metavar='BOT_ID', help="Use this bot's device")
+    parser.add_argument('--out', default=os.path.dirname(REPLAY_MANIFEST_PATH) or '.', help="Output directory")
+    parser.add_argument('--feed-videos', type=int, default=5, help="Videos to record per feed screen")
+    args = parser.parse_args(argv)
+
+    setup_logging_handlers()
+    from tiktok_db_manager import TikTokDBManager
+    from tiktok_appium_helper import TiktokAppiumHelper
+    bot_config = TikTokDBManager().fetch_bot_configuration(args.bot)
+    helper = TiktokAppiumHelper.initialize_driver(bot_config['appium_device_name'], bot_config['appium_udid'],
+                                                  bot_config['appium_host'], bot_config['appium_port'],
+                                                  reuse_session=False)
+    record(helper.driver, args.out, args.feed_videos)
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not manifest.get('screens'):
+        raise ReplayManifestError(f"Manifest {path} defines no screens.")
+    return manifest
+
+
+def main():
+    if sys.argv[1:2] == ['record']:
+        record_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Serve recorded TikTok DOM dumps over a WebDriver-compatible API.")
+    parser.add_argument('--manifest', default=REPLAY_MANIFEST_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4723)
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="Multiply all configured latencies")
+    args = parser.parse_args()
+
+    setup_logging_handlers()
+    server = ReplayServer(args.manifest, args.host, args.port, args.latency_scale)
+    logger.info(f"REPLAY: Serving {args.manifest} on {server.url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# =====================================================================
+# screenshot_codec.py: スクリーンショットの縮小・再エンコード (V105)
+#
+# adb exec-out screencap の出力 (PNG または RAW RGBA) を受け取り、
+# DB に保存する前に指定幅まで縮小して WEBP / JPEG に再エンコードする。
+# Pillow が無い環境では PNG をそのまま返す (RAW は解釈できないため呼び出し側で PNG を要求すること)。
+# ★ V108: 復号済みの画像から知覚ハッシュ (dHash) も同時に求められる (再度デコードしないため)
+# =====================================================================
+import io
+import struct
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app_logger import logger
+from perceptual_hash import dhash_image, MIN_PIXEL_STDDEV
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow はオプション (無い場合は再エンコードしない)
+    Image = None
+
+# screencap (-p なし) の RAW 出力ヘッダ: width, height, format (+ Android 9 以降は colorspace)
+RAW_HEADER_SIZES = (16, 12)
+RAW_BYTES_PER_PIXEL = 4  # PIXEL_FORMAT_RGBA_8888
+
+_UNAVAILABLE_LOGGED = False
+
+
+def is_available() -> bool:
+    return Image is not None
+
+
+def decode_raw_screencap(data: bytes):
+    """screencap の RAW 出力を Pillow の Image (RGBA) に変換する"""
+    if len(data) < 12:
+        raise ValueError(f"Raw screencap output too short ({len(data)} bytes).")
+    width, height = struct.unpack_from('<II', data, 0)
+    pixel_bytes = width * height * RAW_BYTES_PER_PIXEL
+    header_size = next((size for size in RAW_HEADER_SIZES if len(data) - size >= pixel_bytes), None)
+    if header_size is None:
+        raise ValueError(f"Raw screencap size mismatch ({len(data)} bytes for {width}x{height}).")
+    return Image.frombuffer('RGBA', (width, height), data[header_size:header_size + pixel_bytes], 'raw', 'RGBA', 0, 1)
+
+
+def encode_screenshot(data: bytes, raw: bool, max_width: Optional[int], image_format: str,
+                      quality: int, phash: bool = False,
+                      phash_crop_box: Optional[Sequence[float]] = None,
+                      phash_min_stddev: float = MIN_PIXEL_STDDEV) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    (エンコード後のバイト列, 情報) を返す。情報は width / height / format / source_bytes / phash。
+    Pillow が無い場合は PNG をそのまま返す (phash は None)。単色・暗転したフレームも phash は None。
+    """
+    info: Dict[str, Any] = {'source_bytes': len(data), 'format': 'PNG', 'width': None, 'height': None,
+                            'phash': None}
+    if Image is None:
+        if raw:
+            raise RuntimeError("Pillow is required to decode raw screencap output.")
+        return data, info
+
+    image = decode_raw_screencap(data) if raw else Image.open(io.BytesIO(data))
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        # 縮小率が大きいので BILINEAR で十分 (LANCZOS は数倍遅い)
+        image = image.resize((max_width, height), Image.BILINEAR)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if phash:
+        info['phash'] = dhash_image(image, phash_crop_box, phash_min_stddev)
+
+    image_format = image_format.upper()
+    output = io.BytesIO()
+    if image_format == 'WEBP':
+        image.save(output, format='WEBP', quality=quality, method=2)
+    elif image_format == 'JPEG':
+        image.save(output, format='JPEG', quality=quality, optimize=False)
+    else:
+        image_format = 'PNG'
+        image.save(output, format='PNG')
+    info.update({'format': image_format, 'width': image.width, 'height': image.height})
+    return output.getvalue(), info
+
+
+def log_unavailable_once():
+    global _UNAVAILABLE_LOGGED
+    if not _UNAVAILABLE_LOGGED:
+        _UNAVAILABLE_LOGGED = True
+        logger.warning("SCREENSHOT: Pillow is not installed. Screenshots will be stored as full-size PNG.")
@@ -0,0 +1,203 @@
+# =====================================================================
+# screenshot_store.py: コンテンツアドレス方式のスクリーンショット保存 (V107)
+#
+# 1. 画像を SHA-256 のダイジェストをキーとして保存し、DB には ダイジェスト + 幅・高さ のみを持つ
+# 2. 同じ画像 (同一フレーム) は1回だけ保存される (重複排除)
+# 3. 保存先はバックエンドとして差し替え可能 (既定はローカルのシャーディングされたディレクトリ)
+#    例: screenshots/3f/a2/3fa2...(64桁)   ※ 拡張子なし。形式はファイル先頭のシグネチャで判別できる
+#    (★ V107 修正: 相対パスは起動時の作業ディレクトリではなく、このファイルのあるディレクトリを基準にする)
+# =====================================================================
+import hashlib
+import os
+import struct
+import tempfile
+from typing import Any, Dict, Optional, Tuple, Type
+
+from app_logger import logger
+
+
+class ScreenshotStoreError(Exception):
+    pass
+
+
+# =====================================================================
+# I. バックエンド
+# =====================================================================
+
+class ScreenshotStoreBackend:
+    """保存先のインターフェース。ダイジェストをキーとしたバイト列の put / get / exists を実装する"""
+
+    def put(self, digest: str, data: bytes) -> bool:
+        """保存して True を返す。既に同じダイジェストが存在する場合は何もせず False を返す"""
+        raise NotImplementedError
+
+    def get(self, digest: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, digest: str):
+        """[V107 新規] 保存した画像を削除する (DB への記録に失敗した場合の後始末)"""
+        raise NotImplementedError
+
+    def locate(self, digest: str) -> str:
+        """下流のツールが直接読むための場所 (パスやURL)"""
+        raise NotImplementedError
+
+
+class LocalDirectoryBackend(ScreenshotStoreBackend):
+    """root/<先頭2桁>/<次の2桁>/<ダイジェスト> に保存する (1ディレクトリのファイル数を抑える)"""
+
+    def __init__(self, root: str, shard_levels: int = 2, shard_width: int = 2):
+        # ★ V107 修正: Bot ごとに作業ディレクトリが違っても同じ場所に保存されるよう、絶対パスにする
+        if not os.path.isabs(root):
+            root = os.path.join(os.path.dirname(os.path.abspath(__file__)), root)
+        self.root = os.path.normpath(root)
+        self.shard_levels = shard_levels
+        self.shard_width = shard_width
+
+    def locate(self, digest: str) -> str:
+        shards = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_levels)]
+        return os.path.join(self.root, *shards, digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.locate(digest))
+
+    def put(self, digest: str, data: bytes) -> bool:
+        path = self.locate(digest)
+        if os.path.exists(path):
+            return False
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 途中で落ちても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return True
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self.locate(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, digest: str):
+        try:
+            os.remove(self.locate(digest))
+        except FileNotFoundError:
+            pass
+
+
+# バックエンド名 → クラス (config.SCREENSHOT_STORE_BACKEND で選択)
+SCREENSHOT_STORE_BACKENDS: Dict[str, Type[ScreenshotStoreBackend]] = {
+    'local': LocalDirectoryBackend,
+}
+
+
+def register_backend(name: str, backend_class: Type[ScreenshotStoreBackend]):
+    SCREENSHOT_STORE_BACKENDS[name] = backend_class
+
+
+# =====================================================================
+# II. 画像サイズの判定 (Pillow なしで PNG / JPEG / WEBP のヘッダを読む)
+# =====================================================================
+
+def image_dimensions(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', data[16:24])
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(data[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+        if data[:2] == b'\xff\xd8':
+            offset = 2
+            while offset + 9 < len(data):
+                if data[offset] != 0xFF:
+                    offset += 1
+                    continue
+                marker = data[offset + 1]
+                length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+                # SOF0..SOF15 (DHT / JPG / DAC を除く) に画像サイズがある
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                    return width, height
+                offset += 2 + length
+    except (struct.error, IndexError):
+        pass
+    return None, None
+
+
+# =====================================================================
+# III. ストア
+# =====================================================================
+
+class ScreenshotStore:
+    """画像を保存して {digest, width, height, bytes, deduplicated} を返す"""
+
+    def __init__(self, backend: ScreenshotStoreBackend):
+        self.backend = backend
+        self.saved = 0
+        self.deduplicated = 0
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def reference(self, data: bytes, width: Optional[int] = None, height: Optional[int] = None) -> Dict[str, Any]:
+        """[V107 新規] 保存はせず、DB に記録する参照 {digest, width, height, bytes} だけを求める"""
+        if not data:
+            raise ScreenshotStoreError("Cannot store an empty screenshot.")
+        if width is None or height is None:
+            width, height = image_dimensions(data)
+        return {'digest': self.digest(data), 'width': width, 'height': height, 'bytes': len(data)}
+
+    def save(self, data: bytes, width: Optional[int] = None, height: Optional[int] = None) -> Dict[str, Any]:
+        ref = self.reference(data, width, height)
+        stored = self.backend.put(ref['digest'], data)
+        if stored:
+            self.saved += 1
+        else:
+            self.deduplicated += 1
+            logger.debug(f"SCREENSHOT STORE: {ref['digest'][:12]} already stored (deduplicated).")
+        ref['deduplicated'] = not stored
+        return ref
+
+    def discard(self, ref: Dict[str, Any]):
+        """[V107 新規] save した画像を、DB に記録できなかった場合に削除する (既存の画像と重複していた場合は残す)"""
+        if ref.get('deduplicated', True):
+            return
+        self.backend.delete(ref['digest'])
+        self.saved -= 1
+        logger.debug(f"SCREENSHOT STORE: {ref['digest'][:12]} discarded (not recorded in the database).")
+
+    def load(self, digest: str) -> Optional[bytes]:
+        return self.backend.get(digest)
+
+    def locate(self, digest: str) -> str:
+        return self.backend.locate(digest)
+
+
+def create_screenshot_store(backend_name: str, **backend_options) -> ScreenshotStore:
+    backend_class = SCREENSHOT_STORE_BACKENDS.get(backend_name)
+    if backend_class is None:
+        raise ScreenshotStoreError(f"Unknown screenshot store backend '{backend_name}'. "
+                                   f"Available: {sorted(SCREENSHOT_STORE_BACKENDS)}")
+    store = ScreenshotStore(backend_class(**backend_options))
+    if isinstance(store.backend, LocalDirectoryBackend):
+        logger.info(f"SCREENSHOT STORE: Saving screenshots under {store.backend.root}")
+    return store
@@ -0,0 +1,248 @@
+# =====================================================================
+# screenshot_worker.py: スクリーンショットの非同期処理ワーカープール (V106)
+#
+# メインループはシャッター (端末側のキャプチャ完了) までだけ待ち、
+# 残りの転送・縮小/再エンコード・DB書き込みはワーカースレッドで行う。
+# キューは上限付きで、溢れた場合は一定時間だけ待ってから破棄する (バックプレッシャー)。
+# =====================================================================
+import queue
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app_logger import logger
+
+# シャッター判定に使う先頭バイト数 (PNG シグネチャ / RAW ヘッダの幅・高さ)
+SHUTTER_PROBE_BYTES = 8
+
+
+class PendingScreenshot:
+    """
+    撮影済み (端末側でキャプチャ完了) だが、まだ全体を受信していないスクリーンショット。
+    sdcard モードなど同期取得した場合は data に受信済みのバイト列を持つ。
+    """
+
+    def __init__(self, raw: bool, process: Optional[subprocess.Popen] = None, first_chunk: bytes = b'',
+                 data: Optional[bytes] = None, shutter_seconds: float = 0.0):
+        self.raw = raw
+        self.process = process
+        self.first_chunk = first_chunk
+        self.data = data
+        self.shutter_seconds = shutter_seconds
+        self.taken_at = time.time()
+
+    @classmethod
+    def start(cls, cmd, raw: bool, timeout_seconds: float) -> Optional['PendingScreenshot']:
+        """
+        adb exec-out screencap を起動し、最初のバイトが届く (= 端末側のキャプチャが終わった) まで待つ。
+        PNG / RAW のどちらも、キャプチャ完了後にヘッダから出力されるため、これがシャッターのタイミングになる。
+        """
+        started = time.time()
+        try:
+            # bufsize=0: 先読みしたデータが communicate() から見えなくなるのを防ぐ
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except Exception as e:
+            logger.error(f"ADB ERROR: Could not start exec-out screencap: {e}")
+            return None
+        # 応答が無い場合に read が永久に止まらないよう、上限時間でプロセスを止める
+        killer = threading.Timer(timeout_seconds, process.kill)
+        killer.start()
+        try:
+            first_chunk = b''
+            while len(first_chunk) < SHUTTER_PROBE_BYTES:
+                chunk = process.stdout.read(SHUTTER_PROBE_BYTES - len(first_chunk))
+                if not chunk:
+                    break
+                first_chunk += chunk
+        finally:
+            killer.cancel()
+        if len(first_chunk) < SHUTTER_PROBE_BYTES:
+            stderr = process.stderr.read().decode('utf-8', errors='ignore').strip()
+            process.wait()
+            logger.error(f"ADB ERROR: exec-out screencap produced no image (Code: {process.returncode}). "
+                         f"Output: {stderr}")
+            return None
+        return cls(raw, process=process, first_chunk=first_chunk, shutter_seconds=time.time() - started)
+
+    def read(self, timeout_seconds: float) -> Optional[bytes]:
+        """残りを受信して画像全体を返す (ワーカースレッドから呼ばれる)"""
+        if self.data is not None or self.process is None:
+            return self.data
+        try:
+            rest, stderr = self.process.communicate(timeout=timeout_seconds)
+        except subprocess.TimeoutExpired:
+            self.discard()
+            logger.error("ADB ERROR: exec-out screencap transfer timed out.")
+            return None
+        if self.process.returncode != 0:
+            logger.error(f"ADB ERROR: exec-out screencap failed (Code: {self.process.returncode}). "
+                         f"Output: {stderr.decode('utf-8', errors='ignore').strip()}")
+            return None
+        self.data = self.first_chunk + rest
+        return self.data
+
+    def discard(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.communicate()
+
+
+class ScreenshotJob:
+    __slots__ = ('video_id', 'capture', 'submitted_at')
+
+    def __init__(self, video_id: str, capture: PendingScreenshot):
+        self.video_id = video_id
+        self.capture = capture
+        self.submitted_at = time.time()
+
+
+class ScreenshotWorkerPool:
+    """
+    上限付きキューと固定数のワーカースレッド。
+    encoder(data, raw) -> (bytes, info) でエンコードし、store(video_id, bytes, info) で保存する。
+    store はワーカーごとのDB接続を使えるよう、ワーカースレッド内で store_factory() から生成する。
+    ★ V106 修正: 受信・エンコード・保存に失敗した場合は store(video_id, None, {}) で添付できなかったことを伝える。
+    store_factory が失敗した (store が無い) 場合は release(video_id) で伝え、次のジョブで store の作成をやり直す。
+    """
+
+    def __init__(self, workers: int, max_queue: int, put_timeout_seconds: float, transfer_timeout_seconds: float,
+                 encoder: Callable[[bytes, bool], Tuple[bytes, Dict[str, Any]]],
+                 store_factory: Callable[[], Callable[[str, Optional[bytes], Dict[str, Any]], bool]],
+                 release: Optional[Callable[[str], Any]] = None):
+        self.put_timeout_seconds = put_timeout_seconds
+        self.transfer_timeout_seconds = transfer_timeout_seconds
+        self.encoder = encoder
+        self.store_factory = store_factory
+        self.release = release
+        self._queue: 'queue.Queue[Optional[ScreenshotJob]]' = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, float] = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0,
+            'max_queue_depth': 0, 'backpressure_seconds': 0.0,
+            'shutter_seconds': 0.0, 'transfer_seconds': 0.0, 'encode_seconds': 0.0, 'store_seconds': 0.0,
+            'latency_seconds': 0.0, 'source_bytes': 0, 'stored_bytes': 0,
+        }
+        self._threads = [threading.Thread(target=self._run, name=f"ScreenshotWorker-{i + 1}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"SCREENSHOT: Worker pool started (Workers: {workers}, Queue limit: {max_queue}).")
+
+    def _add(self, **values: float):
+        with self._lock:
+            for name, value in values.items():
+                self.metrics[name] += value
+
+    def submit(self, video_id: str, capture: PendingScreenshot) -> bool:
+        """キューに空きが無ければ put_timeout_seconds だけ待ち、それでも空かなければ破棄する"""
+        started = time.time()
+        try:
+            self._queue.put(ScreenshotJob(video_id, capture), timeout=self.put_timeout_seconds)
+        except queue.Full:
+            capture.discard()
+            self._add(dropped=1, backpressure_seconds=time.time() - started)
+            logger.warning(f"SCREENSHOT: Queue full ({self._queue.maxsize}). Dropped screenshot for {video_id}.")
+            return False
+        depth = self._queue.qsize()
+        with self._lock:
+            self.metrics['submitted'] += 1
+            self.metrics['shutter_seconds'] += capture.shutter_seconds
+            self.metrics['backpressure_seconds'] += time.time() - started
+            self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], depth)
+        return True
+
+    def _run(self):
+        store = None
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if store is None:
+                    try:
+                        store = self.store_factory()
+                    except Exception as e:
+                        self._fail_without_store(job, e)
+                        continue
+                self._process(job, store)
+            except Exception as e:
+                self._add(failed=1)
+                logger.error(f"SCREENSHOT: Worker error for {job.video_id if job else None}: {e}")
+                if store is not None:
+                    self._release(store, job.video_id)
+            finally:
+                self._queue.task_done()
+
+    def _fail_without_store(self, job: ScreenshotJob, error: Exception):
+        """[V106 新規] store を作れなかったジョブは、添付待ちのまま残さないよう release で解除する"""
+        self._add(failed=1)
+        job.capture.discard()
+        logger.error(f"SCREENSHOT: Could not create the store for {job.video_id}: {error}")
+        if self.release is None:
+            return
+        try:
+            self.release(job.video_id)
+        except Exception as e:
+            logger.error(f"SCREENSHOT: Could not release {job.video_id} without a screenshot: {e}")
+
+    @staticmethod
+    def _release(store: Callable[[str, Optional[bytes], Dict[str, Any]], bool], video_id: str):
+        try:
+            store(video_id, None, {})
+        except Exception as e:
+            logger.error(f"SCREENSHOT: Could not release {video_id} without a screenshot: {e}")
+
+    def _process(self, job: ScreenshotJob, store: Callable[[str, Optional[bytes], Dict[str, Any]], bool]):
+        started = time.time()
+        data = job.capture.read(self.transfer_timeout_seconds)
+        transferred = time.time()
+        if not data:
+            self._add(failed=1, transfer_seconds=transferred - started)
+            self._release(store, job.video_id)
+            return
+        encoded, info = self.encoder(data, job.capture.raw)
+        encoded_at = time.time()
+        stored = store(job.video_id, encoded, info)
+        finished = time.time()
+        self._add(completed=1 if stored else 0, failed=0 if stored else 1,
+                  transfer_seconds=transferred - started, encode_seconds=encoded_at - transferred,
+                  store_seconds=finished - encoded_at, latency_seconds=finished - job.capture.taken_at,
+                  source_bytes=len(data), stored_bytes=len(encoded) if stored else 0)
+        logger.debug(f"SCREENSHOT: Attached to {job.video_id} ({len(data):,} -> {len(encoded):,} bytes, "
+                     f"Latency since shutter: {finished - job.capture.taken_at:.2f}s).")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        submitted = metrics['submitted'] or 1
+        done = (metrics['completed'] + metrics['failed']) or 1
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': metrics['max_queue_depth'],
+            'submitted': metrics['submitted'],
+            'completed': metrics['completed'],
+            'failed': metrics['failed'],
+            'dropped': metrics['dropped'],
+            'avg_shutter_seconds': metrics['shutter_seconds'] / submitted,
+            'avg_backpressure_seconds': metrics['backpressure_seconds'] / submitted,
+            'avg_transfer_seconds': metrics['transfer_seconds'] / done,
+            'avg_encode_seconds': metrics['encode_seconds'] / done,
+            'avg_store_seconds': metrics['store_seconds'] / done,
+            'avg_latency_seconds': metrics['latency_seconds'] / done,
+            'source_bytes': metrics['source_bytes'],
+            'stored_bytes': metrics['stored_bytes'],
+        }
+
+    def shutdown(self, timeout_seconds: float = 30.0):
+        """キューに残ったジョブを処理し終えてからワーカーを停止する"""
+        deadline = time.time() + timeout_seconds
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(deadline - time.time(), 0.1))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=max(deadline - time.time(), 0.1))
+        alive = sum(thread.is_alive() for thread in self._threads)
+        logger.info(f"SCREENSHOT: Worker pool stopped (Still running: {alive}). Stats: {self.stats()}")
@@ -0,0 +1,311 @@
+# =====================================================================
+# selector_compiler.py: XPath セレクタの高速ロケーター変換ツール (V103)
+#
+# 1. element_ids.py の各セレクタリストを読み込み、XPath 戦略から
+#    同等の accessibility id / UiSelector (-android uiautomator) / resource-id 形式を生成する
+# 2. 記録済みの DOM ダンプ (dom_dumps/*.xml) 上で、変換前と同じノードに一致するかを検証する
+# 3. (任意) 実機の Appium セッションで検索時間を計測する
+# 4. 検証済みの高速ロケーターを変換元のセレクタの直前に並べた表を compiled_selectors.json に出力する
+#    (記述順が意味を持つ FIXED_ORDER_SELECTOR_LISTS は書き換えない)
+#    TiktokAppiumHelper は起動時にこの表を読み込む
+#
+# 使い方:
+#   python selector_compiler.py                       (DOM ダンプのみで検証)
+#   python selector_compiler.py --live <BOT_ID>       (実機で計測も行う。対象画面を表示しておくこと)
+# =====================================================================
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_logger import logger, setup_logging_handlers
+from config import COMPILED_SELECTORS_PATH, DOM_DUMPS_DIR, FIXED_ORDER_SELECTOR_LISTS
+from dom_snapshot import (DomSnapshot, SnapshotSelectorError, BY_ID, BY_XPATH, BY_ACCESSIBILITY_ID,
+                          BY_ANDROID_UIAUTOMATOR)
+
+Selector = Tuple[str, str]
+
+# 実測値が無い場合の静的なコスト順位 (UiAutomator2 では XPath が最も遅い)
+STATIC_STRATEGY_COST = {
+    BY_ID: 1,
+    BY_ACCESSIBILITY_ID: 2,
+    BY_ANDROID_UIAUTOMATOR: 3,
+    BY_XPATH: 10,
+}
+
+# 変換対象: 1ステップのみの XPath (例: //tag[...], (//tag[...])[n])
+_SINGLE_STEP_XPATH = re.compile(
+    r'^(?P<open>\()?//(?P<tag>\*|[A-Za-z_][\w.\-]*)(?:\[(?P<predicate>[^\[\]]+)\])?(?(open)\))(?:\[(?P<index>\d+)\])?$')
+_CONDITION = re.compile(
+    r'^(?:@(?P<eq_attr>[\w\-]+)\s*=\s*"(?P<eq_value>[^"]*)"'
+    r'|(?P<func>starts-with|contains)\(@(?P<fn_attr>[\w\-]+),\s*"(?P<fn_value>[^"]*)"\))$')
+
+# 位置 (.instance) やクラス名だけで一致する候補。何にでも一致しうるため、変換元より前には置かない
+_WEAK_UISELECTOR = re.compile(r'\.instance\(\d+\)|^new UiSelector\(\)\.className\("[^"]*"\)$')
+
+_UISELECTOR_METHODS = {
+    ('content-desc', '='): 'description',
+    ('content-desc', 'starts-with'): 'descriptionStartsWith',
+    ('content-desc', 'contains'): 'descriptionContains',
+    ('text', '='): 'text',
+    ('text', 'starts-with'): 'textStartsWith',
+    ('text', 'contains'): 'textContains',
+    ('resource-id', '='): 'resourceId',
+}
+
+
+# =====================================================================
+# I. 変換
+# =====================================================================
+
+def _quote(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _parse_conditions(predicate: Optional[str]) -> Optional[List[Tuple[str, str, str]]]:
+    """'and' で連結された単純条件を (属性, 演算, 値) のリストにする。'or' などは変換不可 (None)"""
+    if not predicate:
+        return []
+    if re.search(r'\bor\b', predicate):
+        return None
+    conditions = []
+    for part in re.split(r'\s+and\s+', predicate.strip()):
+        match = _CONDITION.match(part.strip())
+        if not match:
+            return None
+        if match.group('eq_attr'):
+            conditions.append((match.group('eq_attr'), '=', match.group('eq_value')))
+        else:
+            conditions.append((match.group('fn_attr'), match.group('func'), match.group('fn_value')))
+    return conditions
+
+
+def compile_selector(selector: Selector) -> List[Selector]:
+    """XPath セレクタから、同等の可能性がある高速ロケーターの候補を生成する (検証は別途)"""
+    by, value = selector
+    if by != BY_XPATH:
+        return []
+    match = _SINGLE_STEP_XPATH.match(value.strip())
+    if not match:
+        return []
+    conditions = _parse_conditions(match.group('predicate'))
+    if conditions is None:
+        return []
+    tag = match.group('tag')
+    index = int(match.group('index')) if match.group('index') else None
+    if index is not None and not match.group('open'):
+        # //tag[n] は「親ごとの n 番目」で UiSelector.instance と意味が異なるため変換しない
+        return []
+
+    candidates: List[Selector] = []
+
+    # 1. resource-id 完全一致のみ → ID
+    if index is None and len(conditions) == 1 and conditions[0][:2] == ('resource-id', '='):
+        candidates.append((BY_ID, conditions[0][2]))
+
+    # 2. content-desc 完全一致のみ → accessibility id
+    if index is None and len(conditions) == 1 and conditions[0][:2] == ('content-desc', '='):
+        candidates.append((BY_ACCESSIBILITY_ID, conditions[0][2]))
+
+    # 3. UiSelector
+    parts = ['new UiSelector()']
+    if tag != '*':
+        parts.append(f'.className({_quote(tag)})')
+    for attr, op, cond_value in conditions:
+        method = _UISELECTOR_METHODS.get((attr, op))
+        if method is None and attr == 'resource-id' and op == 'contains':
+            method, cond_value = 'resourceIdMatches', f'.*{re.escape(cond_value)}.*'
+        if method is None:
+            return candidates
+        parts.append(f'.{method}({_quote(cond_value)})')
+    if index is not None:
+        parts.append(f'.instance({index - 1})')
+    if len(parts) > 1:
+        candidates.append((BY_ANDROID_UIAUTOMATOR, ''.join(parts)))
+    return candidates
+
+
+# =====================================================================
+# II. DOM ダンプでの検証
+# =====================================================================
+
+def load_dom_dumps(dumps_dir: str) -> List[Tuple[str, DomSnapshot]]:
+    dumps = []
+    for path in sorted(glob.glob(os.path.join(dumps_dir, '**', '*.xml'), recursive=True)):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                dumps.append((path, DomSnapshot(f.read())))
+        except Exception as e:
+            logger.warning(f"COMPILER: Skipping unreadable DOM dump {path}: {e}")
+    return dumps
+
+
+def _first_match(snapshot: DomSnapshot, selector: Selector):
+    node = snapshot.find(*selector)
+    return node.element if node is not None else None
+
+
+def verify_candidate(original: Selector, candidate: Selector, dumps: List[Tuple[str, DomSnapshot]]) -> Tuple[bool, int]:
+    """
+    全ダンプで「最初に一致するノード」が変換前と同一なら有効とみなす。
+    (有効か, 変換前が一致したダンプ数) を返す。一致したダンプが1つも無い候補は未検証として無効扱い。
+    """
+    matched_dumps = 0
+    for _, snapshot in dumps:
+        try:
+            expected = _first_match(snapshot, original)
+            actual = _first_match(snapshot, candidate)
+        except SnapshotSelectorError:
+            return False, matched_dumps
+        if expected is not actual:
+            return False, matched_dumps
+        if expected is not None:
+            matched_dumps += 1
+    return matched_dumps > 0, matched_dumps
+
+
+# =====================================================================
+# III. 実機での計測 (任意)
+# =====================================================================
+
+def benchmark_live(driver, selectors: List[Selector], trials: int = 5) -> Dict[Selector, float]:
+    """各セレクタの find_elements の中央値 (秒)。一致しない、またはエラーのセレクタは含めない"""
+    results = {}
+    for selector in selectors:
+        timings = []
+        for _ in range(trials):
+            started = time.time()
+            try:
+                found = driver.find_elements(*selector)
+            except Exception as e:
+                logger.debug(f"COMPILER: Live lookup failed for {selector}: {e}")
+                found = None
+            timings.append(time.time() - started)
+            if not found:
+                break
+        else:
+            results[selector] = statistics.median(timings)
+    return results
+
+
+# =====================================================================
+# IV. セレクタ表の生成・読み込み
+# =====================================================================
+
+def is_weak_candidate(selector: Selector) -> bool:
+    return selector[0] == BY_ANDROID_UIAUTOMATOR and bool(_WEAK_UISELECTOR.search(selector[1]))
+
+
+def selector_lists(namespace) -> Dict[str, List[Selector]]:
+    return {name: value for name, value in vars(namespace).items()
+            if name.endswith('_SELECTORS') and isinstance(value, list)}
+
+
+def compile_table(namespace, dumps: List[Tuple[str, DomSnapshot]],
+                  live_timings: Optional[Dict[Selector, float]] = None) -> Dict[str, Any]:
+    """
+    検証済みの候補を、変換元のセレクタの直前にコスト順で並べた表を作る (元のセレクタ同士の記述順は変えない)。
+    位置・クラス名だけの候補は変換元の直後に置き、手書きの ID・テキストのセレクタより前に出さない。
+    FIXED_ORDER_SELECTOR_LISTS のリストは変換しない。
+    """
+    table: Dict[str, Any] = {'generated_at': time.time(), 'dump_count': len(dumps), 'lists': {}, 'details': {}}
+    for list_name, selectors in sorted(selector_lists(namespace).items()):
+        if list_name in FIXED_ORDER_SELECTOR_LISTS:
+            continue
+        ordered: List[Selector] = []
+        details = []
+        for original in selectors:
+            verified: List[Tuple[float, Selector]] = []
+            for candidate in compile_selector(original):
+                if candidate in selectors:
+                    continue
+                ok, matched = verify_candidate(original, candidate, dumps)
+                details.append({'original': list(original), 'candidate': list(candidate),
+                                'verified': ok, 'matched_dumps': matched,
+                                'live_seconds': (live_timings or {}).get(candidate)})
+                if ok and candidate not in ordered:
+                    cost = (live_timings or {}).get(candidate, STATIC_STRATEGY_COST.get(candidate[0], 99))
+                    verified.append((cost, candidate))
+            ranked = [candidate for _, candidate in sorted(verified, key=lambda item: item[0])]
+            # 変換元と同じノードに一致することは検証済みのため、変換元の位置に置けばフォールバックの意味は変わらない
+            ordered += [sel for sel in ranked if not is_weak_candidate(sel)]
+            ordered.append(original)
+            ordered += [sel for sel in ranked if is_weak_candidate(sel)]
+        table['lists'][list_name] = [list(sel) for sel in ordered]
+        table['details'][list_name] = details
+    return table
+
+
+def apply_compiled_selector_table(path: str, namespace) -> int:
+    """
+    compiled_selectors.json を読み込み、namespace のセレクタリストを「その場で」置き換える。
+    リストの同一性 (id) を保つため、統計キーや import 済みの参照はそのまま有効。置き換えたリスト数を返す。
+    """
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            table = json.load(f)
+    except Exception as e:
+        logger.warning(f"COMPILER: Failed to load compiled selector table {path}: {e}")
+        return 0
+    current = selector_lists(namespace)
+    applied = 0
+    for list_name, compiled in table.get('lists', {}).items():
+        target = current.get(list_name)
+        if target is None or list_name in FIXED_ORDER_SELECTOR_LISTS:
+            continue
+        compiled_selectors = [tuple(sel) for sel in compiled]
+        # element_ids.py 側で追加されたセレクタは失わないよう末尾に残す
+        compiled_selectors += [sel for sel in target if sel not in compiled_selectors]
+        target[:] = compiled_selectors
+        applied += 1
+    logger.info(f"COMPILER: Applied compiled selector table ({applied} lists) from {path}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile XPath selectors in element_ids.py into faster locators.")
+    parser.add_argument('--dumps', default=DOM_DUMPS_DIR, help="Directory of recorded page_source XML dumps")
+    parser.add_argument('--out', default=COMPILED_SELECTORS_PATH, help="Output JSON path")
+    parser.add_argument('--live', type=int, metavar='BOT_ID', help="Also benchmark candidates on this bot's device")
+    args = parser.parse_args()
+
+    setup_logging_handlers()
+    import element_ids
+
+    dumps = load_dom_dumps(args.dumps)
+    logger.info(f"COMPILER: Loaded {len(dumps)} DOM dumps from {args.dumps}")
+    if not dumps:
+        logger.warning("COMPILER: No DOM dumps found. Record some with TiktokAppiumHelper.save_dom_dump() first.")
+
+    live_timings = None
+    if args.live is not None:
+        from tiktok_db_manager import TikTokDBManager
+        from tiktok_appium_helper import TiktokAppiumHelper
+        bot_config = TikTokDBManager().fetch_bot_configuration(args.live)
+        helper = TiktokAppiumHelper.initialize_driver(bot_config['appium_device_name'], bot_config['appium_udid'],
+                                                      bot_config['appium_host'], bot_config['appium_port'],
+                                                      reuse_session=False)
+        candidates = {cand for selectors in selector_lists(element_ids).values()
+                      for sel in selectors for cand in [sel] + compile_selector(sel)}
+        live_timings = benchmark_live(helper.driver, sorted(candidates))
+
+    table = compile_table(element_ids, dumps, live_timings)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, indent=1)
+
+    for list_name, details in table['details'].items():
+        for d in details:
+            status = 'OK ' if d['verified'] else 'NG '
+            logger.info(f"COMPILER: {status} {list_name}: {d['original'][1]} -> {d['candidate'][0]}: {d['candidate'][1]} "
+                        f"(Matched dumps: {d['matched_dumps']})")
+    logger.info(f"COMPILER: Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
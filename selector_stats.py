@@ -0,0 +1,201 @@
+# =====================================================================
+# selector_stats.py: セレクタ別ヒット率の記録と適応的な並び替え (V97)
+#
+# 1. find_element_with_fallbacks の各セレクタについて 成功/失敗 と所要時間を記録
+# 2. 統計はデバイス(UDID)ごとの JSON ファイルに保存し、再起動後も引き継ぐ
+# 3. 現在「勝っている」セレクタを先頭に並び替え、一定確率で他の戦略も試す
+# 4. 死んでいるセレクタのレポートを出力する
+# =====================================================================
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app_logger import logger
+
+# 判定用の既定値
+DEFAULT_PROBE_RATE = 0.05          # 先頭以外のセレクタを先に試す確率
+DEFAULT_SAVE_INTERVAL_SECONDS = 60.0
+DYING_MIN_ATTEMPTS = 10            # これ未満の試行回数では「死亡」と判定しない
+DYING_HIT_RATE = 0.2               # この成功率を下回ったら「死亡」と判定
+
+
+def selector_key(selector: Tuple[str, str]) -> str:
+    """(By, Value) をJSONキーとして使える文字列に変換する"""
+    return f"{selector[0]}|{selector[1]}"
+
+
+class SelectorStats:
+    """単一セレクタの累積カウンタ"""
+    __slots__ = ('attempts', 'hits', 'hit_seconds', 'miss_seconds', 'last_hit_at', 'last_miss_at')
+
+    def __init__(self, attempts: int = 0, hits: int = 0, hit_seconds: float = 0.0, miss_seconds: float = 0.0,
+                 last_hit_at: Optional[float] = None, last_miss_at: Optional[float] = None):
+        self.attempts = attempts
+        self.hits = hits
+        self.hit_seconds = hit_seconds
+        self.miss_seconds = miss_seconds
+        self.last_hit_at = last_hit_at
+        self.last_miss_at = last_miss_at
+
+    @property
+    def hit_rate(self) -> float:
+        """ラプラス平滑化した成功率 (未試行のセレクタは 0.5 扱い)"""
+        return (self.hits + 1) / (self.attempts + 2)
+
+    @property
+    def mean_hit_seconds(self) -> float:
+        return self.hit_seconds / self.hits if self.hits else 0.0
+
+    @property
+    def mean_miss_seconds(self) -> float:
+        misses = self.attempts - self.hits
+        return self.miss_seconds / misses if misses else 0.0
+
+    @property
+    def is_dying(self) -> bool:
+        return self.attempts >= DYING_MIN_ATTEMPTS and self.hits / self.attempts < DYING_HIT_RATE
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SelectorStats':
+        return cls(**{name: data.get(name) for name in cls.__slots__ if name in data})
+
+
+class SelectorStatsStore:
+    """
+    セレクタリスト名 → セレクタ → SelectorStats の2段辞書を保持し、ファイルへ永続化する。
+    TiktokAppiumHelper からのみ呼ばれる前提だが、保存処理はスレッドセーフにしておく。
+    """
+
+    def __init__(self, path: Optional[str], probe_rate: float = DEFAULT_PROBE_RATE,
+                 save_interval_seconds: float = DEFAULT_SAVE_INTERVAL_SECONDS):
+        self.path = path
+        self.probe_rate = probe_rate
+        self.save_interval_seconds = save_interval_seconds
+        self._stats: Dict[str, Dict[str, SelectorStats]] = {}
+        self._list_failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._last_saved_at = time.time()
+        self._dirty = False
+        self.load()
+
+    # --- 永続化 ---
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            for list_name, selectors in raw.get('lists', {}).items():
+                self._stats[list_name] = {key: SelectorStats.from_dict(data) for key, data in selectors.items()}
+            self._list_failures = {name: int(count) for name, count in raw.get('list_failures', {}).items()}
+            logger.info(f"SELECTOR STATS: Loaded statistics for {len(self._stats)} selector lists from {self.path}")
+        except Exception as e:
+            logger.warning(f"SELECTOR STATS: Failed to load {self.path}: {e}. Starting with empty statistics.")
+            self._stats = {}
+
+    def save(self):
+        """一時ファイルに書き出してから置き換える (書き込み途中のクラッシュで壊れないように)"""
+        if not self.path:
+            return
+        with self._lock:
+            payload = {
+                'saved_at': time.time(),
+                'lists': {name: {key: st.to_dict() for key, st in selectors.items()}
+                          for name, selectors in self._stats.items()},
+                'list_failures': dict(self._list_failures),
+            }
+            directory = os.path.dirname(self.path)
+            try:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_path, self.path)
+                self._last_saved_at = time.time()
+                self._dirty = False
+            except Exception as e:
+                logger.warning(f"SELECTOR STATS: Failed to save {self.path}: {e}")
+
+    def maybe_save(self):
+        if self._dirty and time.time() - self._last_saved_at >= self.save_interval_seconds:
+            self.save()
+
+    # --- 記録と並び替え ---
+    def get(self, list_name: str, selector: Tuple[str, str]) -> SelectorStats:
+        selectors = self._stats.setdefault(list_name, {})
+        key = selector_key(selector)
+        stats = selectors.get(key)
+        if stats is None:
+            stats = selectors[key] = SelectorStats()
+        return stats
+
+    def record(self, list_name: str, selector: Tuple[str, str], success: bool, elapsed_seconds: float):
+        stats = self.get(list_name, selector)
+        now = time.time()
+        stats.attempts += 1
+        if success:
+            stats.hits += 1
+            stats.hit_seconds += elapsed_seconds
+            stats.last_hit_at = now
+        else:
+            stats.miss_seconds += elapsed_seconds
+            stats.last_miss_at = now
+        self._dirty = True
+        self.maybe_save()
+
+    def record_list_failure(self, list_name: str):
+        """リスト内の全セレクタが失敗した (要素が本当に無いのか、全滅かは区別できない)"""
+        self._list_failures[list_name] = self._list_failures.get(list_name, 0) + 1
+        self._dirty = True
+        self.maybe_save()
+
+    def order(self, list_name: str, selectors_list: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        成功率の高い順 (同率なら平均所要時間の短い順、さらに同率なら element_ids.py の記述順) に並べる。
+        probe_rate の確率で先頭以外のセレクタを1つ先頭に出し、復活したセレクタを検出できるようにする。
+        """
+        if len(selectors_list) < 2:
+            return list(selectors_list)
+        indexed = list(enumerate(selectors_list))
+        indexed.sort(key=lambda item: (-self.get(list_name, item[1]).hit_rate,
+                                       self.get(list_name, item[1]).mean_hit_seconds,
+                                       item[0]))
+        ordered = [selector for _, selector in indexed]
+        if random.random() < self.probe_rate:
+            probe_index = random.randrange(1, len(ordered))
+            ordered.insert(0, ordered.pop(probe_index))
+        return ordered
+
+    # --- レポート ---
+    def dying_selectors(self) -> List[Tuple[str, str, SelectorStats]]:
+        return [(list_name, key, st)
+                for list_name, selectors in sorted(self._stats.items())
+                for key, st in selectors.items() if st.is_dying]
+
+    def report(self) -> str:
+        lines = ["SELECTOR STATS REPORT", "=" * 60]
+        for list_name, selectors in sorted(self._stats.items()):
+            failures = self._list_failures.get(list_name, 0)
+            lines.append(f"[{list_name}] (all selectors failed: {failures} times)")
+            for key, st in sorted(selectors.items(), key=lambda item: -item[1].hit_rate):
+                rate = st.hits / st.attempts if st.attempts else 0.0
+                mark = " ** DYING **" if st.is_dying else ""
+                lines.append(f"  {rate:6.1%} ({st.hits}/{st.attempts}) hit={st.mean_hit_seconds:.2f}s "
+                             f"miss={st.mean_miss_seconds:.2f}s  {key}{mark}")
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # 使い方: python selector_stats.py selector_stats/<UDID>.json
+    if len(sys.argv) < 2:
+        print("Usage: python selector_stats.py <stats_json_path>")
+        sys.exit(1)
+    print(SelectorStatsStore(sys.argv[1]).report())
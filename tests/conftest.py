@@ -0,0 +1,7 @@
+# =====================================================================
+# tests/conftest.py: リポジトリ直下のモジュール (フラット配置) を tests/ から import できるようにする
+# =====================================================================
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+# =====================================================================
+# tests/test_base_db.py: MySQL エラーの分類 (接続の問題 / ロック競合 / データの問題) とロック競合のやり直し
+# =====================================================================
+import socket
+
+import pymysql
+import pytest
+
+import base_db
+from base_db import BaseDB, is_connection_error, is_lock_conflict, mysql_errno
+
+
+@pytest.mark.parametrize('error', [
+    pymysql.err.OperationalError(2002, "Can't connect to local MySQL server"),
+    pymysql.err.OperationalError(2003, "Can't connect to MySQL server"),
+    pymysql.err.OperationalError(2006, 'MySQL server has gone away'),
+    pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query'),
+    pymysql.err.OperationalError(2055, 'Lost connection to MySQL server at reading'),
+    pymysql.err.InterfaceError(0, ''),
+    ConnectionError('DB接続が失われています。'),
+    socket.timeout('timed out'),
+    OSError('Network is unreachable'),
+])
+def test_outages_are_connection_errors(error):
+    assert is_connection_error(error)
+
+
+@pytest.mark.parametrize('error', [
+    pymysql.err.OperationalError(1054, "Unknown column 'x' in 'field list'"),
+    pymysql.err.OperationalError(1292, "Incorrect datetime value: 'x'"),
+    pymysql.err.OperationalError(1364, "Field 'url' doesn't have a default value"),
+    pymysql.err.OperationalError(1205, 'Lock wait timeout exceeded'),
+    pymysql.err.OperationalError(1213, 'Deadlock found when trying to get lock'),
+    pymysql.err.DataError(1406, 'Data too long for column'),
+    pymysql.err.IntegrityError(1062, "Duplicate entry 'x' for key 'PRIMARY'"),
+    ValueError('bad value'),
+])
+def test_data_and_lock_errors_are_not_connection_errors(error):
+    assert not is_connection_error(error)
+
+
+def test_lock_conflicts():
+    assert is_lock_conflict(pymysql.err.OperationalError(1205, 'Lock wait timeout exceeded'))
+    assert is_lock_conflict(pymysql.err.OperationalError(1213, 'Deadlock found'))
+    assert not is_lock_conflict(pymysql.err.OperationalError(1292, 'Incorrect datetime value'))
+    assert not is_lock_conflict(OSError('Network is unreachable'))
+
+
+def test_mysql_errno():
+    assert mysql_errno(pymysql.err.OperationalError(2013, 'Lost connection')) == 2013
+    assert mysql_errno(pymysql.err.OperationalError('no number')) is None
+    assert mysql_errno(ValueError()) is None
+
+
+class _TransactionDB(BaseDB):
+    """接続を作らずに run_transaction のやり直しだけを確かめる"""
+
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture(autouse=True)
+def _no_lock_retry_wait(monkeypatch):
+    monkeypatch.setattr(base_db, 'DB_LOCK_RETRY_WAIT_SECONDS', 0.0)
+
+
+def test_run_transaction_retries_lock_conflicts():
+    db = _TransactionDB()
+    failures = [pymysql.err.OperationalError(1213, 'Deadlock found')]
+
+    def action():
+        if failures:
+            raise failures.pop()
+        return 'ok'
+
+    assert db.run_transaction(action, attempts=3) == 'ok'
+    assert (db.commits, db.rollbacks) == (1, 1)
+
+
+def test_run_transaction_gives_up_after_attempts():
+    db = _TransactionDB()
+    calls = []
+
+    def action():
+        calls.append(1)
+        raise pymysql.err.OperationalError(1205, 'Lock wait timeout exceeded')
+
+    with pytest.raises(pymysql.err.OperationalError):
+        db.run_transaction(action, attempts=3)
+    assert len(calls) == 3
+    assert db.commits == 0
+
+
+def test_run_transaction_does_not_retry_data_errors():
+    db = _TransactionDB()
+    calls = []
+
+    def action():
+        calls.append(1)
+        raise pymysql.err.OperationalError(1292, 'Incorrect datetime value')
+
+    with pytest.raises(pymysql.err.OperationalError):
+        db.run_transaction(action, attempts=3)
+    assert len(calls) == 1
+    assert db.rollbacks == 1
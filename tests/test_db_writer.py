@@ -0,0 +1,132 @@
+# =====================================================================
+# tests/test_db_writer.py: BackgroundDBWriter のスプールへの退避・再送と、書き込めない記録の rejected への移動
+# =====================================================================
+import sqlite3
+import time
+
+import pymysql
+import pytest
+
+import base_db
+from base_db import BaseDB
+from db_writer import BackgroundDBWriter
+
+
+class FakeServer:
+    """書き込まれた記録を保持する MySQL の代わり (down=True の間は接続が失われた状態)"""
+
+    def __init__(self):
+        self.down = False
+        self.rows = []
+
+
+class FakeWriterDB(BaseDB):
+    """apply_writes / commit だけを持つ書き込み専用の TikTokDBManager の代わり"""
+
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.pending = []
+
+    def ensure_connection(self) -> bool:
+        return not self.server.down
+
+    def apply_writes(self, records):
+        for key, op, values in records:
+            if self.server.down:
+                raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+            if values[0].startswith('BAD'):
+                raise pymysql.err.OperationalError(1292, f"Incorrect datetime value for {values[0]}")
+            self.pending.append(values[0])
+
+    def commit(self):
+        if self.server.down:
+            raise pymysql.err.OperationalError(2013, 'Lost connection to MySQL server during query')
+        self.server.rows.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        pass
+
+
+def wait_for(predicate, timeout_seconds: float = 5.0) -> bool:
+    deadline = time.time() + timeout_seconds
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return predicate()
+
+
+@pytest.fixture(autouse=True)
+def _no_lock_retry_wait(monkeypatch):
+    monkeypatch.setattr(base_db, 'DB_LOCK_RETRY_WAIT_SECONDS', 0.0)
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+def make_writer(server, spool_path, retry_seconds=0.05):
+    writer = BackgroundDBWriter(lambda: FakeWriterDB(server), str(spool_path), batch_rows=10,
+                                batch_wait_seconds=0.05, retry_seconds=retry_seconds)
+    writer.start()
+    return writer
+
+
+def test_data_error_rejects_only_the_bad_record(server, tmp_path):
+    spool_path = tmp_path / 'spool.sqlite3'
+    writer = make_writer(server, spool_path)
+    for video_id in ('v0', 'BAD1', 'v2', 'v3'):
+        writer.submit('history', (video_id, 'A', 'B', 'message', '1'))
+
+    assert wait_for(lambda: len(server.rows) == 3)
+    stats = writer.stats()
+    writer.close(timeout_seconds=5)
+
+    assert server.rows == ['v0', 'v2', 'v3']
+    assert stats['rejected'] == 1
+    assert stats['spool_depth'] == 0
+    with sqlite3.connect(spool_path) as conn:
+        rejected = conn.execute("SELECT op, payload, error FROM rejected").fetchall()
+    assert len(rejected) == 1
+    assert rejected[0][0] == 'history' and 'BAD1' in rejected[0][1] and '1292' in rejected[0][2]
+
+
+def test_outage_spools_and_replays_in_order(server, tmp_path):
+    spool_path = tmp_path / 'spool.sqlite3'
+    server.down = True
+    writer = make_writer(server, spool_path, retry_seconds=60)
+    for i in range(5):
+        writer.submit('history', (f'v{i}', 'A', 'B', 'message', '1'))
+    assert wait_for(lambda: writer.stats()['spool_depth'] == 5)
+    writer.close(timeout_seconds=5)
+    assert server.rows == []
+
+    # 再起動後、スプールに残った記録を新しい記録より先に書き込む
+    server.down = False
+    writer = make_writer(server, spool_path)
+    writer.submit('history', ('v9', 'A', 'B', 'message', '1'))
+    assert wait_for(lambda: len(server.rows) == 6)
+    stats = writer.stats()
+    writer.close(timeout_seconds=5)
+
+    assert server.rows == ['v0', 'v1', 'v2', 'v3', 'v4', 'v9']
+    assert stats['rejected'] == 0
+    assert stats['spool_depth'] == 0
+
+
+def test_outage_does_not_reject_records(server, tmp_path):
+    server.down = True
+    writer = make_writer(server, tmp_path / 'spool.sqlite3')
+    writer.submit('history', ('v0', 'A', 'B', 'message', '1'))
+    assert wait_for(lambda: writer.stats()['spool_depth'] == 1)
+    time.sleep(0.2)  # 再送を何回か試させる
+    stats = writer.stats()
+    writer.close(timeout_seconds=5)
+
+    assert stats['rejected'] == 0
+    assert stats['spool_depth'] == 1
@@ -0,0 +1,73 @@
+# =====================================================================
+# tests/test_locale_packs.py: 言語パックごとの件数表記の解析と、セレクタ文字列の置き換え
+# =====================================================================
+import pytest
+
+import locale_packs
+from locale_packs import CountParser, LocalePackError, load_locale_pack
+
+
+@pytest.mark.parametrize('locale, text, expected', [
+    ('ja', '123', 123),
+    ('ja', '12,345', 12345),
+    ('ja', '1.2万', 12000),
+    ('ja', '3億', 300000000),
+    ('ja', '4.5K', 4500),
+    ('ja', '1.5B', 1500000000),
+    ('en', '12.3K', 12300),
+    ('en', '1,234', 1234),
+    ('en', '2.5m', 2500000),
+    ('de', '1,2 Mio.', 1200000),
+    ('de', '12.345', 12345),
+    ('de', '3,4 Tsd.', 3400),
+    ('de', '1 234', 1234),
+    ('ko', '1.2만', 12000),
+    ('zh_TW', '3.4萬', 34000),
+])
+def test_parse_count(locale, text, expected):
+    assert load_locale_pack(locale).parse_count(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'N/A', 'いいね', '1.2万件です'])
+def test_parse_count_rejects_non_counts(text):
+    assert load_locale_pack('ja').parse_count(text) == 0
+
+
+def test_is_count():
+    parser = load_locale_pack('ja').count_parser
+    assert parser.is_count('1.2万')
+    assert parser.is_count('345')
+    assert not parser.is_count('今日の夕飯 1.2万')
+
+
+def test_likes_desc_pattern():
+    match = load_locale_pack('ja').likes_desc_pattern.search('動画に「いいね」をします。1.2万件')
+    assert match and load_locale_pack('ja').parse_count(match.group(1)) == 12000
+    match = load_locale_pack('de').likes_desc_pattern.search('Video liken. 1,2 Mio. Likes')
+    assert match and load_locale_pack('de').parse_count(match.group(1)) == 1200000
+
+
+def test_count_parser_validates_configuration():
+    with pytest.raises(LocalePackError):
+        CountParser({'K': 1000}, decimal_separator=';')
+    with pytest.raises(LocalePackError):
+        CountParser({})
+
+
+def test_unknown_locale():
+    with pytest.raises(LocalePackError):
+        load_locale_pack('xx')
+
+
+def test_resolve_locale():
+    assert locale_packs.resolve_locale('de', {'DE': 'de'}, 'ja') == 'de'
+    assert locale_packs.resolve_locale(None, {'DE': 'de'}, 'ja') == 'ja'
+
+
+def test_localized_selectors_leave_element_ids_untouched():
+    pytest.importorskip('appium')
+    import element_ids
+    before = list(element_ids.COPY_LINK_BUTTON_SELECTORS)
+    selectors = locale_packs.localized_selectors('de', element_ids)
+    assert any('Link kopieren' in value for _, value in selectors.COPY_LINK_BUTTON_SELECTORS)
+    assert element_ids.COPY_LINK_BUTTON_SELECTORS == before
@@ -0,0 +1,82 @@
+# =====================================================================
+# tests/test_perceptual_hash.py: マルチインデックス・ハッシングの近傍検索と情報量の少ないハッシュの判定
+# =====================================================================
+import random
+
+import pytest
+
+from perceptual_hash import HASH_BITS, MultiIndexHashIndex, hamming_distance, is_informative_hash
+
+
+def flip_bits(value: int, positions) -> int:
+    for position in positions:
+        value ^= 1 << position
+    return value
+
+
+def brute_force(entries, value: int, radius: int):
+    return sorted((hamming_distance(value, stored), video_id) for stored, video_id in entries
+                  if hamming_distance(value, stored) <= radius)
+
+
+def test_hamming_distance():
+    assert hamming_distance(0, 0) == 0
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance(0, (1 << HASH_BITS) - 1) == HASH_BITS
+
+
+def test_nearest_finds_flipped_hash_within_radius():
+    index = MultiIndexHashIndex()
+    original = 0x0F0F_3C3C_A5A5_5A5A
+    index.add(original, 'original')
+    index.add(original ^ ((1 << HASH_BITS) - 1), 'inverted')
+
+    # 4 セグメントに分散した 8 ビットの変化 (各セグメント 2 ビット) も radius=8 で見つかる
+    reposted = flip_bits(original, [0, 1, 16, 17, 32, 33, 48, 49])
+    assert index.nearest(reposted, radius=8) == (8, 'original')
+    assert index.nearest(reposted, radius=7) is None
+
+
+@pytest.mark.parametrize('radius', [0, 4, 8, 10])
+def test_query_matches_brute_force(radius):
+    rng = random.Random(radius)
+    index = MultiIndexHashIndex()
+    entries = []
+    for i in range(300):
+        value = rng.getrandbits(HASH_BITS)
+        entries.append((value, f'v{i}'))
+        index.add(value, f'v{i}')
+    # 既存のハッシュの近くと、無関係なハッシュの両方で問い合わせる
+    probes = [flip_bits(value, rng.sample(range(HASH_BITS), rng.randint(0, radius))) for value, _ in entries[:30]]
+    probes += [rng.getrandbits(HASH_BITS) for _ in range(30)]
+    for probe in probes:
+        assert index.query(probe, radius) == brute_force(entries, probe, radius)
+
+
+def test_query_returns_closest_first():
+    index = MultiIndexHashIndex()
+    base = 0x1234_5678_9ABC_DEF0
+    index.add(flip_bits(base, [3, 20, 40]), 'far')
+    index.add(flip_bits(base, [5]), 'near')
+    assert [video_id for _, video_id in index.query(base, radius=4)] == ['near', 'far']
+    assert len(index) == 2
+
+
+def test_max_bucket_scan_keeps_newest_entries():
+    index = MultiIndexHashIndex(max_bucket_scan=2)
+    value = 0xFFFF_0000_FFFF_0000
+    for i in range(5):
+        index.add(value, f'v{i}')
+    assert [video_id for _, video_id in index.query(value, radius=0)] == ['v3', 'v4']
+
+
+def test_segments_must_divide_hash_bits():
+    with pytest.raises(ValueError):
+        MultiIndexHashIndex(segments=5)
+
+
+def test_informative_hash():
+    assert not is_informative_hash(0)
+    assert not is_informative_hash((1 << HASH_BITS) - 1)
+    assert not is_informative_hash(0b111, min_set_bits=8)
+    assert is_informative_hash(0x0F0F_3C3C_A5A5_5A5A)
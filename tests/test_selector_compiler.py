@@ -0,0 +1,76 @@
+# =====================================================================
+# tests/test_selector_compiler.py: XPath から高速ロケーターへの変換範囲と、DOM ダンプでの検証
+# =====================================================================
+import pytest
+
+from dom_snapshot import DomSnapshot, BY_ID, BY_XPATH, BY_ACCESSIBILITY_ID, BY_ANDROID_UIAUTOMATOR
+from selector_compiler import compile_selector, is_weak_candidate, verify_candidate
+
+DUMP = (
+    '<hierarchy>'
+    '<node class="android.widget.FrameLayout" resource-id="">'
+    '<node class="android.widget.Button" resource-id="app:id/share" content-desc="Share video" text="" />'
+    '<node class="android.widget.Button" resource-id="app:id/like" content-desc="Like video" text="" />'
+    '<node class="android.widget.TextView" resource-id="app:id/desc" content-desc="" text="Caption" />'
+    '</node>'
+    '</hierarchy>'
+)
+
+
+def test_resource_id_equality_compiles_to_id():
+    candidates = compile_selector((BY_XPATH, '//*[@resource-id="app:id/share"]'))
+    assert (BY_ID, 'app:id/share') in candidates
+    assert (BY_ANDROID_UIAUTOMATOR, 'new UiSelector().resourceId("app:id/share")') in candidates
+
+
+def test_content_desc_equality_compiles_to_accessibility_id():
+    candidates = compile_selector((BY_XPATH, '//android.widget.Button[@content-desc="Share video"]'))
+    assert candidates[0] == (BY_ACCESSIBILITY_ID, 'Share video')
+    assert candidates[1] == (BY_ANDROID_UIAUTOMATOR,
+                             'new UiSelector().className("android.widget.Button").description("Share video")')
+
+
+def test_functions_compile_to_uiselector_methods():
+    assert compile_selector((BY_XPATH, '//*[starts-with(@content-desc, "Like")]')) == [
+        (BY_ANDROID_UIAUTOMATOR, 'new UiSelector().descriptionStartsWith("Like")')]
+    assert compile_selector((BY_XPATH, '//*[contains(@text, "Cap") and @resource-id="app:id/desc"]')) == [
+        (BY_ANDROID_UIAUTOMATOR, 'new UiSelector().textContains("Cap").resourceId("app:id/desc")')]
+
+
+def test_document_order_index_compiles_to_instance():
+    assert compile_selector((BY_XPATH, '(//android.widget.Button[@content-desc="Like video"])[2]')) == [
+        (BY_ANDROID_UIAUTOMATOR,
+         'new UiSelector().className("android.widget.Button").description("Like video").instance(1)')]
+
+
+@pytest.mark.parametrize('selector', [
+    (BY_XPATH, '//android.widget.Button[2]'),
+    (BY_XPATH, '//*[@content-desc="a" or @content-desc="b"]'),
+    (BY_XPATH, '//android.widget.FrameLayout/android.widget.Button'),
+    (BY_XPATH, '//*[@bounds="[0,0][1,1]"]'),
+    (BY_ID, 'app:id/share'),
+])
+def test_outside_the_supported_subset_compiles_to_nothing(selector):
+    assert compile_selector(selector) == []
+
+
+def test_verify_candidate_requires_the_same_first_match():
+    dumps = [('dump.xml', DomSnapshot(DUMP))]
+    original = (BY_XPATH, '//*[@resource-id="app:id/share"]')
+    assert verify_candidate(original, (BY_ID, 'app:id/share'), dumps) == (True, 1)
+    assert verify_candidate(original, (BY_ANDROID_UIAUTOMATOR,
+                                       'new UiSelector().className("android.widget.Button")'), dumps) == (True, 1)
+    assert verify_candidate(original, (BY_ACCESSIBILITY_ID, 'Like video'), dumps) == (False, 0)
+
+
+def test_verify_candidate_rejects_candidates_never_matched():
+    dumps = [('dump.xml', DomSnapshot(DUMP))]
+    original = (BY_XPATH, '//*[@resource-id="app:id/missing"]')
+    assert verify_candidate(original, (BY_ID, 'app:id/missing'), dumps) == (False, 0)
+
+
+def test_is_weak_candidate():
+    assert is_weak_candidate((BY_ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.Button")'))
+    assert is_weak_candidate((BY_ANDROID_UIAUTOMATOR, 'new UiSelector().description("x").instance(1)'))
+    assert not is_weak_candidate((BY_ANDROID_UIAUTOMATOR, 'new UiSelector().description("x")'))
+    assert not is_weak_candidate((BY_ID, 'app:id/share'))
@@ -0,0 +1,258 @@
+# =====================================================================
+# throughput_benchmark.py: 再生サーバーを使ったエンドツーエンドのスループット計測 (V104)
+#
+# 1. replay_server.py を別スレッドで起動し、本物の TiktokAppiumHelper.initialize_driver で接続する
+# 2. collector_bot_main の collect_via_recommended / collect_via_search をローカルのベンチマークDBに対して実行する
+# 3. 動画/分 と、ステップ別 (パイプラインの各ステージ・検索の各ステップ・スワイプ) の p50/p95 を出力する
+# 4. 保存済みのベースラインと比較し、許容幅を超えて悪化していれば終了コード 1 で終了する
+#
+# 使い方:
+#   python throughput_benchmark.py                       (計測してベースラインと比較)
+#   python throughput_benchmark.py --update-baseline     (計測結果を新しいベースラインとして保存)
+#   (★ V104 修正: マニフェストが無ければ先に python replay_server.py record --bot <BOT_ID> で実機から記録する)
+# =====================================================================
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import collector_bot_main as bot
+from app_logger import logger, setup_logging_handlers
+from config import MYSQL_CONFIG, BENCHMARK_MYSQL_CONFIG, BENCHMARK_BASELINE_PATH, BENCHMARK_REGRESSION_TOLERANCE
+from config import REPLAY_MANIFEST_PATH, MIN_LIKES_DEFAULT
+from config import USE_FINGERPRINT_CACHE, FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS
+from replay_server import ReplayServer
+from tiktok_appium_helper import TiktokAppiumHelper
+from tiktok_db_manager import TikTokDBManager
+from video_fingerprint_cache import VideoFingerprintCache
+
+BENCHMARK_BOT_ID = 0
+BENCHMARK_UDID = 'replay-benchmark'
+# p95 の悪化がこの秒数未満なら、割合が大きくてもノイズとして回帰扱いしない
+MIN_REGRESSION_SECONDS = 0.02
+
+
+class StepRecorder:
+    """ステップ名 → 所要時間 (秒) のサンプルを集める"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.time() - started)
+        return timed
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples) if samples else 0.0,
+        'p50': _percentile(samples, 0.50),
+        'p95': _percentile(samples, 0.95),
+    }
+
+
+# =====================================================================
+# I. 準備
+# =====================================================================
+
+def prepare_database(db_config: Dict[str, Any], country_code: str, search_word: str) -> TikTokDBManager:
+    """ベンチマーク用DBを初期化する (本番DBを指している場合は中止)"""
+    if (db_config.get('host'), db_config.get('database')) == (MYSQL_CONFIG.get('host'), MYSQL_CONFIG.get('database')):
+        raise RuntimeError("BENCHMARK_MYSQL_CONFIG points at the production database. Refusing to reset it.")
+    db = TikTokDBManager(db_config)
+    if not db._conn:
+        raise ConnectionError(f"Could not connect to benchmark database '{db_config.get('database')}'.")
+    db.execute_query("DELETE FROM tiktok_video_history")
+    db.execute_query("DELETE FROM tiktok_videos")
+    db.execute_query("""
+        INSERT INTO search_words (search_word, target_country, is_active)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE target_country = VALUES(target_country), is_active = 1
+    """, (search_word, country_code))
+    db.commit()
+    return db
+
+
+def prepare_bot(server: ReplayServer, db: TikTokDBManager, country_code: str, min_likes: int,
+                recorder: StepRecorder):
+    """collector_bot_main のグローバル状態を、再生サーバーとベンチマークDB向けに設定する"""
+    bot.BOT_ID = BENCHMARK_BOT_ID
+    bot.DB_MANAGER = db
+    bot.TARGET_COUNTRY_CODE = country_code
+    bot.MIN_LIKES_THRESHOLD = min_likes
+    bot.VIDEO_PIPELINE = None
+    # 再生サーバーには adb が無いため、スクリーンショット取得は計測対象外
+    bot.CAPTURE_SCREENSHOTS = False
+    bot.FINGERPRINT_CACHE = (VideoFingerprintCache(FINGERPRINT_CACHE_MAX_ENTRIES, FINGERPRINT_CACHE_TTL_SECONDS)
+                             if USE_FINGERPRINT_CACHE else None)
+
+    helper = TiktokAppiumHelper.initialize_driver('replay', BENCHMARK_UDID, '127.0.0.1', 5037, appium_url=server.url,
+                                                reuse_session=False)
+    # ステップ別の所要時間を計測する (パイプラインのステージは VideoPipeline 側で計測済み)
+    helper.swipe_to_next_video = recorder.wrap('swipe', helper.swipe_to_next_video)
+    perform_search = recorder.wrap('search.total', helper.perform_search)
+
+    def perform_search_with_steps(search_word: str):
+        try:
+            return perform_search(search_word)
+        finally:
+            for step_name, seconds in helper.last_search_step_timings.items():
+                recorder.add(f"search.{step_name}", seconds)
+
+    helper.perform_search = perform_search_with_steps
+    bot.APPIUM_DRIVER_HELPER = helper
+
+
+# =====================================================================
+# II. 計測
+# =====================================================================
+
+def run_benchmark(manifest_path: str, recommended_count: int, search_count: int, rounds: int,
+                  latency_scale: float, country_code: str, min_likes: int, search_word: str) -> Dict[str, Any]:
+    recorder = StepRecorder()
+    with ReplayServer(manifest_path, latency_scale=latency_scale) as server:
+        db = prepare_database(BENCHMARK_MYSQL_CONFIG, country_code, search_word)
+        try:
+            prepare_bot(server, db, country_code, min_likes, recorder)
+            started = time.time()
+            for round_index in range(1, rounds + 1):
+                logger.info(f"BENCHMARK: Round {round_index}/{rounds} "
+                            f"(Recommended: {recommended_count}, Search: {search_count})")
+                if recommended_count:
+                    bot.collect_via_recommended(recommended_count)
+                if search_count:
+                    bot.collect_via_search(search_count)
+            elapsed = time.time() - started
+        finally:
+            try:
+                bot.APPIUM_DRIVER_HELPER.quit()
+            except Exception:
+                pass
+            db.close()
+
+    pipeline = bot.VIDEO_PIPELINE
+    steps: Dict[str, Dict[str, float]] = {}
+    processed = collected = 0
+    if pipeline is not None:
+        processed = pipeline.stages[pipeline.order[0]].runs
+        last_stage = pipeline.stages[pipeline.order[-1]]
+        collected = last_stage.runs - last_stage.rejections
+        for name in pipeline.order:
+            # パイプラインが保持する直近のサンプル (RECENT_SAMPLES 件) から算出する
+            steps[f"stage.{name}"] = _summarize(list(pipeline.stages[name].recent_seconds))
+    for name, samples in recorder.samples.items():
+        steps[name] = _summarize(samples)
+
+    minutes = elapsed / 60 if elapsed else 0.0
+    return {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'manifest': manifest_path,
+        'latency_scale': latency_scale,
+        'rounds': rounds,
+        'elapsed_seconds': elapsed,
+        'videos_processed': processed,
+        'videos_collected': collected,
+        'videos_per_minute': processed / minutes if minutes else 0.0,
+        'collected_per_minute': collected / minutes if minutes else 0.0,
+        'steps': steps,
+    }
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """ベースラインより 動画/分 が減った、またはステップの p95 が伸びた項目を列挙する"""
+    regressions = []
+    base_vpm = baseline.get('videos_per_minute', 0.0)
+    if base_vpm and report['videos_per_minute'] < base_vpm * (1 - tolerance):
+        regressions.append(f"videos_per_minute {report['videos_per_minute']:.2f} < baseline {base_vpm:.2f}")
+    for name, base in baseline.get('steps', {}).items():
+        current = report['steps'].get(name)
+        if not current or not current['count']:
+            continue
+        if (current['p95'] > base['p95'] * (1 + tolerance)
+                and current['p95'] - base['p95'] >= MIN_REGRESSION_SECONDS):
+            regressions.append(f"{name} p95 {current['p95']:.3f}s > baseline {base['p95']:.3f}s")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"BENCHMARK REPORT ({report['elapsed_seconds']:.1f}s, Latency scale: {report['latency_scale']})",
+        f"  Videos processed: {report['videos_processed']} ({report['videos_per_minute']:.2f}/min), "
+        f"collected: {report['videos_collected']} ({report['collected_per_minute']:.2f}/min)",
+    ]
+    for name, summary in sorted(report['steps'].items()):
+        lines.append(f"  {name:<28} n={summary['count']:<5} p50={summary['p50']:.3f}s p95={summary['p95']:.3f}s "
+                     f"mean={summary['mean']:.3f}s")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end collector throughput benchmark against the replay server.")
+    parser.add_argument('--manifest', default=REPLAY_MANIFEST_PATH)
+    parser.add_argument('--recommended', type=int, default=20, help="Videos per round from the recommended feed")
+    parser.add_argument('--search', type=int, default=10, help="Videos per round from the search feed")
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--latency-scale', type=float, default=1.0)
+    parser.add_argument('--country', default='JP')
+    parser.add_argument('--min-likes', type=int, default=MIN_LIKES_DEFAULT)
+    parser.add_argument('--search-word', default='replay')
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_REGRESSION_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--out', help="Also write the full report JSON to this path")
+    args = parser.parse_args()
+    if not os.path.exists(args.manifest):
+        parser.error(f"Replay manifest {args.manifest} not found. Record one from a device first: "
+                     f"python replay_server.py record --bot <BOT_ID> --out {os.path.dirname(args.manifest) or '.'}")
+
+    setup_logging_handlers()
+    report = run_benchmark(args.manifest, args.recommended, args.search, args.rounds, args.latency_scale,
+                           args.country, args.min_likes, args.search_word)
+    logger.info(format_report(report))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        logger.info(f"BENCHMARK: Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        logger.warning(f"BENCHMARK: No baseline at {args.baseline}. Run with --update-baseline to create one.")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(report, baseline, args.tolerance)
+    if regressions:
+        for regression in regressions:
+            logger.error(f"BENCHMARK: REGRESSION {regression}")
+        sys.exit(1)
+    logger.info(f"BENCHMARK: No regressions against {args.baseline} (Tolerance: {args.tolerance:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,20 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from config import APPIUM_URL, APPIUM_CAPABILITIES_BASE, TIKTOK_PACKAGE_NAME
 from config import APPIUM_HOST, APPIUM_PORT
+from config import SWIPE_SETTLE_TIMEOUT_SECONDS, SWIPE_SETTLE_POLL_SECONDS, CLIPBOARD_TIMEOUT_SECONDS
+from config import SWIPE_PROBE_TIMEOUT_SECONDS
+from config import CLIPBOARD_POLL_SECONDS, APP_STOP_TIMEOUT_SECONDS, APP_READY_TIMEOUT_SECONDS
+from config import SEARCH_STEP_JITTER_SECONDS, SEARCH_STEP_POLL_SECONDS
+from config import SEARCH_STEP_CEILINGS, SEARCH_STEP_DEFAULT_CEILING_SECONDS
+from config import SNAPSHOT_CACHE_MAX_AGE_SECONDS
+from config import ADAPTIVE_SELECTOR_ORDERING, SELECTOR_STATS_DIR, SELECTOR_PROBE_RATE, FIXED_ORDER_SELECTOR_LISTS
+from config import USE_COMPILED_SELECTORS, COMPILED_SELECTORS_PATH, DOM_DUMPS_DIR
+from config import SCREENSHOT_CAPTURE_MODE, SCREENSHOT_STREAM_FORMAT, SCREENSHOT_CAPTURE_TIMEOUT_SECONDS
+from config import SCREENSHOT_MAX_WIDTH, SCREENSHOT_IMAGE_FORMAT, SCREENSHOT_QUALITY
+from config import PHASH_ENABLED, PHASH_CROP_BOX, PHASH_MIN_PIXEL_STDDEV
+from config import DEFAULT_LOCALE, LOCALE_BY_COUNTRY
+from config import GESTURE_PROFILE_DIR
+from config import APPIUM_SESSION_REATTACH, APPIUM_SKIP_PREPARED_DEVICE_INIT
 from typing import Dict, Any, Optional, Tuple, List  # ★ Listを追加
 import time
 import re
@@ -19,11 +33,131 @@ import traceback
 import subprocess
 import random
 from app_logger import logger
-from typing import Any
 import base64
+import os
 
 # ★ V94 修正: 新しい element_ids ファイルからすべてのセレクタをインポート
 import element_ids as ids
+# ★ V96 追加: page_source 単一スナップショット評価エンジン
+from dom_snapshot import DomSnapshot, SnapshotSelectorError
+# ★ V97 追加: セレクタのヒット率統計と適応的並び替え
+from selector_stats import SelectorStatsStore
+# ★ V103 追加: XPath から変換・検証済みの高速ロケーター表
+from selector_compiler import apply_compiled_selector_table
+# ★ V105 追加: スクリーンショットの縮小・再エンコード
+import screenshot_codec
+# ★ V106 追加: シャッターまでだけ待つ非同期スクリーンショット
+from screenshot_worker import PendingScreenshot
+# ★ V109 追加: 表示言語ごとの UI 文字列・件数表記
+import locale_packs
+# ★ V110 追加: 画面サイズをキャッシュし、端末ごとに最速の方式でスワイプする
+from gesture_engine import GestureEngine
+# ★ V115 追加: keep-alive 接続プールとコマンド別の往復時間計測
+from appium_transport import InstrumentedAppiumConnection, AppiumCommandDeadlineExceeded
+# ★ V116 追加: セッションの保存と再接続
+import appium_session
+# ★ V111 追加: ステップ別のレイテンシ・ヒストグラム
+from metrics import FIND_ELEMENT_SECONDS, SEARCH_STEP_SECONDS, APP_REBOOT_SECONDS
+
+# ★ V103 追加: 高速ロケーター表はプロセスごとに1回だけ element_ids のリストへ適用する
+if USE_COMPILED_SELECTORS:
+    apply_compiled_selector_table(COMPILED_SELECTORS_PATH, ids)
+
+# ★ V109 修正: いいね数 (content-desc) とキャプション数値判定の正規表現は言語パック (locale_packs.py) に移動
+
+
+# --- 共通関数 ---
+def convert_count_to_int(count_str: str) -> int:
+    """
+    件数表記を整数に変換する
+    [V109 修正] 適用中の言語パックの表記 (千/万/億/K/M/B, 小数点 . / ,) に対応
+    """
+    return locale_packs.active_pack().parse_count(count_str)
+
+
+def use_locale_for_country(country_code: Optional[str]) -> str:
+    """[V109 新規] 国コードに対応する言語パックを読み込み、element_ids のセレクタに適用する"""
+    locale = locale_packs.resolve_locale(country_code, LOCALE_BY_COUNTRY, DEFAULT_LOCALE)
+    locale_packs.apply_locale_pack(locale, ids)
+    return locale
+
+
+def parse_video_fields(snapshot: DomSnapshot, selectors=None,
+                       pack: Optional[locale_packs.LocalePack] = None) -> Dict[str, Any]:
+    """
+    [V96 新規] 1つのスナップショットから動画1本分のメタデータをまとめて評価する。
+    get_like_count / get_full_caption_text / scrape_video_data / is_video_post と同じ判定を、
+    Appiumへの追加の往復なしで行う。
+    [V114 追加] selectors / pack を指定すると element_ids と適用中の言語パックの代わりに使う (端末ごとの言語)
+    """
+    selectors = selectors or ids
+    pack = pack or locale_packs.active_pack()
+    fields: Dict[str, Any] = {
+        'likes_count': 0,
+        'channel_name': 'N/A',
+        'caption_text': '',
+        'caption_truncated': False,
+        'is_video': True,
+        'is_ad': False,
+        'share_button_bounds': None,
+        'share_button_desc': '',
+    }
+
+    # 1. いいね数 (content-desc → テキストIDの順)
+    likes_button = snapshot.find_first(selectors.LIKES_BUTTON_SELECTORS)
+    match = pack.likes_desc_pattern.search(likes_button.content_desc) if likes_button else None
+    if match:
+        fields['likes_count'] = pack.parse_count(match.group(1))
+    else:
+        likes_text = snapshot.find_first(selectors.LIKES_COUNT_TEXT_SELECTORS)
+        if likes_text:
+            fields['likes_count'] = pack.parse_count(likes_text.text)
+
+    # 2. チャンネル名
+    channel = snapshot.find_first(selectors.CHANNEL_NAME_SELECTORS)
+    if channel and channel.text.strip():
+        fields['channel_name'] = channel.text.strip()
+
+    # 3. キャプション (「もっと見る」がある場合は省略表示であることを記録)
+    caption = snapshot.find_first(selectors.CAPTION_TEXT_SELECTORS)
+    caption_text = caption.text.strip() if caption else ''
+    if caption_text and not pack.count_parser.is_count(caption_text):
+        fields['caption_text'] = caption_text
+    fields['caption_truncated'] = snapshot.exists(selectors.CAPTION_MORE_BUTTON_SELECTORS)
+
+    # 4. 静止画 (Photo) 判定
+    fields['is_video'] = not snapshot.exists(selectors.PHOTO_MODE_INDICATOR_SELECTORS)
+
+    # 4.5 広告判定
+    fields['is_ad'] = snapshot.exists(selectors.AD_LABEL_SELECTORS)
+
+    # 5. シェアボタンの座標 (URL取得時に要素検索を省略するため)
+    share_button = snapshot.find_first(selectors.SHARE_BUTTON_SELECTORS)
+    if share_button:
+        fields['share_button_bounds'] = share_button.bounds
+        fields['share_button_desc'] = share_button.content_desc
+
+    return fields
+
+
+def video_signature(fields: Dict[str, Any]) -> Optional[str]:
+    """[V98 新規] parse_video_fields の結果から、動画の切り替わり判定用シグネチャを作る"""
+    parts = (fields.get('share_button_desc') or '', fields.get('channel_name') or '',
+             (fields.get('caption_text') or '')[:30])
+    if not any(parts) or parts == ('', 'N/A', ''):
+        return None
+    return '|'.join(parts)
+
+
+def extract_video_id_from_url(url: str) -> Optional[str]:
+    """共有URL (短縮 vt.tiktok.com / 通常 /video/<数字>) から VideoID を取り出す"""
+    if not url: return None
+    match_short = re.search(r'vt\.tiktok\.com/([a-zA-Z0-9]+)', url)
+    if match_short: return match_short.group(1)
+    match_long = re.search(r'/video/(\d+)', url)
+    if match_long: return match_long.group(1)
+    logger.warning(f"ID Extract: Could not extract ID from URL: {url}")
+    return None
 
 
 # --- 例外クラス ---
@@ -38,14 +172,42 @@ class AndroidConnectionError(Exception):
 # --- ヘルパークラス ---
 class TiktokAppiumHelper:
 
-    def __init__(self, driver: webdriver.Remote, tiktok_package_name: str, adb_host: str, adb_port: int):
+    def __init__(self, driver: webdriver.Remote, tiktok_package_name: str, adb_host: str, adb_port: int,
+                 selector_stats: Optional[SelectorStatsStore] = None, gesture_profile_path: Optional[str] = None,
+                 udid: Optional[str] = None):
         self.driver = driver
+        # ★ V116 追加: セッション保存先の端末と、既存のセッションに再接続したかどうか
+        self.udid = udid
+        self.reattached = False
         self.tiktok_package_name = tiktok_package_name
         self.adb_host_port_str = f"-H {adb_host} -P {adb_port}"
+        self.adb_host = adb_host
+        self.adb_port = adb_port
+        # ★ V105 追加: 直近のスクリーンショットのエンコード結果 (width / height / format / source_bytes)
+        self.last_screenshot_info: Optional[Dict[str, Any]] = None
         # 瞬時判定用
         self.wait_fast = WebDriverWait(driver, 0.5, poll_frequency=0.1)
         # 中速ポーリング (汎用)
         self.wait_medium = WebDriverWait(driver, 15, poll_frequency=0.5)
+        # ★ V97 追加: セレクタ統計 (None の場合は element_ids.py の記述順のまま)
+        self.selector_stats = selector_stats
+        # ★ V98 追加: 直前に処理した動画のシグネチャ (変化検知用)
+        self._last_feed_signature: Optional[str] = None
+        # ★ V102 追加: 画面状態ごとの DOM スナップショット・キャッシュ
+        self._snapshot_cache: Optional[DomSnapshot] = None
+        self.snapshot_cache_hits = 0
+        self.snapshot_cache_misses = 0
+        # ★ V110 追加: ジェスチャー (実行後はどの方式でもキャッシュを破棄する)
+        self.gestures = GestureEngine(driver, adb_host, adb_port, profile_path=gesture_profile_path,
+                                      on_performed=self.invalidate_snapshot)
+        # ★ V99 追加: 直近の perform_search の各ステップ待機時間 (秒)
+        self.last_search_step_timings: Dict[str, float] = {}
+        self._selector_list_names = {id(value): name for name, value in vars(ids).items()
+                                     if name.endswith('_SELECTORS') and isinstance(value, list)}
+        # ★ V115 追加: 計測付きの接続で作られたドライバーの場合のみ (それ以外は None)
+        executor = getattr(driver, 'command_executor', None)
+        self.transport: Optional[InstrumentedAppiumConnection] = \
+            executor if isinstance(executor, InstrumentedAppiumConnection) else None
 
         try:
             self.driver.update_settings({"waitForIdleTimeout": 0})
@@ -65,24 +227,24 @@ class TiktokAppiumHelper:
         (V91のロジックを継承し、リトライ回数を減らす)
         """
         last_exception = None
-        logger.debug(
-            f"FIND: Attempting (By: {by}, Value: {value}) with {max_retries} retries (Wait: {wait_time_seconds}s per retry).")
+        logger.debug("FIND: Attempting (By: %s, Value: %s) with %d retries (Wait: %ss per retry).",
+                     by, value, max_retries, wait_time_seconds)
 
         for i in range(1, max_retries + 1):
             try:
                 element = WebDriverWait(self.driver, wait_time_seconds, poll_frequency=0.5).until(
                     EC.presence_of_element_located((by, value))
                 )
-                logger.debug(f"FIND: Successfully found element {value}.")
+                logger.debug("FIND: Successfully found element %s.", value)
                 return element
             except TimeoutException as e:
                 last_exception = e
                 if i < max_retries:
-                    logger.debug(
-                        f"RETRY {i}/{max_retries}: Timeout finding {value}. Forcing DOM update.")
+                    logger.debug("RETRY %d/%d: Timeout finding %s. Forcing DOM update.", i, max_retries, value)
                     try:
-                        _ = self.driver.page_source
-                        logger.debug(f"RETRY {i}/{max_retries}: DOM refreshed successfully.")
+                        # ★ V102 修正: 強制取得した page_source を捨てずにスナップショットとしてキャッシュする
+                        self.get_dom_snapshot(refresh=True)
+                        logger.debug("RETRY %d/%d: DOM refreshed successfully.", i, max_retries)
                     except Exception as refresh_e:
                         logger.warning(f"RETRY {i}/{max_retries}: DOM refresh failed: {refresh_e}")
                 continue
@@ -94,42 +256,183 @@ class TiktokAppiumHelper:
         # ★ V94: 失敗ログは呼び出し元の find_element_with_fallbacks で出す
         raise TimeoutException(f"Element {value} not found after {max_retries} retries.") from last_exception
 
+    def _selector_list_name(self, selectors_list: List[Tuple[str, str]]) -> Optional[str]:
+        """element_ids.py の変数名 (例: SHARE_BUTTON_SELECTORS) を統計のキーとして返す"""
+        return self._selector_list_names.get(id(selectors_list))
+
+    def _ordered_selectors(self, selectors_list: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """統計が有効ならヒット率順、そうでなければ element_ids.py の記述順のセレクタリストを返す"""
+        list_name = self._selector_list_name(selectors_list)
+        if self.selector_stats is None or list_name is None or list_name in FIXED_ORDER_SELECTOR_LISTS:
+            return selectors_list
+        return self.selector_stats.order(list_name, selectors_list)
+
+    @staticmethod
+    def _snapshot_may_contain(snapshot: DomSnapshot, selector: Tuple[str, str]) -> bool:
+        """スナップショットで評価できないセレクタは「存在するかもしれない」とみなす"""
+        try:
+            return snapshot.find(selector[0], selector[1]) is not None
+        except SnapshotSelectorError:
+            return True
+
     def find_element_with_fallbacks(self, selectors_list: List[Tuple[str, str]],
                                     max_retries_per_selector: int = 2) -> Any:
         """
         [V94 新規]
         セレクタの優先順位リストを受け取り、見つかるまで順に試行する。
+        [V97 修正] 統計が有効な場合は、現在ヒット率の高いセレクタから順に試行する。
         """
         last_exception = None
         if not selectors_list:
             logger.error("FAILURE: No selectors provided to find_element_with_fallbacks.")
             raise ValueError("Selector list cannot be empty.")
 
+        list_name = self._selector_list_name(selectors_list)
+        adaptive = self.selector_stats is not None and list_name is not None
+        find_started = time.perf_counter()
+        ordered_selectors = self._ordered_selectors(selectors_list)
+        # ★ V102 追加: 有効なスナップショットがあれば、そこに存在しないセレクタを後回しにする
+        # (死んだ先頭セレクタでタイムアウトまで待つのを避ける)
+        snapshot = self.get_cached_snapshot()
+        if snapshot is not None:
+            present = [sel for sel in ordered_selectors if self._snapshot_may_contain(snapshot, sel)]
+            ordered_selectors = present + [sel for sel in ordered_selectors if sel not in present]
+        # 失敗したセレクタは「他のセレクタで要素が見つかった」場合のみ miss として記録する
+        # (要素そのものが画面に無いケースで統計を汚さないため)
+        pending_misses: List[Tuple[Tuple[str, str], float]] = []
+
         # 1. セレクタリストをループ (優先順位順)
-        for (by, value) in selectors_list:
+        for (by, value) in ordered_selectors:
+            started = time.time()
             try:
                 # 2. 各セレクタでリトライ (リトライ回数は少なく)
                 element = self._find_element_with_retry(by, value, max_retries=max_retries_per_selector)
 
                 # ★ 成功したら即時リターン
-                logger.info(f"FIND: SUCCESS using selector (By: {by}, Value: {value})")
+                logger.info("FIND: SUCCESS using selector (By: %s, Value: %s)", by, value)
+                FIND_ELEMENT_SECONDS.observe(time.perf_counter() - find_started,
+                                             selector_list=list_name or 'unnamed', result='found')
+                if adaptive:
+                    for missed_selector, missed_seconds in pending_misses:
+                        self.selector_stats.record(list_name, missed_selector, False, missed_seconds)
+                    self.selector_stats.record(list_name, (by, value), True, time.time() - started)
                 return element
 
             except TimeoutException as e:
                 last_exception = e
-                logger.warning(f"FIND: FAILED selector (By: {by}, Value: {value}). Trying next fallback.")
+                pending_misses.append(((by, value), time.time() - started))
+                logger.warning("FIND: FAILED selector (By: %s, Value: %s). Trying next fallback.", by, value)
                 continue  # 次のセレクタへ
             except Exception as e:
                 # セレクタが不正(XPath構文エラーなど)か、Appiumがクラッシュした
                 logger.error(f"FIND: CRITICAL error on selector (By: {by}, Value: {value}): {e}")
                 last_exception = e
+                pending_misses.append(((by, value), time.time() - started))
                 continue  # 次のセレクタへ
 
         # すべてのセレクタが失敗した場合
+        FIND_ELEMENT_SECONDS.observe(time.perf_counter() - find_started,
+                                     selector_list=list_name or 'unnamed', result='not_found')
+        if adaptive:
+            self.selector_stats.record_list_failure(list_name)
         logger.error(f"FAILURE: All {len(selectors_list)} fallback selectors failed.")
         raise TimeoutException(
             f"Element not found after trying all {len(selectors_list)} fallbacks.") from last_exception
 
+    def save_selector_stats(self):
+        """[V97 新規] セレクタ統計を保存し、死んでいるセレクタを警告ログに出す"""
+        if not self.selector_stats:
+            return
+        self.selector_stats.save()
+        for list_name, key, st in self.selector_stats.dying_selectors():
+            logger.warning(f"SELECTOR STATS: Dying selector in {list_name}: {key} "
+                           f"(Hits: {st.hits}/{st.attempts})")
+
+    # -----------------------------------------------------------------
+    # ★ V96 新規: 単一スナップショット抽出 (page_source 1回で全項目を評価)
+    # -----------------------------------------------------------------
+
+    def get_dom_snapshot(self, refresh: bool = False) -> DomSnapshot:
+        """
+        page_source を1回取得し、解析済みスナップショットを返す。
+        [V102 修正] 同じ画面状態 (ジェスチャー/クリック以降) で取得済みのスナップショットがあれば再利用する。
+        """
+        cached = None if refresh else self.get_cached_snapshot()
+        if cached is not None:
+            self.snapshot_cache_hits += 1
+            return cached
+        started = time.time()
+        page_source = self.driver.page_source
+        snapshot = DomSnapshot(page_source, captured_at=started)
+        self._snapshot_cache = snapshot
+        self.snapshot_cache_misses += 1
+        # ★ V110 追加: 画面の回転はスナップショットから検知する (get_window_size の往復をしない)
+        self.gestures.observe_snapshot(snapshot)
+        logger.debug("SNAPSHOT: page_source captured and parsed in %.3fs (Size: %d chars).",
+                     time.time() - started, len(page_source))
+        return snapshot
+
+    def save_dom_dump(self, name: str) -> Optional[str]:
+        """
+        [V103 新規] 現在の画面の page_source を DOM_DUMPS_DIR に保存する。
+        selector_compiler.py が変換後のロケーターを検証する際の入力になる。
+        """
+        try:
+            snapshot = self.get_dom_snapshot(refresh=True)
+            os.makedirs(DOM_DUMPS_DIR, exist_ok=True)
+            path = os.path.join(DOM_DUMPS_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.xml")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(snapshot.page_source)
+            logger.info(f"SNAPSHOT: DOM dump saved to {path}")
+            return path
+        except Exception as e:
+            logger.warning(f"WARNING: Failed to save DOM dump '{name}': {e}")
+            return None
+
+    def get_cached_snapshot(self) -> Optional[DomSnapshot]:
+        """[V102 新規] 有効期限内かつ無効化されていないキャッシュ済みスナップショット (無ければ None)"""
+        snapshot = self._snapshot_cache
+        if snapshot is None or time.time() - snapshot.captured_at > SNAPSHOT_CACHE_MAX_AGE_SECONDS:
+            return None
+        return snapshot
+
+    def invalidate_snapshot(self):
+        """[V102 新規] 画面状態が変わる操作 (ジェスチャー/クリック/キー入力/アプリ操作) の後に呼ばれる"""
+        self._snapshot_cache = None
+
+    def has_element(self, selectors_list: List[Tuple[str, str]]) -> bool:
+        """[V102 新規] 要素の有無をスナップショットで判定する (キャッシュがあれば往復なし)"""
+        return self.get_dom_snapshot().exists(selectors_list)
+
+    def extract_video_snapshot(self) -> Dict[str, Any]:
+        """
+        [V96 新規] 現在の動画の いいね数 / チャンネル名 / キャプション / 動画・静止画種別 /
+        シェアボタン座標 を1回のスナップショットから取得する。
+        """
+        snapshot = self.get_dom_snapshot()
+        fields = parse_video_fields(snapshot)
+        self._last_feed_signature = video_signature(fields)
+        logger.debug("SNAPSHOT: Extracted Likes=%s, Channel=%s, Video=%s, ShareBounds=%s", fields['likes_count'],
+                     fields['channel_name'], fields['is_video'], fields['share_button_bounds'])
+        return fields
+
+    def tap_bounds(self, bounds: Tuple[int, int, int, int]):
+        """bounds (x1, y1, x2, y2) の中心をタップする (要素検索の往復を省略)"""
+        center_x = (bounds[0] + bounds[2]) // 2
+        center_y = (bounds[1] + bounds[3]) // 2
+        self.driver.tap([(center_x, center_y)])
+        self.invalidate_snapshot()
+
+    def click_element(self, element: Any):
+        """[V102 新規] 要素をクリックし、画面状態が変わるためスナップショット・キャッシュを破棄する"""
+        element.click()
+        self.invalidate_snapshot()
+
+    def press_back(self):
+        """[V102 新規] 戻るキーを送り、スナップショット・キャッシュを破棄する"""
+        self.driver.back()
+        self.invalidate_snapshot()
+
     # -----------------------------------------------------------------
     # (クラス初期化・システム関数 - 変更なし)
     # -----------------------------------------------------------------
@@ -141,12 +444,24 @@ class TiktokAppiumHelper:
             return s.getsockname()[1]
 
     @classmethod
-    def initialize_driver(cls, device_name: str, udid: str, adb_host: str, adb_port: int):
+    def initialize_driver(cls, device_name: str, udid: str, adb_host: str, adb_port: int,
+                          appium_url: Optional[str] = None, reuse_session: bool = APPIUM_SESSION_REATTACH):
         """
         空きポートの自動取得と接続リトライを組み合わせてAppiumを初期化
+        ★ V104 追加: appium_url を指定すると APPIUM_URL 以外 (replay_server.py など) に接続する
+        ★ V115 修正: keep-alive 接続プール (InstrumentedAppiumConnection) を使い、コマンドの往復時間を記録する
+        ★ V116 修正: 保存済みのセッションが生きていれば再接続する (新規作成しない)。
+                     新規作成時も、準備済みの端末では初回の試行でサーバーのインストール・端末の初期化を省略する
         """
+        appium_url = appium_url or APPIUM_URL
+        if reuse_session:
+            helper = cls.reattach_driver(udid, adb_host, adb_port, appium_url)
+            if helper is not None:
+                return helper
+
         max_retries = 3
         last_exception = None
+        prepared = APPIUM_SKIP_PREPARED_DEVICE_INIT and appium_session.load_session_state(udid).get('prepared')
 
         for attempt in range(1, max_retries + 1):
             # 毎回新しい空きポートを取得（前回の失敗がポート競合だった場合の対策）
@@ -159,6 +474,10 @@ class TiktokAppiumHelper:
                 'appium:udid': udid,
                 'appium:systemPort': auto_port
             })
+            # 省略して失敗した場合 (端末の初期化・APK の削除など) は、2回目以降は省略しない
+            skip_preparation = bool(prepared) and attempt == 1
+            if skip_preparation:
+                caps.update(appium_session.SKIP_DEVICE_PREPARATION_CAPS)
 
             options = AppiumOptions()
             options.load_capabilities(caps)
@@ -172,14 +491,19 @@ class TiktokAppiumHelper:
                         * ADB_HOST    : {adb_host}
                         * ADB_PORT    : {adb_port}
                         * SYSTEM_PORT : {auto_port} (Auto-assigned)
-                        * APPIUM_URL  : {APPIUM_URL}
+                        * APPIUM_URL  : {appium_url}
                         ==================================================
                     """).strip()
             logger.info(f"\n{log_msg}")
             try:
-                driver = webdriver.Remote(APPIUM_URL, options=options)
-                logger.info(f"STATUS: Connected successfully via port {auto_port}")
-                return cls(driver, TIKTOK_PACKAGE_NAME, adb_host, adb_port)
+                driver = webdriver.Remote(command_executor=InstrumentedAppiumConnection(appium_url),
+                                          options=options)
+                logger.info(f"STATUS: Connected successfully via port {auto_port} "
+                            f"(Session: {driver.session_id}, Skipped device preparation: {skip_preparation})")
+                appium_session.save_session_state(udid, appium_url, driver.session_id, dict(driver.capabilities))
+                return cls(driver, TIKTOK_PACKAGE_NAME, adb_host, adb_port,
+                           selector_stats=cls.create_selector_stats(udid),
+                           gesture_profile_path=cls.gesture_profile_path(udid), udid=udid)
             except Exception as e:
                 last_exception = e
                 logger.warning(f"RETRY: Connection failed on port {auto_port}: {e}")
@@ -188,6 +512,84 @@ class TiktokAppiumHelper:
         logger.error(f"FATAL: Failed to connect to Appium after {max_retries} attempts.")
         raise last_exception
 
+    @classmethod
+    def reattach_driver(cls, udid: str, adb_host: str, adb_port: int,
+                        appium_url: str) -> Optional['TiktokAppiumHelper']:
+        """
+        [V116 新規] 保存済みのセッションに接続し直す。
+        セッションが終了している (Appium の再起動、newCommandTimeout 切れなど) 場合は None を返す。
+        """
+        state = appium_session.load_session_state(udid)
+        session_id = state.get('session_id')
+        if not session_id or state.get('appium_url') != appium_url:
+            return None
+        started = time.perf_counter()
+        try:
+            options = AppiumOptions()
+            options.load_capabilities({**APPIUM_CAPABILITIES_BASE, 'appium:udid': udid})
+            driver = appium_session.ReattachedRemote(session_id, state.get('capabilities') or {},
+                                                     command_executor=InstrumentedAppiumConnection(appium_url),
+                                                     options=options)
+            # 端末まで届くコマンドで生存を確認する (セッションが無ければ invalid session id で即座に失敗する)
+            driver.query_app_state(TIKTOK_PACKAGE_NAME)
+        except Exception as e:
+            logger.info(f"SESSION: Saved session {session_id} is not usable ({type(e).__name__}). "
+                        f"Creating a new session.")
+            appium_session.clear_session_id(udid)
+            return None
+        logger.info(f"SESSION: Reattached to session {session_id} in {time.perf_counter() - started:.2f}s.")
+        helper = cls(driver, TIKTOK_PACKAGE_NAME, adb_host, adb_port,
+                     selector_stats=cls.create_selector_stats(udid),
+                     gesture_profile_path=cls.gesture_profile_path(udid), udid=udid)
+        helper.reattached = True
+        return helper
+
+    def is_session_alive(self) -> bool:
+        """[V116 新規] 現在のセッションが Appium サーバー・端末の両方で応答するか"""
+        try:
+            self.driver.query_app_state(self.tiktok_package_name)
+            return True
+        except Exception as e:
+            logger.info(f"SESSION: Session {self.driver.session_id} is not responding: {type(e).__name__}: {e}")
+            return False
+
+    def ensure_app_ready(self) -> bool:
+        """
+        [V116 新規] 再接続したセッションでは、アプリが前面でホームフィードが操作可能ならそのまま使う。
+        そうでなければ従来どおりアプリを再起動する。
+        """
+        try:
+            # 4 = 前面で実行中
+            if self.driver.query_app_state(self.tiktok_package_name) == 4 and self._is_home_feed_ready():
+                logger.info("STATUS: TikTok app is already on the home feed. Skipping the app reboot.")
+                return True
+        except Exception as e:
+            logger.debug("STATUS: App state check failed: %s", e)
+        return self.reboot_tiktok_app()
+
+    def quit(self):
+        """[V116 新規] セッションを終了し、保存済みのセッション ID を消す (次回は新規作成する)"""
+        try:
+            self.driver.quit()
+        finally:
+            if self.udid:
+                appium_session.clear_session_id(self.udid)
+
+    @classmethod
+    def create_selector_stats(cls, udid: str) -> Optional[SelectorStatsStore]:
+        """[V97 新規] デバイスごとのセレクタ統計ストアを生成する (アプリのバージョンが端末ごとに異なるため)"""
+        if not ADAPTIVE_SELECTOR_ORDERING:
+            return None
+        safe_udid = re.sub(r'[^\w.\-]', '_', udid)
+        return SelectorStatsStore(os.path.join(SELECTOR_STATS_DIR, f"{safe_udid}.json"),
+                                  probe_rate=SELECTOR_PROBE_RATE)
+
+    @classmethod
+    def gesture_profile_path(cls, udid: str) -> str:
+        """[V110 新規] デバイスごとのジェスチャー方式の計測結果"""
+        safe_udid = re.sub(r'[^\w.\-]', '_', udid)
+        return os.path.join(GESTURE_PROFILE_DIR, f"{safe_udid}.json")
+
     @classmethod
     def old_initialize_driver(cls, device_name: str, udid: str, adb_host: str, adb_port: int):
         logger.info(f"ACTION: [START] Initializing Appium for Device: {device_name} ({udid}) at {adb_host}:{adb_port}")
@@ -211,37 +613,155 @@ class TiktokAppiumHelper:
             logger.error(traceback.format_exc())
             raise AndroidConnectionError(error_msg, original_exception=e)
 
+    # -----------------------------------------------------------------
+    # ★ V98 新規: 条件ベースの待機 (固定 sleep の置き換え)
+    # -----------------------------------------------------------------
+
+    def _wait_until(self, predicate, timeout_seconds: float, poll_seconds: float, description: str) -> Any:
+        """
+        predicate() が真値を返すまでポーリングし、その値を返す。上限時間を超えたら None を返す。
+        predicate 内の一時的な例外 (画面遷移中の取得失敗など) は未成立として扱う。
+        """
+        started = time.time()
+        deadline = started + timeout_seconds
+        while True:
+            try:
+                result = predicate()
+                if result:
+                    logger.debug("WAIT: '%s' satisfied after %.2fs.", description, time.time() - started)
+                    return result
+            except AppiumCommandDeadlineExceeded:
+                # ★ V118 追加: 応答しない端末へのポーリングは続けない (リカバリで生存確認する)
+                raise
+            except Exception as e:
+                logger.debug("WAIT: '%s' check raised %s: %s", description, type(e).__name__, e)
+            if time.time() >= deadline:
+                logger.warning(f"WAIT: '{description}' not satisfied within {timeout_seconds:.1f}s.")
+                return None
+            time.sleep(poll_seconds)
+
+    def get_feed_signature(self, snapshot: Optional[DomSnapshot] = None) -> Optional[str]:
+        """
+        現在表示中の動画を識別する軽量なシグネチャ (シェアボタンの content-desc + チャンネル名 + キャプション冒頭)。
+        フィードの動画要素が見つからない場合は None を返す。
+        """
+        snapshot = snapshot or self.get_dom_snapshot()
+        return video_signature(parse_video_fields(snapshot))
+
+    def _is_home_feed_ready(self) -> bool:
+        snapshot = self.get_dom_snapshot(refresh=True)
+        return snapshot.exists(ids.SHARE_BUTTON_SELECTORS) or snapshot.exists(ids.HOME_ICON_SELECTORS)
+
     def reboot_tiktok_app(self):
+        """[V98 修正] 固定の 1s + 7s 待機をやめ、アプリ停止とホームフィードの操作可能状態を検知する"""
         logger.debug("ACTION: Terminating and reactivating TikTok app.")
+        started = time.perf_counter()
+        result = 'error'
         try:
             self.driver.terminate_app(self.tiktok_package_name)
-            time.sleep(1)
+            self.invalidate_snapshot()
+            # query_app_state: 0=未インストール, 1=停止中, 2以上=実行中
+            self._wait_until(lambda: self.driver.query_app_state(self.tiktok_package_name) <= 1,
+                             APP_STOP_TIMEOUT_SECONDS, 0.2, "TikTok app stopped")
             self.driver.activate_app(self.tiktok_package_name)
-            logger.info("STATUS: TikTok app activated. Waiting 7 seconds for stabilization (ads/popups)...")
-            time.sleep(7)
+            self.invalidate_snapshot()
+            logger.info(f"STATUS: TikTok app activated. Waiting up to {APP_READY_TIMEOUT_SECONDS}s "
+                        f"for the home feed to become interactive...")
+            self._last_feed_signature = None
+            if not self._wait_until(self._is_home_feed_ready, APP_READY_TIMEOUT_SECONDS, 0.5,
+                                    "home feed interactive"):
+                logger.warning("STATUS: TikTok app activated but the home feed was not detected.")
+                result = 'not_ready'
+                return False
             logger.info("STATUS: TikTok app restarted cleanly.")
+            result = 'ok'
             return True
         except Exception as e:
             logger.warning(f"Warning: Error during app reboot: {e}")
             return False
+        finally:
+            APP_REBOOT_SECONDS.observe(time.perf_counter() - started, result=result)
 
-    def swipe_up(self, duration: int = 400):
+    def swipe_up(self, duration: Optional[int] = None) -> bool:
+        """
+        [V98 修正] スワイプ後の固定 2.5s 待機をやめ、表示中の動画のシグネチャが変わるまで待つ。
+        動画が切り替わった場合は True、上限時間内に切り替わらなかった場合は False を返す。
+        [V110 修正] 画面サイズの取得 + driver.swipe をやめ、ジェスチャー・エンジンで1回のコマンドにする
+        """
         logger.debug("ACTION: Executing swipe up to next video.")
         try:
-            size = self.driver.get_window_size()
-            width = size['width']
-            height = size['height']
-            start_x = width // 2
-            start_y = int(height * 0.75)
-            end_y = int(height * 0.25)
-            self.driver.swipe(start_x, start_y, start_x, end_y, duration)
-            time.sleep(2.5)
+            # ★ V102 修正: 切り替わりの検知はキャプション要素1つだけを読む (毎回 page_source を取らない)
+            cached = self.get_cached_snapshot()
+            probe = (self._feed_probe_locator(cached) if cached is not None else None) or ids.CAPTION_TEXT_SELECTORS[0]
+            previous_probe_text = self._read_feed_probe(probe)
+            previous_signature = self._last_feed_signature
+            if previous_signature is None:
+                previous_signature = self.get_feed_signature()
+            self.gestures.perform('next_video', duration)
+            self._last_feed_signature = None
+            deadline = time.time() + SWIPE_SETTLE_TIMEOUT_SECONDS
+
+            # 切り替わる前のキャプションが読めなかった場合は比較できないため、シグネチャ判定だけで待つ
+            if previous_probe_text is not None:
+                def probe_changed() -> bool:
+                    # 要素が消えた (遷移中・キャプションの無い動画) 場合も待ち続けず、シグネチャ判定に進む
+                    text = self._read_feed_probe(probe)
+                    return text is None or text != previous_probe_text
+
+                # キャプションが同じ動画が続く場合に備え、上限を短くしてシグネチャ判定の時間を残す
+                self._wait_until(probe_changed, min(SWIPE_PROBE_TIMEOUT_SECONDS, SWIPE_SETTLE_TIMEOUT_SECONDS),
+                                 SWIPE_SETTLE_POLL_SECONDS, "feed caption changed")
+
+            def feed_moved() -> Optional[str]:
+                # 切り替わり後に最新の画面を取得し直す (遷移途中のものを次の動画の抽出に再利用しない)
+                signature = self.get_feed_signature(self.get_dom_snapshot(refresh=True))
+                if signature and signature != previous_signature:
+                    return signature
+                return None
+
+            # 通常は1回で成立する。遷移途中 (またはキャプションが同じ) の場合のみ残り時間で画面を取り直す
+            new_signature = self._wait_until(feed_moved, max(deadline - time.time(), 0.0), SWIPE_SETTLE_POLL_SECONDS,
+                                             "feed moved to a new video")
+            if not new_signature:
+                logger.warning("STATUS: Swipe did not register (same video still on screen).")
+                self.gestures.report_ineffective()
+                return False
+            self._last_feed_signature = new_signature
             logger.debug("STATUS: Swipe completed.")
             return True
         except Exception as e:
             logger.error(f"Error during swipe_up: {e}")
             raise e
 
+    def _feed_probe_locator(self, snapshot: DomSnapshot) -> Optional[Tuple[str, str]]:
+        """[V102 新規] スナップショット上でキャプションに一致したセレクタ (スワイプ後の軽量な切り替わり検知に使う)"""
+        for by, value in ids.CAPTION_TEXT_SELECTORS:
+            try:
+                if snapshot.find(by, value) is not None:
+                    return by, value
+            except SnapshotSelectorError:
+                continue
+        return None
+
+    def _read_feed_probe(self, locator: Tuple[str, str]) -> Optional[str]:
+        """[V102 新規] キャプション要素1つのテキストだけを読む。見つからない場合は None"""
+        try:
+            elements = self.driver.find_elements(*locator)
+            return elements[0].text if elements else None
+        except AppiumCommandDeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.debug("SWIPE: Feed probe read failed: %s", e)
+            return None
+
+    def swipe_to_next_video(self, max_attempts: int = 2) -> bool:
+        """[V98 新規] 動画が切り替わるまで最大 max_attempts 回スワイプする (同じ動画の二重処理を防ぐ)"""
+        for attempt in range(1, max_attempts + 1):
+            if self.swipe_up():
+                return True
+            logger.debug("STATUS: Retrying swipe (%d/%d).", attempt, max_attempts)
+        return False
+
     # -----------------------------------------------------------------
     # ★ V94 修正: UI操作関数 (find_element_with_fallbacks を使用)
     # -----------------------------------------------------------------
@@ -250,12 +770,22 @@ class TiktokAppiumHelper:
         """「おすすめ」フィードに戻る"""
         logger.info("ACTION: Ensuring recommended feed is active.")
 
+        # ★ V102 修正: スナップショットで選択状態を判定し、座標タップする (要素検索の往復を省略)
+        home_node = self.get_dom_snapshot().find_first(ids.HOME_ICON_SELECTORS)
+        if home_node is not None and home_node.bounds:
+            if home_node.get_attribute("selected") != "true":
+                logger.debug("NAV: Home button not selected. Tapping Home by snapshot bounds.")
+                self.tap_bounds(home_node.bounds)
+                time.sleep(1.0)
+            logger.info("STATUS: Successfully navigated to Recommended feed.")
+            return
+
         # ★ V94 修正: find_element_with_fallbacks を使用
         home_button = self.find_element_with_fallbacks(ids.HOME_ICON_SELECTORS)
         try:
             if home_button.get_attribute("selected") != "true":
                 logger.debug("NAV: Home button not selected. Clicking Home.")
-                home_button.click()
+                self.click_element(home_button)
                 time.sleep(1.0)
             logger.info("STATUS: Successfully navigated to Recommended feed.")
 
@@ -266,57 +796,32 @@ class TiktokAppiumHelper:
             raise e
 
     def is_video_post(self) -> bool:
-        """ [V94 修正] 静止画（写真）投稿かどうかを瞬時に判定する """
+        """
+        [V94 修正] 静止画（写真）投稿かどうかを瞬時に判定する
+        [V102 修正] 0.5s の待機付き検索ではなく、スナップショット上の否定判定で答える
+        """
         try:
-            # ★ V94 修正: find_element_with_fallbacks を瞬時判定で使う
-            # (wait_fast (0.5s) を _find_element_with_retry に渡す)
-            selector = ids.PHOTO_MODE_INDICATOR_SELECTORS[0]  # 最初の戦略のみ試行
-            self._find_element_with_retry(
-                selector[0],
-                selector[1],
-                max_retries=1,
-                wait_time_seconds=0.5
-            )
-
-            logger.debug(f"FILTER: Photo Mode element ({selector[1]}) found. (Type=Static Image)")
-            return False
-        except TimeoutException:
-            logger.debug(f"FILTER: Photo Mode element not found. (Type=Video)")
+            if self.has_element(ids.PHOTO_MODE_INDICATOR_SELECTORS):
+                logger.debug("FILTER: Photo Mode element found. (Type=Static Image)")
+                return False
+            logger.debug("FILTER: Photo Mode element not found. (Type=Video)")
             return True
         except Exception as e:
             logger.warning(f"FILTER: Error checking Photo Mode element: {e}. Assuming Video.")
             return True
 
     def _convert_count_to_int(self, count_str: str) -> int:
-        """K/M/万表記を整数に変換する"""
-        if not count_str: return 0
-        count_str = str(count_str).upper().replace(',', '')
-        if '万' in count_str:
-            count_str = count_str.replace('万', '')
-            try:
-                return int(float(count_str) * 10000)
-            except ValueError:
-                return 0
-        if 'M' in count_str:
-            try:
-                return int(float(count_str.replace('M', '')) * 1_000_000)
-            except ValueError:
-                return 0
-        elif 'K' in count_str:
-            try:
-                return int(float(count_str.replace('K', '')) * 1_000)
-            except ValueError:
-                return 0
-        try:
-            return int(count_str)
-        except ValueError:
-            return 0
+        """件数表記を整数に変換する (V109: 言語パック対応)"""
+        return convert_count_to_int(count_str)
 
     def is_likes_above_threshold(self, current_likes: int, threshold: int) -> bool:
         return current_likes >= threshold
 
-    def get_current_video_url_full(self) -> Optional[str]:
-        """ [V94 修正] シェアメニューを開き、クリップボード経由でURLを取得する """
+    def get_current_video_url_full(self, share_button_bounds: Optional[Tuple[int, int, int, int]] = None) -> Optional[str]:
+        """
+        [V94 修正] シェアメニューを開き、クリップボード経由でURLを取得する
+        [V96 追加] スナップショットで取得済みのシェアボタン座標があれば、要素検索せずに直接タップする
+        """
         logger.info(
             "ACTION: https://www.merriam-webster.com/dictionary/copy Attempting to copy video URL via Share menu.")
         try:
@@ -326,18 +831,25 @@ class TiktokAppiumHelper:
             except Exception as e:
                 logger.warning(f"CLIPBOARD: Could not clear clipboard: {e}")
 
-            # ★ V94 修正: find_element_with_fallbacks を使用
-            share_button_parent = self.find_element_with_fallbacks(ids.SHARE_BUTTON_SELECTORS)
-            share_button_parent.click()
-            logger.debug(f"NAV: Share button clicked.")
+            if share_button_bounds:
+                self.tap_bounds(share_button_bounds)
+                logger.debug(f"NAV: Share button tapped by snapshot bounds {share_button_bounds}.")
+            else:
+                # ★ V94 修正: find_element_with_fallbacks を使用
+                share_button_parent = self.find_element_with_fallbacks(ids.SHARE_BUTTON_SELECTORS)
+                self.click_element(share_button_parent)
+                logger.debug("NAV: Share button clicked.")
 
             # ★ V94 修正: find_element_with_fallbacks を使用
             copy_link_button = self.find_element_with_fallbacks(ids.COPY_LINK_BUTTON_SELECTORS)
-            copy_link_button.click()
+            self.click_element(copy_link_button)
 
             logger.debug("NAV: 'Copy Link' button clicked.")
-            time.sleep(1.5)
-            url = self.driver.get_clipboard_text()
+            # ★ V98 修正: 固定 1.5s 待機をやめ、クリップボードにURLが入るまでポーリングする
+            url = self._wait_until(self._read_clipboard_url, CLIPBOARD_TIMEOUT_SECONDS, CLIPBOARD_POLL_SECONDS,
+                                   "clipboard contains video URL")
+            if not url:
+                url = self.driver.get_clipboard_text()
 
             if not url or not url.startswith('http'):
                 logger.warning(f"CLIPBOARD: Failed to get valid URL. Found: '{url}'")
@@ -349,9 +861,9 @@ class TiktokAppiumHelper:
                 logger.debug("NAV: Copy successful. Assuming menu closed automatically.")
                 return url
 
-            logger.warning(f"NAV: URL not found in clipboard. Closing menu via driver.back().")
+            logger.warning("NAV: URL not found in clipboard. Closing menu via driver.back().")
             try:
-                self.driver.back()
+                self.press_back()
                 logger.debug("NAV: Share menu closed via driver.back().")
                 time.sleep(0.5)
             except Exception as e_back:
@@ -359,10 +871,10 @@ class TiktokAppiumHelper:
             return None
 
         except TimeoutException as e:
-            logger.warning(f"NAV: Timeout while trying to find Share/Copy button.")
+            logger.warning("NAV: Timeout while trying to find Share/Copy button.")
             try:
-                logger.debug(f"NAV: Closing potentially open share menu via driver.back().")
-                self.driver.back()
+                logger.debug("NAV: Closing potentially open share menu via driver.back().")
+                self.press_back()
             except Exception as e_back:
                 logger.error(f"NAV: driver.back() failed during Timeout recovery: {e_back}")
             raise Exception("Failed to complete share menu navigation (Timeout).") from e
@@ -371,15 +883,16 @@ class TiktokAppiumHelper:
             logger.warning(traceback.format_exc())
             raise e
 
-    def _extract_video_id_from_url(self, url: str) -> Optional[str]:
-        if not url: return None
-        match_short = re.search(r'vt\.tiktok\.com/([a-zA-Z0-9]+)', url)
-        if match_short: return match_short.group(1)
-        match_long = re.search(r'/video/(\d+)', url)
-        if match_long: return match_long.group(1)
-        logger.warning(f"ID Extract: Could not extract ID from URL: {url}")
+    def _read_clipboard_url(self) -> Optional[str]:
+        text = self.driver.get_clipboard_text()
+        # クリップボードはコピー前に空にしているため、同じ URL が続いても新しくコピーされたものとして扱う
+        if text and text.startswith('http'):
+            return text
         return None
 
+    def _extract_video_id_from_url(self, url: str) -> Optional[str]:
+        return extract_video_id_from_url(url)
+
     def get_full_caption_text(self) -> str:
         """[V94 修正] 投稿文章を取得。「もっと見る」があればタップする"""
         try:
@@ -387,7 +900,7 @@ class TiktokAppiumHelper:
                 # ★ V94 修正: find_element_with_fallbacks を使用 (リトライ1回)
                 more_button = self.find_element_with_fallbacks(ids.CAPTION_MORE_BUTTON_SELECTORS,
                                                                max_retries_per_selector=1)
-                more_button.click()
+                self.click_element(more_button)
                 logger.debug("CAPTION: 'More' button clicked.")
                 time.sleep(0.5)
             except TimeoutException:
@@ -397,13 +910,13 @@ class TiktokAppiumHelper:
             caption_element = self.find_element_with_fallbacks(ids.CAPTION_TEXT_SELECTORS)
             caption = caption_element.text.strip()
 
-            if caption and re.fullmatch(r'[\d,.]+[KM万]?', caption):
-                logger.debug(f"CAPTION: Found text ({caption}) but it looks like a number. Skipping.")
+            if caption and locale_packs.active_pack().count_parser.is_count(caption):
+                logger.debug("CAPTION: Found text (%s) but it looks like a number. Skipping.", caption)
                 return ""
-            logger.debug(f"CAPTION: Extracted text: {caption[:30]}...")
+            logger.debug("CAPTION: Extracted text: %.30s...", caption)
             return caption
         except TimeoutException:
-            logger.debug(f"CAPTION: Caption element not found (Timeout).")
+            logger.debug("CAPTION: Caption element not found (Timeout).")
             return ""
         except Exception as e:
             logger.warning(f"CAPTION: Error getting caption: {e}")
@@ -415,20 +928,20 @@ class TiktokAppiumHelper:
             # ★ V94 修正: find_element_with_fallbacks を使用
             likes_button = self.find_element_with_fallbacks(ids.LIKES_BUTTON_SELECTORS)
             likes_desc = likes_button.get_attribute("content-desc")
-            match = re.search(r'([\d,.]+[KM万]?)件', likes_desc)
+            match = locale_packs.active_pack().likes_desc_pattern.search(likes_desc or '')
             if match:
                 likes_text = match.group(1)
-                logger.debug(f"LIKES: Extracted from content-desc: {likes_text}")
+                logger.debug("LIKES: Extracted from content-desc: %s", likes_text)
                 return self._convert_count_to_int(likes_text)
             else:
                 # ★ V94 修正: find_element_with_fallbacks を使用
-                logger.debug(f"LIKES: content-desc match failed ('{likes_desc}'), falling back to Text ID.")
+                logger.debug("LIKES: content-desc match failed ('%s'), falling back to Text ID.", likes_desc)
                 likes_element = self.find_element_with_fallbacks(ids.LIKES_COUNT_TEXT_SELECTORS)
                 likes_text = likes_element.text
-                logger.debug(f"LIKES: Extracted from Text ID: {likes_text}")
+                logger.debug("LIKES: Extracted from Text ID: %s", likes_text)
                 return self._convert_count_to_int(likes_text)
         except TimeoutException:
-            logger.error(f"FAILURE: Likes Count element not found after all fallbacks.")
+            logger.error("FAILURE: Likes Count element not found after all fallbacks.")
             return 0
         except Exception as e:
             logger.warning(f"HELPER: ERROR during get_like_count: {e}")
@@ -444,19 +957,77 @@ class TiktokAppiumHelper:
             channel_name = channel_element.text.strip()
             if channel_name:
                 data['channel_name'] = channel_name
-                logger.debug(f"SUCCESS: Channel Name found: {data['channel_name']}")
+                logger.debug("SUCCESS: Channel Name found: %s", data['channel_name'])
             else:
-                logger.debug(f"SKIP: Channel Name element found but text is empty.")
+                logger.debug("SKIP: Channel Name element found but text is empty.")
         except TimeoutException:
-            logger.debug(f"SKIP: Channel Name element not found (Timeout).")
+            logger.debug("SKIP: Channel Name element not found (Timeout).")
         except Exception as e:
             logger.warning(f"Error during channel name scrape: {e}")
-        logger.debug(f"STATUS: Scrape completed. Channel={data['channel_name']}")
+        logger.debug("STATUS: Scrape completed. Channel=%s", data['channel_name'])
         return data
 
     def get_screenshot_binary_via_adb(self) -> Optional[bytes]:
-        """ [V33] ADBコマンドを直接呼び出して高速にスクショを取得する """
-        logger.debug("ACTION: Taking screenshot via ADB command.")
+        """
+        [V105 修正] スクリーンショットを取得し、DB保存用に縮小・再エンコードしたバイト列を返す。
+        SCREENSHOT_CAPTURE_MODE='stream' では adb exec-out で端末のストレージを経由せずに1プロセスで取得する。
+        [V106 修正] 撮影 (start_screenshot_capture) とエンコード (encode_screenshot_data) に分割。同期版。
+        """
+        capture = self.start_screenshot_capture()
+        if capture is None:
+            return None
+        data = capture.read(SCREENSHOT_CAPTURE_TIMEOUT_SECONDS)
+        if data is None:
+            return None
+        try:
+            encoded, info = self.encode_screenshot_data(data, capture.raw)
+        except Exception as e:
+            logger.error(f"SCREENSHOT: Failed to re-encode screenshot ({len(data)} bytes): {e}")
+            return None
+        self.last_screenshot_info = info
+        return encoded
+
+    def start_screenshot_capture(self) -> Optional[PendingScreenshot]:
+        """
+        [V106 新規] シャッター (端末側のキャプチャ完了) までだけ待ち、受信途中のスクリーンショットを返す。
+        残りの受信とエンコードは PendingScreenshot.read / encode_screenshot_data で (別スレッドからでも) 行える。
+        """
+        if SCREENSHOT_CAPTURE_MODE == 'sdcard':
+            started = time.time()
+            data = self._get_screenshot_via_sdcard()
+            if data is None:
+                return None
+            return PendingScreenshot(raw=False, data=data, shutter_seconds=time.time() - started)
+
+        raw = SCREENSHOT_STREAM_FORMAT == 'raw' and screenshot_codec.is_available()
+        # ★ V105: adb exec-out screencap の標準出力を直接受け取る (shell=False, 一時ファイルなし)
+        cmd = ['adb', '-H', str(self.adb_host), '-P', str(self.adb_port), 'exec-out', 'screencap']
+        if not raw:
+            cmd.append('-p')
+        capture = PendingScreenshot.start(cmd, raw, SCREENSHOT_CAPTURE_TIMEOUT_SECONDS)
+        if capture is not None:
+            logger.debug("SCREENSHOT: Shutter released after %.2fs.", capture.shutter_seconds)
+        return capture
+
+    def encode_screenshot_data(self, data: bytes, raw: bool) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        [V106 新規] 縮小・再エンコード (ドライバーを使わないためワーカースレッドから呼び出してよい)
+        [V108 追加] PHASH_ENABLED の場合は info['phash'] に知覚ハッシュを入れる
+        """
+        if not screenshot_codec.is_available():
+            screenshot_codec.log_unavailable_once()
+        started = time.time()
+        encoded, info = screenshot_codec.encode_screenshot(data, raw, SCREENSHOT_MAX_WIDTH,
+                                                           SCREENSHOT_IMAGE_FORMAT, SCREENSHOT_QUALITY,
+                                                           phash=PHASH_ENABLED, phash_crop_box=PHASH_CROP_BOX,
+                                                           phash_min_stddev=PHASH_MIN_PIXEL_STDDEV)
+        logger.debug("STATUS: Screenshot encoded in %.2fs (%d -> %d bytes, %s %sx%s).", time.time() - started,
+                     len(data), len(encoded), info['format'], info['width'], info['height'])
+        return encoded, info
+
+    def _get_screenshot_via_sdcard(self) -> Optional[bytes]:
+        """ [V33] ADBコマンドを直接呼び出して高速にスクショを取得する (V105 で SCREENSHOT_CAPTURE_MODE='sdcard' 用に改名) """
+        logger.debug("ACTION: Taking screenshot via ADB command (sdcard + pull).")
         cmd_screencap = f"adb {self.adb_host_port_str} shell screencap -p /sdcard/tiktok_bot_ss.png"
         try:
             result_cap = subprocess.run(cmd_screencap, shell=True, capture_output=True, text=True, timeout=10)
@@ -481,90 +1052,115 @@ class TiktokAppiumHelper:
             logger.error(f"ADB ERROR: Unknown error during ADB screenshot: {e}")
             return None
 
+    def _wait_for_search_step(self, step_name: str, selectors_list: List[Tuple[str, str]],
+                              required: bool = True) -> Any:
+        """
+        [V99 新規] perform_search の1ステップ分の待機。
+        次のステップで使う要素が現れるまでステップ別の上限時間 (SEARCH_STEP_CEILINGS) を超えない範囲でポーリングし、
+        見つかった要素を返す。
+        [V99 修正] 出現の判定はスナップショット (キャッシュがあれば往復なし) で行い、現れた要素は
+        find_element_with_fallbacks で取得する (セレクタ統計の順序・記録を使う)。待つのは見つからなかった時だけ。
+        """
+        ceiling = SEARCH_STEP_CEILINGS.get(step_name, SEARCH_STEP_DEFAULT_CEILING_SECONDS)
+        poll_seconds = SEARCH_STEP_POLL_SECONDS + random.uniform(0, SEARCH_STEP_JITTER_SECONDS)
+        started = time.time()
+        polls = 0
+
+        def locate() -> Any:
+            nonlocal polls
+            # 1回目は直前の操作以降のキャッシュを使い、2回目以降は取り直す
+            snapshot = self.get_dom_snapshot(refresh=polls > 0)
+            polls += 1
+            if not any(self._snapshot_may_contain(snapshot, selector) for selector in selectors_list):
+                return None
+            return self.find_element_with_fallbacks(selectors_list, max_retries_per_selector=1)
+
+        element = self._wait_until(locate, ceiling, poll_seconds, f"search step '{step_name}'")
+        waited = time.time() - started
+        self.last_search_step_timings[step_name] = waited
+        logger.debug("SEARCH: Step '%s' waited %.2fs (Polls: %d, Ceiling: %.1fs, Found: %s).",
+                     step_name, waited, polls, ceiling, element is not None)
+        if element is None and required:
+            raise TimeoutException(f"Search step '{step_name}' element not found within {ceiling:.1f}s.")
+        return element
+
     def perform_search(self, search_word: str):
         """
         [V94 修正] 検索を実行する (セレクタをidsからインポート)
+        [V99 修正] 各ステップの random.uniform 固定待機をやめ、次のステップで必要な要素の出現を待つ
         """
         logger.info(f"ACTION: [START] Performing full search cycle for: {search_word}")
+        self.last_search_step_timings = {}
+        search_started = time.time()
 
         try:
             # --- 1. ホーム画面から検索アイコンをタップ ---
-            logger.debug(f"SEARCH: (Step 1) Tapping search icon on home screen.")
+            logger.debug("SEARCH: (Step 1) Tapping search icon on home screen.")
             search_icon = self.find_element_with_fallbacks(ids.HOME_SEARCH_ICON_SELECTORS, max_retries_per_selector=5)
-            search_icon.click()
+            self.click_element(search_icon)
             logger.debug("SEARCH: (Step 1) Search icon tapped.")
-            time.sleep(random.uniform(1.5, 2.5))
 
             # --- 2. 検索キーワードの入力と実行 ---
             logger.debug(f"SEARCH: (Step 2) Entering text '{search_word}' and submitting.")
-            input_box = self.find_element_with_fallbacks(ids.SEARCH_INPUT_BOX_SELECTORS)
+            input_box = self._wait_for_search_step('search_input', ids.SEARCH_INPUT_BOX_SELECTORS)
             input_box.send_keys(search_word)
+            self.invalidate_snapshot()
             logger.debug("SEARCH: (Step 2) Text entered.")
-            time.sleep(random.uniform(0.5, 1.0))
-            submit_button = self.find_element_with_fallbacks(ids.SEARCH_SUBMIT_BUTTON_SELECTORS)
-            submit_button.click()
+            submit_button = self._wait_for_search_step('search_submit', ids.SEARCH_SUBMIT_BUTTON_SELECTORS)
+            self.click_element(submit_button)
             logger.debug("SEARCH: (Step 2) Search submitted.")
-            time.sleep(random.uniform(4.0, 6.0))  # 検索結果のロード待ち
 
-            # --- 3. フィルターアイコンをタップ ---
+            # --- 3. フィルターアイコンをタップ (検索結果のロード待ち) ---
             logger.debug("SEARCH: (Step 3) Tapping filter icon.")
-            filter_icon = self.find_element_with_fallbacks(ids.SEARCH_FILTER_ICON_SELECTORS)
-            filter_icon.click()
+            filter_icon = self._wait_for_search_step('search_results', ids.SEARCH_FILTER_ICON_SELECTORS)
+            self.click_element(filter_icon)
             logger.debug("SEARCH: (Step 3) Filter icon tapped.")
-            time.sleep(random.uniform(1.5, 2.5))
 
             # --- 3.5: 中間メニューの「フィルター」をタップ ---
             logger.debug("SEARCH: (Step 3.5) Tapping intermediate 'フィルター' button.")
             try:
-                self.find_element_with_fallbacks(ids.FILTER_INTERMEDIATE_BUTTON_SELECTORS,
-                                                 max_retries_per_selector=2).click()
+                self.click_element(self._wait_for_search_step('filter_menu', ids.FILTER_INTERMEDIATE_BUTTON_SELECTORS))
                 logger.debug("SEARCH: (Step 3.5) Intermediate 'フィルター' button tapped.")
-                time.sleep(random.uniform(1.5, 2.5))
             except TimeoutException as e:
                 logger.error("SEARCH: (Step 3.5) FAILED to find intermediate 'フィルター' button.")
                 raise e
 
             # --- 4. フィルターの適用 ---
             logger.debug("SEARCH: (Step 4) Applying final filters (Sort by Date, Unwatched, Last 6 Months)...")
-            self.find_element_with_fallbacks(ids.FILTER_SORT_DATE_SELECTORS, max_retries_per_selector=2).click()
+            self.click_element(self._wait_for_search_step('filter_sort', ids.FILTER_SORT_DATE_SELECTORS))
             logger.debug("SEARCH: (Step 4) Filter applied: Sort by Date.")
-            time.sleep(random.uniform(0.8, 1.5))
-            try:
-                # (オプション)
-                self.find_element_with_fallbacks(ids.FILTER_UNWATCHED_SELECTORS, max_retries_per_selector=1).click()
+            # (オプション)
+            unwatched_button = self._wait_for_search_step('filter_unwatched', ids.FILTER_UNWATCHED_SELECTORS,
+                                                          required=False)
+            if unwatched_button is not None:
+                self.click_element(unwatched_button)
                 logger.debug("SEARCH: (Step 4) Filter applied: Unwatched.")
-                time.sleep(random.uniform(0.8, 1.5))
-            except TimeoutException:
+            else:
                 logger.warning("SEARCH: (Step 4) 'Unwatched' button not found (fast check). Skipping this filter.")
             logger.debug("SEARCH: (Step 4.5) Scrolling filter panel down...")
             try:
-                size = self.driver.get_window_size()
-                start_x, start_y, end_y = size['width'] // 2, int(size['height'] * 0.80), int(size['height'] * 0.30)
-                self.driver.swipe(start_x, start_y, start_x, end_y, 600)
+                self.gestures.perform('filter_scroll')
                 logger.debug("SEARCH: (Step 4.5) Scroll swipe executed.")
-                time.sleep(random.uniform(1.0, 1.5))
             except Exception as scroll_e:
                 logger.warning(f"SEARCH: (Step 4.5) Failed to execute scroll swipe: {scroll_e}")
-            self.find_element_with_fallbacks(ids.FILTER_6_MONTHS_SELECTORS, max_retries_per_selector=2).click()
+            self.click_element(self._wait_for_search_step('filter_6_months', ids.FILTER_6_MONTHS_SELECTORS))
             logger.debug("SEARCH: (Step 4) Filter applied: Last 6 Months.")
-            time.sleep(random.uniform(0.8, 1.2))
-            self.find_element_with_fallbacks(ids.FILTER_APPLY_BUTTON_SELECTORS, max_retries_per_selector=2).click()
+            self.click_element(self._wait_for_search_step('filter_apply', ids.FILTER_APPLY_BUTTON_SELECTORS))
             logger.info("SEARCH: (Step 4) Apply button tapped.")
-            time.sleep(random.uniform(4.0, 6.0))
 
             # --- 5. 動画タブを明示的にクリックして動画一覧に切り替える ---
             try:
+                self._wait_for_search_step('video_tab', ids.SEARCH_VIDEO_TAB_SELECTORS, required=False)
                 video_tab = None
-                tab_elements = self.driver.find_elements(AppiumBy.XPATH, '//android.widget.FrameLayout[@content-desc="動画"]')
+                tab_elements = self.driver.find_elements(*ids.SEARCH_VIDEO_TAB_SELECTORS[0])
                 for el in tab_elements:
                     if el.get_attribute("selected") == "true":
                         video_tab = el
                         break
                 if not video_tab and tab_elements:
                     video_tab = tab_elements[0]
-                    video_tab.click()
+                    self.click_element(video_tab)
                     logger.debug("SEARCH: (Step 5) '動画'タブをクリックしました。")
-                    time.sleep(1.0)
                 else:
                     logger.debug("SEARCH: (Step 5) '動画'タブは既に選択済み。")
             except Exception as e:
@@ -577,41 +1173,52 @@ class TiktokAppiumHelper:
                     self._recover_from_search_menu_to_home()
                     raise Exception("No video items found or could not click video in search results.")
 
-                time.sleep(2.0)  # 動画画面のロード待ち
-
-                # 動画プレイヤーが開くまでリトライ
+                # 動画プレイヤーが開くまで待機 (開かない場合はタップをやり直す)
+                player_started = time.time()
                 max_wait = 8
                 for i in range(max_wait):
                     try:
-                        WebDriverWait(self.driver, 2, poll_frequency=0.5).until(
+                        WebDriverWait(self.driver, 2, poll_frequency=SEARCH_STEP_POLL_SECONDS).until(
                             EC.presence_of_element_located(ids.SHARE_BUTTON_SELECTORS[0])
                         )
                         break
                     except TimeoutException:
                         self.click_first_video_result_by_location()
-                        time.sleep(1.0)
                 else:
                     self._recover_from_search_menu_to_home()
                     raise Exception("Could not open video player after clicking video item.")
+                self.last_search_step_timings['video_player'] = time.time() - player_started
 
             except Exception as e:
                 self._recover_from_search_menu_to_home()
                 raise Exception("Could not find or open the target video item in search results.") from e
 
-            logger.info(f"ACTION: [SUCCESS] Search cycle complete. Handing over to main loop for scraping.")
+            self._log_search_step_timings(search_started)
+            logger.info("ACTION: [SUCCESS] Search cycle complete. Handing over to main loop for scraping.")
             return True
 
         except TimeoutException as e:
             logger.error(f"FATAL (Timeout) during perform_search: {e}")
             logger.error(traceback.format_exc())
+            self._log_search_step_timings(search_started)
             self._recover_from_search_menu_to_home()
             raise e
         except Exception as e:
             logger.error(f"FATAL (Unknown) during perform_search: {e}")
             logger.error(traceback.format_exc())
+            self._log_search_step_timings(search_started)
             self._recover_from_search_menu_to_home()
             raise e
 
+    def _log_search_step_timings(self, search_started: float):
+        """[V99 新規] perform_search の各ステップが実際に待機した時間を1行で出力する"""
+        timings = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.last_search_step_timings.items())
+        logger.info(f"SEARCH: Step wait timings (Total: {time.time() - search_started:.2f}s) -> {timings}")
+        # ★ V111 追加: 各ステップと全体をヒストグラムに記録する
+        for name, seconds in self.last_search_step_timings.items():
+            SEARCH_STEP_SECONDS.observe(seconds, step=name)
+        SEARCH_STEP_SECONDS.observe(time.time() - search_started, step='total')
+
     def click_first_video_result(self):
         """
         検索結果から最初の動画を開くための構造ベースの安定した処理
@@ -621,7 +1228,7 @@ class TiktokAppiumHelper:
         if videos:
             target_video = videos[0]
             try:
-                target_video.click()
+                self.click_element(target_video)
             except Exception:
                 # location = target_video.location
                 # size = target_video.size
@@ -658,6 +1265,7 @@ class TiktokAppiumHelper:
 
             # 4. 座標を物理タップ
             self.driver.tap([(center_x, center_y)])
+            self.invalidate_snapshot()
             return True
 
         except Exception as e:
@@ -674,14 +1282,14 @@ class TiktokAppiumHelper:
             BACK_BUTTON_SELECTORS = ids.SEARCH_BACK_BUTTON_SELECTORS
 
             try:
-                self.find_element_with_fallbacks(BACK_BUTTON_SELECTORS, max_retries_per_selector=2).click()
+                self.click_element(self.find_element_with_fallbacks(BACK_BUTTON_SELECTORS, max_retries_per_selector=2))
                 logger.debug("SEARCH: (RECOVERY) Back 1: Moved from Search Result to Search Input.")
                 time.sleep(random.uniform(1.0, 1.5))
             except TimeoutException:
                 logger.debug("SEARCH: (RECOVERY) Back 1 failed/already on search input screen.")
                 pass
             try:
-                self.find_element_with_fallbacks(BACK_BUTTON_SELECTORS, max_retries_per_selector=2).click()
+                self.click_element(self.find_element_with_fallbacks(BACK_BUTTON_SELECTORS, max_retries_per_selector=2))
                 logger.debug("SEARCH: (RECOVERY) Back 2: Moved from Search Input to Home.")
                 time.sleep(random.uniform(1.5, 2.5))
             except TimeoutException:
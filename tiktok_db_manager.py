@@ -1,12 +1,15 @@
 # =====================================================================
 # tiktok_db_manager.py: TikTok BotのDB操作ロジック (V26 - 安定版)
 # =====================================================================
-from base_db import BaseDB
-from config import MYSQL_CONFIG, MIN_LIKES_DEFAULT, WAITING_SCREENSHOT_CHECK, ERROR_NEEDS_REVIEW
-from typing import Dict, Any, Optional, List
+from base_db import BaseDB, is_connection_error
+from config import MYSQL_CONFIG, MIN_LIKES_DEFAULT, WAITING_SCREENSHOT_CHECK, ERROR_NEEDS_REVIEW, DUPLICATE_CONTENT
+from config import DB_WRITE_BUFFER_MAX_ROWS, DB_WRITE_BUFFER_MAX_AGE_SECONDS, WAITING_SCREENSHOT_ATTACH
+from config import DB_WRITE_BUFFER_MAX_PENDING_ROWS
+from typing import Dict, Any, Optional, List, Tuple, Callable
 import time
 import pymysql.err
 from app_logger import logger  # ★ グローバルロガーをインポート
+from metrics import DB_FLUSH_SECONDS, DB_BUFFERED_ROWS_TOTAL, DB_BUFFER_DROPPED_ROWS_TOTAL
 
 # ★ V49 修正: collector_bot_main から TARGET_COUNTRY_CODE をインポートできないため、
 # config.py から直接インポートするか、渡す必要がある。
@@ -20,16 +23,114 @@ except ImportError:
     TARGET_COUNTRY_CODE = 'N/A'  # フォールバックのデフォルト
 
 
+# ★ V120 追加: 溜めて後から書き込む操作 (apply_writes が受け付ける op と、その値)
+#   'video'          insert_new_video_record の値 (先頭が video_id)
+#   'history'        (video_id, status_from, status_to, log_message, processed_by)
+#   'isolate'        (video_id,)
+#   'screenshot'     (video_id, screenshot_binary_data)
+#   'screenshot_ref' (video_id, digest, width, height, clear_blob)
+#   'release'        (video_id,)
+#   'phash'          (video_id, phash, canonical_video_id, log_message, processed_by)
+WriteRecord = Tuple[Optional[str], str, Tuple[Any, ...]]  # (重複防止キー, op, 値)
+
+
+# 履歴の INSERT (★ V120: 重複防止キーが同じ行は1行にする。キーが NULL の行は何行でも入る)
+HISTORY_INSERT_SQL = """
+    INSERT INTO tiktok_video_history
+    (video_id, status_from, status_to, log_message, processed_by, dedupe_key)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE dedupe_key = VALUES(dedupe_key)
+"""
+
+
+# スクショの添付 (★ V106 修正: 添付待ちの場合は同じ UPDATE で WAITING_SCREENSHOT_CHECK にする)
+_RELEASE_ATTACH_WAIT = "analysis_status = IF(analysis_status = %s, %s, analysis_status)"
+SCREENSHOT_UPDATE_SQL = f"UPDATE tiktok_videos SET screenshot_data = %s, {_RELEASE_ATTACH_WAIT} WHERE video_id = %s"
+
+
+def screenshot_ref_update_sql(clear_blob: bool) -> str:
+    """スクリーンショットストアの参照を記録する UPDATE (clear_blob=True で旧 BLOB も削除)"""
+    return f"""
+        UPDATE tiktok_videos
+        SET screenshot_digest = %s, screenshot_width = %s, screenshot_height = %s,
+            {_RELEASE_ATTACH_WAIT}
+            {", screenshot_data = NULL" if clear_blob else ""}
+        WHERE video_id = %s
+    """
+
+
+def count_written_records(records: List[WriteRecord]):
+    """[V120 新規] 書き込んだ操作の件数を種類ごとに metrics に加算する"""
+    counts: Dict[str, int] = {}
+    for _, op, _ in records:
+        counts[op] = counts.get(op, 0) + 1
+    for op, count in counts.items():
+        DB_BUFFERED_ROWS_TOTAL.inc(count, kind=op)
+
+
+class WriteBuffer:
+    """
+    [V119 新規] 書き込み待ちの操作と、書き込み後に実行するコールバック。
+    書き込みに失敗した場合は中身を残し、次の書き込みで再試行する。
+    ★ V120 修正: 種類ごとのリストから、受け付け順の WriteRecord のリストに変更
+    ★ V119 修正: コールバックは登録時点の行数と組にして持つ (その行数分が書き込まれたら実行できる)
+    """
+
+    def __init__(self, max_rows: int = DB_WRITE_BUFFER_MAX_ROWS,
+                 max_age_seconds: float = DB_WRITE_BUFFER_MAX_AGE_SECONDS,
+                 max_pending_rows: int = DB_WRITE_BUFFER_MAX_PENDING_ROWS):
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self.max_pending_rows = max_pending_rows
+        self.records: List[WriteRecord] = []
+        self.callbacks: List[Tuple[int, Callable[[], Any]]] = []
+        self.first_queued_at: Optional[float] = None
+
+    @property
+    def rows(self) -> int:
+        return len(self.records)
+
+    def touch(self):
+        if self.first_queued_at is None:
+            self.first_queued_at = time.monotonic()
+
+    def is_due(self) -> bool:
+        if self.first_queued_at is None:
+            return False
+        return self.rows >= self.max_rows or time.monotonic() - self.first_queued_at >= self.max_age_seconds
+
+    def add_callback(self, callback: Callable[[], Any]):
+        self.callbacks.append((self.rows, callback))
+        self.touch()
+
+    def pop_front(self, count: int) -> List[Callable[[], Any]]:
+        """先頭の count 行を取り除き、それらの後に実行するはずだったコールバックを返す"""
+        self.records = self.records[count:]
+        ready = [callback for position, callback in self.callbacks if position <= count]
+        self.callbacks = [(position - count, callback) for position, callback in self.callbacks if position > count]
+        if not self.records and not self.callbacks:
+            self.first_queued_at = None
+        return ready
+
+    def clear(self):
+        self.records = []
+        self.callbacks = []
+        self.first_queued_at = None
+
+
 class TikTokDBManager(BaseDB):
 
-    def __init__(self):
+    def __init__(self, db_config: Optional[Dict[str, Any]] = None):
         """
         BaseDBを継承し、接続情報を渡す。
         接続成功後、テーブル作成を試みる。
+        ★ V104 追加: db_config を指定すると MYSQL_CONFIG 以外のDB (ベンチマーク用など) に接続する
         """
         logger.info("Initializing TikTokDBManager...")
+        self.write_buffer: Optional[WriteBuffer] = None  # ★ V119 追加: enable_write_buffer で有効にする
+        self.writer = None  # ★ V120 追加: attach_writer で指定した BackgroundDBWriter (db_writer.py)
         # BaseDBの __init__ に MYSQL_CONFIG を渡す
-        super().__init__(MYSQL_CONFIG)
+        super().__init__(db_config or MYSQL_CONFIG)
 
         if self._conn:
             self._create_all_tables()
@@ -148,6 +249,42 @@ class TikTokDBManager(BaseDB):
         ;
         """
         self.execute_query(sql)
+        # ★ V107 追加: スクリーンショットストアの参照 (BLOB の代わりにダイジェストと寸法のみを持つ)
+        self._ensure_column('tiktok_videos', 'screenshot_digest',
+                            "CHAR(64) NULL COMMENT 'スクリーンショットの SHA-256 (screenshot_store.py)'")
+        self._ensure_column('tiktok_videos', 'screenshot_width', "INT NULL")
+        self._ensure_column('tiktok_videos', 'screenshot_height', "INT NULL")
+        self._ensure_index('tiktok_videos', 'idx_screenshot_digest', 'screenshot_digest')
+        # ★ V108 追加: 知覚ハッシュ (dHash 64bit) と、転載動画の場合の元動画ID
+        self._ensure_column('tiktok_videos', 'screenshot_phash',
+                            "BIGINT UNSIGNED NULL COMMENT 'スクリーンショットの dHash (perceptual_hash.py)'")
+        self._ensure_column('tiktok_videos', 'canonical_video_id',
+                            "VARCHAR(255) NULL COMMENT '転載元として紐付けた動画ID (DUPLICATE_CONTENT)'")
+        self._ensure_index('tiktok_videos', 'idx_canonical_video_id', 'canonical_video_id')
+
+    def _ensure_column(self, table: str, column: str, definition: str):
+        """[V107 新規] 既存テーブルに列が無ければ追加する (CREATE TABLE IF NOT EXISTS では列が増えないため)"""
+        sql = """
+            SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """
+        record = self.fetchone(sql, (table, column))
+        if record and record['cnt']:
+            return
+        logger.info(f"DB: Adding column {table}.{column}")
+        self.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _ensure_index(self, table: str, index_name: str, columns: str, unique: bool = False):
+        """[V107 新規] 既存テーブルにインデックスが無ければ追加する (★ V120 追加: unique=True で一意インデックス)"""
+        sql = """
+            SELECT COUNT(*) AS cnt FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        """
+        record = self.fetchone(sql, (table, index_name))
+        if record and record['cnt']:
+            return
+        logger.info(f"DB: Adding index {table}.{index_name}")
+        self.execute_query(f"ALTER TABLE {table} ADD {'UNIQUE ' if unique else ''}INDEX {index_name} ({columns})")
 
     def _create_history_table(self):
         """履歴ログ (tiktok_video_history) の作成"""
@@ -167,6 +304,10 @@ class TikTokDBManager(BaseDB):
         ;
         """
         self.execute_query(sql)
+        # ★ V120 追加: スプールから再送した履歴が二重に記録されないよう、ライターが付けるキーで重複を防ぐ
+        self._ensure_column('tiktok_video_history', 'dedupe_key',
+                            "VARCHAR(64) NULL COMMENT 'BackgroundDBWriter の記録キー (db_writer.py)'")
+        self._ensure_index('tiktok_video_history', 'uq_dedupe_key', 'dedupe_key', unique=True)
 
     # ----------------------------------------------------------------
     # II. 収集 Bot 専用の操作
@@ -177,6 +318,22 @@ class TikTokDBManager(BaseDB):
         sql = "SELECT * FROM bot_configurations WHERE bot_id = %s"
         return self.fetchone(sql, (bot_id,))
 
+    def fetch_active_bot_configurations(self) -> List[Dict[str, Any]]:
+        """[V113 新規] フリート監視用: 稼働対象 (is_active = 1) の Bot 設定を bot_id 順に取得する"""
+        sql = "SELECT * FROM bot_configurations WHERE is_active = 1 ORDER BY bot_id"
+        return self.fetchall(sql)
+
+    def mark_bot_started(self, bot_id: int) -> bool:
+        """[V113 新規] Bot プロセスを起動した時刻を last_started_at に記録する"""
+        try:
+            self.execute_query("UPDATE bot_configurations SET last_started_at = NOW() WHERE bot_id = %s", (bot_id,))
+            self.commit()
+            return True
+        except Exception as e:
+            logger.error(f"DB: Failed to update last_started_at for bot {bot_id}: {e}")
+            self.rollback()
+            return False
+
     def get_like_threshold(self, country_code: str) -> Optional[int]:
         """国別いいね閾値を取得する"""
         sql = "SELECT min_likes_threshold FROM LIKE_THRESHOLDS_BY_COUNTRY WHERE target_country = %s AND is_active = 1"
@@ -188,15 +345,43 @@ class TikTokDBManager(BaseDB):
         logger.warning(f"DB: Like threshold not found for {country_code}. Using default.")
         return None
 
+    def fetch_recent_video_fingerprints(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        [V100 新規] 指紋キャッシュの事前ロード用に、最近収集した動画の識別情報を取得する
+        ★ V100 修正: 有効期限をレコードの作成時刻から数えるため created_at_epoch (UNIX 時刻) も返す
+        """
+        sql = """
+            SELECT video_id, channel_name, caption_text, likes_count, UNIX_TIMESTAMP(created_at) AS created_at_epoch
+            FROM tiktok_videos
+            ORDER BY created_at DESC
+            LIMIT %s
+        """
+        return self.fetchall(sql, (limit,))
+
+    def fetch_perceptual_hashes(self, limit: int) -> List[Dict[str, Any]]:
+        """[V108 新規] 知覚ハッシュのインデックス用に、元動画 (転載ではない) のハッシュを新しい順に取得する"""
+        sql = """
+            SELECT video_id, screenshot_phash
+            FROM tiktok_videos
+            WHERE screenshot_phash IS NOT NULL AND canonical_video_id IS NULL
+            ORDER BY created_at DESC
+            LIMIT %s
+        """
+        return self.fetchall(sql, (limit,))
+
     def insert_new_video_record(self, metadata: Dict[str, Any], screenshot_binary_data: Optional[bytes]) -> str:
         """
         [V18 設計復元] BLOBを含む新規レコードを挿入し、PKを返す。重複時は'DUPLICATE'を返す。
+        [V107 追加] metadata に screenshot_digest / screenshot_width / screenshot_height があれば参照として記録する
+        [V108 追加] metadata の screenshot_phash / canonical_video_id / analysis_status (転載の場合) も記録する
         """
         sql = """
             INSERT INTO tiktok_videos 
             (video_id, url, channel_name, country_code, likes_count, caption_text, 
-             analysis_status, screenshot_data, found_source, searched_by_keyword, last_processed_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+             analysis_status, screenshot_data, screenshot_digest, screenshot_width, screenshot_height,
+             screenshot_phash, canonical_video_id,
+             found_source, searched_by_keyword, last_processed_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
             ON DUPLICATE KEY UPDATE 
                 likes_count = VALUES(likes_count), 
                 last_processed_at = NOW()
@@ -215,7 +400,7 @@ class TikTokDBManager(BaseDB):
         searched_by_keyword = metadata.get('searched_by_keyword')
 
         if not video_id or not url:
-            logger.error(f"DB Insert: Missing video_id or url in metadata. Cannot insert.")
+            logger.error("DB Insert: Missing video_id or url in metadata. Cannot insert.")
             return 'ERROR_MISSING_DATA'
 
         # ★ V49 修正: country_code が 'N/A' の場合、挿入を試みない
@@ -225,10 +410,18 @@ class TikTokDBManager(BaseDB):
 
         values = (
             video_id, url, channel_name, country_code,
-            likes_count, caption_text, WAITING_SCREENSHOT_CHECK,
-            screenshot_binary_data, found_source, searched_by_keyword
+            likes_count, caption_text, metadata.get('analysis_status', WAITING_SCREENSHOT_CHECK),
+            screenshot_binary_data, metadata.get('screenshot_digest'),
+            metadata.get('screenshot_width'), metadata.get('screenshot_height'),
+            metadata.get('screenshot_phash'), metadata.get('canonical_video_id'),
+            found_source, searched_by_keyword
         )
 
+        # ★ V119 追加: バッファが有効なら溜めるだけで、video_id を返す (書き込みは flush_writes でまとめて行う)
+        # ★ V120 修正: ライターが指定されていればライターに渡す
+        if self._queue_write('video', values):
+            return video_id
+
         try:
             self.execute_query(sql, values)
             self.commit()
@@ -247,6 +440,105 @@ class TikTokDBManager(BaseDB):
             self.rollback()
             return f'ERROR_DB: {e}'
 
+    def update_video_screenshot(self, video_id: str, screenshot_binary_data: bytes) -> bool:
+        """
+        [V106 新規] 挿入済みの動画レコードにスクリーンショットを後から添付する (ワーカースレッド用)
+        ★ V106 修正: 添付待ち (WAITING_SCREENSHOT_ATTACH) のレコードは WAITING_SCREENSHOT_CHECK にする
+        """
+        if self._queue_write('screenshot', (video_id, screenshot_binary_data)):  # ★ V120 追加
+            return True
+        try:
+            updated = self.execute_query(SCREENSHOT_UPDATE_SQL, (
+                screenshot_binary_data, WAITING_SCREENSHOT_ATTACH, WAITING_SCREENSHOT_CHECK, video_id))
+            self.commit()
+            if not updated:
+                logger.warning(f"DB: Screenshot target {video_id} not found (or unchanged).")
+            return True
+        except Exception as e:
+            logger.error(f"DB Screenshot Update Failed for {video_id}: {e}")
+            self.rollback()
+            return False
+
+    def update_video_screenshot_ref(self, video_id: str, digest: str, width: Optional[int],
+                                    height: Optional[int], clear_blob: bool = False) -> bool:
+        """
+        [V107 新規] スクリーンショットストアの参照を記録する (clear_blob=True で旧 BLOB を削除: 移行用)
+        ★ V106 修正: 添付待ち (WAITING_SCREENSHOT_ATTACH) のレコードは WAITING_SCREENSHOT_CHECK にする
+        """
+        if self._queue_write('screenshot_ref', (video_id, digest, width, height, clear_blob)):  # ★ V120 追加
+            return True
+        try:
+            self.execute_query(screenshot_ref_update_sql(clear_blob), (
+                digest, width, height, WAITING_SCREENSHOT_ATTACH, WAITING_SCREENSHOT_CHECK, video_id))
+            self.commit()
+            return True
+        except Exception as e:
+            logger.error(f"DB Screenshot Ref Update Failed for {video_id}: {e}")
+            self.rollback()
+            return False
+
+    def release_screenshot_wait(self, video_id: str) -> bool:
+        """
+        [V106 新規] スクショを添付できなかった (取得失敗・キュー満杯) レコードを、添付待ちから WAITING_SCREENSHOT_CHECK にする
+        (従来どおりスクショ無しで確認 Bot に渡す)
+        """
+        if self._queue_write('release', (video_id,)):
+            return True
+        try:
+            self._apply_release(video_id)
+            self.commit()
+            return True
+        except Exception as e:
+            logger.error(f"DB Screenshot Wait Release Failed for {video_id}: {e}")
+            self.rollback()
+            return False
+
+    def release_stale_screenshot_waits(self, max_age_seconds: float) -> int:
+        """[V106 新規] 異常終了などで添付待ちのまま残ったレコードを WAITING_SCREENSHOT_CHECK に戻し、件数を返す"""
+        try:
+            released = self.execute_query("""
+                UPDATE tiktok_videos SET analysis_status = %s
+                WHERE analysis_status = %s AND last_processed_at < NOW() - INTERVAL %s SECOND
+            """, (WAITING_SCREENSHOT_CHECK, WAITING_SCREENSHOT_ATTACH, int(max_age_seconds)))
+            self.commit()
+            return released
+        except Exception as e:
+            logger.error(f"DB Stale Screenshot Wait Release Failed: {e}")
+            self.rollback()
+            return 0
+
+    def update_video_phash(self, video_id: str, phash: int, canonical_video_id: Optional[str] = None,
+                           log_message: Optional[str] = None, processed_by_bot: Optional[str] = None) -> bool:
+        """
+        [V108 新規] 知覚ハッシュを記録する (ワーカースレッド用)。
+        canonical_video_id を指定した場合は転載として DUPLICATE_CONTENT に変更し、元動画に紐付ける。
+        既に他の Bot が確認を始めた (添付待ち / WAITING_SCREENSHOT_CHECK ではない) レコードのステータスは変更しない。
+        転載として紐付けた場合に True を返す。
+        ★ V120 追加: log_message を指定すると、紐付けた場合のみ同じトランザクションで履歴も記録する。
+        ライターに渡した場合は紐付けたかどうかが書き込み時に決まるため、canonical_video_id の指定有無を返す。
+        """
+        if self._queue_write('phash', (video_id, phash, canonical_video_id, log_message, processed_by_bot)):
+            return canonical_video_id is not None
+        try:
+            linked = self._apply_phash(None, video_id, phash, canonical_video_id, log_message, processed_by_bot)
+            self.commit()
+            return linked
+        except Exception as e:
+            logger.error(f"DB Perceptual Hash Update Failed for {video_id}: {e}")
+            self.rollback()
+            return False
+
+    def fetch_inline_screenshots(self, after_video_id: str, limit: int) -> List[Dict[str, Any]]:
+        """[V107 新規] 移行用: BLOB がインラインで残っている動画を主キー順に取得する (キーセット・ページング)"""
+        sql = """
+            SELECT video_id, screenshot_data
+            FROM tiktok_videos
+            WHERE video_id > %s AND screenshot_data IS NOT NULL
+            ORDER BY video_id
+            LIMIT %s
+        """
+        return self.fetchall(sql, (after_video_id, limit))
+
     def log_history(self, video_id: str, status_from: str, status_to: str, log_message: str, processed_by_bot: str):
         """tiktok_video_historyテーブルにログを記録する"""
         if not video_id:
@@ -260,6 +552,9 @@ class TikTokDBManager(BaseDB):
         """
         values = (video_id, status_from, status_to, log_message, processed_by_bot)
 
+        if self._queue_write('history', values):  # ★ V119 追加
+            return
+
         try:
             self.execute_query(sql, values)
             self.commit()
@@ -271,11 +566,17 @@ class TikTokDBManager(BaseDB):
         """
         [V26 修正] 致命的エラー発生時にレコードを隔離し、履歴を記録する。
         video_id が None の場合はログ出力のみ。
+        ★ V119 追加: バッファ (★ V120: またはライター) がある場合は、隔離と履歴を溜めて後からまとめて書き込む。
         """
         if not video_id:
             logger.error(f"DB Isolate: Cannot isolate record without video_id. Error: {error_message}")
             return
 
+        if self._queue_write('isolate', (video_id,)):
+            log_message = f"Error during status '{current_status}': {error_message}"
+            self.log_history(video_id, current_status, ERROR_NEEDS_REVIEW, log_message, bot_id)
+            return
+
         sql_update = """
         UPDATE tiktok_videos 
         SET analysis_status = %s, last_processed_at = NOW() 
@@ -295,6 +596,257 @@ class TikTokDBManager(BaseDB):
             logger.error(f"FATAL: Failed to isolate record {video_id}. Error: {e}")
             self.rollback()
 
+    # ----------------------------------------------------------------
+    # ★ V119 追加: 書き込みバッファ
+    # 動画1本ごとに 挿入+COMMIT / 履歴+COMMIT (棄却時は 隔離+COMMIT / 履歴+COMMIT) の往復が発生していたため、
+    # 溜めた行を 動画の複数行 INSERT → 隔離の UPDATE 1文 → 履歴の複数行 INSERT → COMMIT の1トランザクションで書き込む
+    # ★ V120 追加: 同じ書き込み (apply_writes) を BackgroundDBWriter のスレッドからも使う
+    # ----------------------------------------------------------------
+
+    def enable_write_buffer(self, max_rows: int = DB_WRITE_BUFFER_MAX_ROWS,
+                            max_age_seconds: float = DB_WRITE_BUFFER_MAX_AGE_SECONDS,
+                            buffer: Optional[WriteBuffer] = None) -> WriteBuffer:
+        """
+        [V119 新規] 以降の insert_new_video_record / log_history / isolate_record_due_to_error を溜めるようにする。
+        buffer を指定すると、作り直す前の接続で書き込めなかった行を引き継ぐ。
+        同じ接続を別スレッドと共有しないこと (ワーカーは従来どおり自分の接続で即時に書き込む)。
+        """
+        if buffer is None:
+            buffer = WriteBuffer(max_rows, max_age_seconds)
+        self.write_buffer = buffer
+        logger.info(f"DB: Write buffer enabled (Max rows: {buffer.max_rows}, Max age: {buffer.max_age_seconds}s, "
+                    f"Pending: {buffer.rows}).")
+        return buffer
+
+    def attach_writer(self, writer):
+        """
+        [V120 新規] 以降の書き込み (動画の挿入・隔離・履歴・スクショ・知覚ハッシュ) を BackgroundDBWriter に渡す。
+        書き込みメソッドはキューに入れるだけになるため、ワーカースレッドから呼んでもよい (読み取りは従来どおりこの接続で行う)。
+        書き込みバッファに残っている行は先にライターへ引き継ぐ。
+        """
+        buffer = self.write_buffer
+        self.write_buffer = None
+        self.writer = writer
+        if buffer is not None:
+            for _, op, values in buffer.records:
+                writer.submit(op, values)
+            for _, callback in buffer.callbacks:
+                callback()
+
+    def _queue_write(self, op: str, values: Tuple[Any, ...]) -> bool:
+        """[V120 新規] ライターかバッファがあれば書き込みを預けて True を返す (無ければ呼び出し側ですぐに書き込む)"""
+        if self.writer is not None:
+            self.writer.submit(op, values)
+            return True
+        if self.write_buffer is not None:
+            self.write_buffer.records.append((None, op, values))
+            self._after_queue()
+            return True
+        return False
+
+    def after_flush(self, callback: Callable[[], Any]):
+        """
+        [V119 新規] 溜めている行が書き込まれた (コミットされた) 後に callback を実行する。
+        挿入済みのレコードを前提とする処理 (スクショのワーカーへの受け渡しなど) に使う。バッファが無効ならすぐに実行する。
+        (★ V120: ライターは受け付け順に書き込むため、ライターがある場合もすぐに実行する)
+        """
+        if self.write_buffer is None:
+            callback()
+            return
+        self.write_buffer.add_callback(callback)
+
+    def _after_queue(self):
+        self.write_buffer.touch()
+        if self.write_buffer.is_due():
+            self.flush_writes()
+
+    def flush_writes_if_due(self) -> bool:
+        """[V119 新規] 行数・経過時間のどちらかが上限に達していれば書き込む"""
+        if self.write_buffer is None or not self.write_buffer.is_due():
+            return True
+        return self.flush_writes()
+
+    def flush_writes(self) -> bool:
+        """
+        [V119 新規] 溜めている行を1トランザクションで書き込む。
+        ★ V119 修正: 接続の問題で失敗した場合はロールバックして行を残し (次の書き込みで再試行する)、False を返す。
+        データの問題で失敗した場合は1行ずつ書き込み直し、書き込めない行だけを破棄する (1行のせいで全体が止まらないようにする)。
+        ★ V120 修正: 接続の問題かどうかはエラー番号で判定し (is_connection_error)、ロック競合は上限回数までやり直す
+        """
+        buffer = self.write_buffer
+        if buffer is None or buffer.first_queued_at is None:
+            return True
+
+        started = time.perf_counter()
+        try:
+            self.run_transaction(lambda: self.apply_writes(buffer.records))
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            DB_FLUSH_SECONDS.observe(seconds, result='error')
+            if is_connection_error(e):
+                logger.error(f"DB ERROR: Write buffer flush failed after {seconds:.2f}s. "
+                             f"Keeping {buffer.rows} rows for the next flush: {e}")
+                self._trim_write_buffer(buffer)
+                return False
+            logger.error(f"DB ERROR: Write buffer flush rejected by the server ({e}). "
+                         f"Writing {buffer.rows} rows one by one.")
+            return self._flush_writes_one_by_one(buffer)
+
+        seconds = time.perf_counter() - started
+        DB_FLUSH_SECONDS.observe(seconds, result='ok')
+        count_written_records(buffer.records)
+        logger.debug("DB: Flushed %d buffered rows in %.3fs.", buffer.rows, seconds)
+        self._run_flush_callbacks(buffer.pop_front(buffer.rows))
+        return True
+
+    def _flush_writes_one_by_one(self, buffer: WriteBuffer) -> bool:
+        """[V119 新規] 1行ずつ書き込み、データの問題で書き込めない行は破棄する。接続の問題が起きたらそこで止める"""
+        callbacks: List[Callable[[], Any]] = []
+        try:
+            while buffer.records:
+                record = buffer.records[0]
+                try:
+                    self.run_transaction(lambda: self.apply_writes([record]))
+                except Exception as e:
+                    if is_connection_error(e):
+                        logger.error(f"DB ERROR: Connection lost while writing rows one by one. "
+                                     f"Keeping {buffer.rows} rows for the next flush: {e}")
+                        self._trim_write_buffer(buffer)
+                        return False
+                    DB_BUFFER_DROPPED_ROWS_TOTAL.inc(reason='rejected')
+                    logger.error(f"DB ERROR: Dropped buffered {record[1]} row for {record[2][0]}: {e}")
+                else:
+                    count_written_records([record])
+                callbacks.extend(buffer.pop_front(1))
+            return True
+        finally:
+            self._run_flush_callbacks(callbacks)
+
+    def _trim_write_buffer(self, buffer: WriteBuffer):
+        """[V119 新規] 書き込めない間に上限を超えた分を古い順に破棄する"""
+        excess = buffer.rows - buffer.max_pending_rows
+        if excess <= 0:
+            return
+        DB_BUFFER_DROPPED_ROWS_TOTAL.inc(excess, reason='overflow')
+        logger.error(f"DB ERROR: Write buffer is over its limit ({buffer.max_pending_rows} rows). "
+                     f"Dropped the oldest {excess} rows.")
+        # 破棄した行の後に実行するはずだったコールバック (スクショの受け渡し) は、溜め続けないようここで実行する
+        self._run_flush_callbacks(buffer.pop_front(excess))
+
+    @staticmethod
+    def _run_flush_callbacks(callbacks: List[Callable[[], Any]]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"DB ERROR: Callback after flush failed: {e}")
+
+    def apply_writes(self, records: List[WriteRecord]):
+        """
+        [V120 新規] 受け付け順の操作を現在のトランザクションで実行する (コミットは呼び出し側で行う)。
+        動画の挿入はまとめて先に行うため、挿入より前に受け付けた同じ動画の更新がある場合はそこで区切り、順序を保つ。
+        スプールからの再送で同じ操作を2回実行しても結果が変わらないようにする (履歴は重複防止キーで1行にする)。
+        """
+        start = 0
+        updated_ids = set()
+        for index, (_, op, values) in enumerate(records):
+            if op == 'video' and values[0] in updated_ids:
+                self._apply_write_segment(records[start:index])
+                start = index
+                updated_ids = set()
+            elif op not in ('video', 'history'):
+                updated_ids.add(values[0])
+        self._apply_write_segment(records[start:])
+
+    def _apply_write_segment(self, records: List[WriteRecord]):
+        """動画の複数行 INSERT → 更新 (受け付け順。連続する隔離は1文) → 履歴の複数行 INSERT"""
+        videos = [values for _, op, values in records if op == 'video']
+        if videos:
+            # 複数行 INSERT にまとめられるよう VALUES には %s だけを置き、last_processed_at は後から1文で設定する
+            self.execute_many("""
+                INSERT INTO tiktok_videos
+                (video_id, url, channel_name, country_code, likes_count, caption_text,
+                 analysis_status, screenshot_data, screenshot_digest, screenshot_width, screenshot_height,
+                 screenshot_phash, canonical_video_id,
+                 found_source, searched_by_keyword)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    likes_count = VALUES(likes_count)
+            """, videos)
+            video_ids = list(dict.fromkeys(values[0] for values in videos))
+            self.execute_query(
+                "UPDATE tiktok_videos SET last_processed_at = NOW() WHERE video_id IN ({})".format(
+                    ', '.join(['%s'] * len(video_ids))), tuple(video_ids))
+
+        isolated: List[str] = []
+        for key, op, values in records:
+            if op == 'isolate':
+                if values[0] not in isolated:
+                    isolated.append(values[0])
+                continue
+            if op in ('video', 'history'):
+                continue
+            self._apply_isolation(isolated)
+            isolated = []
+            if op == 'screenshot':
+                video_id, screenshot_binary_data = values
+                self.execute_query(SCREENSHOT_UPDATE_SQL, (screenshot_binary_data, WAITING_SCREENSHOT_ATTACH,
+                                                           WAITING_SCREENSHOT_CHECK, video_id))
+            elif op == 'screenshot_ref':
+                video_id, digest, width, height, clear_blob = values
+                self.execute_query(screenshot_ref_update_sql(clear_blob), (
+                    digest, width, height, WAITING_SCREENSHOT_ATTACH, WAITING_SCREENSHOT_CHECK, video_id))
+            elif op == 'release':
+                self._apply_release(values[0])
+            elif op == 'phash':
+                self._apply_phash(key, *values)
+            else:
+                raise ValueError(f"Unknown write operation: {op}")
+        self._apply_isolation(isolated)
+
+        history = [tuple(values) + (key,) for key, op, values in records if op == 'history']
+        if history:
+            self.execute_many(HISTORY_INSERT_SQL, history)
+
+    def _apply_isolation(self, video_ids: List[str]):
+        if not video_ids:
+            return
+        self.execute_query(
+            "UPDATE tiktok_videos SET analysis_status = %s, last_processed_at = NOW() "
+            "WHERE video_id IN ({})".format(', '.join(['%s'] * len(video_ids))),
+            (ERROR_NEEDS_REVIEW,) + tuple(video_ids))
+
+    def _apply_release(self, video_id: str):
+        self.execute_query("UPDATE tiktok_videos SET analysis_status = %s WHERE video_id = %s AND analysis_status = %s",
+                           (WAITING_SCREENSHOT_CHECK, video_id, WAITING_SCREENSHOT_ATTACH))
+
+    def _apply_phash(self, key: Optional[str], video_id: str, phash: int, canonical_video_id: Optional[str],
+                     log_message: Optional[str], processed_by_bot: Optional[str]) -> bool:
+        """update_video_phash の本体 (コミットは呼び出し側)。紐付けた場合に True"""
+        if canonical_video_id is None:
+            self.execute_query("UPDATE tiktok_videos SET screenshot_phash = %s WHERE video_id = %s",
+                               (phash, video_id))
+            return False
+        sql = """
+            UPDATE tiktok_videos
+            SET screenshot_phash = %s, canonical_video_id = %s, analysis_status = %s, last_processed_at = NOW()
+            WHERE video_id = %s AND analysis_status IN (%s, %s)
+        """
+        linked = bool(self.execute_query(sql, (phash, canonical_video_id, DUPLICATE_CONTENT, video_id,
+                                               WAITING_SCREENSHOT_ATTACH, WAITING_SCREENSHOT_CHECK)))
+        if linked and log_message:
+            # ★ V106 修正: 紐付けはスクショの添付 (添付待ちの解除) より前に行う
+            self.execute_query(HISTORY_INSERT_SQL, (video_id, WAITING_SCREENSHOT_ATTACH, DUPLICATE_CONTENT,
+                                                    log_message, processed_by_bot, key))
+        return linked
+
+    def close(self):
+        """★ V119 修正: 溜めている行を書き込んでから接続を閉じる"""
+        if self.write_buffer is not None and self.write_buffer.first_queued_at is not None:
+            if not self.flush_writes():
+                logger.error(f"DB ERROR: {self.write_buffer.rows} buffered rows could not be written before closing.")
+        super().close()
+
     def get_oldest_search_word(self, country_code: str) -> Optional[Dict[str, Any]]:
         """
         [V18 設計復元] 最も古い未使用の検索キーワードを取得し、last_usedを更新する (アトミック処理)
@@ -0,0 +1,168 @@
+# =====================================================================
+# video_fingerprint_cache.py: 収集済み動画の指紋キャッシュ (V100)
+#
+# シェアメニュー経由のURL取得 (最も高コストな処理) の前に、画面から安価に読める
+# 「チャンネル名 + キャプションのハッシュ + いいね数のバケット」で収集済みかを判定する。
+# 容量上限 (LRU) と有効期限 (TTL) 付きのインメモリキャッシュ。
+#
+# ★ V100 修正: キャプション冒頭だけのキーでは、同じチャンネルの定型キャプション (冒頭が同じハッシュタグ列など) の
+# 別動画を収集済みと誤判定するため、正規化したキャプション全体をハッシュする。
+# 画面上で省略されている (「もっと見る」がある) キャプションは全体が分からないため、キャッシュでは判定しない。
+# 有効期限はキャッシュへの登録時刻ではなく、レコードの作成時刻 (created_at) から数える。
+# ★ V100 修正: 定型キャプション (ハッシュタグ・メンションだけ、一言だけ) は同じチャンネルの別動画と区別できないため
+# キャッシュしない。同じキーが別の video_id で登録された場合も、そのキーは以降判定に使わない (曖昧なキー)。
+# =====================================================================
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app_logger import logger
+
+# いいね数は収集後も増えるため、対数バケット (底2) で比較し、この幅のずれまでは同一とみなす
+LIKES_BUCKET_BASE = 2
+LIKES_BUCKET_TOLERANCE = 2
+
+# ハッシュタグ・メンションを除いた本文がこの文字数 (記号・空白を除く) 未満のキャプションはキャッシュしない
+MIN_CAPTION_TEXT_CHARS = 8
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_TAG_PATTERN = re.compile(r'[#@]\S+')
+_NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def caption_digest(caption_text: Optional[str]) -> Optional[str]:
+    """空白を正規化したキャプション全体の SHA-1 (16桁)。キャプションが空なら None"""
+    if not caption_text:
+        return None
+    normalized = _WHITESPACE_PATTERN.sub(' ', caption_text).strip()
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def is_distinctive_caption(caption_text: Optional[str], min_chars: int = MIN_CAPTION_TEXT_CHARS) -> bool:
+    """[V100 新規] ハッシュタグ・メンション・記号を除いた本文が min_chars 文字以上あるか (定型キャプションでないか)"""
+    if not caption_text:
+        return False
+    body = _NON_WORD_PATTERN.sub('', _TAG_PATTERN.sub('', caption_text))
+    return len(body) >= min_chars
+
+
+def likes_bucket(likes_count: Optional[int]) -> int:
+    if not likes_count or likes_count <= 0:
+        return 0
+    return int(math.log(likes_count, LIKES_BUCKET_BASE))
+
+
+def fingerprint_key(channel_name: Optional[str], caption_text: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    キャッシュキー (チャンネル名, キャプションハッシュ)。
+    どちらかが読めない動画は誤判定 (同一チャンネルのキャプション無し動画など) を避けるためキャッシュ対象外。
+    ★ V100 修正: 定型キャプション (is_distinctive_caption が False) の動画も同じ理由で対象外。
+    """
+    digest = caption_digest(caption_text)
+    if not channel_name or channel_name == 'N/A' or not digest or not is_distinctive_caption(caption_text):
+        return None
+    return channel_name, digest
+
+
+class VideoFingerprintCache:
+    """(チャンネル名, キャプションハッシュ) → (video_id, いいね数バケット, レコードの作成時刻) の LRU/TTL キャッシュ"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[str, int, float]]' = OrderedDict()
+        # ★ V100 修正: 別の video_id で2回登録されたキー (同じチャンネルの同じキャプション)。判定に使わない
+        self._ambiguous: 'OrderedDict[Tuple[str, str], None]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.truncated = 0  # ★ V100 修正: キャプションが省略されていて判定しなかった回数
+        self.ambiguous = 0  # ★ V100 修正: 曖昧なキーのため判定しなかった回数
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, channel_name: Optional[str], caption_text: Optional[str], likes_count: Optional[int],
+            video_id: str, created_at: Optional[float] = None):
+        """created_at はレコードの作成時刻 (UNIX 時刻)。省略時は現在時刻 (今挿入したレコード)"""
+        key = fingerprint_key(channel_name, caption_text)
+        if key is None or not video_id:
+            return
+        created_at = created_at or time.time()
+        if time.time() - created_at > self.ttl_seconds or key in self._ambiguous:
+            return
+        existing = self._entries.get(key)
+        if existing is not None and existing[0] != video_id:
+            self._mark_ambiguous(key)
+            return
+        self._entries[key] = (video_id, likes_bucket(likes_count), created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _mark_ambiguous(self, key: Tuple[str, str]):
+        del self._entries[key]
+        self._ambiguous[key] = None
+        while len(self._ambiguous) > self.max_entries:
+            self._ambiguous.popitem(last=False)
+
+    def lookup(self, channel_name: Optional[str], caption_text: Optional[str],
+               likes_count: Optional[int], caption_truncated: bool = False) -> Optional[str]:
+        """収集済みと判定できれば video_id を返す (caption_truncated=True の場合は判定しない)"""
+        if caption_truncated:
+            self.truncated += 1
+            return None
+        key = fingerprint_key(channel_name, caption_text)
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            if key in self._ambiguous:
+                self.ambiguous += 1
+            self.misses += 1
+            return None
+        video_id, bucket, created_at = entry
+        if time.time() - created_at > self.ttl_seconds:
+            del self._entries[key]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        if abs(likes_bucket(likes_count) - bucket) > LIKES_BUCKET_TOLERANCE:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return video_id
+
+    def warm(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        tiktok_videos の最近のレコード (video_id, channel_name, caption_text, likes_count, created_at_epoch) で事前に埋める
+        (有効期限を過ぎたレコードは登録しない)
+        """
+        loaded = 0
+        # 古い順に登録し、最新のレコードが LRU の末尾 (最も残りやすい位置) に来るようにする
+        for row in reversed(list(rows)):
+            before = len(self._entries)
+            created_at = row.get('created_at_epoch')
+            self.add(row.get('channel_name'), row.get('caption_text'), row.get('likes_count'), row.get('video_id'),
+                     float(created_at) if created_at is not None else None)
+            loaded += len(self._entries) > before
+        logger.info(f"FINGERPRINT: Cache warmed with {loaded} recent videos (Size: {len(self._entries)}).")
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'truncated': self.truncated,
+            'ambiguous': self.ambiguous,
+            'ambiguous_keys': len(self._ambiguous),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
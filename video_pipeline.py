@@ -0,0 +1,149 @@
+# =====================================================================
+# video_pipeline.py: 単一動画処理のステージ・パイプライン (V101)
+#
+# process_single_video の各処理を名前付きステージとして実行し、
+# ステージごとの 所要時間 / 棄却率 を計測する。
+# 実行順は設定で変更でき、計測結果から「安くて棄却率の高い順」の推奨順を算出する。
+# ★ V111: 各ステージの所要時間は metrics.PIPELINE_STAGE_SECONDS にも記録する (エクスポート用)
+# =====================================================================
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app_logger import logger
+from metrics import PIPELINE_STAGE_SECONDS
+
+# ステージ関数: コンテキスト辞書を受け取り、続行なら None、棄却なら理由文字列を返す
+StageFunc = Callable[[Dict[str, Any]], Optional[str]]
+
+RECENT_SAMPLES = 500  # パーセンタイル計算用に保持する直近の所要時間
+
+
+class PipelineConfigError(Exception):
+    """ステージ名の誤りや依存関係に違反する実行順"""
+    pass
+
+
+class PipelineStage:
+    """名前付きステージと、その累積統計"""
+
+    def __init__(self, name: str, func: StageFunc, requires: Iterable[str] = (), after: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        # requires: 必ず先に実行されている必要があるステージ / after: 実行順に含まれる場合のみ先に実行するステージ
+        self.requires = tuple(requires)
+        self.after = tuple(after)
+        self.runs = 0
+        self.rejections = 0
+        self.total_seconds = 0.0
+        self.recent_seconds: Deque[float] = deque(maxlen=RECENT_SAMPLES)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.runs if self.runs else 0.0
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.rejections / self.runs if self.runs else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        if not self.recent_seconds:
+            return 0.0
+        samples = sorted(self.recent_seconds)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def record(self, elapsed_seconds: float, rejected: bool):
+        self.runs += 1
+        self.total_seconds += elapsed_seconds
+        self.recent_seconds.append(elapsed_seconds)
+        if rejected:
+            self.rejections += 1
+
+
+class VideoPipeline:
+    """登録済みステージを指定順に実行し、最初に棄却したステージで処理を打ち切る"""
+
+    def __init__(self, stages: List[PipelineStage], order: List[str]):
+        self.stages: Dict[str, PipelineStage] = {stage.name: stage for stage in stages}
+        self.order: List[str] = []
+        self.set_order(order)
+
+    def set_order(self, order: List[str]):
+        """実行順を検証して設定する (依存ステージより前に置かれたステージがあればエラー)"""
+        unknown = [name for name in order if name not in self.stages]
+        if unknown:
+            raise PipelineConfigError(f"Unknown pipeline stages: {unknown}")
+        seen = set()
+        for name in order:
+            stage = self.stages[name]
+            missing = [dep for dep in stage.requires if dep not in seen]
+            missing += [dep for dep in stage.after if dep in order and dep not in seen]
+            if missing:
+                raise PipelineConfigError(f"Stage '{name}' must run after {missing}. Order: {order}")
+            seen.add(name)
+        self.order = list(order)
+
+    def run(self, context: Dict[str, Any]) -> Tuple[bool, Optional[str], Optional[str]]:
+        """
+        (受理されたか, 棄却したステージ名, 棄却理由) を返す。
+        ステージ内の例外は計測した上でそのまま呼び出し元へ送出する。
+        [V112 追加] 各ステージの所要時間を context['stage_seconds'] に残す (判定記録用)
+        """
+        stage_seconds = context.setdefault('stage_seconds', {})
+        for name in self.order:
+            stage = self.stages[name]
+            started = time.time()
+            try:
+                reason = stage.func(context)
+            except Exception:
+                elapsed = time.time() - started
+                stage_seconds[name] = round(elapsed, 3)
+                stage.record(elapsed, rejected=False)
+                PIPELINE_STAGE_SECONDS.observe(elapsed, stage=name, outcome='error')
+                raise
+            elapsed = time.time() - started
+            stage_seconds[name] = round(elapsed, 3)
+            stage.record(elapsed, rejected=reason is not None)
+            PIPELINE_STAGE_SECONDS.observe(elapsed, stage=name, outcome='passed' if reason is None else 'rejected')
+            if reason is not None:
+                return False, name, reason
+        return True, None, None
+
+    def suggested_order(self) -> List[str]:
+        """
+        依存関係を守りつつ「平均コスト / 棄却率」が小さいステージから並べた推奨順。
+        一度も実行されていないステージは現在の位置を保つよう、順位を現在の並びで決める。
+        """
+        def rank(name: str) -> Tuple[float, int]:
+            stage = self.stages[name]
+            if not stage.runs:
+                return float('inf'), self.order.index(name)
+            return stage.mean_seconds / max(stage.rejection_rate, 1e-3), self.order.index(name)
+
+        remaining = list(self.order)
+        placed: List[str] = []
+        while remaining:
+            ready = [name for name in remaining
+                     if all(dep in placed or dep not in remaining
+                            for dep in self.stages[name].requires + self.stages[name].after)]
+            best = min(ready, key=rank)
+            placed.append(best)
+            remaining.remove(best)
+        return placed
+
+    def apply_suggested_order(self) -> bool:
+        suggested = self.suggested_order()
+        if suggested == self.order:
+            return False
+        logger.info(f"PIPELINE: Reordering stages {self.order} -> {suggested}")
+        self.set_order(suggested)
+        return True
+
+    def report(self) -> str:
+        lines = [f"PIPELINE REPORT (Order: {' -> '.join(self.order)})"]
+        for name in self.order:
+            stage = self.stages[name]
+            lines.append(f"  {name:<12} runs={stage.runs:<6} mean={stage.mean_seconds:.3f}s "
+                         f"p95={stage.percentile(0.95):.3f}s rejected={stage.rejection_rate:6.1%}")
+        lines.append(f"  Suggested order: {' -> '.join(self.suggested_order())}")
+        return "\n".join(lines)